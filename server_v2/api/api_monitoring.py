@@ -18,7 +18,10 @@ from flask import Blueprint, request, jsonify
 from typing import Dict, Any, List
 
 from services.monitoring_service import get_monitoring_service, MonitorType
+from services.file_watcher import get_file_watcher
 from core.exceptions import ValidationError
+from core.shared_cache import get_shared_cache
+from core.single_flight import get_single_flight_stats
 
 logger = logging.getLogger(__name__)
 
@@ -429,6 +432,78 @@ def get_monitor_metrics(monitor_id: str):
             'message': f'Errore nel recupero delle metriche: {str(e)}'
         }), 500
 
+# Shared cache endpoints
+@monitoring_bp.route('/monitor/cache', methods=['GET'])
+def get_cache_stats():
+    """Statistiche della cache condivisa (byte, hit/miss, eviction per namespace)."""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_shared_cache().get_stats()
+        })
+    except Exception as e:
+        logger.error(f"Error getting cache stats: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Errore nel recupero delle statistiche cache: {str(e)}'
+        }), 500
+
+@monitoring_bp.route('/monitor/single-flight', methods=['GET'])
+def get_single_flight_metrics():
+    """Metriche di coalescenza dei caricamenti DBF concorrenti (per gruppo e per namespace cache)."""
+    try:
+        cache_stats = get_shared_cache().get_stats()['namespaces']
+        return jsonify({
+            'success': True,
+            'data': {
+                'groups': get_single_flight_stats(),
+                'cache_namespaces': {
+                    name: {key: stats[key] for key in ('loads', 'coalesced', 'inflight')}
+                    for name, stats in cache_stats.items()
+                }
+            }
+        })
+    except Exception as e:
+        logger.error(f"Error getting single-flight metrics: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Errore nel recupero delle metriche single-flight: {str(e)}'
+        }), 500
+
+@monitoring_bp.route('/monitor/pipeline', methods=['GET'])
+def get_change_pipeline_metrics():
+    """Metriche della pipeline eventi DBF (debounce, coalescenza, coda e latenza)."""
+    try:
+        return jsonify({
+            'success': True,
+            'data': get_file_watcher().get_status()
+        })
+    except Exception as e:
+        logger.error(f"Error getting change pipeline metrics: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Errore nel recupero delle metriche della pipeline: {str(e)}'
+        }), 500
+
+@monitoring_bp.route('/monitor/cache/clear', methods=['POST'])
+def clear_cache():
+    """Svuota un namespace della cache condivisa (body: {"namespace": ...}) o tutta la cache."""
+    try:
+        data = request.get_json(silent=True) or {}
+        removed = get_shared_cache().invalidate(data.get('namespace'))
+        
+        return jsonify({
+            'success': True,
+            'data': {'removed': removed},
+            'message': f'{removed} voci rimosse dalla cache'
+        })
+    except Exception as e:
+        logger.error(f"Error clearing cache: {e}")
+        return jsonify({
+            'success': False,
+            'message': f'Errore nella pulizia della cache: {str(e)}'
+        }), 500
+
 # Health check endpoint
 @monitoring_bp.route('/monitor/health', methods=['GET'])
 def health_check():
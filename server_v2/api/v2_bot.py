@@ -7,7 +7,6 @@ directly from StudioDimaAI without going through n8n UI.
 
 import os
 import logging
-import sqlite3
 import subprocess
 import requests
 from datetime import datetime, timedelta, timezone, time as dtime
@@ -16,6 +15,7 @@ from flask_jwt_extended import jwt_required
 from functools import wraps
 
 from app_v2 import format_response
+from core.database_manager import db_connection
 from core.paths import STUDIO_DIMA_DB_PATH
 from core.reminder_db import ensure_reminder_tables
 
@@ -502,51 +502,47 @@ def get_last_igienista(db_code: str):
 def _do_confirmation(phone: str, response_val: str, appointment_date: str = '') -> dict:
     """Logica condivisa tra /bot/appointment-confirmation e /bot/whatsapp-webhook."""
     phone_suffix = phone[-9:]
-    conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-
-    if appointment_date:
-        cur.execute("""
-            SELECT id, patient_id, patient_name, appointment_date, appointment_time
-            FROM patient_communications
-            WHERE phone LIKE ? AND appointment_date = ? AND stato NOT IN ('confirmed', 'cancelled')
-            ORDER BY created_at DESC LIMIT 1
-        """, ('%' + phone_suffix, appointment_date))
-    else:
-        cur.execute("""
-            SELECT id, patient_id, patient_name, appointment_date, appointment_time
-            FROM patient_communications
-            WHERE phone LIKE ? AND stato NOT IN ('confirmed', 'cancelled')
-            ORDER BY created_at DESC LIMIT 1
-        """, ('%' + phone_suffix,))
-
-    comm = cur.fetchone()
-    comm_id = None
-    patient_id = None
-    patient_name = 'Paziente'
-    ap_date = appointment_date
-    ap_time = ''
-
-    if comm:
-        comm_id = comm['id']
-        patient_id = comm['patient_id']
-        patient_name = comm['patient_name'] or 'Paziente'
-        ap_date = comm['appointment_date']
-        ap_time = comm['appointment_time']
-        cur.execute(
-            "UPDATE patient_communications SET stato = ? WHERE id = ?",
-            (response_val, comm_id)
-        )
+    with db_connection(STUDIO_DIMA_DB_PATH, caller='v2_bot') as conn:
+        cur = conn.cursor()
 
-    cur.execute("""
-        INSERT INTO appointment_confirmations
-            (patient_id, phone, appointment_date, appointment_time, response, communication_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (patient_id, phone, ap_date, ap_time, response_val, comm_id))
+        if appointment_date:
+            cur.execute("""
+                SELECT id, patient_id, patient_name, appointment_date, appointment_time
+                FROM patient_communications
+                WHERE phone LIKE ? AND appointment_date = ? AND stato NOT IN ('confirmed', 'cancelled')
+                ORDER BY created_at DESC LIMIT 1
+            """, ('%' + phone_suffix, appointment_date))
+        else:
+            cur.execute("""
+                SELECT id, patient_id, patient_name, appointment_date, appointment_time
+                FROM patient_communications
+                WHERE phone LIKE ? AND stato NOT IN ('confirmed', 'cancelled')
+                ORDER BY created_at DESC LIMIT 1
+            """, ('%' + phone_suffix,))
+
+        comm = cur.fetchone()
+        comm_id = None
+        patient_id = None
+        patient_name = 'Paziente'
+        ap_date = appointment_date
+        ap_time = ''
+
+        if comm:
+            comm_id = comm['id']
+            patient_id = comm['patient_id']
+            patient_name = comm['patient_name'] or 'Paziente'
+            ap_date = comm['appointment_date']
+            ap_time = comm['appointment_time']
+            cur.execute(
+                "UPDATE patient_communications SET stato = ? WHERE id = ?",
+                (response_val, comm_id)
+            )
 
-    conn.commit()
-    conn.close()
+        cur.execute("""
+            INSERT INTO appointment_confirmations
+                (patient_id, phone, appointment_date, appointment_time, response, communication_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (patient_id, phone, ap_date, ap_time, response_val, comm_id))
 
     if response_val == 'cancelled':
         try:
@@ -684,23 +680,21 @@ def get_pending_reminder():
     current_time = now.strftime('%H:%M')
 
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, patient_id, patient_name, appointment_date, appointment_time
-            FROM patient_communications
-            WHERE phone LIKE ?
-              AND stato NOT IN ('confirmed', 'cancelled', 'failed')
-              AND (
-                  appointment_date > ?
-                  OR (appointment_date = ? AND appointment_time > ?)
-              )
-            ORDER BY appointment_date ASC, created_at DESC
-            LIMIT 1
-        """, ('%' + phone_suffix, today, today, current_time))
-        row = cur.fetchone()
-        conn.close()
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='v2_bot') as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, patient_id, patient_name, appointment_date, appointment_time
+                FROM patient_communications
+                WHERE phone LIKE ?
+                  AND stato NOT IN ('confirmed', 'cancelled', 'failed')
+                  AND (
+                      appointment_date > ?
+                      OR (appointment_date = ? AND appointment_time > ?)
+                  )
+                ORDER BY appointment_date ASC, created_at DESC
+                LIMIT 1
+            """, ('%' + phone_suffix, today, today, current_time))
+            row = cur.fetchone()
 
         if row:
             return format_response({
@@ -802,17 +796,15 @@ def get_evolution_dashboard_status():
 
     # 5. Ultime comunicazioni
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id, patient_name, phone, channel, type, stato,
-                   appointment_date, appointment_time, created_at
-            FROM patient_communications
-            ORDER BY created_at DESC LIMIT 50
-        """)
-        status['recent_communications'] = [dict(r) for r in cur.fetchall()]
-        conn.close()
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='v2_bot') as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id, patient_name, phone, channel, type, stato,
+                       appointment_date, appointment_time, created_at
+                FROM patient_communications
+                ORDER BY created_at DESC LIMIT 50
+            """)
+            status['recent_communications'] = [dict(r) for r in cur.fetchall()]
     except Exception:
         pass
 
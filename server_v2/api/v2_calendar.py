@@ -879,6 +879,13 @@ def calendar_health_check():
             # Non-blocking error for sync state
             pass
         
+        # Freschezza del cubo rollup delle statistiche
+        try:
+            from services.appointment_rollup import get_appointment_rollup
+            rollup_cube = get_appointment_rollup().get_status()
+        except Exception as e:
+            rollup_cube = {'error': str(e)}
+        
         return format_response(
             success=True,
             data={
@@ -886,7 +893,8 @@ def calendar_health_check():
                 'google_error': None if connection_test else "Impossibile connettersi a Google Calendar",
                 'sync_state_entries': len(sync_manager.sync_state) if hasattr(sync_manager, 'sync_state') else 0,
                 'token_exists': GOOGLE_TOKEN_PATH.exists(),
-                'credentials_exists': GOOGLE_CREDENTIALS_PATH.exists()
+                'credentials_exists': GOOGLE_CREDENTIALS_PATH.exists(),
+                'rollup_cube': rollup_cube
             },
             message='Health check passed',
             state='success'
@@ -8,7 +8,7 @@ import logging
 from flask import Blueprint, request, jsonify, g
 from flask_jwt_extended import jwt_required
 
-from services.pazienti_service import PazientiService
+from services.pazienti_service import PazientiService, PAZIENTI_LIST_FIELDS
 from app_v2 import require_auth, format_response, handle_dbf_data
 from core.exceptions import ValidationError, DatabaseError
 
@@ -74,6 +74,28 @@ def validate_pagination_params(page, per_page):
         raise ValidationError("Per page must be >= 1")
 
 
+def parse_fields_param(value):
+    """
+    Parse the `fields` projection parameter.
+    
+    Args:
+        value: Comma-separated field names (empty = all fields)
+    
+    Returns:
+        List of field names or None
+    
+    Raises:
+        ValidationError: If a field is not available in the list response
+    """
+    fields = [f.strip() for f in (value or '').split(',') if f.strip()]
+    if not fields:
+        return None
+    unknown = sorted(set(fields) - PAZIENTI_LIST_FIELDS)
+    if unknown:
+        raise ValidationError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
 @pazienti_v2_bp.route('/pazienti', methods=['GET'])
 @jwt_required()
 def get_pazienti():
@@ -87,6 +109,8 @@ def get_pazienti():
         da_richiamare (bool): Filter by patients to recall
         in_cura (bool): Filter by patients in care
         all (int): If 1, load all patients without pagination
+        cursor (str): Keyset cursor from a previous `next_cursor` (replaces page)
+        fields (str): Comma-separated list of fields to return (e.g. "id,nome,cellulare")
     
     Returns:
         JSON response with paginated patients list
@@ -99,6 +123,8 @@ def get_pazienti():
         da_richiamare = request.args.get('da_richiamare', type=bool)
         in_cura = request.args.get('in_cura', type=bool)
         load_all = request.args.get('all', 0, type=int)
+        cursor = request.args.get('cursor', '').strip() or None
+        fields = parse_fields_param(request.args.get('fields', ''))
         
         # Validate parameters
         validate_pagination_params(page, per_page)
@@ -122,7 +148,9 @@ def get_pazienti():
         result = service.get_pazienti_paginated(
             page=page,
             per_page=per_page,
-            filters=filters
+            filters=filters,
+            cursor=cursor,
+            fields=fields
         )
         
         # Return response
@@ -5,11 +5,11 @@ Reminder appuntamenti API - endpoints per trigger manuale, status e log.
 import json
 import logging
 import os
-import sqlite3
 from flask import Blueprint, request
 from flask_jwt_extended import jwt_required
 
 from app_v2 import format_response
+from core.database_manager import db_connection
 from core.paths import STUDIO_DIMA_DB_PATH
 from core.reminder_db import ensure_reminder_tables
 
@@ -123,17 +123,15 @@ def get_communications():
     offset = (page - 1) * per_page
 
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("SELECT COUNT(*) FROM patient_communications")
-        total = cur.fetchone()[0]
-        cur.execute("""
-            SELECT * FROM patient_communications
-            ORDER BY created_at DESC LIMIT ? OFFSET ?
-        """, (per_page, offset))
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='v2_reminders') as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM patient_communications")
+            total = cur.fetchone()[0]
+            cur.execute("""
+                SELECT * FROM patient_communications
+                ORDER BY created_at DESC LIMIT ? OFFSET ?
+            """, (per_page, offset))
+            rows = [dict(r) for r in cur.fetchall()]
         return format_response({
             'items': rows,
             'total': total,
@@ -174,39 +172,37 @@ def get_reminder_replies():
     date_filter = request.args.get('date')
 
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='v2_reminders') as conn:
+            cur = conn.cursor()
 
-        if date_filter:
-            where = "WHERE pc.appointment_date = ?"
-            params = [date_filter, 100]
-        else:
-            where = "WHERE pc.created_at >= datetime('now', ? || ' days')"
-            params = [f'-{days}', 100]
+            if date_filter:
+                where = "WHERE pc.appointment_date = ?"
+                params = [date_filter, 100]
+            else:
+                where = "WHERE pc.created_at >= datetime('now', ? || ' days')"
+                params = [f'-{days}', 100]
 
-        cur.execute(f"""
-            SELECT
-                pc.id,
-                pc.patient_name,
-                pc.phone,
-                pc.channel,
-                pc.type AS reminder_type,
-                pc.appointment_date,
-                pc.appointment_time,
-                pc.stato,
-                pc.created_at,
-                ac.response,
-                ac.received_at AS response_at
-            FROM patient_communications pc
-            LEFT JOIN appointment_confirmations ac ON ac.communication_id = pc.id
-            {where}
-            ORDER BY pc.appointment_date DESC, pc.appointment_time ASC, pc.created_at DESC
-            LIMIT ?
-        """, params)
+            cur.execute(f"""
+                SELECT
+                    pc.id,
+                    pc.patient_name,
+                    pc.phone,
+                    pc.channel,
+                    pc.type AS reminder_type,
+                    pc.appointment_date,
+                    pc.appointment_time,
+                    pc.stato,
+                    pc.created_at,
+                    ac.response,
+                    ac.received_at AS response_at
+                FROM patient_communications pc
+                LEFT JOIN appointment_confirmations ac ON ac.communication_id = pc.id
+                {where}
+                ORDER BY pc.appointment_date DESC, pc.appointment_time ASC, pc.created_at DESC
+                LIMIT ?
+            """, params)
 
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
+            rows = [dict(r) for r in cur.fetchall()]
         return format_response({'items': rows, 'total': len(rows)})
     except Exception as e:
         logger.error(f"Errore lettura reminder replies: {e}")
@@ -219,15 +215,13 @@ def get_wa_cache():
     """Stato cache WhatsApp pazienti."""
     ensure_reminder_tables()
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT patient_id, phone, has_whatsapp, wa_jid, checked_at
-            FROM pazienti_wa_cache ORDER BY checked_at DESC
-        """)
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='v2_reminders') as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT patient_id, phone, has_whatsapp, wa_jid, checked_at
+                FROM pazienti_wa_cache ORDER BY checked_at DESC
+            """)
+            rows = [dict(r) for r in cur.fetchall()]
         wa = sum(1 for r in rows if r['has_whatsapp'] == 1)
         no_wa = sum(1 for r in rows if r['has_whatsapp'] == 0)
         return format_response({'items': rows, 'total': len(rows), 'wa': wa, 'no_wa': no_wa})
@@ -5,13 +5,13 @@ Implementa endpoint modernizzati con architettura repository/service
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required
 import logging
-import sqlite3
 import os
 import base64
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography import x509
 from typing import Dict, Any, Optional
+from core.database_manager import db_connection
 from utils.ricetta_utils import ricetta_data_manager
 
 # Database path per protocolli
@@ -34,7 +34,7 @@ def _ensure_tables():
     global _TABLES_READY
     if _TABLES_READY:
         return
-    with sqlite3.connect(PROTOCOLLI_DB_PATH) as conn:
+    with db_connection(PROTOCOLLI_DB_PATH, caller='v2_ricetta', row_factory=None) as conn:
         conn.execute("""
             CREATE TABLE IF NOT EXISTS farmaci_commerciali (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -50,7 +50,6 @@ def _ensure_tables():
                 FOREIGN KEY (farmaco_id) REFERENCES farmaci(id)
             )
         """)
-        conn.commit()
     _TABLES_READY = True
 
 
@@ -59,7 +58,7 @@ def _ensure_tables():
 def get_all_diagnosi():
     """Get all diagnosi (not search)"""
     try:
-        with sqlite3.connect(PROTOCOLLI_DB_PATH) as conn:
+        with db_connection(PROTOCOLLI_DB_PATH, caller='v2_ricetta', row_factory=None) as conn:
             cursor = conn.cursor()
             
             query = """
@@ -184,7 +183,7 @@ def get_farmaci_commerciali(farmaco_id):
     """Elenco dei prodotti commerciali (AIC) disponibili per un principio attivo"""
     try:
         _ensure_tables()
-        with sqlite3.connect(PROTOCOLLI_DB_PATH) as conn:
+        with db_connection(PROTOCOLLI_DB_PATH, caller='v2_ricetta', row_factory=None) as conn:
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT id, aic, nome_commerciale, classe, ripetibilita,
@@ -232,7 +231,7 @@ def add_farmaci_commerciali():
                 'message': 'farmaco_id e prodotti sono obbligatori'
             }), 400
 
-        with sqlite3.connect(PROTOCOLLI_DB_PATH) as conn:
+        with db_connection(PROTOCOLLI_DB_PATH, caller='v2_ricetta', row_factory=None) as conn:
             for p in prodotti:
                 conn.execute("""
                     INSERT INTO farmaci_commerciali
@@ -250,7 +249,6 @@ def add_farmaci_commerciali():
                     p.get('ripetibilita'), p.get('gruppo_equivalenza_codice'),
                     p.get('gruppo_equivalenza_descrizione'),
                 ))
-            conn.commit()
 
         return jsonify({'success': True, 'message': f'{len(prodotti)} prodotti salvati'})
     except Exception as e:
@@ -266,7 +264,7 @@ def add_farmaci_commerciali():
 def get_protocolli_per_diagnosi(diagnosi_id):
     """Get protocolli for a specific diagnosi by ID"""
     try:
-        with sqlite3.connect(PROTOCOLLI_DB_PATH) as conn:
+        with db_connection(PROTOCOLLI_DB_PATH, caller='v2_ricetta', row_factory=None) as conn:
             cursor = conn.cursor()
             
             query = """
@@ -6,14 +6,18 @@ Modern API endpoints for patient recall management.
 
 import logging
 import os
-from datetime import date, datetime
+from datetime import date, timedelta
 from flask import Blueprint, request, g
 from flask_jwt_extended import jwt_required, verify_jwt_in_request
 from jwt.exceptions import InvalidTokenError
 
 from services.pazienti_service import PazientiService
 from services.richiami_service import RichiamiService
-from services.slot_finder_service import trova_slot_liberi, trova_ultimo_igienista, build_last_igiene_lookup
+from services.recall_index import get_recall_index, add_months as _add_months
+from services.slot_finder_service import (
+    trova_slot_liberi, trova_ultimo_igienista,
+    profilo_slot_richiamo, pianifica_slot_batch,
+)
 from app_v2 import format_response
 from core.exceptions import ValidationError, DatabaseError
 from core.constants_v2 import TIPO_RICHIAMI
@@ -45,31 +49,6 @@ def _check_auth():
         raise NoAuthorizationError('Autenticazione richiesta: JWT o X-API-Key valido')
 
 
-def _months_between(d1: date, d2: date) -> int:
-    return (d2.year - d1.year) * 12 + (d2.month - d1.month)
-
-
-def _add_months(d: date, months: int) -> date:
-    m = d.month - 1 + months
-    year = d.year + m // 12
-    month = m % 12 + 1
-    import calendar
-    day = min(d.day, calendar.monthrange(year, month)[1])
-    return date(year, month, day)
-
-
-def _parse_date(value) -> date | None:
-    if not value:
-        return None
-    if isinstance(value, date):
-        return value
-    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%Y%m%d'):
-        try:
-            return datetime.strptime(str(value), fmt).date()
-        except ValueError:
-            continue
-    return None
-
 # Create blueprint
 richiami_v2_bp = Blueprint('richiami_v2', __name__)
 
@@ -113,6 +92,20 @@ def validate_required_param(data, param_name, param_type=str):
     return value
 
 
+def parse_non_negative_int(data, param_name, default=None):
+    """Optional integer parameter (>= 0); `default` when missing."""
+    value = data.get(param_name)
+    if value is None:
+        return default
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"{param_name} must be a valid int")
+    if value < 0:
+        raise ValidationError(f"{param_name} must be >= 0")
+    return value
+
+
 @richiami_v2_bp.route('/pazienti/<paziente_id>/richiamo/status', methods=['PUT'])
 @jwt_required()
 def update_richiamo_status(paziente_id):
@@ -281,78 +274,31 @@ def migrate_richiami_from_dbf():
     """
     Migrate existing richiami data from DBF gestionale to SQLite table.
     This is a one-time operation to import existing data.
+
+    Body JSON (opzionale):
+        aggiorna_esistenti : bool (default false) — aggiorna anche i pazienti
+                             gia' presenti i cui dati richiamo nel DBF sono cambiati
     """
     try:
-        # Get all pazienti with richiami data from DBF
+        data = request.get_json(silent=True) or {}
         pazienti_service = PazientiService(g.database_manager)
-        result = pazienti_service.get_pazienti_paginated(page=1, per_page=10000)
-        
-        if not result['success']:
-            return format_response(success=False, error="Could not fetch pazienti from DBF"), 500
-        
-        pazienti = result['data']['pazienti']
-        richiami_service = RichiamiService()
-        
-        migrated_count = 0
-        skipped_count = 0
-        error_count = 0
-        
-        for paziente in pazienti:
-            try:
-                paziente_id = paziente.get('id')
-                nome = paziente.get('nome', 'N/A')
-                da_richiamare = paziente.get('da_richiamare', '').strip()
-                tipo_richiamo = paziente.get('tipo_richiamo', '').strip()
-                tempo_richiamo = paziente.get('mesi_richiamo')  # Note: field name difference
-                ultima_visita = paziente.get('ultima_visita')
-                
-                # Skip if no richiamo data
-                if not da_richiamare or da_richiamare not in ['S', 'N', 'R']:
-                    skipped_count += 1
-                    continue
-                
-                # Check if already exists
-                existing = richiami_service.get_richiami_paziente(paziente_id)
-                if existing['success'] and existing['data']:
-                    skipped_count += 1
-                    continue
-                
-                # Create richiamo record
-                create_result = richiami_service.create_richiamo(
-                    paziente_id=paziente_id,
-                    nome=nome,
-                    data_ultima_visita=ultima_visita,
-                    tipo_richiamo=tipo_richiamo if tipo_richiamo else None,
-                    tempo_richiamo=tempo_richiamo if tempo_richiamo and isinstance(tempo_richiamo, int) else None
-                )
-                
-                if create_result['success']:
-                    # Update status to match DBF
-                    status_result = richiami_service.update_richiamo_status(
-                        paziente_id=paziente_id,
-                        da_richiamare=da_richiamare,
-                        data_richiamo=None
-                    )
-                    
-                    if status_result['success']:
-                        migrated_count += 1
-                    else:
-                        error_count += 1
-                else:
-                    error_count += 1
-                    
-            except Exception:
-                error_count += 1
-                continue
-        
+        records = pazienti_service.get_richiami_dbf_records()
+
+        result = RichiamiService().bulk_upsert(records, update_existing=bool(data.get('aggiorna_esistenti', False)))
+        report = result['data']
+        skipped_count = report['skipped'] + report['existing'] + report['unchanged']
+
         return format_response({
-            'migrated': migrated_count,
+            'migrated': report['inserted'],
+            'updated': report['updated'],
             'skipped': skipped_count,
-            'errors': error_count,
-            'total_processed': len(pazienti),
-            'message': f'Migration completed: {migrated_count} migrated, {skipped_count} skipped, {error_count} errors'
+            'errors': 0,
+            'total_processed': len(records),
+            'report': report,
+            'message': f"Migration completed: {report['inserted']} migrated, {report['updated']} updated, "
+                       f"{skipped_count} skipped, 0 errors"
         })
-            
+
     except (DatabaseError, Exception) as e:
         return handle_error(e, "migrate_richiami_from_dbf")
 
@@ -593,6 +539,36 @@ def get_anteprima_messaggio():
         return format_response({'success': False, 'error': str(e)}), 500
 
 
+def _seleziona_pazienti_da_richiamare(filtro: str = '',
+                                      tipo_filtro: str | None = None,
+                                      eta_max: int = 16,
+                                      solo_cellulare: bool = True,
+                                      scaduti_solo: bool = False,
+                                      ritardo_max_giorni: int = 3650,
+                                      entro: date | None = None,
+                                      limit: int | None = None) -> list[dict]:
+    """
+    Pazienti marcati da richiamare nel DBF con i filtri dell'endpoint
+    pazienti-da-richiamare, ordinati dal piu' in ritardo.
+    `entro` limita ai pazienti con richiamo previsto entro quella data.
+
+    Legge dalla tabella richiami materializzata (RecallIndex), riallineata
+    incrementalmente a PAZIENTI.DBF, tabella richiami ed ELENCO/PREVENT.
+    """
+    service = PazientiService(g.database_manager)
+    index = get_recall_index(service.get_pazienti_dbf_path())
+    return index.select(
+        filtro=filtro,
+        tipo_filtro=tipo_filtro,
+        eta_max=eta_max,
+        solo_cellulare=solo_cellulare,
+        scaduti_solo=scaduti_solo,
+        ritardo_max_giorni=ritardo_max_giorni,
+        entro=entro,
+        limit=limit,
+    )
+
+
 @richiami_v2_bp.route('/richiami/pazienti-da-richiamare', methods=['GET'])
 def get_pazienti_da_richiamare():
     """
@@ -622,104 +598,15 @@ def get_pazienti_da_richiamare():
     tipo_filtro = tipo_override or _FILTRO_TO_TIPO.get(filtro)
 
     try:
-        # Leggi tutti i pazienti dal DBF (merge SQLite disabilitato per velocita)
-        service = PazientiService(g.database_manager)
-        raw = service.get_pazienti_paginated(page=1, per_page=20000)
-        if not raw.get('success'):
-            return format_response({'success': False, 'error': 'Errore lettura DBF pazienti'}), 500
-
-        pazienti = raw['data']['pazienti']
-        today = date.today()
-        result = []
-
-        # Lookup data ultima igiene da PREVENT.DBF per tutti i pazienti in una sola lettura.
-        # Usato per sovrascrivere ultima_visita (DB_PAULTVI) che Windent aggiorna raramente.
-        igiene_lookup = build_last_igiene_lookup()
-
-        for p in pazienti:
-            # Solo quelli marcati da richiamare
-            if p.get('da_richiamare', '').strip().upper() != 'S':
-                continue
-
-            # Filtro per tipo richiamo (DB_PARIMOT è multi-carattere: "21" = igiene+generico)
-            tipo_paz = p.get('tipo_richiamo', '').strip()
-            if tipo_filtro and tipo_filtro not in tipo_paz:
-                continue
-
-            # Filtro donne
-            if filtro == 'donne' and p.get('sesso', '').strip().upper() != 'F':
-                continue
-
-            # Filtro bambini
-            if filtro == 'bambini':
-                dn = _parse_date(p.get('data_nascita'))
-                if not dn or _months_between(dn, today) // 12 > eta_max:
-                    continue
-
-            # Solo pazienti con cellulare (per WhatsApp)
-            cellulare = p.get('cellulare', '').strip()
-            if solo_cellulare and not cellulare:
-                continue
-
-            # Calcola scadenza richiamo.
-            # Per pazienti con igiene ('2' in tipo): usa data reale da PREVENT.DBF.
-            # Per altri tipi: usa ultima_visita dal record paziente.
-            paziente_id = p.get('id', '').strip()
-            igiene_entry = igiene_lookup.get(paziente_id) if '2' in tipo_paz else None
-            if igiene_entry:
-                uv = igiene_entry[0]  # già un oggetto date
-            else:
-                uv = _parse_date(p.get('ultima_visita'))
-            mesi = None
-            raw_mesi = p.get('tempo_richiamo') or p.get('mesi_richiamo')
-            if raw_mesi is not None:
-                try:
-                    mesi = int(raw_mesi)
-                except (TypeError, ValueError):
-                    mesi = None
-
-            data_richiamo_prevista = None
-            mesi_dalla_visita = None
-            scaduto = False
-            giorni_ritardo = 0
-
-            if uv and mesi:
-                data_richiamo_prevista = _add_months(uv, mesi)
-                mesi_dalla_visita = _months_between(uv, today)
-                scaduto = data_richiamo_prevista <= today
-                giorni_ritardo = (today - data_richiamo_prevista).days if scaduto else 0
-
-            if scaduti_solo and not scaduto:
-                continue
-
-            if giorni_ritardo > ritardo_max_giorni:
-                continue
-
-            # Decodifica multi-carattere: "21" → ["Igiene", "Generico"]
-            tipi_nomi = [TIPO_RICHIAMI[c] for c in tipo_paz if c in TIPO_RICHIAMI]
-
-            result.append({
-                'id':                     p.get('id'),
-                'nome':                   p.get('nome', '').strip(),
-                'cellulare':              cellulare,
-                'telefono':               p.get('telefono', '').strip(),
-                'sesso':                  p.get('sesso', '').strip(),
-                'data_nascita':           p.get('data_nascita'),
-                'tipo_richiamo':          tipo_paz,
-                'tipo_richiamo_nomi':     tipi_nomi,
-                'mesi_richiamo':          mesi,
-                'ultima_visita':          p.get('ultima_visita'),
-                'data_richiamo_prevista': data_richiamo_prevista.isoformat() if data_richiamo_prevista else None,
-                'mesi_dalla_visita':      mesi_dalla_visita,
-                'scaduto':                scaduto,
-                'giorni_ritardo':         giorni_ritardo,
-            })
-
-        # Ordine: più in ritardo prima
-        result.sort(key=lambda x: x['giorni_ritardo'], reverse=True)
-
-        if limit:
-            result = result[:limit]
+        result = _seleziona_pazienti_da_richiamare(
+            filtro=filtro,
+            tipo_filtro=tipo_filtro,
+            eta_max=eta_max,
+            solo_cellulare=solo_cellulare,
+            scaduti_solo=scaduti_solo,
+            ritardo_max_giorni=ritardo_max_giorni,
+            limit=limit,
+        )
 
         return format_response({
             'pazienti': result,
@@ -772,27 +659,17 @@ def get_slot_per_paziente(db_code: str):
 
         if '2' in tipo_richiamo:
             operatore_id, ultima_data = trova_ultimo_igienista(db_code)
-
-            if operatore_id == 2:
-                operatori = [2]
-                operatore_suggerito = 'lara'
-            elif operatore_id == 5:
-                operatori = [5]
-                operatore_suggerito = 'anet'
-            else:
-                operatori = [2, 5]
-                operatore_suggerito = 'entrambe'
-
-            tipo = 'igiene'
-            durata = 50
             ultima_igiene = {'operatore_id': operatore_id, 'data': ultima_data}
         else:
-            operatori = [1]
-            operatore_suggerito = 'nicola'
-            tipo = 'altro'
-            durata = 30
+            operatore_id = None
             ultima_igiene = None
 
+        profilo = profilo_slot_richiamo(tipo_richiamo, operatore_id)
+        operatori = profilo['operatori']
+        operatore_suggerito = profilo['operatore_suggerito']
+        tipo = profilo['tipo']
+        durata = profilo['durata']
+
         slots = []
         for op_id in operatori:
             op_slots = trova_slot_liberi(
@@ -823,6 +700,75 @@ def get_slot_per_paziente(db_code: str):
         return format_response({'success': False, 'error': str(e)}), 500
 
 
+@richiami_v2_bp.route('/richiami/slot-batch', methods=['POST'])
+def get_slot_batch():
+    """
+    Propone slot liberi per piu' pazienti in una sola chiamata, senza conflitti
+    tra le proposte (assegnazione greedy, ordine = priorita').
+
+    Body JSON:
+        pazienti          : lista di DB_CODE (in ordine di priorita')
+        tutti_in_scadenza : bool — in alternativa, tutti i pazienti da richiamare
+                            con richiamo previsto entro fine mese (piu' in ritardo prima)
+        filtro / tipo     : filtri come in pazienti-da-richiamare (solo con tutti_in_scadenza)
+        solo_cellulare    : bool (default true, solo con tutti_in_scadenza)
+        giorni_avanti     : int (default 14)
+        alternative       : int (default 0) — slot alternativi non riservati per paziente
+        limit             : int — numero massimo di pazienti
+
+    Auth: X-API-Key o JWT.
+    """
+    _check_auth()
+
+    data = request.get_json(silent=True) or {}
+
+    try:
+        giorni_avanti = parse_non_negative_int(data, 'giorni_avanti', 14)
+        alternative = parse_non_negative_int(data, 'alternative', 0)
+        limit = parse_non_negative_int(data, 'limit')
+
+        non_trovati = []
+        if data.get('tutti_in_scadenza'):
+            filtro = (data.get('filtro') or '').lower().strip()
+            today = date.today()
+            pazienti = _seleziona_pazienti_da_richiamare(
+                filtro=filtro,
+                tipo_filtro=(data.get('tipo') or '').strip() or _FILTRO_TO_TIPO.get(filtro),
+                solo_cellulare=bool(data.get('solo_cellulare', True)),
+                entro=_add_months(today.replace(day=1), 1) - timedelta(days=1),
+            )
+        else:
+            codici = data.get('pazienti')
+            if not isinstance(codici, list) or not codici:
+                raise ValidationError("Specificare 'pazienti' (lista di DB_CODE) oppure 'tutti_in_scadenza'")
+            service = PazientiService(g.database_manager)
+            pazienti = []
+            for db_code in codici:
+                res = service.get_paziente_by_id(str(db_code))
+                if res.get('success'):
+                    pazienti.append(res['data'])
+                else:
+                    non_trovati.append(db_code)
+
+        if limit:
+            pazienti = pazienti[:limit]
+
+        assegnazioni = pianifica_slot_batch(pazienti, giorni_avanti=giorni_avanti, alternative=alternative)
+
+        return format_response({
+            'assegnazioni': assegnazioni,
+            'count': len(assegnazioni),
+            'senza_slot': sum(1 for a in assegnazioni if a['slot'] is None),
+            'non_trovati': non_trovati,
+        })
+
+    except ValidationError as e:
+        return format_response({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f'Errore get_slot_batch: {e}', exc_info=True)
+        return format_response({'success': False, 'error': str(e)}), 500
+
+
 # Error handlers for the blueprint
 @richiami_v2_bp.errorhandler(404)
 def handle_not_found(e):
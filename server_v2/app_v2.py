@@ -674,7 +674,10 @@ def register_health_check(app: Flask) -> None:
                 'performance': {
                     'connections_created': stats.get('connections_created', 0),
                     'queries_executed': stats.get('queries_executed', 0),
-                    'transactions_committed': stats.get('transactions_committed', 0)
+                    'transactions_committed': stats.get('transactions_committed', 0),
+                    'thread_connections': stats.get('thread_connections', 0),
+                    'callers': stats.get('callers', {}),
+                    'endpoints': stats.get('endpoints', {})
                 }
             }), 200
             
@@ -0,0 +1,130 @@
+"""
+Benchmark: statistiche del calendario (get_stats_aggregates) dal cubo rollup.
+
+Genera un APPUNTA.DBF sintetico e confronta, per /calendar/stats/year,
+/stats/first-visits e /stats/summary (tre chiamate per caricamento della dashboard):
+
+- scan:    decodifica di DATA e TIPO da APPUNTA ad ogni chiamata (versione precedente)
+- cube:    AppointmentRollupCube.monthly_stats sulle celle precalcolate
+- cold:    costruzione del cubo dal mirror (prima richiesta dopo l'avvio)
+- update:  richiesta dopo la modifica di un record del DBF
+
+Verifica anche che i risultati coincidano.
+
+Esegui dalla directory server_v2:
+  python -m benchmarks.bench_appointment_rollup
+  python -m benchmarks.bench_appointment_rollup --records 500000
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import services.appointment_rollup as appointment_rollup
+from benchmarks.synthetic_dbf import write_synthetic_appunta
+from core.constants_v2 import COLONNE
+from services.appointment_rollup import AppointmentRollupCube
+from services.dbf_mirror import DbfMirror
+from utils.dbf_utils import DbfRecordDecoder
+
+
+def scan_stats(path, years, ytd_limit=None):
+    """Versione precedente di get_stats_aggregates."""
+    limit_month, limit_day = ytd_limit if ytd_limit else (13, 32)
+    col = COLONNE['appuntamenti']
+    with DbfRecordDecoder(path) as decoder:
+        dates = decoder.column(col['data'])
+        record_years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        rows = np.flatnonzero(decoder.live_mask() & ~np.isnat(dates) & np.isin(record_years, years))
+        tipi = np.char.strip(decoder.column(col['tipo'], rows))
+    dates, record_years = dates[rows], record_years[rows]
+    months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    days = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+    first_visits = tipi == b'V'
+    within_ytd = first_visits & ((months < limit_month) | ((months == limit_month) & (days <= limit_day)))
+    result = {}
+    for year in years:
+        in_year = record_years == year
+        counts = np.bincount(months[in_year], minlength=13)
+        firsts = np.bincount(months[in_year & first_visits], minlength=13)
+        firsts_ytd = np.bincount(months[in_year & within_ytd], minlength=13)
+        result[str(year)] = [{'month': m, 'count': int(counts[m]), 'first_visits': int(firsts[m]),
+                              'first_visits_ytd': int(firsts_ytd[m])} for m in range(1, 13)]
+    return result
+
+
+def _dashboard(fn, years, ytd_limit):
+    # year, first-visits e summary
+    return [fn(years, None), fn(years, ytd_limit), fn(years[-1:], None)]
+
+
+def _best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, result
+
+
+def _touch_record(path, record, offset_in_record):
+    with open(path, 'r+b') as f:
+        header = f.read(12)
+        header_length = int.from_bytes(header[8:10], 'little')
+        record_length = int.from_bytes(header[10:12], 'little')
+        f.seek(header_length + record * record_length + offset_in_record)
+        f.write(b'20250101')
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    years = [2023, 2024, 2025]
+    ytd_limit = (datetime.date.today().month, datetime.date.today().day)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'APPUNTA.DBF')
+        write_synthetic_appunta(path, args.records)
+        mirror = DbfMirror(mirror_dir=os.path.join(tmp, 'mirror'), stat_interval=0)
+        appointment_rollup.get_dbf_mirror = lambda: mirror
+        mirror.table_at(path)
+
+        cube = AppointmentRollupCube(path)
+        start = time.perf_counter()
+        cube.monthly_stats(years)
+        cold_ms = (time.perf_counter() - start) * 1000
+
+        scan_ms, expected = _best_of(args.repeat, lambda: _dashboard(lambda y, l: scan_stats(path, y, l), years, ytd_limit))
+        cube_ms, actual = _best_of(args.repeat, lambda: _dashboard(cube.monthly_stats, years, ytd_limit))
+        assert actual == expected, "risultati diversi tra scan e cubo"
+
+        # Prima colonna dopo il flag di cancellazione: la data
+        _touch_record(path, args.records // 2, 1)
+        start = time.perf_counter()
+        updated = _dashboard(cube.monthly_stats, years, ytd_limit)
+        update_ms = (time.perf_counter() - start) * 1000
+        assert updated == _dashboard(lambda y, l: scan_stats(path, y, l), years, ytd_limit)
+
+        print(f"APPUNTA sintetico: {args.records} record, dashboard = 3 chiamate")
+        print(f"{'versione':<10}{'ms':>10}")
+        for name, ms in (('scan', scan_ms), ('cube', cube_ms), ('cold', cold_ms), ('update', update_ms)):
+            print(f"{name:<10}{ms:>10.1f}")
+        status = cube.get_status()
+        print(f"celle: {status['cells']}, righe incluse: {status['rows_included']}, "
+              f"build {status['last_build_ms']} ms, update {status['last_update_ms']} ms")
+
+
+if __name__ == '__main__':
+    main()
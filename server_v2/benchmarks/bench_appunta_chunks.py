@@ -0,0 +1,75 @@
+"""
+Benchmark: lettura parallela a chunk di APPUNTA.DBF (thread vs processi).
+
+Genera un APPUNTA.DBF sintetico e misura DBFOptimizedReader._read_appointments_parallel_chunks
+al variare del numero di worker. Ogni chunk mappa solo i propri byte
+(header_length + i * record_length), quindi il lavoro totale resta lineare.
+
+Esegui dalla directory server_v2:
+  python -m benchmarks.bench_appunta_chunks
+  python -m benchmarks.bench_appunta_chunks --records 500000 --workers 1 2 4 8 --modes process
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_dbf import write_synthetic_appunta
+from utils.dbf_utils import DBFOptimizedReader
+
+
+def _best_of(repeat, fn):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run(path, workers, modes, month, year, chunk_size, repeat):
+    print(f"{'mode':<8} {'workers':>7} {'best ms':>10} {'speedup':>8} {'appuntamenti':>13}")
+    for mode in modes:
+        baseline = None
+        for count in workers:
+            reader = DBFOptimizedReader(parallel_mode=mode, max_workers=count)
+            read = lambda: reader._read_appointments_parallel_chunks(path, {}, month, year, None, chunk_size)
+            try:
+                read()  # warm-up: avvio del pool e page cache
+                best, appointments = _best_of(repeat, read)
+            finally:
+                reader.cleanup()
+            baseline = baseline or best
+            print(f"{mode:<8} {count:>7} {best * 1000:>10.1f} {baseline / best:>7.2f}x {len(appointments):>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=500_000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--modes', nargs='+', choices=['thread', 'process'], default=['thread', 'process'])
+    parser.add_argument('--chunk-size', type=int, default=25_000)
+    parser.add_argument('--month', type=int, default=3)
+    parser.add_argument('--year', type=int, default=2023)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--path', help='Usa/crea il file DBF a questo percorso invece di un file temporaneo')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path or os.path.join(tmp, 'APPUNTA.DBF')
+        if not os.path.exists(path):
+            start = time.perf_counter()
+            write_synthetic_appunta(path, args.records)
+            print(f"APPUNTA.DBF sintetico: {args.records} record, "
+                  f"{os.path.getsize(path) / 1024 / 1024:.1f} MB in {time.perf_counter() - start:.1f}s")
+        print(f"CPU disponibili: {os.cpu_count()}, chunk_size: {args.chunk_size}\n")
+        run(path, args.workers, args.modes, args.month, args.year, args.chunk_size, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Benchmark: classificazione delle righe fattura (MaterialiMigrationService).
+
+Catalogo sintetico di righe fornitore (descrizioni con marchi, misure, codici
+e parole chiave dentali/escluse) e pattern esistenti (materiali già
+classificati). Confronta:
+
+- classify legacy:  loop categorie x parole chiave con test `in` (versione precedente)
+- classify engine:  KeywordClassifier (regex a trie, una scansione)
+- match legacy:     _find_pattern_match con pulizia regex e similarità su tutti i pattern
+- match engine:     MaterialPatternIndex (pattern puliti una volta, candidati top-k da token/trigrammi)
+
+Verifica che la classificazione coincida e riporta quante righe del campione
+ottengono lo stesso pattern (i candidati top-k possono escludere pattern a
+pari merito). La cache delle classificazioni è
+disattivata per misurare il costo reale di ogni riga.
+
+Esegui dalla directory server_v2:
+  python -m benchmarks.bench_material_classifier
+  python -m benchmarks.bench_material_classifier --lines 100000 --patterns 2000 --legacy-lines 5000
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from services import material_classifier
+from services.materiali_migration_service import MaterialiMigrationService
+
+BRANDS = ['reciproc', 'celtra', 'sdr', 'dentsply', 'kerr', 'ivoclar', 'gc', 'coltene', 'ultradent', 'voco',
+          'septodont', 'hu-friedy', 'komet', 'mani', 'vdw', 'protaper', 'waveone', 'tetric', 'filtek', 'optibond']
+NOUNS = ['composito', 'flow', 'bulk fill', 'paper points', 'gutta percha', 'files', 'lima', 'fresa', 'bur',
+         'guanti nitrile', 'mascherina ffp2', 'sutura', 'ago', 'carpule articaina', 'alginato', 'silicone',
+         'cemento', 'matrice', 'cuneo', 'perno fibra', 'filo retrazione', 'sigillante', 'pasta profilassi',
+         'clorexidina', 'spazzolino', 'busta sterilizzazione', 'bracket', 'archwire', 'abutment', 'blocchetti',
+         'trasporto', 'spese di spedizione', 'toner stampante', 'caffè', 'imballo', 'etching gel', 'primer']
+SUFFIXES = ['', ' 2ml', ' 4x2gr', ' A3', ' A2', ' 25mm', ' 6st', ' refill', ' sterile', ' 10%', ' r25', ' 100pz',
+            ' conf. 50', ' blue', ' taglia m', ' 021', ' 30.04']
+
+
+def synthetic_lines(count: int, seed: int = 3) -> list:
+    rng = np.random.default_rng(seed)
+    brands = rng.choice(BRANDS, count)
+    nouns = rng.choice(NOUNS, count)
+    suffixes = rng.choice(SUFFIXES, count)
+    codes = rng.integers(100, 99999, count)
+    return [f"{b.upper()} {n.upper()}{s.upper()} COD.{c}" for b, n, s, c in zip(brands, nouns, suffixes, codes)]
+
+
+def synthetic_patterns(count: int, seed: int = 5) -> list:
+    rng = np.random.default_rng(seed)
+    branche = [('ENDODONZIA', 'STRUMENTI MANUALI'), ('ENDODONZIA', 'MATERIALI'), ('CONSERVATIVA', 'COMPOSITI'),
+               ('CHIRURGIA', 'SUTURE'), ('PROTESI', 'IMPRONTE'), ('IGIENE', 'MONOUSO')]
+    patterns = []
+    for i, line in enumerate(synthetic_lines(count, seed)):
+        branca, sottoconto = branche[int(rng.integers(len(branche)))]
+        patterns.append({'nome': line, 'fornitoreid': f'F{i % 50}', 'classification': {
+            'contoid': 1, 'brancaid': 1, 'sottocontoid': 1, 'contonome': 'MATERIALI',
+            'brancanome': branca, 'sottocontonome': sottoconto}})
+    return patterns
+
+
+# -----------------------------------------------------------------------------
+# Versione precedente (riferimento)
+# -----------------------------------------------------------------------------
+
+def legacy_classify(service, descrizione: str):
+    descrizione_lower = descrizione.lower().strip()
+    for exclude_word in service.exclude_keywords:
+        if exclude_word in descrizione_lower:
+            return ('non_dental', 0)
+    best_match = ('unknown', 0)
+    for categoria, keywords in service.dental_keywords.items():
+        confidence = matches = exact_matches = 0
+        for keyword in keywords:
+            if keyword in descrizione_lower:
+                matches += 1
+                if keyword == descrizione_lower:
+                    confidence += service.WEIGHT_EXACT_MATCH
+                    exact_matches += 1
+                else:
+                    confidence += min(service.WEIGHT_PARTIAL_MATCH, len(keyword) * 5)
+            elif ' ' in keyword:
+                if all(word in descrizione_lower for word in keyword.split()):
+                    matches += 1
+                    confidence += min(service.WEIGHT_PHRASE_MATCH, len(keyword) * 4)
+        if matches > 1:
+            confidence += matches * service.WEIGHT_MULTIPLE_MATCHES
+        if exact_matches > 0:
+            confidence += exact_matches * service.WEIGHT_EXACT_BONUS
+        if len(descrizione_lower) < 5:
+            confidence *= 0.5
+        if confidence > best_match[1]:
+            best_match = (categoria, confidence)
+    if best_match[1] < service.CONFIDENCE_THRESHOLD_UNKNOWN:
+        best_match = ('unknown', best_match[1])
+    return best_match
+
+
+def legacy_clean(name: str) -> str:
+    if not name:
+        return ""
+    cleaned = str(name).lower().strip()
+    cleaned = re.sub(r'[^\w\s]', ' ', cleaned)
+    cleaned = re.sub(r'\b\d+[x×]\d+\b', '', cleaned)
+    cleaned = re.sub(r'\b[a-z]\d+\b', '', cleaned)
+    cleaned = re.sub(r'\b\d+st\b', '', cleaned)
+    cleaned = re.sub(r'\b\d+%\b', '', cleaned)
+    cleaned = re.sub(r'\b\d+ml\b', '', cleaned)
+    cleaned = re.sub(r'\b\d+cc\b', '', cleaned)
+    cleaned = re.sub(r'\b\d+gr\b', '', cleaned)
+    cleaned = re.sub(r'\b\d+mg\b', '', cleaned)
+    cleaned = re.sub(r'\b(lt|refill|sterile|steril|r\d+|6x|sterile)\b', '', cleaned)
+    cleaned = re.sub(r'\s+', ' ', cleaned)
+    return cleaned.strip()
+
+
+def legacy_match(service, descrizione: str, patterns: list):
+    """Algoritmo generale di _find_pattern_match (senza le regole RECIPROC/FILES)."""
+    descrizione_clean = legacy_clean(descrizione)
+    best_match, best_score = None, 0
+    for pattern in patterns:
+        similarity = service._calculate_similarity(descrizione_clean, legacy_clean(pattern['nome']))
+        if similarity > best_score and similarity >= 0.5:
+            best_score = similarity
+            best_match = {'classification': pattern['classification'], 'confidence': int(similarity * 100),
+                          'matched_pattern': pattern['nome']}
+    return best_match
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=100_000)
+    parser.add_argument('--patterns', type=int, default=2_000)
+    parser.add_argument('--legacy-lines', type=int, default=2_000,
+                        help='Righe su cui misurare (ed estrapolare) il matching legacy, che è quadratico')
+    args = parser.parse_args()
+
+    service = MaterialiMigrationService(None)
+    lines = synthetic_lines(args.lines)
+    patterns = synthetic_patterns(args.patterns)
+    # Regole RECIPROC/FILES escluse dal confronto: con il catalogo sintetico catturerebbero molte righe
+    general = [line for line in lines if 'RECIPROC' not in line and 'FILES' not in line]
+
+    legacy_cls, expected = _timed(lambda: [legacy_classify(service, line) for line in lines])
+    engine_cls, got = _timed(lambda: [service.keyword_classifier.classify(line.lower().strip()) for line in lines])
+    assert got == expected, "classificazione diversa dalla versione precedente"
+
+    sample = general[:args.legacy_lines]
+    legacy_ms, expected = _timed(lambda: [legacy_match(service, line, patterns) for line in sample])
+    material_classifier.clean_material_name.cache_clear()
+    build_ms, index = _timed(lambda: service._build_pattern_index(patterns))
+    sample_ms, got = _timed(lambda: [index.match(line) for line in sample])
+    agree = sum((g and g['matched_pattern']) == (e and e['matched_pattern']) for g, e in zip(got, expected))
+    engine_ms, _ = _timed(lambda: [index.match(line) for line in general])
+
+    per_line_legacy = legacy_ms / len(sample)
+    print(f"catalogo: {len(lines)} righe, {len(patterns)} pattern")
+    print(f"{'':<18}{'legacy ms':>12}{'engine ms':>12}{'speedup':>10}")
+    print(f"{'classify':<18}{legacy_cls:>12.0f}{engine_cls:>12.0f}{legacy_cls / engine_cls:>9.1f}x")
+    print(f"{'match (sample)':<18}{legacy_ms:>12.0f}{sample_ms:>12.0f}{legacy_ms / sample_ms:>9.1f}x")
+    print(f"{'match (catalogo)':<18}{per_line_legacy * len(general):>11.0f}*{engine_ms:>12.0f}"
+          f"{per_line_legacy * len(general) / engine_ms:>9.1f}x")
+    print(f"indice pattern: {build_ms:.0f} ms, candidati medi per riga: "
+          f"{index.stats['candidates'] / max(index.stats['lookups'], 1):.1f} su {len(patterns)}")
+    print(f"match uguale alla versione precedente: {agree}/{len(sample)} righe del campione")
+    print("* stimato dal campione")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""
+Benchmark: /richiami/pazienti-da-richiamare (selezione pazienti da richiamare).
+
+PAZIENTI.DBF sintetico, tabella richiami SQLite con tipo/mesi per buona parte
+dei pazienti e lookup ultima igiene precalcolato (uguale per le due versioni,
+quindi il costo di build_last_igiene_lookup ad ogni richiesta della versione
+precedente non e' incluso). Confronta per ogni filtro usato da n8n:
+
+- legacy:  dict per tutti i pazienti + merge richiami + calcolo scadenze ad
+           ogni richiesta (versione precedente di _seleziona_pazienti_da_richiamare)
+- index:   RecallIndex.select sulla tabella materializzata
+- cold:    costruzione della tabella (prima richiesta)
+- update:  richiesta dopo la modifica di una voce della tabella richiami
+
+Verifica anche che i risultati coincidano.
+
+Esegui dalla directory server_v2:
+  python -m benchmarks.bench_recall_index
+  python -m benchmarks.bench_recall_index --patients 20000 100000
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import services.recall_index as recall_index
+from benchmarks.synthetic_dbf import write_dbf
+from core.constants_v2 import TIPO_RICHIAMI
+from services.dbf_mirror import DbfMirror
+from services.pazienti_service import PazientiService
+from services.recall_index import RecallIndex, add_months, months_between, parse_date
+
+FILTERS = [
+    ('tutti', {}),
+    ('igiene', {'tipo_filtro': '2'}),
+    ('impianti', {'tipo_filtro': '5'}),
+    ('bambini', {'filtro': 'bambini'}),
+    ('donne', {'filtro': 'donne'}),
+    ('scaduti 90gg', {'scaduti_solo': True, 'ritardo_max_giorni': 90}),
+]
+
+
+def write_synthetic_sources(pazienti_path: str, db_path: str, patients: int, seed: int = 17) -> dict:
+    rng = np.random.default_rng(seed)
+    today = np.datetime64(datetime.date.today(), 'D')
+    codes = np.char.add('P', np.arange(patients).astype(str))
+    births = today - rng.integers(365, 365 * 90, patients).astype('timedelta64[D]')
+    visits = today - rng.integers(0, 900, patients).astype('timedelta64[D]')
+    tipi = rng.choice(['1', '2', '21', '3', '4', '5', '6', '25'], patients)
+    fields = [('DB_CODE', 'C', 8, 0), ('DB_PANOME', 'C', 40, 0), ('DB_PADANAS', 'D', 8, 0),
+              ('DB_PASESSO', 'C', 1, 0), ('DB_PATELEF', 'C', 15, 0), ('DB_PACELLU', 'C', 15, 0),
+              ('DB_PAULTVI', 'D', 8, 0), ('DB_PARIMOT', 'C', 6, 0), ('DB_PARICHI', 'C', 1, 0)]
+    columns = {
+        'DB_CODE': codes,
+        'DB_PANOME': np.char.add('PAZIENTE ', codes),
+        'DB_PADANAS': np.char.replace(births.astype(str), '-', ''),
+        'DB_PASESSO': rng.choice(['M', 'F'], patients),
+        'DB_PATELEF': np.where(rng.random(patients) < 0.5, '0555123456', ''),
+        'DB_PACELLU': np.where(rng.random(patients) < 0.8, np.char.add('333', codes), ''),
+        'DB_PAULTVI': np.char.replace(visits.astype(str), '-', ''),
+        'DB_PARIMOT': tipi,
+        'DB_PARICHI': np.where(rng.random(patients) < 0.7, 'S', 'N'),
+    }
+    write_dbf(pazienti_path, fields, columns, rng.random(patients) < 0.01)
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE richiami (id INTEGER PRIMARY KEY AUTOINCREMENT, paziente_id TEXT, nome TEXT, "
+                 "data_ultima_visita TEXT, data_richiamo TEXT, richiamato_il TEXT, tipo_richiamo TEXT, "
+                 "tempo_richiamo INTEGER, da_richiamare TEXT, sms_sent BOOLEAN DEFAULT 0)")
+    with_recall = np.flatnonzero(rng.random(patients) < 0.6)
+    conn.executemany(
+        "INSERT INTO richiami (paziente_id, nome, tipo_richiamo, tempo_richiamo, da_richiamare) VALUES (?, ?, ?, ?, ?)",
+        [(codes[i], columns['DB_PANOME'][i], tipi[i], int(rng.choice([6, 12])), 'S') for i in with_recall.tolist()])
+    conn.commit()
+    conn.close()
+
+    igiene = today - rng.integers(0, 600, patients).astype('timedelta64[D]')
+    return {codes[i]: (igiene[i].item(), 2) for i in np.flatnonzero(rng.random(patients) < 0.3).tolist()}
+
+
+def legacy_select(table, db_path: str, igiene_lookup: dict, today: datetime.date, filtro: str = '',
+                  tipo_filtro=None, eta_max: int = 16, solo_cellulare: bool = True,
+                  scaduti_solo: bool = False, ritardo_max_giorni: int = 3650) -> list:
+    """Versione precedente: lista completa dal DBF, merge richiami e loop Python."""
+    service = PazientiService(None)
+    flags = service._list_flags(table)
+    pazienti = service._read_pazienti_from_mirror(table, np.flatnonzero(flags['listed']))
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    richiami = {row['paziente_id']: dict(row) for row in conn.execute(
+        "SELECT paziente_id, data_ultima_visita, tipo_richiamo, tempo_richiamo, da_richiamare FROM richiami")}
+    conn.close()
+    for p in pazienti:
+        richiamo = richiami.get(p['id'])
+        if richiamo:
+            p['tipo_richiamo'] = richiamo['tipo_richiamo']
+            p['tempo_richiamo'] = richiamo['tempo_richiamo']
+            p['da_richiamare'] = richiamo['da_richiamare']
+            if richiamo['data_ultima_visita']:
+                p['ultima_visita'] = richiamo['data_ultima_visita']
+
+    result = []
+    for p in pazienti:
+        if p.get('da_richiamare', '').strip().upper() != 'S':
+            continue
+        tipo_paz = p.get('tipo_richiamo', '').strip()
+        if tipo_filtro and tipo_filtro not in tipo_paz:
+            continue
+        if filtro == 'donne' and p.get('sesso', '').strip().upper() != 'F':
+            continue
+        if filtro == 'bambini':
+            dn = parse_date(p.get('data_nascita'))
+            if not dn or months_between(dn, today) // 12 > eta_max:
+                continue
+        cellulare = p.get('cellulare', '').strip()
+        if solo_cellulare and not cellulare:
+            continue
+        igiene_entry = igiene_lookup.get(p.get('id', '').strip()) if '2' in tipo_paz else None
+        uv = igiene_entry[0] if igiene_entry else parse_date(p.get('ultima_visita'))
+        mesi = None
+        raw_mesi = p.get('tempo_richiamo') or p.get('mesi_richiamo')
+        if raw_mesi is not None:
+            try:
+                mesi = int(raw_mesi)
+            except (TypeError, ValueError):
+                mesi = None
+        data_richiamo_prevista = mesi_dalla_visita = None
+        scaduto, giorni_ritardo = False, 0
+        if uv and mesi:
+            data_richiamo_prevista = add_months(uv, mesi)
+            mesi_dalla_visita = months_between(uv, today)
+            scaduto = data_richiamo_prevista <= today
+            giorni_ritardo = (today - data_richiamo_prevista).days if scaduto else 0
+        if scaduti_solo and not scaduto:
+            continue
+        if giorni_ritardo > ritardo_max_giorni:
+            continue
+        result.append({
+            'id': p.get('id'), 'nome': p.get('nome', '').strip(), 'cellulare': cellulare,
+            'telefono': p.get('telefono', '').strip(), 'sesso': p.get('sesso', '').strip(),
+            'data_nascita': p.get('data_nascita'), 'tipo_richiamo': tipo_paz,
+            'tipo_richiamo_nomi': [TIPO_RICHIAMI[c] for c in tipo_paz if c in TIPO_RICHIAMI],
+            'mesi_richiamo': mesi, 'ultima_visita': p.get('ultima_visita'),
+            'data_richiamo_prevista': data_richiamo_prevista.isoformat() if data_richiamo_prevista else None,
+            'mesi_dalla_visita': mesi_dalla_visita, 'scaduto': scaduto, 'giorni_ritardo': giorni_ritardo,
+        })
+    result.sort(key=lambda x: x['giorni_ritardo'], reverse=True)
+    return result
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(patients: int, tmp: str) -> None:
+    pazienti_path = os.path.join(tmp, f'PAZIENTI_{patients}.DBF')
+    db_path = os.path.join(tmp, f'richiami_{patients}.db')
+    igiene = write_synthetic_sources(pazienti_path, db_path, patients)
+
+    mirror = DbfMirror(mirror_dir=os.path.join(tmp, f'mirror_{patients}'), stat_interval=0)
+    recall_index.get_dbf_mirror = lambda: mirror
+    recall_index.build_last_igiene_lookup = lambda: igiene
+    recall_index._igiene_version = lambda: 1
+    table = mirror.table_at(pazienti_path)
+    today = datetime.date.today()
+
+    index = RecallIndex(pazienti_path, richiami_db_path=db_path)
+    cold, _ = _timed(lambda: index.select(today=today))
+    print(f"\n{patients} pazienti, {index.get_status()['da_richiamare']} da richiamare, tabella in {cold:.0f} ms")
+    print(f"{'filtro':<14}{'legacy ms':>11}{'index ms':>10}{'risultati':>11}")
+    for name, kwargs in FILTERS:
+        legacy_ms, expected = _timed(lambda: legacy_select(table, db_path, igiene, today, **kwargs))
+        index_ms = min(_timed(lambda: index.select(today=today, **kwargs))[0] for _ in range(5))
+        assert index.select(today=today, **kwargs) == expected, f"risultato diverso per il filtro {name}"
+        print(f"{name:<14}{legacy_ms:>11.0f}{index_ms:>10.2f}{len(expected):>11}")
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE richiami SET tempo_richiamo = 3 WHERE id = 1")
+    conn.commit()
+    conn.close()
+    update, _ = _timed(lambda: index.select(today=today, **dict(FILTERS)['igiene']))
+    print(f"richiesta dopo modifica tabella richiami: {update:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, nargs='+', default=[20_000, 100_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for patients in args.patients:
+            run(patients, tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Benchmark: selezione dei candidati reminder (get_upcoming_appointments).
+
+Confronta la scansione completa di APPUNTA.DBF + PAZIENTI.DBF con la libreria
+dbf (comportamento precedente) con la lettura del bucket del giorno
+dall'AppointmentDayIndex e dei contatti dal PatientIndex:
+
+- legacy:       scansione completa ad ogni esecuzione del job
+- index cold:   prima esecuzione (mirror + costruzione degli indici)
+- 24h / 2h:     esecuzioni successive, file invariato
+- after change: esecuzione dopo la modifica di un record (aggiornamento incrementale)
+
+Esegui dalla directory server_v2:
+  python -m benchmarks.bench_reminder_selection
+  python -m benchmarks.bench_reminder_selection --records 10000 100000 1000000 --legacy-max 100000
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbf
+import numpy as np
+
+import services.appointment_reminder_service as reminders
+import services.dbf_mirror as dbf_mirror
+import services.reminder_dispatch_engine as dispatch_engine
+from benchmarks.synthetic_dbf import write_dbf, write_synthetic_appunta
+from core.constants_v2 import COLONNE
+from services.dbf_mirror import DbfMirror
+from services.patient_index import PatientIndex
+
+PATIENTS = 20_000
+
+
+class _Engine:
+    """Config di invio fissa: tutti i giorni abilitati, soglia mattina alle 13."""
+
+    def should_send_today(self, weekday):
+        return True
+
+    def get_morning_threshold_hour(self, day_of_week):
+        return 13
+
+
+def write_synthetic_pazienti(path: str, seed: int = 7) -> None:
+    rng = np.random.default_rng(seed)
+    col = COLONNE['pazienti']
+    fields = [(col['id'], 'C', 8, 0), (col['nome'], 'C', 30, 0),
+              (col['cellulare'], 'C', 15, 0), (col['telefono'], 'C', 15, 0)]
+    ids = np.char.add('P', np.arange(1, PATIENTS).astype(str))
+    columns = {
+        col['id']: ids,
+        col['nome']: np.char.add('PAZIENTE ', ids),
+        col['cellulare']: np.char.add('333', rng.integers(1_000_000, 9_999_999, ids.size).astype(str)),
+        col['telefono']: np.full(ids.size, ''),
+    }
+    write_dbf(path, fields, columns, np.zeros(ids.size, dtype=bool))
+
+
+def legacy_scan(ap_path: str, paz_path: str, target: datetime.date) -> int:
+    """Scansione completa come nella versione precedente di get_upcoming_appointments (24h)."""
+    found = set()
+    table = dbf.Table(ap_path, codepage='cp1252')
+    table.open(dbf.READ_ONLY)
+    for record in table:
+        if dbf.is_deleted(record):
+            continue
+        try:
+            ap_date = record['DB_APDATA']
+            paz_id = str(record['DB_APPACOD']).strip()
+            if not paz_id:
+                continue
+            ora = reminders._ora_fmt(str(record['DB_APOREIN']).strip())
+            datetime.datetime.combine(ap_date, datetime.datetime.strptime(ora, '%H:%M').time())
+            if ap_date == target:
+                found.add(paz_id)
+        except Exception:
+            continue
+    table.close()
+    table = dbf.Table(paz_path, codepage='cp1252')
+    table.open(dbf.READ_ONLY)
+    matched = sum(1 for record in table if str(record['DB_CODE']).strip() in found)
+    table.close()
+    return matched
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(records: int, tmp: str, legacy_max: int) -> None:
+    today = datetime.datetime.now(reminders.ROME_TZ).date()
+    ap_path = os.path.join(tmp, f'APPUNTA_{records}.DBF')
+    paz_path = os.path.join(tmp, 'PAZIENTI.DBF')
+    days = 2190
+    start = np.datetime64(today, 'D') - np.timedelta64(days // 2, 'D')
+    write_synthetic_appunta(ap_path, records, start=str(start), days=days)
+    if not os.path.exists(paz_path):
+        write_synthetic_pazienti(paz_path)
+
+    paths = {'APPUNTA': ap_path, 'pazienti': paz_path}
+    reminders._dbf_path = lambda name: paths[name]
+    dbf_mirror._dbf_mirror = DbfMirror(mirror_dir=os.path.join(tmp, f'mirror_{records}'), stat_interval=0)
+    patient_indexes = {}
+    reminders.get_patient_index = lambda path: patient_indexes.setdefault(
+        path, PatientIndex(path, index_dir=os.path.join(tmp, f'patient_index_{records}')))
+
+    legacy = '-'
+    if records <= legacy_max:
+        legacy = f"{_timed(lambda: legacy_scan(ap_path, paz_path, today + datetime.timedelta(days=1)))[0]:.0f}"
+    cold, rows = _timed(lambda: reminders.get_upcoming_appointments('24h'))
+    warm_24h = min(_timed(lambda: reminders.get_upcoming_appointments('24h'))[0] for _ in range(5))
+    warm_2h = min(_timed(lambda: reminders.get_upcoming_appointments('2h'))[0] for _ in range(5))
+
+    # Modifica di un record (ora di inizio) direttamente nel file
+    with dbf.Table(ap_path, codepage='cp1252') as table:
+        table.open(dbf.READ_WRITE)
+        with table[records // 2] as record:
+            record.db_aporein = 11.3
+    st = os.stat(ap_path)
+    os.utime(ap_path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    changed, _ = _timed(lambda: reminders.get_upcoming_appointments('24h'))
+
+    print(f"{records:>9} {legacy:>11} {cold:>11.0f} {warm_24h:>9.2f} {warm_2h:>9.2f} {changed:>13.1f} {len(rows):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='Numero massimo di record per cui misurare la scansione completa')
+    args = parser.parse_args()
+
+    dispatch_engine._dispatch_engine = _Engine()
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'records':>9} {'legacy ms':>11} {'cold ms':>11} {'24h ms':>9} {'2h ms':>9} "
+              f"{'after chg ms':>13} {'24h rows':>8}")
+        for records in args.records:
+            run(records, tmp, args.legacy_max)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark: lista fatture fornitori (SpeseFornitoriService.get_spese).
+
+Confronta la scansione completa di FORNITOR.DBF + SPESAFOR.DBF con la
+libreria dbf (comportamento precedente: dict per ogni record, filtro, sort e
+solo alla fine la paginazione) con le query sullo SpeseIndex:
+
+- legacy:     prima pagina dell'anno corrente con scansione completa
+- cold:       prima chiamata (mirror + costruzione dell'indice)
+- page:       prima pagina dell'anno, file invariato
+- supplier:   filtro su due fornitori (tutti gli anni)
+- riepilogo:  aggregato per fornitore dell'anno
+
+Esegui dalla directory server_v2:
+  python -m benchmarks.bench_spese_query
+  python -m benchmarks.bench_spese_query --records 10000 100000 --legacy-max 100000
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import dbf
+import numpy as np
+
+import services.spese_index as spese_index
+from benchmarks.synthetic_dbf import write_dbf
+from services.dbf_mirror import DbfMirror
+from services.spese_fornitori_service import SpeseFornitoriService
+
+SUPPLIERS = 800
+
+
+def write_synthetic_spese(spese_path: str, fornitori_path: str, records: int, seed: int = 11) -> None:
+    rng = np.random.default_rng(seed)
+    fields = [('DB_CODE', 'C', 8, 0), ('DB_SPFOCOD', 'C', 8, 0), ('DB_SPDATA', 'D', 8, 0),
+              ('DB_SPNUMER', 'C', 12, 0), ('DB_SPDESCR', 'C', 40, 0), ('DB_SPCOSTO', 'N', 10, 2),
+              ('DB_SPCOIVA', 'N', 10, 2), ('DB_NOTE', 'C', 20, 0)]
+    start = np.datetime64(datetime.date.today(), 'D') - np.timedelta64(3650, 'D')
+    days = start + rng.integers(0, 3650, records).astype('timedelta64[D]')
+    netto = np.round(rng.uniform(10, 2000, records), 2)
+    columns = {
+        'DB_CODE': np.char.add('S', np.arange(records).astype(str)),
+        'DB_SPFOCOD': np.char.add('F', rng.integers(1, SUPPLIERS, records).astype(str)),
+        'DB_SPDATA': np.char.replace(days.astype(str), '-', ''),
+        'DB_SPNUMER': np.char.add('FT/', rng.integers(1, 99999, records).astype(str)),
+        'DB_SPDESCR': np.char.add('MATERIALE ', rng.integers(1, 500, records).astype(str)),
+        'DB_SPCOSTO': np.char.mod('%.2f', netto),
+        'DB_SPCOIVA': np.char.mod('%.2f', np.round(netto * 0.22, 2)),
+        'DB_NOTE': np.full(records, ''),
+    }
+    write_dbf(spese_path, fields, columns, rng.random(records) < 0.01)
+
+    if not os.path.exists(fornitori_path):
+        codes = np.char.add('F', np.arange(1, SUPPLIERS).astype(str))
+        write_dbf(fornitori_path, [('DB_CODE', 'C', 8, 0), ('DB_FONOME', 'C', 40, 0)],
+                  {'DB_CODE': codes, 'DB_FONOME': np.char.add('FORNITORE ', codes)},
+                  np.zeros(codes.size, dtype=bool))
+
+
+def legacy_first_page(spese_path: str, fornitori_path: str, anno: int, per_page: int = 10) -> int:
+    """Scansione completa come nella versione precedente di get_spese."""
+    names = {}
+    with dbf.Table(fornitori_path, codepage='cp1252') as table:
+        for record in table:
+            names[str(record.db_code).strip()] = str(record.db_fonome).strip()
+    rows = []
+    with dbf.Table(spese_path, codepage='cp1252') as table:
+        for record in table:
+            if not record.db_code or not record.db_spdata or record.db_spdata.year != anno:
+                continue
+            code = str(record.db_spfocod).strip()
+            rows.append({'id': record.db_code, 'nome_fornitore': names.get(code, code),
+                         'data_spesa': record.db_spdata, 'numero_documento': record.db_spnumer,
+                         'descrizione': record.db_spdescr, 'costo_netto': float(record.db_spcosto),
+                         'costo_iva': float(record.db_spcoiva), 'note': record.db_note})
+    rows.sort(key=lambda x: (x['nome_fornitore'] or '').lower())
+    rows.sort(key=lambda x: x['data_spesa'], reverse=True)
+    return len(rows[:per_page])
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def run(records: int, tmp: str, legacy_max: int) -> None:
+    spese_path = os.path.join(tmp, f'SPESAFOR_{records}.DBF')
+    fornitori_path = os.path.join(tmp, 'FORNITOR.DBF')
+    write_synthetic_spese(spese_path, fornitori_path, records)
+
+    spese_index.get_dbf_mirror = lambda mirror=DbfMirror(mirror_dir=os.path.join(tmp, f'mirror_{records}'),
+                                                          stat_interval=0): mirror
+    service = SpeseFornitoriService(None)
+    service._get_spese_dbf_path = lambda: spese_path
+    service._get_fornitori_dbf_path = lambda: fornitori_path
+    anno = datetime.date.today().year - 1
+
+    legacy = '-'
+    if records <= legacy_max:
+        legacy = f"{_timed(lambda: legacy_first_page(spese_path, fornitori_path, anno))[0]:.0f}"
+    cold, first = _timed(lambda: service.get_spese(1, 10, {'anno': anno}))
+    page = min(_timed(lambda: service.get_spese(1, 10, {'anno': anno}))[0] for _ in range(5))
+    supplier = min(_timed(lambda: service.get_spese(1, 10, {'codice_fornitore': 'F1,F2'}))[0] for _ in range(5))
+    riepilogo = min(_timed(lambda: service.get_riepilogo_spese(anno))[0] for _ in range(5))
+
+    print(f"{records:>9} {legacy:>11} {cold:>9.0f} {page:>9.2f} {supplier:>11.2f} {riepilogo:>12.2f} "
+          f"{first['total']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, nargs='+', default=[10_000, 100_000, 500_000])
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='Numero massimo di record per cui misurare la scansione completa')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'records':>9} {'legacy ms':>11} {'cold ms':>9} {'page ms':>9} {'supplier ms':>11} "
+              f"{'riepilogo ms':>12} {'year rows':>8}")
+        for records in args.records:
+            run(records, tmp, args.legacy_max)
+
+
+if __name__ == '__main__':
+    main()
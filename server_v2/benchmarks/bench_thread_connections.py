@@ -0,0 +1,118 @@
+"""
+Benchmark: connessione per chiamata vs connessione per thread (DatabaseManager).
+
+Simula le query brevi dei servizi (lookup richiamo per id, controllo duplicati
+reminder, insert nel log comunicazioni) su un database SQLite con qualche
+decina di migliaia di righe:
+
+- connect: sqlite3.connect + query + close ad ogni chiamata (versione precedente)
+- thread:  db_connection(), connessione del thread riusata con la cache degli
+           statement preparati e le PRAGMA di Config
+
+Esegui dalla directory server_v2:
+  python -m benchmarks.bench_thread_connections
+  python -m benchmarks.bench_thread_connections --calls 20000 --threads 4
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.config import Config
+from core.database_manager import DatabaseManager
+
+ROWS = 50_000
+
+LOOKUP = "SELECT * FROM richiami WHERE id = ?"
+DUPLICATE = ("SELECT id FROM patient_communications WHERE patient_id = ? AND appointment_date = ? "
+             "AND type = ? AND stato != 'failed'")
+INSERT = ("INSERT INTO patient_communications (patient_id, appointment_date, type, stato) "
+          "VALUES (?, ?, ?, 'sent')")
+
+
+def build_db(path: str) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE richiami (id INTEGER PRIMARY KEY, paziente_id TEXT, nome TEXT, "
+                 "tipo_richiamo TEXT, tempo_richiamo INTEGER, da_richiamare TEXT)")
+    conn.execute("CREATE TABLE patient_communications (id INTEGER PRIMARY KEY, patient_id TEXT, "
+                 "appointment_date TEXT, type TEXT, stato TEXT)")
+    conn.execute("CREATE INDEX idx_pc ON patient_communications(patient_id, appointment_date)")
+    conn.executemany("INSERT INTO richiami VALUES (?, ?, ?, '2', 6, 'S')",
+                     [(i, f'P{i}', f'PAZIENTE {i}') for i in range(1, ROWS + 1)])
+    conn.executemany("INSERT INTO patient_communications (patient_id, appointment_date, type, stato) "
+                     "VALUES (?, '2025-06-01', '24h', 'sent')", [(f'P{i}',) for i in range(1, ROWS + 1)])
+    conn.commit()
+    conn.close()
+
+
+def _work(i: int):
+    pid = f'P{i % ROWS + 1}'
+    if i % 10 == 0:
+        return INSERT, (pid, '2025-06-02', '2h')
+    if i % 2:
+        return LOOKUP, (i % ROWS + 1,)
+    return DUPLICATE, (pid, '2025-06-01', '24h')
+
+
+def per_call_connect(path: str, calls: range) -> None:
+    for i in calls:
+        query, params = _work(i)
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(query, params).fetchall()
+        [dict(r) for r in rows]
+        conn.commit()
+        conn.close()
+
+
+def thread_connection(manager: DatabaseManager, path: str, calls: range) -> None:
+    for i in calls:
+        query, params = _work(i)
+        with manager.connection(path, caller='bench') as conn:
+            [dict(r) for r in conn.execute(query, params).fetchall()]
+
+
+def _timed_threads(target, calls: int, threads: int) -> float:
+    chunk = calls // threads
+    workers = [threading.Thread(target=target, args=(range(t * chunk, (t + 1) * chunk),)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=10_000)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_db = os.path.join(tmp, 'legacy.db')
+        thread_db = os.path.join(tmp, 'thread.db')
+        build_db(legacy_db)
+        build_db(thread_db)
+        manager = DatabaseManager(Config(db_path=os.path.join(tmp, 'main.db'), environment='test'))
+
+        legacy_ms = _timed_threads(lambda calls: per_call_connect(legacy_db, calls), args.calls, args.threads)
+        thread_ms = _timed_threads(lambda calls: thread_connection(manager, thread_db, calls), args.calls, args.threads)
+        print(f"{args.calls} chiamate su {args.threads} thread")
+        print(f"{'versione':<10}{'totale ms':>12}{'us/chiamata':>14}")
+        for name, ms in (('connect', legacy_ms), ('thread', thread_ms)):
+            print(f"{name:<10}{ms:>12.0f}{ms * 1000 / args.calls:>14.1f}")
+        stats = manager.get_statistics()
+        print(f"connessioni aperte: {stats['connections_created']}, "
+              f"statement per caller: {stats['callers']['bench']['statements']}")
+        manager.release_thread_connections()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Generatore di file DBF sintetici per i benchmark.
+
+Scrive direttamente header e record (dBase III, cp1252) con NumPy, cosi' anche
+file da centinaia di migliaia di record vengono creati in pochi secondi senza
+passare dalla libreria dbf.
+"""
+
+import datetime
+import struct
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from core.constants_v2 import COLONNE
+
+# (nome, tipo, lunghezza, decimali)
+FieldSpec = Tuple[str, str, int, int]
+
+
+def appunta_fields() -> List[FieldSpec]:
+    """Layout APPUNTA.DBF ridotto ai campi letti dal calendario (senza memo)."""
+    col = COLONNE['appuntamenti']
+    return [
+        (col['data'], 'D', 8, 0),
+        (col['ora_inizio'], 'N', 5, 2),
+        (col['ora_fine'], 'N', 5, 2),
+        (col['id_paziente'], 'C', 8, 0),
+        (col['tipo'], 'C', 2, 0),
+        (col['medico'], 'N', 3, 0),
+        (col['studio'], 'N', 2, 0),
+        (col['descrizione'], 'C', 30, 0),
+    ]
+
+
+def _fixed_width(values: np.ndarray, length: int, right_align: bool = False) -> np.ndarray:
+    """Matrice (n, length) di byte con i valori allineati e riempiti di spazi."""
+    text = np.char.rjust(values, length) if right_align else np.char.ljust(values, length)
+    encoded = np.char.encode(text, 'cp1252').astype(f'S{length}')
+    return np.frombuffer(encoded.tobytes(), dtype=np.uint8).reshape(-1, length)
+
+
+def write_dbf(path: str,
+              fields: Sequence[FieldSpec],
+              columns: Dict[str, np.ndarray],
+              deleted: np.ndarray) -> None:
+    """
+    Scrive un DBF con le colonne fornite come array di stringhe gia' formattate
+    (date YYYYMMDD, numeri come testo, char).
+    """
+    count = len(deleted)
+    record_length = 1 + sum(f[2] for f in fields)
+    header_length = 32 + 32 * len(fields) + 1
+
+    today = datetime.date.today()
+    header = struct.pack('<BBBBIHH20x', 0x03, today.year - 1900, today.month, today.day,
+                         count, header_length, record_length)
+    descriptors = b''.join(
+        struct.pack('<11sc4xBB14x', name.encode('ascii'), field_type.encode('ascii'), length, decimals)
+        for name, field_type, length, decimals in fields
+    )
+
+    records = np.full((count, record_length), 0x20, dtype=np.uint8)
+    records[deleted, 0] = ord('*')
+    offset = 1
+    for name, field_type, length, _ in fields:
+        records[:, offset:offset + length] = _fixed_width(columns[name], length, right_align=field_type == 'N')
+        offset += length
+
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(descriptors)
+        f.write(b'\x0d')
+        f.write(records.tobytes())
+        f.write(b'\x1a')
+
+
+def write_synthetic_appunta(path: str,
+                            records: int,
+                            seed: int = 42,
+                            start: str = '2020-01-01',
+                            days: int = 2190,
+                            deleted_ratio: float = 0.05) -> None:
+    """
+    Scrive un APPUNTA.DBF sintetico con appuntamenti distribuiti su `days` giorni.
+    """
+    rng = np.random.default_rng(seed)
+    fields = appunta_fields()
+    col = COLONNE['appuntamenti']
+
+    dates = np.datetime64(start, 'D') + rng.integers(0, days, records).astype('timedelta64[D]')
+    ore = rng.integers(8, 19, records)
+    minuti = rng.choice([0, 10, 20, 30, 40, 50], records)
+    inizio = ore + minuti / 100
+    fine = np.minimum(ore + 1, 20) + minuti / 100
+
+    columns = {
+        col['data']: np.char.replace(np.datetime_as_string(dates, unit='D'), '-', ''),
+        col['ora_inizio']: np.char.mod('%.2f', inizio),
+        col['ora_fine']: np.char.mod('%.2f', fine),
+        col['id_paziente']: np.char.add('P', rng.integers(1, 20000, records).astype(str)),
+        col['tipo']: rng.choice(['V', 'I', 'C', 'P', 'O', ''], records),
+        col['medico']: rng.integers(1, 5, records).astype(str),
+        col['studio']: rng.integers(1, 3, records).astype(str),
+        col['descrizione']: rng.choice(['CONTROLLO', 'IGIENE', 'PRIMA VISITA', ''], records),
+    }
+    write_dbf(path, fields, columns, rng.random(records) < deleted_ratio)
@@ -19,6 +19,8 @@ DEFAULT_AUTOMATION_SETTINGS = {
     'calendar_sync_fallback_time': "21:00",
     'calendar_sync_times': ["21:00"],
     'calendar_sync_weeks_to_sync': 3,
+    'calendar_sync_mode': 'batch',
+    'calendar_sync_incremental': True,
     'calendar_studio_blu_id': 'a60fdd2c5ea45c5575bea897a32d25a0309e8d61db566353aa8b95b2111d4a4e@group.calendar.google.com',
     'calendar_studio_giallo_id': '6b34420df23351c1dc0225cb912d7fb5a8e8aaa5bd0e9a7285a22b86010354b2@group.calendar.google.com',
     'theoretical_mode_enabled': False
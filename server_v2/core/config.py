@@ -44,6 +44,7 @@ class Config:
     DEFAULT_PAGE_SIZE = 4096
     DEFAULT_JOURNAL_MODE = "WAL"
     DEFAULT_SYNCHRONOUS = "NORMAL"
+    DEFAULT_STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
     
     def __init__(self, db_path: Optional[str] = None, environment: str = "production"):
         """
@@ -109,6 +110,9 @@ class Config:
         self.page_size = int(os.getenv("STUDIO_PAGE_SIZE", self.DEFAULT_PAGE_SIZE))
         self.journal_mode = os.getenv("STUDIO_JOURNAL_MODE", self.DEFAULT_JOURNAL_MODE)
         self.synchronous = os.getenv("STUDIO_SYNCHRONOUS", self.DEFAULT_SYNCHRONOUS)
+        self.statement_cache_size = int(
+            os.getenv("STUDIO_STATEMENT_CACHE_SIZE", self.DEFAULT_STATEMENT_CACHE_SIZE)
+        )
     
     def get_connection_string(self) -> str:
         """
@@ -119,10 +123,13 @@ class Config:
         """
         return f"file:{self.db_path}?cache=shared&_journal_mode={self.journal_mode}"
     
-    def get_pragma_statements(self) -> list[str]:
+    def get_pragma_statements(self, foreign_keys: bool = True) -> list[str]:
         """
         Get list of PRAGMA statements for SQLite optimization.
         
+        Args:
+            foreign_keys: Enforce foreign key constraints on the connection
+        
         Returns:
             List of PRAGMA statements to execute on new connections
         """
@@ -131,7 +138,7 @@ class Config:
             f"PRAGMA page_size = {self.page_size}",
             f"PRAGMA journal_mode = {self.journal_mode}",
             f"PRAGMA synchronous = {self.synchronous}",
-            "PRAGMA foreign_keys = ON",
+            f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}",
             "PRAGMA temp_store = MEMORY",
             "PRAGMA mmap_size = 268435456",  # 256MB
         ]
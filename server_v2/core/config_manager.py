@@ -89,7 +89,7 @@ class ConfigManager:
             'DEV_DB_BASE_PATH', 'DEV_DBF_APPOINTMENTS_PATH', 'DEV_DBF_PATIENTS_PATH',
             'PROD_DB_BASE_PATH', 'PROD_DBF_APPOINTMENTS_PATH', 'PROD_DBF_PATIENTS_PATH',
             'GOOGLE_CREDENTIALS_PATH', 'GOOGLE_TOKEN_PATH', 'GOOGLE_TIMEZONE',
-            'DBF_CACHE_TTL_SECONDS', 'DBF_MAX_CACHE_ITEMS', 'DBF_CHUNK_SIZE', 'DBF_MAX_WORKERS',
+            'DBF_CACHE_TTL_SECONDS', 'DBF_CACHE_MAX_MB', 'DBF_CHUNK_SIZE', 'DBF_MAX_WORKERS', 'DBF_PARALLEL_MODE',
             'LOG_LEVEL', 'LOG_FILE_PATH',
             'DEBUG_MODE', 'VERBOSE_LOGGING', 'MOCK_GOOGLE_API'
         ]
@@ -114,9 +114,10 @@ class ConfigManager:
             'PROD_DBF_PATIENTS_PATH': '\\\\serverdima\\pixel\\windent\\DATI\\PAZIENTI.DBF',
             'GOOGLE_TIMEZONE': 'Europe/Rome',
             'DBF_CACHE_TTL_SECONDS': '300',
-            'DBF_MAX_CACHE_ITEMS': '1000', 
+            'DBF_CACHE_MAX_MB': '128',
             'DBF_CHUNK_SIZE': '1000',
             'DBF_MAX_WORKERS': '4',
+            'DBF_PARALLEL_MODE': 'thread',
             'LOG_LEVEL': 'INFO',
             'DEBUG_MODE': 'false',
             'VERBOSE_LOGGING': 'false',
@@ -244,7 +245,7 @@ class ConfigManager:
         """Recupera configurazione performance."""
         return {
             'cache_ttl_seconds': int(self.get('DBF_CACHE_TTL_SECONDS', 300)),
-            'max_cache_items': int(self.get('DBF_MAX_CACHE_ITEMS', 1000)),
+            'cache_max_mb': int(self.get('DBF_CACHE_MAX_MB', 128)),
             'chunk_size': int(self.get('DBF_CHUNK_SIZE', 1000)),
             'max_workers': int(self.get('DBF_MAX_WORKERS', 4))
         }
@@ -4,8 +4,14 @@ Centralized database connection management for StudioDimaAI Server V2.
 This module provides a thread-safe connection pool manager that replaces
 the 40+ hardcoded SQLite connections throughout the codebase with a
 centralized, optimized solution.
+
+Modules that used to open their own ``sqlite3.connect`` per call use the
+lightweight API instead (``db_connection``, ``fetch_all``, ``fetch_one``,
+``execute``): one connection per thread and database file, reused across
+calls with its prepared-statement cache, and per-caller query statistics.
 """
 
+import os
 import sqlite3
 import threading
 import time
@@ -18,6 +24,11 @@ from dataclasses import dataclass
 from .config import Config
 from .exceptions import DatabaseError, ConnectionPoolError, TransactionError
 
+try:
+    from flask import has_request_context, request
+except ImportError:  # pragma: no cover - core usable without Flask
+    has_request_context = None
+
 # Configura logger per rispettare il livello globale
 logger = logging.getLogger(__name__)
 
@@ -35,6 +46,26 @@ class ConnectionInfo:
     is_busy: bool = False
 
 
+# Statements issued by sqlite3 itself around transactions, not counted as queries
+_TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK')
+
+
+class _ThreadConnection:
+    """Connection owned by a single thread for one database file."""
+    __slots__ = ('connection', 'depth')
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.depth = 0
+
+
+def _current_endpoint() -> Optional[str]:
+    """Flask endpoint of the current request, if any."""
+    if has_request_context is not None and has_request_context():
+        return request.endpoint or request.path
+    return None
+
+
 class DatabaseManager:
     """
     Thread-safe database connection pool manager.
@@ -50,6 +81,8 @@ class DatabaseManager:
     - Thread-safe operations
     - Connection health monitoring
     - Performance optimization with SQLite PRAGMAs
+    - Thread-local connections per database file with prepared-statement
+      reuse and per-caller/per-endpoint query statistics
     """
     
     def __init__(self, config: Optional[Config] = None):
@@ -86,8 +119,16 @@ class DatabaseManager:
         }
         self._stats_lock = threading.Lock()
         
-        # Initialize pool
-        self._initialize_pool()
+        # Thread-local connections (see connection())
+        self._local = threading.local()
+        self._thread_connections: Dict[Tuple[int, str], _ThreadConnection] = {}
+        self._thread_connections_lock = threading.Lock()
+        self._caller_stats: Dict[str, Dict[str, float]] = {}
+        self._endpoint_stats: Dict[str, Dict[str, float]] = {}
+        
+        # The pool is filled on first use: managers used only for thread
+        # connections (db_connection on other files) never open the default DB
+        self._pool_initialized = False
         
         # Start cleanup thread
         self._cleanup_thread = threading.Thread(target=self._cleanup_loop, daemon=True)
@@ -123,7 +164,8 @@ class DatabaseManager:
                 self.config.db_path,
                 timeout=self.config.query_timeout,
                 check_same_thread=False,
-                isolation_level=None  # Autocommit mode for better control
+                isolation_level=None,  # Autocommit mode for better control
+                cached_statements=self.config.statement_cache_size
             )
             
             # Enable row factory for dict-like access
@@ -231,6 +273,9 @@ class DatabaseManager:
         try:
             # Try to get from pool first
             with self._pool_lock:
+                if not self._pool_initialized:
+                    self._initialize_pool()
+                    self._pool_initialized = True
                 connection_info = self._get_connection_from_pool()
             
             # If pool is empty, try overflow
@@ -463,6 +508,221 @@ class DatabaseManager:
                 cause=e
             )
     
+    # ------------------------------------------------------------------
+    # Thread-local connections
+    # ------------------------------------------------------------------
+
+    def _open_thread_connection(self, db_path: str) -> sqlite3.Connection:
+        """
+        Open a connection for the calling thread with the configured PRAGMAs.
+
+        Unlike pooled connections it keeps the default sqlite3 transaction
+        handling and leaves foreign keys unenforced, so code moved from
+        ``sqlite3.connect`` keeps its semantics.
+        """
+        try:
+            conn = sqlite3.connect(
+                db_path,
+                timeout=self.config.query_timeout,
+                check_same_thread=False,  # close() may run from the cleanup thread
+                cached_statements=self.config.statement_cache_size
+            )
+            for pragma in self.config.get_pragma_statements(foreign_keys=False):
+                conn.execute(pragma)
+            conn.set_trace_callback(self._count_statement)
+        except Exception as e:
+            with self._stats_lock:
+                self._stats['errors_occurred'] += 1
+            logger.error(f"Failed to open thread connection to {db_path}: {e}")
+            raise DatabaseError(
+                "Failed to create database connection",
+                cause=e,
+                details={'db_path': db_path}
+            )
+
+        with self._stats_lock:
+            self._stats['connections_created'] += 1
+        logger.debug(f"Opened thread connection to {db_path}")
+        return conn
+
+    def _count_statement(self, statement: str) -> None:
+        """sqlite3 trace callback: count statements for the innermost open block."""
+        counters = getattr(self._local, 'counters', None)
+        if counters and not statement.startswith(_TRANSACTION_CONTROL):
+            counters[-1] += 1
+
+    def _thread_connection(self, db_path: str) -> _ThreadConnection:
+        """Return the calling thread's connection to ``db_path``, opening it once."""
+        key = os.path.normcase(os.path.abspath(db_path))
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        entry = connections.get(key)
+        registry_key = (threading.get_ident(), key)
+        if entry is not None:
+            # Released connections leave the registry; a detached connection
+            # still in use by an outer block keeps serving nested blocks
+            if entry.depth or self._thread_connections.get(registry_key) is entry:
+                return entry
+
+        entry = _ThreadConnection(self._open_thread_connection(db_path))
+        connections[key] = entry
+        with self._thread_connections_lock:
+            self._thread_connections[registry_key] = entry
+        return entry
+
+    @contextmanager
+    def connection(
+        self,
+        db_path: Optional[str] = None,
+        caller: Optional[str] = None,
+        row_factory: Optional[Any] = sqlite3.Row
+    ) -> Generator[sqlite3.Connection, None, None]:
+        """
+        Use the calling thread's connection to a database file.
+
+        Drop-in replacement for ``sqlite3.connect`` in service code: the
+        connection stays open for the thread, so repeated calls skip the
+        connect cost and reuse prepared statements. The outermost block
+        commits on success and rolls back on error; nested blocks on the same
+        file share the transaction. Do not close the yielded connection and do
+        not commit it (``commit()`` or ``with conn:``) inside the block.
+        Foreign keys are not enforced, as with a plain ``sqlite3.connect``.
+
+        Args:
+            db_path: Database file, the configured database if None
+            caller: Name used for the per-caller statistics
+            row_factory: Row factory for this block (None for plain tuples)
+
+        Yields:
+            sqlite3.Connection: Connection owned by the calling thread
+        """
+        entry = self._thread_connection(str(db_path or self.config.db_path))
+        conn = entry.connection
+        outermost = entry.depth == 0
+        previous_factory = conn.row_factory
+        conn.row_factory = row_factory
+        counters = getattr(self._local, 'counters', None)
+        if counters is None:
+            counters = self._local.counters = []
+        counters.append(0)
+        start_time = time.perf_counter()
+        failed = False
+        entry.depth += 1
+        try:
+            yield conn
+            if outermost and conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            failed = True
+            if outermost and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error as rollback_error:
+                    logger.error(f"Failed to rollback thread connection: {rollback_error}")
+            raise
+        finally:
+            entry.depth -= 1
+            conn.row_factory = previous_factory
+            self._record_call(caller or 'unknown', time.perf_counter() - start_time, counters.pop(), failed)
+
+    def _record_call(self, caller: str, elapsed: float, statements: int, failed: bool) -> None:
+        """Update per-caller and per-endpoint statistics for one connection() block."""
+        endpoint = _current_endpoint()
+        with self._stats_lock:
+            self._stats['queries_executed'] += statements
+            if failed:
+                self._stats['errors_occurred'] += 1
+            targets = [self._caller_stats.setdefault(caller, {
+                'calls': 0, 'statements': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})]
+            if endpoint:
+                targets.append(self._endpoint_stats.setdefault(endpoint, {
+                    'calls': 0, 'statements': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0}))
+            elapsed_ms = elapsed * 1000
+            for entry in targets:
+                entry['calls'] += 1
+                entry['statements'] += statements
+                entry['errors'] += failed
+                entry['total_ms'] += elapsed_ms
+                if elapsed_ms > entry['max_ms']:
+                    entry['max_ms'] = elapsed_ms
+
+    def fetch_all(
+        self,
+        query: str,
+        parameters: Tuple = (),
+        db_path: Optional[str] = None,
+        caller: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Run a SELECT on the thread connection and return the rows as dicts."""
+        with self.connection(db_path, caller) as conn:
+            return [dict(row) for row in conn.execute(query, parameters)]
+
+    def fetch_one(
+        self,
+        query: str,
+        parameters: Tuple = (),
+        db_path: Optional[str] = None,
+        caller: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Run a SELECT on the thread connection and return the first row as dict."""
+        with self.connection(db_path, caller) as conn:
+            row = conn.execute(query, parameters).fetchone()
+            return dict(row) if row else None
+
+    def execute(
+        self,
+        query: str,
+        parameters: Tuple = (),
+        db_path: Optional[str] = None,
+        caller: Optional[str] = None
+    ) -> sqlite3.Cursor:
+        """Run a write statement on the thread connection and commit it."""
+        with self.connection(db_path, caller) as conn:
+            return conn.execute(query, parameters)
+
+    def release_thread_connections(self, db_path: Optional[str] = None) -> int:
+        """
+        Close thread connections, e.g. after a database file has been replaced.
+
+        Threads reopen their connection on next use. Connections in use by
+        their thread are only detached and get closed when it drops them.
+
+        Args:
+            db_path: Only connections to this file, all if None
+
+        Returns:
+            Number of connections released
+        """
+        key = os.path.normcase(os.path.abspath(db_path)) if db_path else None
+        with self._thread_connections_lock:
+            released = [
+                registry_key for registry_key in self._thread_connections
+                if key is None or registry_key[1] == key
+            ]
+            entries = [self._thread_connections.pop(registry_key) for registry_key in released]
+        for entry in entries:
+            if entry.depth == 0:
+                self._close_thread_connection(entry.connection)
+        return len(entries)
+
+    def _close_thread_connection(self, conn: sqlite3.Connection) -> None:
+        try:
+            conn.close()
+            with self._stats_lock:
+                self._stats['connections_closed'] += 1
+        except Exception as e:
+            logger.warning(f"Error closing thread connection: {e}")
+
+    def _prune_thread_connections(self) -> None:
+        """Close connections owned by threads that have exited."""
+        alive = {thread.ident for thread in threading.enumerate()}
+        with self._thread_connections_lock:
+            dead = [registry_key for registry_key in self._thread_connections if registry_key[0] not in alive]
+            entries = [self._thread_connections.pop(registry_key) for registry_key in dead]
+        for entry in entries:
+            self._close_thread_connection(entry.connection)
+
     def _cleanup_loop(self) -> None:
         """Background thread for connection cleanup and maintenance."""
         while self._cleanup_running:
@@ -481,6 +741,8 @@ class DatabaseManager:
                         self._close_connection(conn_info)
                         logger.debug(f"Cleaned up expired overflow connection {conn_id}")
                 
+                self._prune_thread_connections()
+                
                 # Log statistics periodically
                 if int(current_time) % 300 == 0:  # Every 5 minutes
                     self._log_statistics()
@@ -527,11 +789,32 @@ class DatabaseManager:
             'overflow_connections': len(self._overflow_connections),
             'max_overflow': self.config.max_overflow,
             'active_transactions': len(self._active_transactions),
-            'pool_utilization': (self.config.pool_size - self._pool.qsize()) / self.config.pool_size * 100
+            'pool_utilization': ((self.config.pool_size - self._pool.qsize()) / self.config.pool_size * 100
+                                 if self._pool_initialized else 0.0),
+            'thread_connections': len(self._thread_connections),
+            'statement_cache_size': self.config.statement_cache_size,
+            'callers': self._usage_report(self._caller_stats),
+            'endpoints': self._usage_report(self._endpoint_stats)
         })
         
         return stats
     
+    def _usage_report(self, usage: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, Any]]:
+        """Per-caller statistics sorted by total time, heaviest first."""
+        with self._stats_lock:
+            items = [(name, dict(entry)) for name, entry in usage.items()]
+        report = {}
+        for name, entry in sorted(items, key=lambda item: item[1]['total_ms'], reverse=True):
+            report[name] = {
+                'calls': entry['calls'],
+                'statements': entry['statements'],
+                'errors': entry['errors'],
+                'total_ms': round(entry['total_ms'], 2),
+                'avg_ms': round(entry['total_ms'] / entry['calls'], 3) if entry['calls'] else 0.0,
+                'max_ms': round(entry['max_ms'], 2)
+            }
+        return report
+    
     def close(self) -> None:
         """
         Close all connections and shutdown the manager.
@@ -565,6 +848,8 @@ class DatabaseManager:
                 pass
         self._active_transactions.clear()
         
+        self.release_thread_connections()
+        
         logger.info("DatabaseManager shutdown complete")
     
     def __enter__(self):
@@ -625,4 +910,33 @@ def close_database_manager() -> None:
     with _db_manager_lock:
         if _db_manager is not None:
             _db_manager.close()
-            _db_manager = None
\ No newline at end of file
+            _db_manager = None
+
+
+# Lightweight API for modules that used to call sqlite3.connect directly
+
+def db_connection(
+    db_path: Optional[str] = None,
+    caller: Optional[str] = None,
+    row_factory: Optional[Any] = sqlite3.Row
+):
+    """Thread-local connection context manager, see DatabaseManager.connection."""
+    return get_database_manager().connection(db_path, caller, row_factory)
+
+
+def fetch_all(query: str, parameters: Tuple = (), db_path: Optional[str] = None,
+              caller: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Rows of a SELECT as dicts, see DatabaseManager.fetch_all."""
+    return get_database_manager().fetch_all(query, parameters, db_path, caller)
+
+
+def fetch_one(query: str, parameters: Tuple = (), db_path: Optional[str] = None,
+              caller: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """First row of a SELECT as dict, see DatabaseManager.fetch_one."""
+    return get_database_manager().fetch_one(query, parameters, db_path, caller)
+
+
+def execute(query: str, parameters: Tuple = (), db_path: Optional[str] = None,
+            caller: Optional[str] = None) -> sqlite3.Cursor:
+    """Committed write statement, see DatabaseManager.execute."""
+    return get_database_manager().execute(query, parameters, db_path, caller)
@@ -1,14 +1,11 @@
 from typing import Optional,Dict, Any, Tuple
 from datetime import datetime
 from core.constants_v2 import GOOGLE_COLOR_MAP
-from core.database_manager import DatabaseManager
 from services.pazienti_service import PazientiService
 
 import os
 from .schemas import NormalizedAppointment, AppointmentKind
 
-db_manager = DatabaseManager()
-
 
 # ============================================================
 # CONFIG
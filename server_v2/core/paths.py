@@ -40,6 +40,17 @@ CALENDAR_SYNC_STATE_PATH = Path(
     os.getenv("CALENDAR_SYNC_STATE_PATH", str(DATA_DIR / "sync_state.json"))
 ).resolve()
 
+# Calendar incremental sync ledger (uid -> fingerprint, syncToken per calendario)
+CALENDAR_SYNC_DB_PATH = Path(
+    os.getenv("CALENDAR_SYNC_DB_PATH", str(DATA_DIR / "calendar_sync.sqlite"))
+).resolve()
+
+# DBF mirror (colonne NumPy + hash per record) e partizioni annuali economics
+DBF_MIRROR_DIR = Path(os.getenv("DBF_MIRROR_DIR", str(DATA_DIR / "dbf_mirror"))).resolve()
+ECONOMICS_FRAMES_DIR = Path(
+    os.getenv("ECONOMICS_FRAMES_DIR", str(DATA_DIR / "economics_frames"))
+).resolve()
+
 # Local SQLite db (if used)
 STUDIO_DIMA_DB_PATH = Path(os.getenv("STUDIO_DIMA_DB_PATH", str(DATA_DIR / "studio_dima.db"))).resolve()
 
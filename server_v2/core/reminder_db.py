@@ -6,6 +6,7 @@ import logging
 import sqlite3
 from pathlib import Path
 
+from core.database_manager import db_connection
 from core.paths import STUDIO_DIMA_DB_PATH
 
 logger = logging.getLogger(__name__)
@@ -123,7 +124,6 @@ def _insert_default_studio_hours(conn: sqlite3.Connection):
              afternoon_start, afternoon_end, fascia_unica_start, fascia_unica_end)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """, default_hours)
-        conn.commit()
     except Exception as e:
         logger.warning(f"Errore inserimento default studio hours: {e}")
 
@@ -133,46 +133,40 @@ def ensure_reminder_tables() -> None:
     if _TABLES_ENSURED:
         # Anche se già assicurato, verifica che studio_opening_hours esista
         try:
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            existing_tables = {
-                r[0] for r in conn.execute(
-                    "SELECT name FROM sqlite_master WHERE type='table'"
-                ).fetchall()
-            }
-            conn.close()
-            
-            if "studio_opening_hours" not in existing_tables:
-                # Tabella manca, creala e popola
-                conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-                conn.execute("""
-                    CREATE TABLE IF NOT EXISTS studio_opening_hours (
-                        day_of_week INTEGER PRIMARY KEY,
-                        name TEXT NOT NULL,
-                        enabled INTEGER DEFAULT 1,
-                        continuous_hours INTEGER DEFAULT 0,
-                        morning_start TEXT,
-                        morning_end TEXT,
-                        afternoon_start TEXT,
-                        afternoon_end TEXT,
-                        fascia_unica_start TEXT,
-                        fascia_unica_end TEXT,
-                        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                _insert_default_studio_hours(conn)
-                conn.commit()
-                conn.close()
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='reminder_db', row_factory=None) as conn:
+                existing_tables = {
+                    r[0] for r in conn.execute(
+                        "SELECT name FROM sqlite_master WHERE type='table'"
+                    ).fetchall()
+                }
+
+                if "studio_opening_hours" not in existing_tables:
+                    # Tabella manca, creala e popola
+                    conn.execute("""
+                        CREATE TABLE IF NOT EXISTS studio_opening_hours (
+                            day_of_week INTEGER PRIMARY KEY,
+                            name TEXT NOT NULL,
+                            enabled INTEGER DEFAULT 1,
+                            continuous_hours INTEGER DEFAULT 0,
+                            morning_start TEXT,
+                            morning_end TEXT,
+                            afternoon_start TEXT,
+                            afternoon_end TEXT,
+                            fascia_unica_start TEXT,
+                            fascia_unica_end TEXT,
+                            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    _insert_default_studio_hours(conn)
         except Exception as e:
             logger.warning(f"Errore verifica tabella studio_opening_hours: {e}")
         return
     
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.executescript(_REMINDER_SCHEMA_SQL)
-        _migrate_sqlite(conn)
-        _insert_default_studio_hours(conn)
-        conn.commit()
-        conn.close()
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='reminder_db', row_factory=None) as conn:
+            conn.executescript(_REMINDER_SCHEMA_SQL)
+            _migrate_sqlite(conn)
+            _insert_default_studio_hours(conn)
         _TABLES_ENSURED = True
     except Exception as e:
         logger.error(f"Errore creazione/migrazione tabelle reminder: {e}")
@@ -184,41 +178,37 @@ def is_appointment_confirmed(
     """True se il paziente ha già confermato (SI) per questo appuntamento."""
     ensure_reminder_tables()
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        cur = conn.cursor()
-        pc_cols = _table_columns(conn, "patient_communications")
-
-        if "stato" in pc_cols:
-            cur.execute(
-                """
-                SELECT 1 FROM patient_communications
-                WHERE patient_id = ? AND appointment_date = ? AND appointment_time = ?
-                  AND stato = 'confirmed'
-                LIMIT 1
-                """,
-                (patient_id, ap_date, ap_time),
-            )
-            if cur.fetchone():
-                conn.close()
-                return True
-
-        ac_cols = _table_columns(conn, "appointment_confirmations")
-        if "response" in ac_cols:
-            cur.execute(
-                """
-                SELECT 1 FROM appointment_confirmations
-                WHERE patient_id = ? AND appointment_date = ? AND appointment_time = ?
-                  AND response = 'confirmed'
-                LIMIT 1
-                """,
-                (patient_id, ap_date, ap_time),
-            )
-            found = cur.fetchone() is not None
-            conn.close()
-            return found
-
-        conn.close()
-        return False
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='reminder_db', row_factory=None) as conn:
+            cur = conn.cursor()
+            pc_cols = _table_columns(conn, "patient_communications")
+
+            if "stato" in pc_cols:
+                cur.execute(
+                    """
+                    SELECT 1 FROM patient_communications
+                    WHERE patient_id = ? AND appointment_date = ? AND appointment_time = ?
+                      AND stato = 'confirmed'
+                    LIMIT 1
+                    """,
+                    (patient_id, ap_date, ap_time),
+                )
+                if cur.fetchone():
+                    return True
+
+            ac_cols = _table_columns(conn, "appointment_confirmations")
+            if "response" in ac_cols:
+                cur.execute(
+                    """
+                    SELECT 1 FROM appointment_confirmations
+                    WHERE patient_id = ? AND appointment_date = ? AND appointment_time = ?
+                      AND response = 'confirmed'
+                    LIMIT 1
+                    """,
+                    (patient_id, ap_date, ap_time),
+                )
+                return cur.fetchone() is not None
+
+            return False
     except Exception as e:
         logger.warning(f"Errore check confirmed: {e}")
         return False
@@ -0,0 +1,333 @@
+"""
+🗄️ Shared Cache per StudioDimaAI Server V2
+==========================================
+
+Cache in-process unica per i servizi che leggono i DBF:
+
+- Namespace separati (es. 'dbf_reader', 'statistiche', 'economics'), ognuno
+  con un budget di memoria in byte e un TTL di default
+- Dimensione stimata per ogni voce (array NumPy, DataFrame, dict/list annidati)
+  ed eviction LRU finché il namespace rientra nel budget
+- Invalidazione per TTL e per versione: la versione è tipicamente la firma
+  (mtime, size) dei file sorgente, vedi `file_version`
+- `get_or_load`: protezione single-flight, richieste concorrenti per la stessa
+  chiave attendono un solo caricamento
+- Statistiche hit/miss/eviction per namespace (esposte da api_monitoring)
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+from core.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Budget e TTL di default per namespace noti (byte, secondi; None = senza scadenza)
+DEFAULT_NAMESPACES: Dict[str, Tuple[int, Optional[float]]] = {
+    'dbf_reader': (128 * 1024 * 1024, 300),
+    'statistiche': (32 * 1024 * 1024, 3600),
+    'economics': (32 * 1024 * 1024, 600),
+    'economics_frames': (256 * 1024 * 1024, None),
+}
+DEFAULT_MAX_BYTES = 16 * 1024 * 1024
+
+# Oltre questa soglia gli elementi di un contenitore si stimano a campione
+_SIZE_SAMPLE = 64
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    Stima in byte della memoria occupata da `value`.
+
+    Esatta per array NumPy e DataFrame/Series pandas, approssimata (a campione
+    oltre _SIZE_SAMPLE elementi) per dict, list, tuple e set annidati.
+    """
+    dtype = getattr(value, 'dtype', None)
+    is_array = dtype is not None and hasattr(value, 'nbytes') and hasattr(value, 'tolist')
+    if is_array and dtype != object:
+        return int(value.nbytes)
+
+    memory_usage = getattr(value, 'memory_usage', None)
+    if callable(memory_usage) and hasattr(value, 'index'):
+        try:
+            usage = memory_usage(deep=True)
+            return int(usage.sum()) if hasattr(usage, 'sum') else int(usage)
+        except Exception:
+            pass
+
+    size = sys.getsizeof(value, 0)
+    if _depth > 8:
+        return size
+
+    if isinstance(value, dict):
+        items = value.items()
+        count = len(value)
+        measure = lambda kv: estimate_size(kv[0], _depth + 1) + estimate_size(kv[1], _depth + 1)
+    elif isinstance(value, (list, tuple, set, frozenset)) or is_array:
+        items = value
+        count = len(value)
+        measure = lambda item: estimate_size(item, _depth + 1)
+    else:
+        return size
+
+    if count <= _SIZE_SAMPLE:
+        return size + sum(measure(item) for item in items)
+
+    step = count / _SIZE_SAMPLE
+    targets = {int(i * step) for i in range(_SIZE_SAMPLE)}
+    sampled = sum(measure(item) for i, item in enumerate(items) if i in targets)
+    return size + int(sampled * count / len(targets))
+
+
+def file_version(*paths: str) -> Tuple:
+    """Firma (mtime_ns, size) dei file: cambia a ogni scrittura (None se il file manca)."""
+    version = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            version.append((st.st_mtime_ns, st.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'version', 'expires_at')
+
+    def __init__(self, value: Any, size: int, version: Any, expires_at: Optional[float]):
+        self.value = value
+        self.size = size
+        self.version = version
+        self.expires_at = expires_at
+
+
+class CacheNamespace:
+    """
+    Un namespace della cache condivisa: LRU limitato in byte.
+
+    I metodi pubblici sono thread-safe; `get_or_load` esegue il loader fuori
+    dal lock, una sola volta per (chiave, versione).
+    """
+
+    def __init__(self, name: str, max_bytes: int, ttl: Optional[float] = None):
+        self.name = name
+        self.max_bytes = int(max_bytes)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[Hashable, _Entry]' = OrderedDict()
+        self._flight = SingleFlight(f'cache.{name}')
+        self._bytes = 0
+        self._stats = {
+            'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'stale_versions': 0,
+            'rejected_oversize': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def get(self, key: Hashable, version: Any = None, default: Any = None) -> Any:
+        """Valore in cache per `key` se valido per `version` e non scaduto, altrimenti `default`."""
+        with self._lock:
+            entry = self._lookup(key, version)
+            if entry is None:
+                self._stats['misses'] += 1
+                return default
+            self._stats['hits'] += 1
+            return entry.value
+
+    def set(self, key: Hashable, value: Any, version: Any = None,
+            ttl: Optional[float] = None, size: Optional[int] = None) -> bool:
+        """
+        Memorizza `value`. Restituisce False se la voce da sola supera il budget
+        del namespace (in quel caso non viene memorizzata).
+        """
+        size = estimate_size(value) if size is None else int(size)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                self._stats['rejected_oversize'] += 1
+                logger.debug(f"Cache {self.name}: voce {key!r} di {size} byte oltre il budget")
+                return False
+            self._entries[key] = _Entry(value, size, version, expires_at)
+            self._bytes += size
+            self._evict()
+            return True
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], version: Any = None,
+                    ttl: Optional[float] = None) -> Any:
+        """
+        Valore in cache oppure risultato di `loader()`, memorizzato.
+
+        Se un altro thread sta già caricando la stessa (chiave, versione) si
+        attende il suo risultato invece di ripetere il caricamento; un'eccezione
+        del loader viene propagata a tutti i chiamanti in attesa.
+        """
+        with self._lock:
+            entry = self._lookup(key, version)
+            if entry is not None:
+                self._stats['hits'] += 1
+                return entry.value
+            self._stats['misses'] += 1
+
+        def load():
+            # Un caricamento appena concluso da un altro leader è già in cache
+            with self._lock:
+                entry = self._lookup(key, version)
+            if entry is not None:
+                return entry.value
+            value = loader()
+            self.set(key, value, version=version, ttl=ttl)
+            return value
+
+        value, _ = self._flight.do((key, version), load)
+        return value
+
+    def invalidate(self, key: Optional[Hashable] = None,
+                   predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """Rimuove `key`, le chiavi per cui `predicate` è vero, o tutto. Restituisce il numero di voci rimosse."""
+        with self._lock:
+            if key is not None:
+                keys: Iterable[Hashable] = [key] if key in self._entries else []
+            elif predicate is not None:
+                keys = [k for k in self._entries if predicate(k)]
+            else:
+                keys = list(self._entries)
+            for k in keys:
+                self._remove(k)
+            return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def bytes_used(self) -> int:
+        return self._bytes
+
+    def get_stats(self) -> Dict[str, Any]:
+        flight = self._flight.get_stats()
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'items': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'usage_percent': round(self._bytes / self.max_bytes * 100, 1) if self.max_bytes else 0.0,
+                'ttl_seconds': self.ttl,
+                'hit_rate_percent': round(self._stats['hits'] / lookups * 100, 1) if lookups else 0.0,
+                **self._stats,
+                'loads': flight['executions'],
+                'load_errors': flight['errors'],
+                'load_time_ms': flight['execution_time_ms'],
+                'coalesced': flight['coalesced'],
+                'inflight': flight['inflight'],
+            }
+
+    # ------------------------------------------------------------------
+    # Interni (chiamati con il lock acquisito)
+    # ------------------------------------------------------------------
+
+    def _lookup(self, key: Hashable, version: Any) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+            self._stats['expirations'] += 1
+            self._remove(key)
+            return None
+        if entry.version != version:
+            self._stats['stale_versions'] += 1
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            self._stats['evictions'] += 1
+
+
+class SharedCache:
+    """Registro dei namespace della cache condivisa."""
+
+    def __init__(self, namespaces: Optional[Dict[str, Tuple[int, Optional[float]]]] = None):
+        self._defaults = dict(DEFAULT_NAMESPACES if namespaces is None else namespaces)
+        self._namespaces: Dict[str, CacheNamespace] = {}
+        self._lock = threading.Lock()
+
+    def namespace(self, name: str) -> CacheNamespace:
+        """Namespace `name`, creato al primo uso con budget e TTL di default."""
+        with self._lock:
+            ns = self._namespaces.get(name)
+            if ns is None:
+                max_bytes, ttl = self._defaults.get(name, (DEFAULT_MAX_BYTES, None))
+                ns = self._namespaces[name] = CacheNamespace(name, max_bytes, ttl)
+            return ns
+
+    def configure(self, name: str, max_bytes: Optional[int] = None, ttl: Optional[float] = None) -> CacheNamespace:
+        """Imposta budget e/o TTL di un namespace (riducendo il budget si applica subito l'eviction)."""
+        ns = self.namespace(name)
+        with ns._lock:
+            if max_bytes is not None:
+                ns.max_bytes = int(max_bytes)
+                ns._evict()
+            if ttl is not None:
+                ns.ttl = ttl
+        return ns
+
+    def get_or_load(self, name: str, key: Hashable, loader: Callable[[], Any],
+                    version: Any = None, ttl: Optional[float] = None) -> Any:
+        return self.namespace(name).get_or_load(key, loader, version=version, ttl=ttl)
+
+    def invalidate(self, name: Optional[str] = None) -> int:
+        """Svuota un namespace o tutta la cache."""
+        with self._lock:
+            namespaces = [self._namespaces[name]] if name in self._namespaces else (
+                [] if name is not None else list(self._namespaces.values()))
+        return sum(ns.invalidate() for ns in namespaces)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Statistiche per namespace e totali."""
+        with self._lock:
+            namespaces = list(self._namespaces.values())
+        per_ns = {ns.name: ns.get_stats() for ns in namespaces}
+        return {
+            'namespaces': per_ns,
+            'total': {
+                'items': sum(s['items'] for s in per_ns.values()),
+                'bytes': sum(s['bytes'] for s in per_ns.values()),
+                'max_bytes': sum(s['max_bytes'] for s in per_ns.values()),
+                'hits': sum(s['hits'] for s in per_ns.values()),
+                'misses': sum(s['misses'] for s in per_ns.values()),
+                'evictions': sum(s['evictions'] for s in per_ns.values()),
+                'coalesced': sum(s['coalesced'] for s in per_ns.values()),
+            },
+        }
+
+
+# Istanza globale
+_shared_cache: Optional[SharedCache] = None
+_shared_cache_lock = threading.Lock()
+
+def get_shared_cache() -> SharedCache:
+    """Get the global shared cache instance."""
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_cache_lock:
+            if _shared_cache is None:
+                _shared_cache = SharedCache()
+    return _shared_cache
@@ -0,0 +1,118 @@
+"""
+🛫 Single-flight per StudioDimaAI Server V2
+===========================================
+
+Coalescenza in-process di caricamenti concorrenti: se più thread chiedono la
+stessa chiave (tipicamente file, versione del file e query) mentre un
+caricamento è già in corso, attendono quello invece di rileggere il DBF.
+
+All'apertura della dashboard calendario, statistiche, KPI economics e richiami
+partono in parallelo e, senza coalescenza, decodificano gli stessi file più
+volte contemporaneamente.
+
+Le metriche di ogni gruppo (chiamate, esecuzioni, chiamate coalizzate) sono
+raccolte da `get_single_flight_stats` per api_monitoring.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """Esecuzione in corso: i follower attendono l'evento e leggono l'esito."""
+
+    __slots__ = ('event', 'value', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Gruppo di chiamate coalizzate per chiave.
+
+    `do(key, fn)` esegue `fn` una sola volta per tutte le chiamate concorrenti
+    con la stessa chiave; l'eccezione di `fn` viene propagata a tutte.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {'calls': 0, 'executions': 0, 'coalesced': 0, 'errors': 0, 'execution_time_ms': 0.0}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Esegue `fn` (o attende l'esecuzione in corso per `key`).
+
+        Returns:
+            (risultato, shared): shared è True se lo stesso oggetto è stato
+            consegnato a più chiamanti (chi intende modificarlo deve copiarlo).
+        """
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+
+        start = time.perf_counter()
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._stats['executions'] += 1
+                self._stats['execution_time_ms'] += (time.perf_counter() - start) * 1000
+                if call.error is not None:
+                    self._stats['errors'] += 1
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.value, call.waiters > 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            calls = self._stats['calls']
+            return {
+                **self._stats,
+                'inflight': len(self._calls),
+                'coalescing_rate_percent': round(self._stats['coalesced'] / calls * 100, 1) if calls else 0.0,
+            }
+
+
+# Registry dei gruppi per nome
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+def get_single_flight(name: str) -> SingleFlight:
+    """Get the shared single-flight group `name`."""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def get_single_flight_stats() -> Dict[str, Dict[str, Any]]:
+    """Metriche di coalescenza di tutti i gruppi."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.get_stats() for group in groups}
@@ -18,6 +18,7 @@ from datetime import datetime, date, timedelta
 from ..core.base_repository import BaseRepository, QueryOptions, QueryResult
 from ..core.database_manager import DatabaseManager
 from ..core.exceptions import RepositoryError, ValidationError
+from ..core.shared_cache import get_shared_cache
 from ..utils.dbf_utils import DbfProcessor, clean_dbf_value, safe_get_dbf_field
 
 logger = logging.getLogger(__name__)
@@ -431,7 +432,12 @@ class StatisticheRepository(BaseRepository):
             }
     
     def _get_cached_data(self, cache_key: str) -> Optional[Dict[str, Any]]:
-        """Get data from cache if valid."""
+        """Get data from cache if valid (in-memory shared cache first, then SQLite)."""
+        memory = get_shared_cache().namespace('statistiche')
+        cached = memory.get(cache_key)
+        if cached is not None:
+            return cached
+
         try:
             result = self.execute_custom_query(
                 """
@@ -454,7 +460,13 @@ class StatisticheRepository(BaseRepository):
                     fetch_all=False
                 )
                 
-                return json.loads(result['data_json'])
+                data = json.loads(result['data_json'])
+                remaining = None
+                if result['expires_at']:
+                    remaining = (datetime.fromisoformat(str(result['expires_at'])) - datetime.now()).total_seconds()
+                if remaining is None or remaining > 0:
+                    memory.set(cache_key, data, ttl=remaining)
+                return data
             
             return None
             
@@ -485,6 +497,7 @@ class StatisticheRepository(BaseRepository):
                 fetch_all=False
             )
             
+            get_shared_cache().namespace('statistiche').set(cache_key, json.loads(data_json), ttl=duration_minutes * 60)
             logger.debug(f"Cached data for key: {cache_key}")
             
         except Exception as e:
@@ -12,6 +12,8 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from contextlib import contextmanager
 from typing import Optional, Dict, Any, List
 
+from core.database_manager import db_connection
+
 logger = logging.getLogger(__name__)
 
 # Construct an absolute path to the database file to make the connection robust
@@ -20,19 +22,13 @@ DB_PATH = os.path.abspath(os.path.join(_current_dir, '..', 'instance', 'users.db
 
 @contextmanager
 def get_db_connection():
-    """Provides a database connection context."""
-    conn = None
+    """Provides a database connection context (the thread's connection, reused across calls)."""
     try:
-        logger.debug(f"Connecting to user database at: {DB_PATH}")
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        yield conn
+        with db_connection(DB_PATH, caller='user_repository') as conn:
+            yield conn
     except sqlite3.Error as e:
         logger.error(f"Database connection error to {DB_PATH}: {e}")
         raise
-    finally:
-        if conn:
-            conn.close()
 
 class UserRepository:
     """
@@ -116,7 +112,6 @@ class UserRepository:
                     "INSERT INTO user (username, password_hash, role, created_at) VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
                     (username, password_hash, role)
                 )
-                conn.commit()
                 new_user_id = cursor.lastrowid
                 return self.find_by_id(new_user_id)
         except sqlite3.IntegrityError:
@@ -162,7 +157,6 @@ class UserRepository:
             with get_db_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(sql, tuple(params))
-                conn.commit()
                 if cursor.rowcount == 0:
                     return None # User not found
                 return self.find_by_id(user_id)
@@ -186,7 +180,6 @@ class UserRepository:
                 # Also delete related credentials to maintain integrity
                 cursor.execute("DELETE FROM google_credentials WHERE user_id = ?", (user_id,))
                 cursor.execute("DELETE FROM user WHERE id = ?", (user_id,))
-                conn.commit()
                 return cursor.rowcount > 0
         except sqlite3.Error as e:
             logger.error(f"Error deleting user {user_id}: {e}")
@@ -0,0 +1,195 @@
+"""
+📅 Appointment Day Index per StudioDimaAI Server V2
+===================================================
+
+Vista degli appuntamenti di APPUNTA.DBF indicizzata per giorno:
+
+- Per ogni giorno le righe degli appuntamenti validi (non cancellati, con
+  paziente) e l'ora di inizio già convertita in minuti dalla mezzanotte
+- Costruzione vettoriale sulle colonne del DBF mirror, aggiornamento
+  incrementale sulle sole righe con hash cambiato
+- Riallineata dal file watcher insieme agli altri indici di APPUNTA
+
+La selezione dei reminder (appointment_reminder_service) legge solo il bucket
+del giorno invece di scandire l'intero file ad ogni esecuzione del job.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.config_manager import get_config
+from core.constants_v2 import COLONNE
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+from services.occupancy_index import dbf_times_to_minutes
+
+logger = logging.getLogger(__name__)
+
+# Giorno fittizio delle righe escluse dall'indice
+_NO_DAY = -1
+_EPOCH = date(1970, 1, 1)
+
+
+class AppointmentDayIndex:
+    """Appuntamenti per giorno di un file APPUNTA.DBF."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._table: Optional[MirrorTable] = None
+        self._hashes = np.zeros(0, dtype=np.uint64)
+
+        # Stato per riga: giorno (giorni dal 1970, _NO_DAY se esclusa) e minuti di inizio
+        self._row_days = np.zeros(0, dtype=np.int64)
+        self._row_minutes = np.zeros(0, dtype=np.int64)
+
+        self._buckets: Dict[int, Set[int]] = defaultdict(set)
+        self._cache: Dict[int, List[Tuple[int, int]]] = {}
+        self._stats = {'full_builds': 0, 'incremental_updates': 0, 'rows_indexed': 0, 'lookups': 0}
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def day(self, giorno: date) -> Tuple[MirrorTable, List[Tuple[int, int]]]:
+        """
+        Restituisce (tabella, [(riga, minuti_inizio)]) per il giorno, righe in
+        ordine di file; la tabella è la generazione del mirror su cui leggere i campi.
+        """
+        key = (giorno - _EPOCH).days
+        with self._lock:
+            table = self._ensure_current()
+            self._stats['lookups'] += 1
+            cached = self._cache.get(key)
+            if cached is None:
+                rows = sorted(self._buckets.get(key, ()))
+                cached = self._cache[key] = [(row, int(self._row_minutes[row])) for row in rows]
+            return table, list(cached)
+
+    def refresh(self) -> None:
+        """Riallinea subito l'indice al file (es. su evento del file watcher)."""
+        get_dbf_mirror().invalidate(self.path)
+        with self._lock:
+            self._ensure_current()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato dell'indice per monitoring."""
+        with self._lock:
+            return {
+                'path': self.path,
+                'rows': int(np.count_nonzero(self._row_days != _NO_DAY)),
+                'days': len(self._buckets),
+                'generation': self._table.generation if self._table is not None else None,
+                'stats': dict(self._stats),
+            }
+
+    # ------------------------------------------------------------------
+    # Sincronizzazione con il mirror
+    # ------------------------------------------------------------------
+
+    def _ensure_current(self) -> MirrorTable:
+        table = get_dbf_mirror().table_at(self.path)
+        if table is self._table:
+            return table
+
+        start = time.time()
+        old_count, new_count = len(self._row_days), len(table)
+        if self._table is None or new_count < old_count:
+            rows = np.arange(new_count, dtype=np.int64)
+            days, minutes = self._row_values(table, rows)
+            self._build(days, minutes)
+            self._stats['full_builds'] += 1
+        else:
+            changed = np.flatnonzero(self._hashes[:old_count] != table.hashes[:old_count])
+            rows = np.concatenate([changed, np.arange(old_count, new_count)]).astype(np.int64)
+            if rows.size:
+                days, minutes = self._row_values(table, rows)
+                self._update(rows, days, minutes, new_count)
+                self._stats['incremental_updates'] += 1
+
+        self._stats['rows_indexed'] += int(rows.size)
+        if rows.size:
+            logger.debug(f"Appointment day index {table.name}: {rows.size}/{new_count} righe "
+                         f"indicizzate in {(time.time() - start) * 1000:.1f}ms")
+        self._hashes = table.hashes.copy()
+        self._table = table
+        return table
+
+    @staticmethod
+    def _row_values(table: MirrorTable, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Giorno e minuti di inizio per le righe; _NO_DAY per cancellate, senza
+        data, senza paziente o senza ora di inizio (non si invia un promemoria
+        "ore 00:00").
+        """
+        col = COLONNE['appuntamenti']
+        days = table.column(col['data'])[rows].astype('datetime64[D]')
+        ore = table.column(col['ora_inizio'])[rows]
+        valid = ~np.isnat(days) & ~table.deleted[rows] & (table.stripped(col['id_paziente'])[rows] != b'')
+        if ore.dtype.kind == 'f':
+            valid &= ~np.isnan(ore)
+        day_numbers = np.where(valid, days.astype(np.int64), _NO_DAY)
+        minutes = dbf_times_to_minutes(np.nan_to_num(ore) if ore.dtype.kind == 'f' else ore)
+        return day_numbers, minutes
+
+    def _build(self, days: np.ndarray, minutes: np.ndarray) -> None:
+        self._row_days, self._row_minutes = days, minutes
+        self._buckets.clear()
+        self._cache.clear()
+        rows = np.flatnonzero(days != _NO_DAY)
+        order = rows[np.argsort(days[rows], kind='stable')]
+        keys, starts = np.unique(days[order], return_index=True)
+        for key, group in zip(keys.tolist(), np.split(order, starts[1:])):
+            self._buckets[key] = set(group.tolist())
+
+    def _update(self, rows: np.ndarray, days: np.ndarray, minutes: np.ndarray, count: int) -> None:
+        if len(self._row_days) < count:
+            missing = count - len(self._row_days)
+            self._row_days = np.concatenate([self._row_days, np.full(missing, _NO_DAY, dtype=np.int64)])
+            self._row_minutes = np.concatenate([self._row_minutes, np.zeros(missing, dtype=np.int64)])
+
+        for row, day in zip(rows.tolist(), days.tolist()):
+            old = int(self._row_days[row])
+            if old != _NO_DAY:
+                self._cache.pop(old, None)
+                bucket = self._buckets.get(old)
+                if bucket is not None:
+                    bucket.discard(row)
+                    if not bucket:
+                        del self._buckets[old]
+            if day != _NO_DAY:
+                self._buckets[day].add(row)
+                self._cache.pop(day, None)
+        self._row_days[rows] = days
+        self._row_minutes[rows] = minutes
+
+
+# Registry per percorso
+_day_indexes: Dict[str, AppointmentDayIndex] = {}
+_day_indexes_lock = threading.Lock()
+
+def get_appointment_day_index(path: Optional[str] = None) -> AppointmentDayIndex:
+    """Get the shared appointment day index for `path` (default: APPUNTA.DBF from config)."""
+    path = path or get_config().get_dbf_path('APPUNTA')
+    key = os.path.normcase(os.path.abspath(path))
+    with _day_indexes_lock:
+        if key not in _day_indexes:
+            _day_indexes[key] = AppointmentDayIndex(path)
+        return _day_indexes[key]
+
+
+def refresh_appointment_day_indexes() -> None:
+    """Riallinea tutti gli indici per giorno istanziati (chiamato dal file watcher)."""
+    with _day_indexes_lock:
+        indexes = list(_day_indexes.values())
+    for index in indexes:
+        try:
+            index.refresh()
+        except Exception as e:
+            logger.warning(f"Refresh appointment day index {index.path} fallito: {e}")
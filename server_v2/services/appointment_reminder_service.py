@@ -8,21 +8,29 @@ Flusso per ogni appuntamento:
 4. Se no WA o solo fisso: SMS via Brevo
 5. Solo fisso: alert push alla segreteria, nessun automatismo
 6. Log in patient_communications (SQLite)
+
+run_reminders lavora a fasi sull'intero lotto: stato inviato/confermato con una
+sola query, cache WhatsApp in blocco con verifiche Evolution concorrenti per i
+soli numeri mancanti, invii sul pool di ReminderDispatcher (rate limit per
+canale, retry, idempotenza). I tempi di ogni fase finiscono in stats['timing_ms'].
 """
 
 import os
 import logging
-import sqlite3
+import time
 import requests
-import dbf
 import pytz
 from datetime import datetime, date, timedelta
 from typing import Optional
 
 from core.config_manager import get_config
+from core.database_manager import db_connection
 from core.paths import STUDIO_DIMA_DB_PATH
-from core.constants_v2 import TIPI_APPUNTAMENTO
+from core.constants_v2 import COLONNE, TIPI_APPUNTAMENTO
 from core.reminder_db import ensure_reminder_tables, is_appointment_confirmed
+from services.appointment_day_index import get_appointment_day_index
+from services.patient_index import get_patient_index
+from services.reminder_dispatcher import DispatchJob, ReminderDispatcher
 
 ROME_TZ = pytz.timezone('Europe/Rome')
 
@@ -58,6 +66,9 @@ REMINDER_MESSAGES = {
 
 _sent_this_session: set[str] = set()  # chiave: "patient_id|ap_date|ap_time|type"
 
+# Esiti HTTP per cui un invio fallito può essere ritentato
+_RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
 
 def _session_key(patient_id: str, ap_date: str, ap_time: str, reminder_type: str) -> str:
     return f"{patient_id}|{ap_date}|{ap_time}|{reminder_type}"
@@ -109,7 +120,9 @@ def _normalize_phone(phone: str) -> str:
 
 def get_upcoming_appointments(reminder_type: str, slot: str = 'all') -> list[dict]:
     """
-    Legge APPUNTA.DBF e restituisce gli appuntamenti da notificare.
+    Restituisce gli appuntamenti da notificare leggendo solo i giorni
+    interessati dall'indice per giorno di APPUNTA.DBF; i contatti vengono
+    dall'indice pazienti.
 
     reminder_type '24h': appuntamenti di DOMANI (data == domani)
       slot='morning'   -> ore < morning_end (da config DB)
@@ -141,52 +154,53 @@ def get_upcoming_appointments(reminder_type: str, slot: str = 'all') -> list[dic
     if morning_threshold is None:
         morning_threshold = 13  # Default fallback
 
-    # --- Appuntamenti ---
+    # --- Appuntamenti: solo i bucket dei giorni interessati ---
+    if reminder_type == '24h':
+        days = [tomorrow]
+    else:
+        days = sorted({(now + timedelta(minutes=90)).date(), (now + timedelta(minutes=150)).date()})
+
+    col = COLONNE['appuntamenti']
     rows = []
     try:
-        table = dbf.Table(ap_path, codepage='cp1252')
-        table.open(dbf.READ_ONLY)
-        for record in table:
-            if dbf.is_deleted(record):
+        index = get_appointment_day_index(ap_path)
+        for ap_date in days:
+            table, entries = index.day(ap_date)
+            if not entries:
                 continue
-            try:
-                ap_date = record['DB_APDATA']
-                if hasattr(ap_date, 'date'):
-                    ap_date = ap_date.date()
-                paz_id = str(record['DB_APPACOD']).strip()
-                if not paz_id:
-                    continue
-
-                ora_raw = str(record['DB_APOREIN']).strip()
-                ora_fmt = _ora_fmt(ora_raw)
-                ap_dt = datetime.combine(ap_date, datetime.strptime(ora_fmt, '%H:%M').time())
-
+            selected = []
+            for row, minutes in entries:
                 if reminder_type == '24h':
-                    if ap_date != tomorrow:
-                        continue
                     if slot == 'morning':
-                        match = (ap_dt.hour < morning_threshold)
+                        match = (minutes // 60 < morning_threshold)
                     elif slot == 'afternoon':
-                        match = (ap_dt.hour >= morning_threshold)
+                        match = (minutes // 60 >= morning_threshold)
                     else:
                         match = True
                 else:
                     # Appuntamenti tra 90 e 150 minuti da adesso
+                    ap_dt = datetime.combine(ap_date, datetime.min.time()) + timedelta(minutes=minutes)
                     delta = (ap_dt - now).total_seconds() / 60
                     match = (90 <= delta <= 150)
-
                 if match:
-                    rows.append({
-                        'patient_id': paz_id,
-                        'appointment_date': str(ap_date),
-                        'appointment_time': ora_fmt,
-                        'tipo': str(record['DB_GUARDIA']).strip(),
-                        'studio': str(record['DB_APSTUDI']).strip(),
-                        'nome_dbf': str(record['DB_APDESCR']).strip(),
-                    })
-            except Exception:
+                    selected.append((row, minutes))
+            if not selected:
                 continue
-        table.close()
+
+            positions = [row for row, _ in selected]
+            fields = {
+                key: table.values(col[key], positions) if table.has_field(col[key]) else [''] * len(positions)
+                for key in ('id_paziente', 'tipo', 'studio', 'descrizione')
+            }
+            for pos, (_, minutes) in enumerate(selected):
+                rows.append({
+                    'patient_id': str(fields['id_paziente'][pos] or '').strip(),
+                    'appointment_date': str(ap_date),
+                    'appointment_time': f"{minutes // 60:02d}:{minutes % 60:02d}",
+                    'tipo': str(fields['tipo'][pos] or '').strip(),
+                    'studio': str(fields['studio'][pos] or '').strip(),
+                    'nome_dbf': str(fields['descrizione'][pos] or '').strip(),
+                })
     except Exception as e:
         logger.error(f"Errore lettura APPUNTA.DBF: {e}")
         return []
@@ -194,28 +208,10 @@ def get_upcoming_appointments(reminder_type: str, slot: str = 'all') -> list[dic
     if not rows:
         return []
 
-    # --- Pazienti ---
-    paz_ids = {r['patient_id'] for r in rows}
+    # --- Pazienti: contatti dall'indice anagrafico ---
     pazienti: dict[str, dict] = {}
     try:
-        table = dbf.Table(paz_path, codepage='cp1252')
-        table.open(dbf.READ_ONLY)
-        for record in table:
-            if dbf.is_deleted(record):
-                continue
-            try:
-                pid = str(record['DB_CODE']).strip()
-                if pid not in paz_ids:
-                    continue
-                pazienti[pid] = {
-                    'nome': str(record['DB_PANOME']).strip(),
-                    'cell': str(record['DB_PACELLU']).strip(),
-                    'tel': str(record['DB_PATELEF']).strip(),
-                    'email': str(record['DB_PAEMAIL']).strip(),
-                }
-            except Exception:
-                continue
-        table.close()
+        pazienti = get_patient_index(paz_path).contacts({r['patient_id'] for r in rows})
     except Exception as e:
         logger.error(f"Errore lettura PAZIENTI.DBF: {e}")
 
@@ -242,26 +238,43 @@ def check_whatsapp(patient_id: str, phone: str) -> tuple[bool, Optional[str]]:
     Ordine: cache SQLite → studiobot_pazienti PostgreSQL → Evolution API.
     Ritorna (has_whatsapp, wa_jid).
     """
-    phone_norm = _normalize_phone(phone)
-
     # 1. Cache SQLite
+    cached = _load_wa_cache([patient_id]).get(patient_id)
+    if cached is not None:
+        return cached
+
+    # 2. Evolution API
+    return _check_whatsapp_remote(patient_id, phone)
+
+
+def _load_wa_cache(patient_ids: list[str]) -> dict[str, tuple[bool, Optional[str]]]:
+    """Esiti WhatsApp in cache (non più vecchi di 30 giorni) per più pazienti in una query."""
+    result: dict[str, tuple[bool, Optional[str]]] = {}
+    ids = list(dict.fromkeys(patient_ids))
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT has_whatsapp, wa_jid, checked_at FROM pazienti_wa_cache WHERE patient_id = ?",
-            (patient_id,)
-        )
-        row = cur.fetchone()
-        conn.close()
-        if row and row[0] is not None:
-            checked_at = datetime.fromisoformat(row[2]) if row[2] else None
-            if checked_at and (datetime.now() - checked_at).days < 30:
-                return bool(row[0]), row[1]
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='appointment_reminder_service', row_factory=None) as conn:
+            cur = conn.cursor()
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                cur.execute(
+                    f"SELECT patient_id, has_whatsapp, wa_jid, checked_at FROM pazienti_wa_cache "
+                    f"WHERE patient_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                for pid, has_wa, jid, checked in cur.fetchall():
+                    if has_wa is None:
+                        continue
+                    checked_at = datetime.fromisoformat(checked) if checked else None
+                    if checked_at and (datetime.now() - checked_at).days < 30:
+                        result[pid] = (bool(has_wa), jid)
     except Exception as e:
         logger.warning(f"Errore lettura wa_cache: {e}")
+    return result
 
-    # 2. Evolution API
+
+def _check_whatsapp_remote(patient_id: str, phone: str) -> tuple[bool, Optional[str]]:
+    """Verifica WhatsApp via Evolution API (aggiorna la cache)."""
+    phone_norm = _normalize_phone(phone)
     try:
         r = requests.post(
             f"{EVOLUTION_BASE_URL}/chat/whatsappNumbers/{EVOLUTION_INSTANCE}",
@@ -293,16 +306,14 @@ def check_whatsapp(patient_id: str, phone: str) -> tuple[bool, Optional[str]]:
 
 def _save_wa_cache(patient_id: str, phone: str, has_wa: bool, jid: Optional[str]):
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.execute("""
-            INSERT INTO pazienti_wa_cache (patient_id, phone, has_whatsapp, wa_jid, checked_at)
-            VALUES (?, ?, ?, ?, ?)
-            ON CONFLICT(patient_id) DO UPDATE SET
-                phone=excluded.phone, has_whatsapp=excluded.has_whatsapp,
-                wa_jid=excluded.wa_jid, checked_at=excluded.checked_at
-        """, (patient_id, phone, 1 if has_wa else 0, jid, datetime.now().isoformat()))
-        conn.commit()
-        conn.close()
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='appointment_reminder_service', row_factory=None) as conn:
+            conn.execute("""
+                INSERT INTO pazienti_wa_cache (patient_id, phone, has_whatsapp, wa_jid, checked_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(patient_id) DO UPDATE SET
+                    phone=excluded.phone, has_whatsapp=excluded.has_whatsapp,
+                    wa_jid=excluded.wa_jid, checked_at=excluded.checked_at
+            """, (patient_id, phone, 1 if has_wa else 0, jid, datetime.now().isoformat()))
     except Exception as e:
         logger.warning(f"Errore salvataggio wa_cache: {e}")
 
@@ -341,7 +352,11 @@ def send_whatsapp_text(phone: str, text: str) -> dict:
                 msg_id = key.get('id', '') if isinstance(key, dict) else str(key or '')
             return {'success': True, 'message_id': msg_id, 'channel': 'whatsapp'}
         logger.warning(f"Evolution API error {r.status_code}: {data}")
-        return {'success': False, 'error': str(data)}
+        return {'success': False, 'error': str(data), 'retryable': r.status_code in _RETRYABLE_STATUS}
+    except requests.ConnectionError as e:
+        # Connessione rifiutata: il messaggio non è partito, si può ritentare
+        logger.error(f"Errore invio WA: {e}")
+        return {'success': False, 'error': str(e), 'retryable': True}
     except Exception as e:
         logger.error(f"Errore invio WA: {e}")
         return {'success': False, 'error': str(e)}
@@ -373,6 +388,7 @@ def send_sms_reminder(phone: str, patient_name: str, ap_date: str, ap_time: str,
         'message_id': result.get('message_id', ''),
         'channel': 'sms',
         'error': result.get('message') if not result.get('success') else None,
+        'retryable': result.get('status_code') in _RETRYABLE_STATUS,
     }
 
 
@@ -386,40 +402,70 @@ def _already_sent(patient_id: str, ap_date: str, ap_time: str, reminder_type: st
     if key in _sent_this_session:
         return True
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT id FROM patient_communications
-            WHERE patient_id = ? AND appointment_date = ? AND appointment_time = ? AND type = ?
-            AND stato != 'failed'
-        """, (patient_id, ap_date, ap_time, reminder_type))
-        exists = cur.fetchone() is not None
-        conn.close()
-        if exists:
-            _sent_this_session.add(key)
-        return exists
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='appointment_reminder_service', row_factory=None) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT id FROM patient_communications
+                WHERE patient_id = ? AND appointment_date = ? AND appointment_time = ? AND type = ?
+                AND stato != 'failed'
+            """, (patient_id, ap_date, ap_time, reminder_type))
+            exists = cur.fetchone() is not None
+            if exists:
+                _sent_this_session.add(key)
+            return exists
     except Exception as e:
         logger.warning(f"Errore check duplicati: {e}")
         return False
 
 
+def _load_precheck_state(appointments: list[dict], reminder_type: str) -> Optional[tuple[set, set]]:
+    """
+    Stato di tutti gli appuntamenti del lotto con una sola query:
+    (già inviati per questo tipo, confermati), come chiavi (patient_id, data, ora).
+    None se la query non è eseguibile: il chiamante ripiega sui controlli singoli.
+    """
+    dates = sorted({a['appointment_date'] for a in appointments})
+    sent: set = set()
+    confirmed: set = set()
+    if not dates:
+        return sent, confirmed
+    marks = ','.join('?' * len(dates))
+    try:
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='appointment_reminder_service', row_factory=None) as conn:
+            cur = conn.cursor()
+            cur.execute(f"""
+                SELECT 'sent', patient_id, appointment_date, appointment_time FROM patient_communications
+                WHERE type = ? AND stato != 'failed' AND appointment_date IN ({marks})
+                UNION ALL
+                SELECT 'confirmed', patient_id, appointment_date, appointment_time FROM patient_communications
+                WHERE stato = 'confirmed' AND appointment_date IN ({marks})
+                UNION ALL
+                SELECT 'confirmed', patient_id, appointment_date, appointment_time FROM appointment_confirmations
+                WHERE response = 'confirmed' AND appointment_date IN ({marks})
+            """, (reminder_type, *dates, *dates, *dates))
+            for kind, pid, ap_date, ap_time in cur.fetchall():
+                (sent if kind == 'sent' else confirmed).add((pid, ap_date, ap_time))
+    except Exception as e:
+        logger.warning(f"Errore pre-check reminder, controllo per appuntamento: {e}")
+        return None
+    return sent, confirmed
+
+
 def _log_communication(patient_id: str, patient_name: str, phone: str,
                         channel: str, reminder_type: str, ap_date: str, ap_time: str,
                         stato: str, message_id: str = '') -> int:
     if stato == 'sent':
         _sent_this_session.add(_session_key(patient_id, ap_date, ap_time, reminder_type))
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO patient_communications
-                (patient_id, patient_name, phone, channel, type, appointment_date, appointment_time, stato, message_id)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (patient_id, patient_name, phone, channel, reminder_type, ap_date, ap_time, stato, message_id))
-        comm_id = cur.lastrowid
-        conn.commit()
-        conn.close()
-        return comm_id
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='appointment_reminder_service', row_factory=None) as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                INSERT INTO patient_communications
+                    (patient_id, patient_name, phone, channel, type, appointment_date, appointment_time, stato, message_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (patient_id, patient_name, phone, channel, reminder_type, ap_date, ap_time, stato, message_id))
+            comm_id = cur.lastrowid
+            return comm_id
     except Exception as e:
         logger.error(f"Errore log comunicazione: {e}")
         return 0
@@ -441,34 +487,32 @@ def get_appointments_pending_followup(hours_before: int = 3) -> list[dict]:
     cutoff_time = (now + timedelta(hours=hours_before)).strftime('%H:%M')
 
     try:
-        conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT DISTINCT patient_id, patient_name, phone, appointment_date, appointment_time, channel
-            FROM patient_communications
-            WHERE appointment_date = ?
-              AND stato = 'sent'
-              AND type != 'followup'
-              AND appointment_time > ?
-              AND appointment_time <= ?
-              AND NOT EXISTS (
-                SELECT 1 FROM patient_communications f
-                WHERE f.patient_id = patient_communications.patient_id
-                  AND f.appointment_date = patient_communications.appointment_date
-                  AND f.appointment_time = patient_communications.appointment_time
-                  AND f.type = 'followup'
-              )
-              AND NOT EXISTS (
-                SELECT 1 FROM appointment_confirmations ac
-                WHERE ac.patient_id = patient_communications.patient_id
-                  AND ac.appointment_date = patient_communications.appointment_date
-                  AND ac.response = 'confirmed'
-              )
-        """, (today, current_time, cutoff_time))
-        rows = [dict(r) for r in cur.fetchall()]
-        conn.close()
-        return rows
+        with db_connection(STUDIO_DIMA_DB_PATH, caller='appointment_reminder_service') as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT DISTINCT patient_id, patient_name, phone, appointment_date, appointment_time, channel
+                FROM patient_communications
+                WHERE appointment_date = ?
+                  AND stato = 'sent'
+                  AND type != 'followup'
+                  AND appointment_time > ?
+                  AND appointment_time <= ?
+                  AND NOT EXISTS (
+                    SELECT 1 FROM patient_communications f
+                    WHERE f.patient_id = patient_communications.patient_id
+                      AND f.appointment_date = patient_communications.appointment_date
+                      AND f.appointment_time = patient_communications.appointment_time
+                      AND f.type = 'followup'
+                  )
+                  AND NOT EXISTS (
+                    SELECT 1 FROM appointment_confirmations ac
+                    WHERE ac.patient_id = patient_communications.patient_id
+                      AND ac.appointment_date = patient_communications.appointment_date
+                      AND ac.response = 'confirmed'
+                  )
+            """, (today, current_time, cutoff_time))
+            rows = [dict(r) for r in cur.fetchall()]
+            return rows
     except Exception as e:
         logger.error(f"Errore lettura pending followup: {e}")
         return []
@@ -545,16 +589,29 @@ def run_reminders(reminder_type: str, dry_run: bool = False, patient_filter: str
     slot:            'morning' | 'afternoon' | 'all' (usato solo per 24h)
     dry_run:         se True, simula senza inviare nulla
     patient_filter:  se valorizzato, processa solo il paziente con questo patient_id
-    Ritorna statistiche: {sent_wa, sent_sms, skipped_fisso, errors, no_phone}
+    Ritorna statistiche: {sent_wa, sent_sms, skipped_fisso, errors, no_phone, timing_ms, dispatch}
     """
+    timing: dict[str, float] = {}
+    started = time.perf_counter()
+
+    def lap(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        timing[stage] = round((now - since) * 1000, 1)
+        return now
+
     ensure_reminder_tables()
     appointments = get_upcoming_appointments(reminder_type, slot=slot)
     if patient_filter:
         appointments = [a for a in appointments if a['patient_id'] == patient_filter]
+    mark = lap('read_appointments', started)
 
     stats = {'sent_wa': 0, 'sent_sms': 0, 'skipped_fisso': [], 'errors': [], 'no_phone': [],
              'dry_run': dry_run, 'simulated_actions': []}
 
+    # Pre-check: inviati e confermati per tutto il lotto
+    precheck = _load_precheck_state(appointments, reminder_type)
+    mobiles: list[tuple[dict, str]] = []
+    seen: set[str] = set()
     for ap in appointments:
         pid = ap['patient_id']
         name = ap['patient_name']
@@ -564,63 +621,28 @@ def run_reminders(reminder_type: str, dry_run: bool = False, patient_filter: str
         tel = ap.get('tel', '').strip()
 
         # Anti-duplicati
-        if _already_sent(pid, ap_date, ap_time, reminder_type):
+        key = _session_key(pid, ap_date, ap_time, reminder_type)
+        if key in seen or key in _sent_this_session:
+            continue
+        seen.add(key)
+        if precheck is None:
+            if _already_sent(pid, ap_date, ap_time, reminder_type):
+                continue
+        elif (pid, ap_date, ap_time) in precheck[0]:
+            _sent_this_session.add(key)
             continue
 
         # Se ha già confermato (SI alla 24h), non disturbare con il 2h
-        if reminder_type == '2h' and is_appointment_confirmed(pid, ap_date, ap_time):
-            continue
+        if reminder_type == '2h':
+            if precheck is None:
+                if is_appointment_confirmed(pid, ap_date, ap_time):
+                    continue
+            elif (pid, ap_date, ap_time) in precheck[1]:
+                continue
 
         # Classifica contatto
         if cell and _is_mobile(cell):
-            phone = cell
-            has_wa, _ = check_whatsapp(pid, phone)
-            if dry_run:
-                channel = 'whatsapp' if has_wa else 'sms'
-                logger.info(f"[DRY RUN] {name} -> {channel} ({phone})")
-                if has_wa:
-                    stats['sent_wa'] += 1
-                else:
-                    stats['sent_sms'] += 1
-                
-                # Record simulated action
-                tpl = REMINDER_MESSAGES[reminder_type][channel == 'whatsapp' and 'wa' or 'sms']
-                data_fmt = datetime.strptime(ap_date, '%Y-%m-%d').strftime('%d/%m')
-                if channel == 'whatsapp':
-                    parts = name.split() if name else []
-                    nome = parts[-1] if len(parts) > 1 else (parts[0] if parts else 'paziente')
-                    text = tpl.format(nome=nome, data=data_fmt, ora=ap_time)
-                else:
-                    text = tpl.format(data=data_fmt, ora=ap_time)
-                
-                stats['simulated_actions'].append({
-                    'patient_id': pid,
-                    'patient_name': name,
-                    'phone': phone,
-                    'channel': channel,
-                    'type': reminder_type,
-                    'appointment_date': ap_date,
-                    'appointment_time': ap_time,
-                    'message': text
-                })
-            else:
-                if has_wa:
-                    result = send_whatsapp_reminder(phone, name, ap_date, ap_time, reminder_type)
-                else:
-                    result = send_sms_reminder(phone, name, ap_date, ap_time, reminder_type)
-
-                channel = result.get('channel', 'sms')
-                stato = 'sent' if result['success'] else 'failed'
-                _log_communication(pid, name, phone, channel, reminder_type, ap_date, ap_time,
-                                   stato, result.get('message_id', ''))
-                if result['success']:
-                    if channel == 'whatsapp':
-                        stats['sent_wa'] += 1
-                    else:
-                        stats['sent_sms'] += 1
-                else:
-                    stats['errors'].append({'patient': name, 'error': result.get('error', '')})
-
+            mobiles.append((ap, cell))
         elif tel:
             # Solo fisso: nessun automatismo, verrà notificata la segreteria dopo
             stats['skipped_fisso'].append({'patient_id': pid, 'name': name,
@@ -628,11 +650,89 @@ def run_reminders(reminder_type: str, dry_run: bool = False, patient_filter: str
         else:
             stats['no_phone'].append({'patient_id': pid, 'name': name,
                                       'ap_date': ap_date, 'ap_time': ap_time})
+    mark = lap('precheck', mark)
+
+    # Check WhatsApp: cache in blocco, Evolution in parallelo solo per i mancanti
+    dispatcher = ReminderDispatcher()
+    wa_status = _load_wa_cache([ap['patient_id'] for ap, _ in mobiles])
+    missing = list({ap['patient_id']: (ap['patient_id'], phone)
+                    for ap, phone in mobiles if ap['patient_id'] not in wa_status}.values())
+    checked = dispatcher.map_concurrent(lambda item: _check_whatsapp_remote(*item), missing, channel='wa_check')
+    wa_status.update({pid: result for (pid, _), result in zip(missing, checked)})
+    mark = lap('whatsapp_check', mark)
+
+    jobs = []
+    for ap, phone in mobiles:
+        pid = ap['patient_id']
+        name = ap['patient_name']
+        ap_date = ap['appointment_date']
+        ap_time = ap['appointment_time']
+        has_wa = wa_status[pid][0]
+        if dry_run:
+            channel = 'whatsapp' if has_wa else 'sms'
+            logger.info(f"[DRY RUN] {name} -> {channel} ({phone})")
+            if has_wa:
+                stats['sent_wa'] += 1
+            else:
+                stats['sent_sms'] += 1
+
+            # Record simulated action
+            tpl = REMINDER_MESSAGES[reminder_type][channel == 'whatsapp' and 'wa' or 'sms']
+            data_fmt = datetime.strptime(ap_date, '%Y-%m-%d').strftime('%d/%m')
+            if channel == 'whatsapp':
+                parts = name.split() if name else []
+                nome = parts[-1] if len(parts) > 1 else (parts[0] if parts else 'paziente')
+                text = tpl.format(nome=nome, data=data_fmt, ora=ap_time)
+            else:
+                text = tpl.format(data=data_fmt, ora=ap_time)
+
+            stats['simulated_actions'].append({
+                'patient_id': pid,
+                'patient_name': name,
+                'phone': phone,
+                'channel': channel,
+                'type': reminder_type,
+                'appointment_date': ap_date,
+                'appointment_time': ap_time,
+                'message': text
+            })
+            continue
+
+        send = send_whatsapp_reminder if has_wa else send_sms_reminder
+        jobs.append(DispatchJob(
+            key=_session_key(pid, ap_date, ap_time, reminder_type),
+            channel='whatsapp' if has_wa else 'sms',
+            send=lambda send=send, phone=phone, name=name, ap_date=ap_date, ap_time=ap_time:
+                send(phone, name, ap_date, ap_time, reminder_type),
+            context={'patient_id': pid, 'name': name, 'phone': phone,
+                     'ap_date': ap_date, 'ap_time': ap_time},
+        ))
+
+    def on_result(job: DispatchJob, result: dict):
+        ctx = job.context
+        channel = result.get('channel', 'sms')
+        stato = 'sent' if result['success'] else 'failed'
+        _log_communication(ctx['patient_id'], ctx['name'], ctx['phone'], channel, reminder_type,
+                           ctx['ap_date'], ctx['ap_time'], stato, result.get('message_id', ''))
+        if result['success']:
+            if channel == 'whatsapp':
+                stats['sent_wa'] += 1
+            else:
+                stats['sent_sms'] += 1
+        else:
+            stats['errors'].append({'patient': ctx['name'], 'error': result.get('error', '')})
+
+    dispatcher.dispatch(jobs, on_result)
+    lap('dispatch', mark)
 
     # Notifica segreteria per pazienti con solo fisso
     if stats['skipped_fisso']:
         _notify_staff_fisso(stats['skipped_fisso'], reminder_type)
 
+    lap('total', started)
+    stats['timing_ms'] = timing
+    stats['dispatch'] = {**dispatcher.stats, 'wa_checks': len(missing), 'jobs': len(jobs)}
+
     # Log su file (stesso pattern scheduler esistente)
     _write_log(reminder_type, stats)
 
@@ -670,6 +770,8 @@ def _write_log(reminder_type: str, stats: dict):
         'no_phone': len(stats.get('no_phone', [])),
         'errors': stats['errors'],
     }
+    if 'timing_ms' in stats:
+        entry['timing_ms'] = stats['timing_ms']
     try:
         log_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'automation_reminders.log')
         with open(log_path, 'a', encoding='utf-8') as f:
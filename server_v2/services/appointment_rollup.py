@@ -0,0 +1,446 @@
+"""
+📊 Appointment Rollup Cube per StudioDimaAI Server V2
+=====================================================
+
+Cubo di aggregazione degli appuntamenti di APPUNTA.DBF:
+
+- Una cella per (anno, mese, giorno, tipo, medico, studio) con numero di
+  appuntamenti e minuti prenotati; chiave impacchettata in un int64
+- Costruzione vettoriale sulle colonne del DBF mirror, aggiornamento
+  incrementale sulle sole righe con hash cambiato (si toglie il contributo
+  vecchio della riga e si aggiunge quello nuovo)
+- Stato per riga salvato su disco accanto al mirror: dopo un riavvio si
+  ricostruiscono le celle senza decodificare il DBF e si applicano solo le
+  differenze
+
+Le statistiche del calendario (anno, prime visite YTD, riepilogo mesi)
+leggono le celle invece di scandire APPUNTA ad ogni richiesta.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core.config_manager import get_config
+from core.constants_v2 import COLONNE
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+from services.occupancy_index import dbf_times_to_minutes
+
+logger = logging.getLogger(__name__)
+
+# Tipo appuntamento delle prime visite
+TIPO_PRIMA_VISITA = 'V'
+
+# Layout della chiave di cella: studio e medico 16 bit, tipo 10, giorno 5, mese 4, anno 8 (da 1900)
+_BITS = (('studio', 0, 16), ('medico', 16, 16), ('tipo', 32, 10), ('day', 42, 5), ('month', 47, 4), ('year', 51, 8))
+_YEAR_BASE = 1900
+_MAX_TIPI = 1 << 10
+DIMENSIONS = tuple(name for name, _, _ in reversed(_BITS))
+
+# Salvataggio dello stato al piu' ogni N secondi durante gli aggiornamenti incrementali
+PERSIST_INTERVAL = 60.0
+
+
+def _pack(year, month, day, tipo, medico, studio) -> np.ndarray:
+    code = np.zeros(len(year), dtype=np.int64)
+    for (name, shift, _), values in zip(_BITS, (studio, medico, tipo, day, month, year - _YEAR_BASE)):
+        code |= np.asarray(values, dtype=np.int64) << shift
+    return code
+
+
+def _unpack(codes: np.ndarray) -> Dict[str, np.ndarray]:
+    dims = {name: (codes >> shift) & ((1 << bits) - 1) for name, shift, bits in _BITS}
+    dims['year'] = dims['year'] + _YEAR_BASE
+    return dims
+
+
+class AppointmentRollupCube:
+    """
+    Conteggi e minuti degli appuntamenti di un file APPUNTA.DBF per cella.
+
+    Come get_stats_aggregates che sostituisce, considera i soli record non
+    cancellati con data valorizzata.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._table: Optional[MirrorTable] = None
+        self._ready = False
+        self._hashes = np.zeros(0, dtype=np.uint64)
+
+        # Stato per riga: cella (-1 se esclusa) e minuti
+        self._row_cells = np.zeros(0, dtype=np.int64)
+        self._row_minutes = np.zeros(0, dtype=np.int64)
+
+        # Celle: chiave impacchettata, conteggio e minuti (solo in aggiunta, i conteggi possono tornare a 0)
+        self._tipi: List[str] = []
+        self._tipo_codes: Dict[str, int] = {}
+        self._cell_index: Dict[int, int] = {}
+        self._cell_codes = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._minutes = np.zeros(0, dtype=np.int64)
+        self._dims: Optional[Dict[str, np.ndarray]] = None
+
+        self._built_at: Optional[float] = None
+        self._updated_at: Optional[float] = None
+        self._persisted_at: Optional[float] = None
+        self._loaded_from_disk = False
+        self._last_build_ms: Optional[float] = None
+        self._last_update_ms: Optional[float] = None
+        self._stats = {'full_builds': 0, 'incremental_updates': 0, 'rows_indexed': 0, 'queries': 0}
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def aggregate(self,
+                  group_by: Sequence[str] = ('year', 'month'),
+                  years: Optional[Iterable[int]] = None,
+                  months: Optional[Iterable[int]] = None,
+                  tipo: Optional[str] = None,
+                  medico: Optional[int] = None,
+                  studio: Optional[int] = None,
+                  until: Optional[Tuple[int, int]] = None) -> List[Dict[str, Any]]:
+        """
+        Somma le celle per le dimensioni in `group_by` (vedi DIMENSIONS).
+
+        Filtri opzionali per anno, mese, tipo, medico e studio; `until`
+        (mese, giorno) limita ogni anno al periodo fino a quella data (YTD).
+        Restituisce dict con le dimensioni, 'count' e 'minutes', ordinati.
+        """
+        unknown = set(group_by) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Dimensioni non valide: {sorted(unknown)}")
+
+        with self._lock:
+            self._ensure_current()
+            self._stats['queries'] += 1
+            dims = self._cell_dims()
+            mask = self._counts > 0
+            if years is not None:
+                mask &= np.isin(dims['year'], list(years))
+            if months is not None:
+                mask &= np.isin(dims['month'], list(months))
+            if tipo is not None:
+                mask &= dims['tipo'] == self._tipo_codes.get(tipo.strip(), -1)
+            if medico is not None:
+                mask &= dims['medico'] == int(medico)
+            if studio is not None:
+                mask &= dims['studio'] == int(studio)
+            if until is not None:
+                mask &= self._within(dims, until)
+
+            cells = np.flatnonzero(mask)
+            counts, minutes = self._counts[cells], self._minutes[cells]
+            tipi = list(self._tipi)
+
+        if not group_by:
+            return [{'count': int(counts.sum()), 'minutes': int(minutes.sum())}]
+        keys = np.stack([dims[name][cells] for name in group_by], axis=1)
+        groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        group_counts = np.bincount(inverse, weights=counts, minlength=len(groups))
+        group_minutes = np.bincount(inverse, weights=minutes, minlength=len(groups))
+
+        result = []
+        for values, count, total_minutes in zip(groups.tolist(), group_counts.tolist(), group_minutes.tolist()):
+            row = dict(zip(group_by, values))
+            if 'tipo' in row:
+                row['tipo'] = tipi[row['tipo']]
+            row['count'] = int(count)
+            row['minutes'] = int(total_minutes)
+            result.append(row)
+        return result
+
+    def monthly_stats(self, years: List[int], ytd_limit: Optional[Tuple[int, int]] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Statistiche mensili nel formato di DBFOptimizedReader.get_stats_aggregates:
+        per anno 12 voci con count, first_visits e first_visits_ytd.
+        """
+        years = [int(year) for year in years]
+        limit = ytd_limit if ytd_limit else (13, 32)
+        with self._lock:
+            self._ensure_current()
+            self._stats['queries'] += 1
+            dims = self._cell_dims()
+            first_visit = dims['tipo'] == self._tipo_codes.get(TIPO_PRIMA_VISITA, -1)
+            within = first_visit & self._within(dims, limit)
+            counts = self._counts[:len(self._cell_codes)]
+
+            result = {}
+            for year in years:
+                in_year = dims['year'] == year
+                months = dims['month'][in_year]
+                totals = np.bincount(months, weights=counts[in_year], minlength=13)
+                firsts = np.bincount(months, weights=counts[in_year] * first_visit[in_year], minlength=13)
+                firsts_ytd = np.bincount(months, weights=counts[in_year] * within[in_year], minlength=13)
+                result[str(year)] = [{
+                    'month': month,
+                    'count': int(totals[month]),
+                    'first_visits': int(firsts[month]),
+                    'first_visits_ytd': int(firsts_ytd[month]),
+                } for month in range(1, 13)]
+            return result
+
+    def refresh(self) -> None:
+        """Riallinea subito il cubo al file (es. su evento del file watcher)."""
+        get_dbf_mirror().invalidate(self.path)
+        with self._lock:
+            self._ensure_current()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Freschezza e tempi di costruzione del cubo per /calendar/health."""
+        try:
+            source = get_dbf_mirror().table_at(self.path)
+        except Exception as e:
+            source, source_error = None, str(e)
+        else:
+            source_error = None
+        with self._lock:
+            now = time.time()
+            status = {
+                'path': self.path,
+                'rows': int(self._row_cells.size),
+                'rows_included': int((self._row_cells >= 0).sum()),
+                'cells': int((self._counts > 0).sum()),
+                'generation': self._table.generation if self._table is not None else None,
+                'source_generation': source.generation if source is not None else None,
+                'in_sync': source is not None and source is self._table,
+                'built_at': _iso(self._built_at),
+                'updated_at': _iso(self._updated_at),
+                'age_seconds': round(now - self._updated_at, 1) if self._updated_at else None,
+                'last_build_ms': self._last_build_ms,
+                'last_update_ms': self._last_update_ms,
+                'loaded_from_disk': self._loaded_from_disk,
+                'persisted_at': _iso(self._persisted_at),
+                'stats': dict(self._stats),
+            }
+        if source_error:
+            status['source_error'] = source_error
+        return status
+
+    # ------------------------------------------------------------------
+    # Sincronizzazione con il mirror
+    # ------------------------------------------------------------------
+
+    def _ensure_current(self) -> MirrorTable:
+        mirror = get_dbf_mirror()
+        table = mirror.table_at(self.path)
+        if table is self._table:
+            return table
+
+        if not self._ready:
+            self._load_persisted(mirror)
+
+        start = time.time()
+        old_count, new_count = self._row_cells.size, len(table)
+        if not self._ready or new_count < old_count:
+            codes, minutes = self._row_values(table, np.arange(new_count, dtype=np.int64))
+            self._build(codes, minutes)
+            self._last_build_ms = round((time.time() - start) * 1000, 1)
+            self._built_at = time.time()
+            self._stats['full_builds'] += 1
+            self._stats['rows_indexed'] += new_count
+            persist = True
+        else:
+            changed = np.flatnonzero(self._hashes[:old_count] != table.hashes[:old_count])
+            rows = np.concatenate([changed, np.arange(old_count, new_count)]).astype(np.int64)
+            if rows.size:
+                codes, minutes = self._row_values(table, rows)
+                self._update(rows, codes, minutes, new_count)
+                self._last_update_ms = round((time.time() - start) * 1000, 1)
+                self._stats['incremental_updates'] += 1
+                self._stats['rows_indexed'] += rows.size
+                logger.debug(f"Rollup {table.name}: {rows.size}/{new_count} righe aggiornate "
+                             f"in {self._last_update_ms}ms")
+            persist = rows.size > 0 and (self._persisted_at is None
+                                         or time.time() - self._persisted_at >= PERSIST_INTERVAL)
+
+        self._hashes = table.hashes.copy()
+        self._table = table
+        self._ready = True
+        self._updated_at = time.time()
+        if persist:
+            self._persist(mirror)
+        return table
+
+    def _row_values(self, table: MirrorTable, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Chiave di cella (-1 se la riga e' esclusa) e minuti prenotati per le righe."""
+        col = COLONNE['appuntamenti']
+        dates = table.column(col['data'])[rows].astype('datetime64[D]')
+        valid = ~table.deleted[rows] & ~np.isnat(dates)
+        years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+        valid &= (years >= _YEAR_BASE) & (years < _YEAR_BASE + 256)
+        months = dates.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        days = (dates - dates.astype('datetime64[M]')).astype(np.int64) + 1
+
+        def number(key: str) -> np.ndarray:
+            if not table.has_field(col[key]):
+                return np.zeros(rows.size, dtype=np.int64)
+            return np.clip(np.nan_to_num(table.numbers(col[key])[rows]), 0, 0xFFFF).astype(np.int64)
+
+        if table.has_field(col['tipo']):
+            raw_tipi = np.char.strip(table.column(col['tipo'])[rows])
+            values, inverse = np.unique(raw_tipi, return_inverse=True)
+            tipi = np.array([self._tipo_code(v.decode('latin-1')) for v in values.tolist()],
+                            dtype=np.int64)[inverse.reshape(-1)] if values.size else np.zeros(0, dtype=np.int64)
+        else:
+            tipi = np.full(rows.size, self._tipo_code(''), dtype=np.int64)
+
+        inizi = dbf_times_to_minutes(table.numbers(col['ora_inizio'])[rows])
+        fini = dbf_times_to_minutes(table.numbers(col['ora_fine'])[rows])
+        minutes = np.where(fini > inizi, fini - inizi, 0)
+
+        codes = _pack(np.where(valid, years, _YEAR_BASE), np.where(valid, months, 0), np.where(valid, days, 0),
+                      tipi, number('medico'), number('studio'))
+        codes[~valid] = -1
+        return codes, np.where(valid, minutes, 0)
+
+    def _tipo_code(self, tipo: str) -> int:
+        code = self._tipo_codes.get(tipo)
+        if code is None:
+            if len(self._tipi) >= _MAX_TIPI - 1:
+                # Vocabolario pieno (dati anomali): tutto nell'ultimo codice
+                return _MAX_TIPI - 1
+            code = self._tipo_codes[tipo] = len(self._tipi)
+            self._tipi.append(tipo)
+        return code
+
+    def _build(self, codes: np.ndarray, minutes: np.ndarray) -> None:
+        included = codes >= 0
+        cell_codes, inverse = np.unique(codes[included], return_inverse=True)
+        inverse = inverse.reshape(-1)
+        self._cell_codes = cell_codes
+        self._cell_index = {code: cell for cell, code in enumerate(cell_codes.tolist())}
+        self._counts = np.bincount(inverse, minlength=cell_codes.size).astype(np.int64)
+        self._minutes = np.bincount(inverse, weights=minutes[included], minlength=cell_codes.size).astype(np.int64)
+        self._row_cells = np.full(codes.size, -1, dtype=np.int64)
+        self._row_cells[included] = inverse
+        self._row_minutes = np.asarray(minutes, dtype=np.int64).copy()
+        self._dims = None
+
+    def _update(self, rows: np.ndarray, codes: np.ndarray, minutes: np.ndarray, count: int) -> None:
+        if count > self._row_cells.size:
+            missing = count - self._row_cells.size
+            self._row_cells = np.concatenate([self._row_cells, np.full(missing, -1, dtype=np.int64)])
+            self._row_minutes = np.concatenate([self._row_minutes, np.zeros(missing, dtype=np.int64)])
+
+        # Tolgo il contributo precedente delle righe
+        old_cells = self._row_cells[rows]
+        had_cell = old_cells >= 0
+        np.subtract.at(self._counts, old_cells[had_cell], 1)
+        np.subtract.at(self._minutes, old_cells[had_cell], self._row_minutes[rows][had_cell])
+
+        # ...e aggiungo quello nuovo, creando le celle mancanti
+        new_cells = np.array([self._cell_for(code) if code >= 0 else -1 for code in codes.tolist()], dtype=np.int64)
+        has_cell = new_cells >= 0
+        np.add.at(self._counts, new_cells[has_cell], 1)
+        np.add.at(self._minutes, new_cells[has_cell], minutes[has_cell])
+        self._row_cells[rows] = new_cells
+        self._row_minutes[rows] = minutes
+
+    def _cell_for(self, code: int) -> int:
+        cell = self._cell_index.get(code)
+        if cell is None:
+            cell = self._cell_index[code] = self._cell_codes.size
+            self._cell_codes = np.append(self._cell_codes, code)
+            self._counts = np.append(self._counts, 0)
+            self._minutes = np.append(self._minutes, 0)
+            self._dims = None
+        return cell
+
+    def _cell_dims(self) -> Dict[str, np.ndarray]:
+        if self._dims is None:
+            self._dims = _unpack(self._cell_codes)
+        return self._dims
+
+    @staticmethod
+    def _within(dims: Dict[str, np.ndarray], until: Tuple[int, int]) -> np.ndarray:
+        month, day = until
+        return (dims['month'] < month) | ((dims['month'] == month) & (dims['day'] <= day))
+
+    # ------------------------------------------------------------------
+    # Persistenza
+    # ------------------------------------------------------------------
+
+    def _state_file(self, mirror) -> Path:
+        return Path(mirror.mirror_dir) / f"{Path(self.path).stem.upper()}_rollup.npz"
+
+    def _persist(self, mirror) -> None:
+        try:
+            row_codes = np.where(self._row_cells >= 0, self._cell_codes[np.maximum(self._row_cells, 0)]
+                                 if self._cell_codes.size else -1, -1)
+            meta = {'path': self.path, 'tipi': self._tipi, 'generation': self._table.generation}
+            buffer = io.BytesIO()
+            np.savez(buffer, _meta=np.array(json.dumps(meta)), codes=row_codes,
+                     minutes=self._row_minutes, hashes=self._hashes)
+            target = self._state_file(mirror)
+            tmp = target.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp, target)
+            self._persisted_at = time.time()
+        except Exception as e:
+            logger.warning(f"Salvataggio rollup {self.path} fallito: {e}")
+
+    def _load_persisted(self, mirror) -> None:
+        target = self._state_file(mirror)
+        if not target.exists():
+            return
+        try:
+            start = time.time()
+            with np.load(target, allow_pickle=False) as data:
+                meta = json.loads(str(data['_meta']))
+                if os.path.normcase(os.path.abspath(meta['path'])) != os.path.normcase(os.path.abspath(self.path)):
+                    return
+                codes, minutes, hashes = data['codes'], data['minutes'], data['hashes']
+            self._tipi = list(meta['tipi'])
+            self._tipo_codes = {tipo: code for code, tipo in enumerate(self._tipi)}
+            self._build(codes, minutes)
+            self._hashes = hashes
+            self._ready = True
+            self._loaded_from_disk = True
+            self._built_at = self._persisted_at = time.time()
+            self._last_build_ms = round((time.time() - start) * 1000, 1)
+            logger.debug(f"Rollup {self.path}: stato caricato da {target} ({codes.size} righe)")
+        except Exception as e:
+            logger.warning(f"Rollup persistito {target} non leggibile, ricostruzione completa: {e}")
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+# Registry per percorso
+_rollup_cubes: Dict[str, AppointmentRollupCube] = {}
+_rollup_cubes_lock = threading.Lock()
+
+
+def get_appointment_rollup(path: Optional[str] = None) -> AppointmentRollupCube:
+    """Get the shared rollup cube for `path` (default: APPUNTA.DBF from config)."""
+    path = path or get_config().get_dbf_path('APPUNTA')
+    key = os.path.normcase(os.path.abspath(path))
+    with _rollup_cubes_lock:
+        if key not in _rollup_cubes:
+            _rollup_cubes[key] = AppointmentRollupCube(path)
+        return _rollup_cubes[key]
+
+
+def refresh_appointment_rollups() -> None:
+    """Riallinea tutti i cubi istanziati (chiamato dal file watcher)."""
+    with _rollup_cubes_lock:
+        cubes = list(_rollup_cubes.values())
+    for cube in cubes:
+        try:
+            cube.refresh()
+        except Exception as e:
+            logger.warning(f"Refresh rollup {cube.path} fallito: {e}")
@@ -0,0 +1,599 @@
+"""
+Sync incrementale Google Calendar
+=================================
+
+La sync completa normalizza tutti i record della finestra, scarica tutti gli
+eventi Google e confronta tutto ad ogni esecuzione. Qui il costo segue le
+modifiche:
+
+- il ledger SQLite (`CALENDAR_SYNC_DB_PATH`) conserva per ogni uid l'impronta
+  del record sorgente già sincronizzato e il syncToken di ogni calendario;
+- i record con impronta già nota vengono saltati senza normalizzarli;
+- le modifiche lato Google arrivano da `events.list(syncToken=...)`: gli eventi
+  toccati da altri (non l'eco delle nostre scritture, riconosciuta dall'etag)
+  vengono dimenticati dal ledger e quindi riconciliati come nuovi;
+- gli eventi Google sono indicizzati nello stesso database (uid, fingerprint,
+  data): l'indice si riempie con letture a finestra (`timeMin`/`timeMax`) delle
+  sole date non ancora lette e resta allineato applicando il delta del
+  syncToken, quindi la sync cerca gli eventi esistenti in locale;
+- senza syncToken (primo avvio o token scaduto, 410) l'indice del calendario
+  riparte da zero e il token arriva dalla prima lettura a finestra.
+
+Le chiamate di scrittura passano dal piano batch di calendar_sync_engine.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+from core.appointment_normalizer import normalize_batch
+from core.database_manager import db_connection
+from core.paths import CALENDAR_SYNC_DB_PATH
+from services.calendar_sync_engine import (
+    AimdController,
+    SyncOperation,
+    _is_modified,
+    build_sync_plan,
+    execute_sync_plan,
+    execute_with_retry,
+)
+from services.sync_state_manager import get_sync_state_manager
+
+logger = logging.getLogger(__name__)
+
+_CHUNK = 500  # limite parametri per query IN
+
+# Campi letti da SyncStateManager.generate_appointment_hash
+_HASH_FIELDS = ("DATA", "ORA_INIZIO", "ORA_FINE", "TIPO", "STUDIO", "NOTE", "DESCRIZIONE", "PAZIENTE")
+
+
+def source_fingerprint(record: Dict[str, Any]) -> str:
+    """
+    Impronta del record sorgente: hash di SyncStateManager (campi in maiuscolo
+    o minuscolo, come li accetta il normalizer) più l'id paziente, che entra
+    nell'uid.
+    """
+    view = {name: record.get(name) or record.get(name.lower()) or "" for name in _HASH_FIELDS}
+    base = get_sync_state_manager().generate_appointment_hash(view) or ""
+    patient_id = record.get("_PATIENT_ID") or record.get("id_paziente") or ""
+    return hashlib.sha256(f"{base}|{patient_id}".encode("utf-8")).hexdigest()
+
+
+def _record_calendar(record: Dict[str, Any]) -> Optional[str]:
+    try:
+        studio = int(record.get("STUDIO") or record.get("studio"))
+    except (TypeError, ValueError):
+        return None
+    if studio == 1:
+        return os.getenv("CALENDAR_ID_STUDIO_1") or None
+    if studio == 2:
+        return os.getenv("CALENDAR_ID_STUDIO_2") or None
+    return None
+
+
+def _chunks(values: List[Any]) -> Iterable[List[Any]]:
+    for start in range(0, len(values), _CHUNK):
+        yield values[start:start + _CHUNK]
+
+
+# ============================================================
+# LEDGER
+# ============================================================
+
+class CalendarSyncLedger:
+    """
+    Stato persistente della sync incrementale.
+
+    synced_events: uid -> impronta sorgente, calendario, id evento, data, etag
+    sync_tokens:   calendario -> ultimo nextSyncToken
+    google_events: indice degli eventi Google (uid, fingerprint, data, evento JSON)
+    google_event_windows: intervalli di date già letti da Google per calendario
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = Path(db_path or CALENDAR_SYNC_DB_PATH)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS synced_events (
+                    uid TEXT PRIMARY KEY,
+                    source_hash TEXT NOT NULL,
+                    calendar_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    etag TEXT,
+                    synced_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_synced_events_hash ON synced_events(source_hash);
+                CREATE INDEX IF NOT EXISTS idx_synced_events_date ON synced_events(calendar_id, date);
+                CREATE TABLE IF NOT EXISTS sync_tokens (
+                    calendar_id TEXT PRIMARY KEY,
+                    token TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS google_events (
+                    calendar_id TEXT NOT NULL,
+                    event_id TEXT NOT NULL,
+                    uid TEXT,
+                    fingerprint TEXT,
+                    date TEXT NOT NULL,
+                    etag TEXT,
+                    event TEXT NOT NULL,
+                    PRIMARY KEY (calendar_id, event_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_google_events_uid ON google_events(uid);
+                CREATE INDEX IF NOT EXISTS idx_google_events_fingerprint ON google_events(fingerprint);
+                CREATE INDEX IF NOT EXISTS idx_google_events_date ON google_events(calendar_id, date);
+                CREATE TABLE IF NOT EXISTS google_event_windows (
+                    calendar_id TEXT NOT NULL,
+                    date_from TEXT NOT NULL,
+                    date_to TEXT NOT NULL,
+                    fetched_at TEXT NOT NULL,
+                    PRIMARY KEY (calendar_id, date_from)
+                );
+            """)
+
+    def _connect(self):
+        return db_connection(str(self.db_path), caller='calendar_sync_ledger')
+
+    def _select_in(self, sql: str, values: Iterable[Any], extra: Tuple = ()) -> List[Dict[str, Any]]:
+        values = list(values)
+        rows: List[Dict[str, Any]] = []
+        with self._connect() as conn:
+            for chunk in _chunks(values):
+                query = sql.format(placeholders=",".join("?" * len(chunk)))
+                rows.extend(dict(row) for row in conn.execute(query, (*extra, *chunk)))
+        return rows
+
+    # --- eventi sincronizzati ---
+
+    def by_hashes(self, hashes: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        rows = self._select_in("SELECT * FROM synced_events WHERE source_hash IN ({placeholders})", set(hashes))
+        return {row["source_hash"]: row for row in rows}
+
+    def by_uids(self, uids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        rows = self._select_in("SELECT * FROM synced_events WHERE uid IN ({placeholders})", set(uids))
+        return {row["uid"]: row for row in rows}
+
+    def on_dates(self, calendar_id: str, dates: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        rows = self._select_in(
+            "SELECT * FROM synced_events WHERE calendar_id = ? AND date IN ({placeholders})",
+            set(dates), extra=(calendar_id,))
+        return {row["uid"]: row for row in rows}
+
+    def record(self, entries: List[Tuple[str, str, str, str, str, Optional[str]]]) -> None:
+        """entries: (uid, source_hash, calendar_id, event_id, date, etag)"""
+        if not entries:
+            return
+        now = datetime.now().isoformat()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO synced_events "
+                "(uid, source_hash, calendar_id, event_id, date, etag, synced_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*entry, now) for entry in entries])
+
+    def forget(self, uids: Iterable[str]) -> None:
+        uids = list(set(uids))
+        with self._lock, self._connect() as conn:
+            for chunk in _chunks(uids):
+                conn.execute(f"DELETE FROM synced_events WHERE uid IN ({','.join('?' * len(chunk))})", chunk)
+
+    def forget_calendar(self, calendar_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM synced_events WHERE calendar_id = ?", (calendar_id,))
+
+    # --- syncToken ---
+
+    def get_tokens(self) -> Dict[str, str]:
+        with self._connect() as conn:
+            return {row["calendar_id"]: row["token"] for row in conn.execute("SELECT * FROM sync_tokens")}
+
+    def set_tokens(self, tokens: Dict[str, str]) -> None:
+        if not tokens:
+            return
+        now = datetime.now().isoformat()
+        with self._lock, self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO sync_tokens (calendar_id, token, updated_at) VALUES (?, ?, ?)",
+                             [(calendar_id, token, now) for calendar_id, token in tokens.items()])
+
+    def drop_token(self, calendar_id: str) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM sync_tokens WHERE calendar_id = ?", (calendar_id,))
+
+    # --- indice eventi Google ---
+
+    def google_events(self, calendar_ids: Iterable[str], date_from: str, date_to: str) -> List[Dict[str, Any]]:
+        """Eventi indicizzati dei calendari con data tra `date_from` e `date_to` (inclusi)."""
+        rows = self._select_in(
+            "SELECT event FROM google_events WHERE date BETWEEN ? AND ? AND calendar_id IN ({placeholders})",
+            set(calendar_ids), extra=(date_from, date_to))
+        return [json.loads(row["event"]) for row in rows]
+
+    def missing_windows(self, calendar_id: str, date_from: str, date_to: str) -> List[Tuple[str, str]]:
+        """Tratti di [date_from, date_to] mai letti da Google per il calendario."""
+        with self._connect() as conn:
+            windows = conn.execute(
+                "SELECT date_from, date_to FROM google_event_windows "
+                "WHERE calendar_id = ? AND date_to >= ? AND date_from <= ? ORDER BY date_from",
+                (calendar_id, date_from, date_to)).fetchall()
+        gaps = []
+        cursor = date_from
+        for window in windows:
+            if window["date_from"] > cursor:
+                gaps.append((cursor, _shift(window["date_from"], -1)))
+            cursor = max(cursor, _shift(window["date_to"], 1))
+        if cursor <= date_to:
+            gaps.append((cursor, date_to))
+        return gaps
+
+    def store_google_window(self, calendar_id: str, date_from: str, date_to: str, events: List[Dict]) -> None:
+        """
+        Sostituisce gli eventi indicizzati del calendario tra `date_from` e
+        `date_to` con quelli letti da Google e segna l'intervallo come letto,
+        unendolo agli intervalli adiacenti.
+        """
+        now = datetime.now().isoformat()
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM google_events WHERE calendar_id = ? AND date BETWEEN ? AND ?",
+                         (calendar_id, date_from, date_to))
+            conn.executemany(_UPSERT_GOOGLE_EVENT, [_google_event_row(e) for e in events if e.get("status") != "cancelled"])
+            merged = conn.execute(
+                "SELECT MIN(date_from), MAX(date_to) FROM google_event_windows "
+                "WHERE calendar_id = ? AND date_to >= ? AND date_from <= ?",
+                (calendar_id, _shift(date_from, -1), _shift(date_to, 1))).fetchone()
+            conn.execute("DELETE FROM google_event_windows WHERE calendar_id = ? AND date_to >= ? AND date_from <= ?",
+                         (calendar_id, _shift(date_from, -1), _shift(date_to, 1)))
+            conn.execute("INSERT INTO google_event_windows (calendar_id, date_from, date_to, fetched_at) "
+                         "VALUES (?, ?, ?, ?)",
+                         (calendar_id, min(filter(None, (merged[0], date_from))),
+                          max(filter(None, (merged[1], date_to))), now))
+
+    def apply_google_changes(self, calendar_id: str, events: List[Dict]) -> None:
+        """Applica all'indice il delta del syncToken (eventi cancellati inclusi)."""
+        cancelled = [(calendar_id, e["id"]) for e in events if e.get("status") == "cancelled"]
+        live = [_google_event_row(e) for e in events if e.get("status") != "cancelled"]
+        with self._lock, self._connect() as conn:
+            conn.executemany("DELETE FROM google_events WHERE calendar_id = ? AND event_id = ?", cancelled)
+            conn.executemany(_UPSERT_GOOGLE_EVENT, live)
+
+    def forget_google_events(self, calendar_id: str) -> None:
+        """Svuota l'indice del calendario (token scaduto o mai ottenuto)."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM google_events WHERE calendar_id = ?", (calendar_id,))
+            conn.execute("DELETE FROM google_event_windows WHERE calendar_id = ?", (calendar_id,))
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            events = conn.execute("SELECT COUNT(*) FROM synced_events").fetchone()[0]
+            tokens = conn.execute("SELECT calendar_id, updated_at FROM sync_tokens").fetchall()
+            google_events = conn.execute("SELECT COUNT(*) FROM google_events").fetchone()[0]
+            windows = conn.execute("SELECT * FROM google_event_windows ORDER BY calendar_id, date_from").fetchall()
+        return {"db_path": str(self.db_path), "synced_events": events,
+                "sync_tokens": {row["calendar_id"]: row["updated_at"] for row in tokens},
+                "google_events": google_events,
+                "google_event_windows": [dict(row) for row in windows]}
+
+
+_UPSERT_GOOGLE_EVENT = ("INSERT OR REPLACE INTO google_events "
+                        "(calendar_id, event_id, uid, fingerprint, date, etag, event) VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+def _google_event_row(event: Dict[str, Any]) -> Tuple:
+    from services.calendar_service import _event_fingerprint
+
+    start = event.get("start") or {}
+    uid = _event_uid(event)
+    return (event["calendarId"], event["id"], uid, None if uid else _event_fingerprint(event),
+            (start.get("dateTime") or start.get("date") or "")[:10], event.get("etag"), json.dumps(event))
+
+
+def _shift(day: str, days: int) -> str:
+    return (date.fromisoformat(day) + timedelta(days=days)).isoformat()
+
+
+_ledger: Optional[CalendarSyncLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_calendar_sync_ledger() -> CalendarSyncLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = CalendarSyncLedger()
+        return _ledger
+
+
+# ============================================================
+# DELTA GOOGLE
+# ============================================================
+
+class SyncTokenExpired(Exception):
+    """Google ha risposto 410: serve una lettura completa del calendario."""
+
+
+def pull_remote_changes(service, calendar_id: str, sync_token: str) -> Tuple[List[Dict], Optional[str]]:
+    """Eventi modificati su Google dal `sync_token` (cancellati inclusi) e nuovo token."""
+    changes: List[Dict] = []
+    page_token = None
+    while True:
+        try:
+            result = execute_with_retry(
+                lambda: service.events().list(
+                    calendarId=calendar_id,
+                    syncToken=sync_token,
+                    pageToken=page_token,
+                    maxResults=2500,
+                    singleEvents=True,
+                ).execute(),
+                context=f"LIST_DELTA calendar={calendar_id}"
+            )
+        except HttpError as e:
+            if getattr(e.resp, "status", None) == 410:
+                raise SyncTokenExpired(calendar_id) from e
+            raise
+        for event in result.get("items", []):
+            event["calendarId"] = calendar_id
+            changes.append(event)
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return changes, result.get("nextSyncToken")
+
+
+def _event_uid(event: Dict[str, Any]) -> Optional[str]:
+    uid = (event.get("extendedProperties") or {}).get("private", {}).get("uid")
+    return str(uid) if uid else None
+
+
+def apply_remote_changes(service, calendar_ids: Iterable[str], ledger: CalendarSyncLedger,
+                         info: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
+    """
+    Legge il delta dal syncToken dei calendari, lo applica all'indice eventi e
+    dimentica dal ledger gli eventi toccati da altri. Restituisce i token
+    ancora validi; per i calendari con token scaduto ledger e indice ripartono
+    da zero.
+    """
+    info = info if info is not None else {}
+    tokens = ledger.get_tokens()
+    for calendar_id in sorted(set(calendar_ids) & set(tokens)):
+        try:
+            changes, next_token = pull_remote_changes(service, calendar_id, tokens[calendar_id])
+        except SyncTokenExpired:
+            logger.warning("syncToken scaduto per %s: indice da rileggere", calendar_id)
+            ledger.forget_calendar(calendar_id)
+            ledger.forget_google_events(calendar_id)
+            ledger.drop_token(calendar_id)
+            tokens.pop(calendar_id)
+            continue
+        ledger.apply_google_changes(calendar_id, changes)
+        known = ledger.by_uids(uid for uid in (_event_uid(e) for e in changes) if uid)
+        touched = []
+        for event in changes:
+            uid = _event_uid(event)
+            row = known.get(uid) if uid else None
+            if row is None:
+                continue
+            if row["etag"] and row["etag"] == event.get("etag"):
+                info["remote_echoes"] = info.get("remote_echoes", 0) + 1
+            else:
+                touched.append(uid)
+        info["remote_changes"] = info.get("remote_changes", 0) + len(touched)
+        ledger.forget(touched)
+        if next_token:
+            ledger.set_tokens({calendar_id: next_token})
+            tokens[calendar_id] = next_token
+    return tokens
+
+
+def lookup_google_events(
+    service,
+    calendar_ids: Iterable[str],
+    date_from: str,
+    date_to: str,
+    ledger: Optional[CalendarSyncLedger] = None,
+    tokens: Optional[Dict[str, str]] = None,
+    info: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Mappe uid -> evento e fingerprint -> evento dei calendari tra `date_from`
+    e `date_to` (YYYY-MM-DD, inclusi), lette dall'indice locale.
+
+    Da Google si leggono solo i tratti di date mai letti. `tokens` sono i
+    syncToken già applicati con apply_remote_changes (None: li applica qui);
+    per un calendario senza token l'indice riparte da zero e il nextSyncToken
+    della lettura a finestra diventa il punto di partenza del delta.
+    """
+    from services.calendar_service import index_google_events, list_google_events
+
+    ledger = ledger or get_calendar_sync_ledger()
+    info = info if info is not None else {}
+    calendar_ids = sorted(set(calendar_ids))
+    if tokens is None:
+        tokens = apply_remote_changes(service, calendar_ids, ledger, info)
+
+    for calendar_id in calendar_ids:
+        bootstrap = calendar_id not in tokens
+        if bootstrap:
+            ledger.forget_google_events(calendar_id)
+        for gap_from, gap_to in ledger.missing_windows(calendar_id, date_from, date_to):
+            events, next_token = list_google_events(service, calendar_id, gap_from, gap_to)
+            info["window_reads"] = info.get("window_reads", 0) + 1
+            if bootstrap and not next_token:
+                # Senza token dalla finestra: lettura completa del calendario
+                events, next_token = list_google_events(service, calendar_id)
+                gap_from, gap_to = "0001-01-01", "9999-12-31"
+                info["full_reads"] = info.get("full_reads", 0) + 1
+            ledger.store_google_window(calendar_id, gap_from, gap_to, events)
+            if bootstrap and next_token:
+                ledger.set_tokens({calendar_id: next_token})
+                tokens[calendar_id] = next_token
+                bootstrap = False
+
+    events = ledger.google_events(calendar_ids, date_from, date_to)
+    info["indexed_events"] = info.get("indexed_events", 0) + len(events)
+    return index_google_events(events)
+
+
+# ============================================================
+# SYNC INCREMENTALE
+# ============================================================
+
+def sync_incremental(
+    service,
+    records: List[Dict[str, Any]],
+    on_progress=None,
+    ledger: Optional[CalendarSyncLedger] = None,
+    controller: Optional[AimdController] = None,
+) -> Tuple[Dict[str, Any], List[Any]]:
+    """
+    Sincronizza `records` toccando solo ciò che è cambiato nel DBF o su Google.
+    Restituisce (statistiche come sync_appointments, anomalie di normalizzazione).
+    """
+    ledger = ledger or get_calendar_sync_ledger()
+    info: Dict[str, Any] = {"mode": "incremental", "records": len(records), "unchanged": 0, "normalized": 0,
+                            "remote_changes": 0, "remote_echoes": 0, "full_reads": 0, "window_reads": 0,
+                            "indexed_events": 0}
+
+    calendars = {cal for cal in (_record_calendar(r) for r in records) if cal}
+
+    # --------------------------------------------------------
+    # 1. Modifiche lato Google dall'ultimo token (ledger e indice eventi)
+    # --------------------------------------------------------
+    tokens = apply_remote_changes(service, calendars, ledger, info)
+
+    # --------------------------------------------------------
+    # 2. Solo i record nuovi o cambiati vengono normalizzati
+    # --------------------------------------------------------
+    fingerprints = [source_fingerprint(r) for r in records]
+    known_by_hash = ledger.by_hashes(fingerprints)
+    changed = [(r, fp) for r, fp in zip(records, fingerprints) if fp not in known_by_hash]
+    info["unchanged"] = len(records) - len(changed)
+    info["normalized"] = len(changed)
+
+    normalization = normalize_batch([r for r, _ in changed])
+    fp_by_record = {id(r): fp for r, fp in changed}
+    appointments = []
+    seen = set()
+    for appt in normalization.valid:
+        if appt.uid not in seen:
+            seen.add(appt.uid)
+            appointments.append(appt)
+    hash_by_uid = {appt.uid: fp_by_record[id(appt.raw)] for appt in appointments}
+    date_by_uid = {appt.uid: appt.date for appt in appointments}
+
+    current_uids = {row["uid"] for row in known_by_hash.values()} | seen
+    scope_dates = {row["date"] for row in known_by_hash.values()} | {appt.date for appt in appointments}
+
+    in_ledger = ledger.by_uids(seen)
+    unknown = [appt for appt in appointments if appt.uid not in in_ledger]
+
+    # --------------------------------------------------------
+    # 3. Eventi Google solo dove servono
+    # --------------------------------------------------------
+    remote_by_uid: Dict[str, Dict] = {}
+    remote_by_fp: Dict[str, Dict] = {}
+    if calendars - set(tokens):
+        # Primo avvio o token scaduto: tutte le date in gioco, anche per il prune
+        info["mode"] = "bootstrap"
+        dates = sorted(scope_dates) or [date.today().isoformat()]
+    else:
+        dates = sorted({appt.date for appt in unknown})
+    if dates:
+        remote_by_uid, remote_by_fp = lookup_google_events(service, calendars, dates[0], dates[-1],
+                                                           ledger=ledger, tokens=tokens, info=info)
+
+    # --------------------------------------------------------
+    # 4. Piano: riconciliazione dei nuovi, update forzato dei cambiati, prune
+    # --------------------------------------------------------
+    unknown_uids = {appt.uid for appt in unknown}
+    plan = build_sync_plan(
+        unknown,
+        {uid: event for uid, event in remote_by_uid.items() if uid in unknown_uids},
+        remote_by_fp,
+    )
+    plan.appointments = len(appointments)
+    for appt in appointments:
+        row = in_ledger.get(appt.uid)
+        if row is None:
+            continue
+        try:
+            forced = build_sync_plan([appt], {appt.uid: _stale_event(row)}, {})
+        except Exception as e:  # pragma: no cover - build_sync_plan gestisce già gli errori
+            logger.error("Sync plan error uid=%s (%s)", appt.uid, e)
+            continue
+        plan.operations.extend(forced.operations)
+        plan.errors += forced.errors
+
+    pruned_keys = set()
+    for calendar_id in calendars:
+        for uid, row in ledger.on_dates(calendar_id, scope_dates).items():
+            if uid not in current_uids:
+                pruned_keys.add((calendar_id, row["event_id"], uid))
+    for uid, event in remote_by_uid.items():
+        start_dt = (event.get("start") or {}).get("dateTime", "")
+        if (uid not in current_uids and start_dt[:10] in scope_dates
+                and event.get("id", "").startswith("sdai") and event.get("calendarId") in calendars):
+            pruned_keys.add((event["calendarId"], event["id"], uid))
+    for calendar_id, event_id, uid in sorted(pruned_keys):
+        plan.operations.append(SyncOperation("delete", uid, calendar_id, event_id, counter="pruned",
+                                             completes_appointment=False))
+
+    # --------------------------------------------------------
+    # 5. Esecuzione e aggiornamento del ledger
+    # --------------------------------------------------------
+    recorded: List[Tuple[str, str, str, str, str, Optional[str]]] = []
+    forgotten: List[str] = []
+    planned_uids = set()
+    for op in plan.operations:
+        while op is not None:
+            planned_uids.add(op.uid)
+            op = op.then
+
+    def on_result(op: SyncOperation, response: Any, error: Optional[Exception]) -> None:
+        if op.counter == "pruned":
+            if error is None:
+                forgotten.append(op.uid)
+            return
+        if error is not None:
+            forgotten.append(op.uid)
+        elif op.then is None and op.uid in hash_by_uid:
+            recorded.append((op.uid, hash_by_uid[op.uid], op.calendar_id, op.event_id,
+                             date_by_uid[op.uid], (response or {}).get("etag")))
+
+    stats = execute_sync_plan(service, plan, controller, on_progress, on_result=on_result)
+
+    for appt in unknown:
+        event = remote_by_uid.get(appt.uid)
+        if appt.uid in planned_uids or event is None or _is_modified(appt, event):
+            continue
+        recorded.append((appt.uid, hash_by_uid[appt.uid], event["calendarId"], event["id"],
+                         appt.date, event.get("etag")))
+
+    ledger.forget(forgotten)
+    ledger.record(recorded)
+
+    stats["skipped"] += info["unchanged"]
+    info["plan"] = stats.get("batch", {}).get("plan")
+    stats["incremental"] = info
+    logger.info(
+        "Sync incrementale (%s) | record=%s invariati=%s normalizzati=%s modifiche_google=%s",
+        info["mode"], info["records"], info["unchanged"], info["normalized"], info["remote_changes"],
+    )
+    return stats, normalization.anomalies
+
+
+def _stale_event(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Evento fittizio per un uid del ledger il cui record sorgente è cambiato:
+    risulta sempre modificato, quindi build_sync_plan produce l'update (o la
+    migrazione se l'evento registrato non ha l'id deterministico).
+    """
+    return {"id": row["event_id"], "calendarId": row["calendar_id"],
+            "start": {"dateTime": ""}, "end": {"dateTime": ""}, "summary": None}
@@ -3,10 +3,12 @@ import logging
 from typing import List, Dict, Any
 
 from core.appointment_normalizer import normalize_batch
+from core.automation_config import get_automation_settings
 from core.google_calendar_client import GoogleCalendarClient
 from core.exceptions import CalendarSyncError
 from core.paths import GOOGLE_CREDENTIALS_PATH, GOOGLE_TOKEN_PATH, ensure_data_dir
-from services.calendar_sync_engine import sync_appointments, execute_with_retry
+from services.calendar_sync_engine import SYNC_MODE_BATCH, sync_appointments, execute_with_retry
+from services.calendar_incremental_sync import lookup_google_events, sync_incremental
 
 logger = logging.getLogger(__name__)
 
@@ -14,14 +16,31 @@ logger = logging.getLogger(__name__)
 # PUBLIC – ENTRY POINT PRINCIPALE (SYNC)
 # ============================================================
 
-def sync_calendar_from_records(records: List[Dict[str, Any]], on_progress=None) -> Dict[str, Any]:
+def sync_calendar_from_records(records: List[Dict[str, Any]], on_progress=None,
+                               incremental: bool | None = None) -> Dict[str, Any]:
     """
     Entry point unico per la sincronizzazione.
     records: lista di dict già prodotti dal loader DBF esistente
+    incremental: None = da automation_settings ('calendar_sync_incremental')
     """
 
     logger.info("=== Avvio sincronizzazione Google Calendar ===")
 
+    settings = get_automation_settings()
+    if incremental is None:
+        incremental = settings.get("calendar_sync_incremental", True)
+    if incremental and settings.get("calendar_sync_mode", SYNC_MODE_BATCH) == SYNC_MODE_BATCH:
+        ensure_data_dir()
+        client = GoogleCalendarClient(
+            credentials_path=GOOGLE_CREDENTIALS_PATH,
+            token_path=GOOGLE_TOKEN_PATH,
+        )
+        stats, anomalies = sync_incremental(client.get_service(), records, on_progress=on_progress)
+        return {
+            "sync": stats,
+            "anomalies": anomalies,
+        }
+
     # --------------------------------------------------------
     # 1. Normalizzazione
     # --------------------------------------------------------
@@ -51,9 +70,11 @@ def sync_calendar_from_records(records: List[Dict[str, Any]], on_progress=None)
     service = client.get_service()
 
     # --------------------------------------------------------
-    # 3. Caricamento eventi Google esistenti
+    # 3. Eventi Google esistenti: indice locale per le sole date da sincronizzare
     # --------------------------------------------------------
-    existing_by_uid, existing_by_fingerprint = load_existing_google_events(service)
+    calendar_ids = [cal for cal in (os.getenv("CALENDAR_ID_STUDIO_1"), os.getenv("CALENDAR_ID_STUDIO_2")) if cal]
+    dates = sorted({appt.date for appt in normalization.valid})
+    existing_by_uid, existing_by_fingerprint = lookup_google_events(service, calendar_ids, dates[0], dates[-1])
 
     logger.info(
         "Eventi Google indicizzati: uid=%s fingerprint=%s",
@@ -62,7 +83,7 @@ def sync_calendar_from_records(records: List[Dict[str, Any]], on_progress=None)
     )
 
     # --------------------------------------------------------
-    # 4. Sync
+    # 4. Sync (modalità da automation_settings: 'batch' o 'serial')
     # --------------------------------------------------------
     stats = sync_appointments(
         service=service,
@@ -70,6 +91,7 @@ def sync_calendar_from_records(records: List[Dict[str, Any]], on_progress=None)
         existing_by_uid=existing_by_uid,
         existing_by_fingerprint=existing_by_fingerprint,
         on_progress=on_progress,
+        mode=settings.get("calendar_sync_mode", SYNC_MODE_BATCH),
     )
 
     logger.info(
@@ -91,15 +113,21 @@ def sync_calendar_from_records(records: List[Dict[str, Any]], on_progress=None)
 # GOOGLE – LOADER EVENTI (ESSENZIALE)
 # ============================================================
 
-def load_existing_google_events(service) -> tuple[Dict[str, Dict], Dict[str, Dict]]:
+def load_existing_google_events(service, sync_tokens: Dict[str, str] | None = None) -> tuple[Dict[str, Dict], Dict[str, Dict]]:
     """
     Costruisce due mappe:
       - uid -> evento Google (source of truth per sync)
       - fingerprint -> evento Google (fallback per "heal" eventi legacy senza uid)
+
+    Lettura completa di entrambi i calendari: la sync usa l'indice locale
+    (calendar_incremental_sync.lookup_google_events), questa resta per debug e
+    come ripiego quando una lettura a finestra non restituisce il syncToken.
+
+    Se `sync_tokens` è un dict viene riempito con il nextSyncToken di ogni
+    calendario (punto di partenza della sync incrementale).
     """
 
-    by_uid: Dict[str, Dict] = {}
-    by_fingerprint: Dict[str, Dict] = {}
+    events: List[Dict] = []
 
     calendar_ids = [
         os.getenv("CALENDAR_ID_STUDIO_1"),
@@ -110,37 +138,80 @@ def load_existing_google_events(service) -> tuple[Dict[str, Dict], Dict[str, Dic
         if not calendar_id:
             continue
 
-        page_token = None
-        while True:
-            result = execute_with_retry(
-                lambda: service.events().list(
-                    calendarId=calendar_id,
-                    maxResults=2500,
-                    pageToken=page_token,
-                    singleEvents=True,
-                ).execute(),
-                context=f"LIST_EXISTING calendar={calendar_id}"
-            )
+        items, next_sync_token = list_google_events(service, calendar_id)
+        events.extend(items)
+        if sync_tokens is not None and next_sync_token:
+            sync_tokens[calendar_id] = next_sync_token
 
-            for event in result.get("items", []):
-                event["calendarId"] = calendar_id
-
-                uid = (
-                    event.get("extendedProperties", {})
-                    .get("private", {})
-                    .get("uid")
-                )
-                if uid:
-                    by_uid[str(uid)] = event
-                else:
-                    fp = _event_fingerprint(event)
-                    if fp:
-                        by_fingerprint[fp] = event
+    return index_google_events(events)
 
-            page_token = result.get("nextPageToken")
-            if not page_token:
-                break
 
+def load_google_events_window(service, calendar_ids, date_from: str, date_to: str) -> tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Come load_existing_google_events ma solo per gli eventi tra `date_from` e
+    `date_to` (YYYY-MM-DD, inclusi) dei calendari indicati.
+    """
+    events: List[Dict] = []
+    for calendar_id in calendar_ids:
+        events.extend(list_google_events(service, calendar_id, date_from, date_to)[0])
+    return index_google_events(events)
+
+
+def list_google_events(service, calendar_id: str, date_from: str | None = None,
+                       date_to: str | None = None) -> tuple[List[Dict], str | None]:
+    """
+    Tutti gli eventi (singleEvents) di un calendario, opzionalmente solo tra
+    `date_from` e `date_to` (YYYY-MM-DD, inclusi), con il nextSyncToken
+    dell'ultima pagina. La finestra viene allargata di un giorno per lato per
+    non dipendere dal fuso orario.
+    """
+    from datetime import date, timedelta
+
+    window = {}
+    if date_from and date_to:
+        window = {
+            "timeMin": (date.fromisoformat(date_from) - timedelta(days=1)).isoformat() + "T00:00:00Z",
+            "timeMax": (date.fromisoformat(date_to) + timedelta(days=2)).isoformat() + "T00:00:00Z",
+        }
+
+    events: List[Dict] = []
+    page_token = None
+    while True:
+        result = execute_with_retry(
+            lambda: service.events().list(
+                calendarId=calendar_id,
+                maxResults=2500,
+                pageToken=page_token,
+                singleEvents=True,
+                **window,
+            ).execute(),
+            context=f"{'LIST_WINDOW' if window else 'LIST_EXISTING'} calendar={calendar_id}"
+        )
+        for event in result.get("items", []):
+            event["calendarId"] = calendar_id
+            events.append(event)
+
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return events, result.get("nextSyncToken")
+
+
+def index_google_events(events: List[Dict]) -> tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """Mappe uid -> evento e fingerprint -> evento (solo eventi legacy senza uid)."""
+    by_uid: Dict[str, Dict] = {}
+    by_fingerprint: Dict[str, Dict] = {}
+    for event in events:
+        uid = (
+            event.get("extendedProperties", {})
+            .get("private", {})
+            .get("uid")
+        )
+        if uid:
+            by_uid[str(uid)] = event
+        else:
+            fp = _event_fingerprint(event)
+            if fp:
+                by_fingerprint[fp] = event
     return by_uid, by_fingerprint
 
 
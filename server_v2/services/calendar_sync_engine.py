@@ -1,7 +1,9 @@
 import os
 import time
 import logging
-from typing import Dict, List, Tuple, Optional
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple, Optional
 
 from googleapiclient.errors import HttpError
 
@@ -19,6 +21,11 @@ SYNC_SLEEP_SECONDS = 0.15     # throttling soft
 MAX_RETRIES = 3
 RETRY_BACKOFF = 2             # esponenziale
 
+SYNC_MODE_SERIAL = "serial"   # una chiamata per appuntamento (storico)
+SYNC_MODE_BATCH = "batch"     # piano di diff + batch request con controllo AIMD
+
+BATCH_MAX_SIZE = 50           # limite consigliato da Google per batch Calendar
+
 
 # ============================================================
 # ENTRY POINT
@@ -31,11 +38,18 @@ def sync_appointments(
     existing_by_uid: Dict[str, Dict],  # uid -> event (da Google)
     existing_by_fingerprint: Dict[str, Dict],  # fingerprint -> event (legacy fallback)
     on_progress=None,  # callback(synced, total)
+    mode: str = SYNC_MODE_SERIAL,
+    controller: Optional["AimdController"] = None,
 ) -> Dict[str, int]:
     """
     existing_by_uid: mappa uid -> evento google esistente
     existing_by_fingerprint: fallback per riconciliare eventi legacy senza uid
+    mode: SYNC_MODE_SERIAL (una chiamata per appuntamento) o SYNC_MODE_BATCH
+          (piano di diff eseguito con batch request, vedi execute_sync_plan)
     """
+    if mode == SYNC_MODE_BATCH:
+        plan = build_sync_plan(appointments, existing_by_uid, existing_by_fingerprint)
+        return execute_sync_plan(service, plan, controller=controller, on_progress=on_progress)
 
     stats = {
         "inserted": 0,
@@ -284,10 +298,11 @@ def _is_modified(appt: NormalizedAppointment, google_event: Dict) -> bool:
     if google_event.get("description", "") != appt.description:
         return True
 
-    if google_event["start"]["dateTime"][-5:] != appt.start_time:
+    # RFC3339 "YYYY-MM-DDTHH:MM:SS[+01:00]": HH:MM sono i caratteri 11-16
+    if google_event["start"]["dateTime"][11:16] != appt.start_time:
         return True
 
-    if google_event["end"]["dateTime"][-5:] != appt.end_time:
+    if google_event["end"]["dateTime"][11:16] != appt.end_time:
         return True
 
     # Get colorId from appointment metadata
@@ -410,3 +425,306 @@ def execute_with_retry(fn, context: str):
 
         except Exception:
             raise
+
+
+# ============================================================
+# BATCH MODE: PIANO DI DIFF
+# ============================================================
+
+@dataclass
+class SyncOperation:
+    """
+    Una chiamata Google del piano.
+
+    action: insert | update | patch | delete
+    counter: statistica incrementata al successo (inserted/updated/skipped/pruned)
+    then: operazione da eseguire solo dopo il successo di questa (migrazione id)
+    """
+    action: str
+    uid: str
+    calendar_id: str
+    event_id: str
+    body: Optional[Dict[str, Any]] = None
+    counter: Optional[str] = None
+    then: Optional["SyncOperation"] = None
+    attempts: int = 0
+    completes_appointment: bool = True
+
+
+@dataclass
+class SyncPlan:
+    operations: List[SyncOperation] = field(default_factory=list)
+    appointments: int = 0
+    skipped: int = 0
+    errors: int = 0
+
+    def summary(self) -> Dict[str, int]:
+        counts = {"insert": 0, "update": 0, "patch": 0, "delete": 0}
+        for op in self.operations:
+            while op is not None:
+                counts[op.action] += 1
+                op = op.then
+        return {**counts, "skip": self.skipped, "invalid": self.errors}
+
+
+def _calendar_for(appointment: NormalizedAppointment, calendar_id: Optional[str]) -> str:
+    if calendar_id:
+        return calendar_id
+    try:
+        studio = int(appointment.metadata.get("studio"))
+    except (TypeError, ValueError):
+        studio = None
+    if studio == 1:
+        calendar_id = os.getenv("CALENDAR_ID_STUDIO_1")
+    elif studio == 2:
+        calendar_id = os.getenv("CALENDAR_ID_STUDIO_2")
+    if not calendar_id:
+        raise ValueError(f"Studio non valido uid={appointment.uid}")
+    return calendar_id
+
+
+def build_sync_plan(
+    appointments: List[NormalizedAppointment],
+    existing_by_uid: Dict[str, Dict],
+    existing_by_fingerprint: Dict[str, Dict],
+) -> SyncPlan:
+    """
+    Stesse decisioni della sync seriale (insert/update/migrazione/heal legacy/prune),
+    calcolate prima di qualunque chiamata a Google.
+    """
+    plan = SyncPlan(appointments=len(appointments))
+
+    for appt in appointments:
+        uid = appt.uid
+        try:
+            google_event = existing_by_uid.get(uid)
+            legacy = False
+            if google_event is None:
+                fp = _appointment_fingerprint(appt)
+                google_event = existing_by_fingerprint.get(fp) if fp else None
+                if google_event is not None:
+                    existing_by_uid[uid] = google_event
+                    legacy = True
+
+            if google_event is None:
+                event, calendar_id = build_google_event(appt)
+                event["id"] = _desired_event_id(uid)
+                plan.operations.append(SyncOperation(
+                    "insert", uid, _calendar_for(appt, calendar_id), event["id"], event, "inserted"))
+            elif not _is_modified(appt, google_event):
+                if legacy:
+                    # Solo uid mancante: patch come nella sync seriale
+                    private_props = dict(((google_event.get("extendedProperties") or {}).get("private") or {}))
+                    private_props["uid"] = str(uid)
+                    private_props.setdefault("kind", appt.kind.value)
+                    plan.operations.append(SyncOperation(
+                        "patch", uid, google_event.get("calendarId"), google_event.get("id"),
+                        {"extendedProperties": {"private": private_props}}, "skipped"))
+                else:
+                    plan.skipped += 1
+            else:
+                event, calendar_id = build_google_event(appt)
+                calendar_id = _calendar_for(appt, calendar_id)
+                event["id"] = _desired_event_id(uid)
+                update = SyncOperation("update", uid, calendar_id, event["id"], event, "updated")
+                if google_event.get("calendarId", calendar_id) == calendar_id and google_event.get("id") == event["id"]:
+                    plan.operations.append(update)
+                else:
+                    # Migrazione verso l'id deterministico: delete, poi insert
+                    plan.operations.append(SyncOperation(
+                        "delete", uid, google_event["calendarId"], google_event["id"],
+                        completes_appointment=False,
+                        then=SyncOperation("insert", uid, calendar_id, event["id"], event, "updated")))
+        except Exception as e:
+            plan.errors += 1
+            logger.error("Sync plan error uid=%s (%s)", uid, str(e), exc_info=True)
+
+    synced_dates = {appt.date for appt in appointments}
+    synced_uids = {appt.uid for appt in appointments}
+    synced_calendar_ids = set()
+    for appt in appointments:
+        try:
+            synced_calendar_ids.add(_calendar_for(appt, None))
+        except ValueError:
+            continue
+
+    for uid, google_event in existing_by_uid.items():
+        start_dt = google_event.get("start", {}).get("dateTime", "")
+        if not start_dt:
+            continue
+        event_id = google_event.get("id", "")
+        if (start_dt[:10] in synced_dates
+                and uid not in synced_uids
+                and event_id.startswith("sdai")
+                and google_event.get("calendarId", "") in synced_calendar_ids):
+            plan.operations.append(SyncOperation(
+                "delete", uid, google_event["calendarId"], event_id, counter="pruned",
+                completes_appointment=False))
+
+    return plan
+
+
+# ============================================================
+# BATCH MODE: ESECUZIONE
+# ============================================================
+
+class AimdController:
+    """
+    Controllo additive-increase / multiplicative-decrease della concorrenza:
+    `window` è il numero di richieste per batch (eseguite in parallelo da Google).
+    Un batch senza 403/429 allarga la finestra di `increase`; un batch limitato
+    la riduce di `decrease` e introduce una pausa che raddoppia a ogni limite
+    consecutivo e si dimezza a ogni batch pulito.
+    """
+
+    def __init__(self, initial: int = 10, minimum: int = 1, maximum: int = BATCH_MAX_SIZE,
+                 increase: int = 2, decrease: float = 0.5, base_delay: float = 1.0,
+                 max_delay: float = 32.0, sleep: Callable[[float], None] = time.sleep):
+        self.window = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self._sleep = sleep
+        self.stats = {"throttled_batches": 0, "window_min": int(initial), "window_max": int(initial),
+                      "wait_seconds": 0.0}
+
+    @property
+    def size(self) -> int:
+        return int(self.window)
+
+    def wait(self) -> None:
+        if self.delay:
+            self.stats["wait_seconds"] = round(self.stats["wait_seconds"] + self.delay, 3)
+            self._sleep(self.delay)
+
+    def record(self, throttled: bool) -> None:
+        if throttled:
+            self.stats["throttled_batches"] += 1
+            self.window = max(self.minimum, self.window * self.decrease)
+            self.delay = min(self.max_delay, max(self.base_delay, self.delay * 2))
+        else:
+            self.window = min(self.maximum, self.window + self.increase)
+            self.delay = self.delay / 2 if self.delay >= self.base_delay else 0.0
+        self.stats["window_min"] = min(self.stats["window_min"], self.size)
+        self.stats["window_max"] = max(self.stats["window_max"], self.size)
+
+
+def _operation_request(service, op: SyncOperation):
+    events = service.events()
+    if op.action == "insert":
+        return events.insert(calendarId=op.calendar_id, body=op.body)
+    if op.action == "update":
+        return events.update(calendarId=op.calendar_id, eventId=op.event_id, body=op.body)
+    if op.action == "patch":
+        return events.patch(calendarId=op.calendar_id, eventId=op.event_id, body=op.body)
+    return events.delete(calendarId=op.calendar_id, eventId=op.event_id)
+
+
+def execute_sync_plan(
+    service,
+    plan: SyncPlan,
+    controller: Optional[AimdController] = None,
+    on_progress=None,
+    on_result: Optional[Callable[[SyncOperation, Any, Optional[Exception]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Esegue il piano con batch request Google. Gli esiti sono per singola
+    operazione: 403/429/5xx vengono ritentati (fino a MAX_RETRIES) nei batch
+    successivi, 409 su insert diventa update, 404/410 su delete conta come
+    già eseguito; gli altri errori sono definitivi.
+
+    on_result(op, risposta, errore) riceve l'esito finale di ogni operazione.
+    """
+    controller = controller or AimdController()
+    stats: Dict[str, Any] = {"inserted": 0, "updated": 0, "skipped": plan.skipped, "pruned": 0,
+                             "errors": plan.errors}
+    batch_stats = {"plan": plan.summary(), "batches": 0, "requests": 0, "retries": 0, "quota_errors": 0}
+    pending = deque(plan.operations)
+    done_appointments = plan.skipped + plan.errors
+    started = time.perf_counter()
+
+    def fail(op: SyncOperation, error: Exception) -> None:
+        stats["errors"] += 1
+        logger.error("Sync batch error %s uid=%s (%s)", op.action.upper(), op.uid, error)
+        if on_result:
+            on_result(op, None, error)
+
+    while pending:
+        chunk = [pending.popleft() for _ in range(min(controller.size, len(pending)))]
+        outcomes: Dict[str, Tuple[Any, Optional[Exception]]] = {}
+        batch = service.new_batch_http_request(
+            callback=lambda request_id, response, exception: outcomes.__setitem__(request_id, (response, exception)))
+        for position, op in enumerate(chunk):
+            batch.add(_operation_request(service, op), request_id=str(position))
+
+        controller.wait()
+        batch_stats["batches"] += 1
+        batch_stats["requests"] += len(chunk)
+        try:
+            batch.execute()
+        except Exception as e:
+            # Errore dell'intero batch (rete, quota sulla richiesta batch): si ritenta tutto
+            outcomes = {str(position): (None, e) for position in range(len(chunk))}
+
+        throttled = False
+        retry: List[SyncOperation] = []
+        follow_up: List[SyncOperation] = []
+        for position, op in enumerate(chunk):
+            response, error = outcomes.get(str(position), (None, RuntimeError("risposta batch mancante")))
+            status = getattr(getattr(error, "resp", None), "status", None) if error is not None else None
+            status = int(status) if status is not None else None
+
+            if error is None or (op.action == "delete" and status in (404, 410)):
+                if op.counter:
+                    stats[op.counter] += 1
+                if op.then is not None:
+                    follow_up.append(op.then)
+                if op.completes_appointment:
+                    done_appointments += 1
+                if on_result:
+                    on_result(op, response, None)
+                continue
+            if op.action == "insert" and status == 409:
+                # Id deterministico già presente: aggiorna l'evento esistente
+                follow_up.append(SyncOperation("update", op.uid, op.calendar_id, op.event_id, op.body,
+                                               op.counter, completes_appointment=op.completes_appointment))
+                continue
+
+            transient = status in (403, 429) or (status is not None and status >= 500) or status is None
+            if status in (403, 429):
+                throttled = True
+                batch_stats["quota_errors"] += 1
+            if transient and op.attempts < MAX_RETRIES:
+                op.attempts += 1
+                batch_stats["retries"] += 1
+                retry.append(op)
+            else:
+                fail(op, error)
+                if op.completes_appointment or op.then is not None:
+                    done_appointments += 1
+
+        controller.record(throttled)
+        # Ritentativi e operazioni dipendenti in testa alla coda, nell'ordine originale
+        pending.extendleft(reversed(retry + follow_up))
+        if on_progress:
+            on_progress(min(done_appointments, plan.appointments), plan.appointments)
+
+    elapsed = time.perf_counter() - started
+    applied = stats["inserted"] + stats["updated"] + stats["pruned"]
+    batch_stats.update({
+        "elapsed_seconds": round(elapsed, 3),
+        "ops_per_second": round(applied / elapsed, 1) if elapsed > 0 else None,
+        "final_window": controller.size,
+        **controller.stats,
+    })
+    stats["batch"] = batch_stats
+    logger.info(
+        "Sync batch: %s richieste in %s batch (%s retry, %s limiti quota) in %.2fs",
+        batch_stats["requests"], batch_stats["batches"], batch_stats["retries"],
+        batch_stats["quota_errors"], elapsed,
+    )
+    return stats
@@ -0,0 +1,186 @@
+"""
+Pipeline degli eventi di modifica DBF
+=====================================
+
+Il gestionale scrive i DBF a raffiche: una singola operazione genera decine di
+eventi watchdog sullo stesso file. La pipeline li trasforma in un solo
+confronto per tabella:
+
+- Debounce per tabella: si elabora quando il file resta fermo per
+  `debounce_seconds`, comunque entro `max_delay_seconds` dal primo evento
+- Coalescenza: gli eventi arrivati durante l'attesa o durante l'elaborazione
+  della stessa tabella producono al massimo un'ulteriore elaborazione
+- Coda limitata con pool di worker dedicato; una tabella non viene mai
+  elaborata da due worker insieme
+- Metriche di back-pressure (profondità coda, rinvii per coda piena, latenza)
+"""
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class _Pending:
+    """Raffica di eventi in attesa per una tabella."""
+
+    __slots__ = ('first_at', 'last_at', 'events')
+
+    def __init__(self, now: float):
+        self.first_at = now
+        self.last_at = now
+        self.events = 0
+
+
+class ChangePipeline:
+    """
+    Debounce + coda + worker per le notifiche di modifica.
+
+    `submit(key)` registra un evento per la chiave (nome tabella); `handler(key)`
+    viene chiamato su un worker una volta per raffica.
+    """
+
+    def __init__(self,
+                 handler: Callable[[str], None],
+                 debounce_seconds: float = 1.5,
+                 max_delay_seconds: float = 10.0,
+                 max_queue: int = 32,
+                 workers: int = 2,
+                 name: str = 'dbf-changes'):
+        self.handler = handler
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.workers = workers
+        self.name = name
+
+        self._cond = threading.Condition()
+        self._pending: Dict[str, _Pending] = {}
+        self._queued: Set[str] = set()
+        self._running: Set[str] = set()
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._threads: List[threading.Thread] = []
+
+        self._stats = {
+            'events': 0, 'batches': 0, 'coalesced_events': 0, 'deferred_queue_full': 0,
+            'handler_errors': 0, 'handler_time_ms': 0.0,
+            'max_queue_depth': 0, 'last_latency_ms': 0.0, 'max_latency_ms': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def submit(self, key: str) -> None:
+        """Registra un evento per `key` (non bloccante)."""
+        now = time.monotonic()
+        with self._cond:
+            self._stats['events'] += 1
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = _Pending(now)
+            pending.last_at = now
+            pending.events += 1
+            self._ensure_started()
+            self._cond.notify_all()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """Attende che non ci siano eventi in attesa né elaborazioni in corso."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending or self._queued or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'pending_tables': sorted(self._pending),
+                'queued_tables': sorted(self._queued),
+                'running_tables': sorted(self._running),
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self._queue.maxsize,
+                'workers': self.workers,
+                'debounce_seconds': self.debounce_seconds,
+                'max_delay_seconds': self.max_delay_seconds,
+            })
+        stats['handler_time_ms'] = round(stats['handler_time_ms'], 1)
+        return stats
+
+    # ------------------------------------------------------------------
+    # Thread interni
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._threads:
+            return
+        self._threads.append(threading.Thread(target=self._schedule_loop, name=f"{self.name}-scheduler", daemon=True))
+        for i in range(self.workers):
+            self._threads.append(threading.Thread(target=self._work_loop, name=f"{self.name}-worker-{i}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _schedule_loop(self) -> None:
+        """Sposta in coda le tabelle la cui raffica è terminata."""
+        while True:
+            with self._cond:
+                timeout = self._dispatch_due(time.monotonic())
+                self._cond.wait(timeout)
+
+    def _dispatch_due(self, now: float) -> Optional[float]:
+        """Accoda le chiavi pronte; restituisce l'attesa fino alla prossima scadenza."""
+        next_due = None
+        for key, pending in list(self._pending.items()):
+            due_at = min(pending.last_at + self.debounce_seconds, pending.first_at + self.max_delay_seconds)
+            if key in self._queued or key in self._running:
+                # Verrà elaborata dopo il giro in corso, con tutti gli eventi accumulati
+                continue
+            if due_at > now:
+                next_due = due_at if next_due is None else min(next_due, due_at)
+                continue
+            try:
+                self._queue.put_nowait((key, pending))
+            except queue.Full:
+                self._stats['deferred_queue_full'] += 1
+                retry_at = now + self.debounce_seconds
+                next_due = retry_at if next_due is None else min(next_due, retry_at)
+                continue
+            del self._pending[key]
+            self._queued.add(key)
+            self._stats['coalesced_events'] += pending.events - 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._queue.qsize())
+        return None if next_due is None else max(next_due - now, 0.01)
+
+    def _work_loop(self) -> None:
+        while True:
+            key, pending = self._queue.get()
+            with self._cond:
+                self._queued.discard(key)
+                self._running.add(key)
+                latency = (time.monotonic() - pending.first_at) * 1000
+                self._stats['last_latency_ms'] = round(latency, 1)
+                self._stats['max_latency_ms'] = round(max(self._stats['max_latency_ms'], latency), 1)
+
+            start = time.perf_counter()
+            failed = False
+            try:
+                logger.debug(f"Pipeline {self.name}: elaborazione {key} ({pending.events} eventi)")
+                self.handler(key)
+            except Exception as e:
+                failed = True
+                logger.error(f"Pipeline {self.name}: errore elaborazione {key}: {e}", exc_info=True)
+            finally:
+                with self._cond:
+                    self._running.discard(key)
+                    self._stats['batches'] += 1
+                    self._stats['handler_time_ms'] += (time.perf_counter() - start) * 1000
+                    if failed:
+                        self._stats['handler_errors'] += 1
+                    self._cond.notify_all()
+                self._queue.task_done()
@@ -1,9 +1,9 @@
 """Classificazioni Service stub for StudioDimaAI Server V2."""
-import sqlite3
 import os
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 from .base_service import BaseService
+from core.database_manager import db_connection
 from core.exceptions import ValidationError, DatabaseError
 from core.config import Config
 
@@ -14,7 +14,7 @@ class ClassificazioniService(BaseService):
     
     def _init_database(self):
         """Inizializza il database SQLite con la tabella classificazioni_costi"""
-        with sqlite3.connect(self.db_path) as conn:
+        with db_connection(self.db_path, caller='classificazioni_service', row_factory=None) as conn:
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS classificazioni_costi (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -40,8 +40,7 @@ class ClassificazioniService(BaseService):
             Lista di dizionari con le classificazioni dei fornitori
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with db_connection(self.db_path, caller='classificazioni_service') as conn:
                 cursor = conn.execute('''
                     SELECT * FROM classificazioni_costi 
                     WHERE tipo_entita = 'fornitore'
@@ -71,7 +70,7 @@ class ClassificazioniService(BaseService):
             True se la classificazione è avvenuta con successo
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with db_connection(self.db_path, caller='classificazioni_service', row_factory=None) as conn:
                 conn.execute('''
                     INSERT OR REPLACE INTO classificazioni_costi 
                     (codice_riferimento, tipo_entita, tipo_di_costo, data_modifica)
@@ -100,7 +99,7 @@ class ClassificazioniService(BaseService):
             True se la classificazione è avvenuta con successo
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with db_connection(self.db_path, caller='classificazioni_service', row_factory=None) as conn:
                 conn.execute('''
                     INSERT OR REPLACE INTO classificazioni_costi
                     (codice_riferimento, tipo_entita, tipo_di_costo, contoid, brancaid, sottocontoid, data_modifica, fornitore_nome)
@@ -122,8 +121,7 @@ class ClassificazioniService(BaseService):
             Dizionario con la classificazione del fornitore o None
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with db_connection(self.db_path, caller='classificazioni_service') as conn:
                 cursor = conn.execute('''
                     SELECT * FROM classificazioni_costi 
                     WHERE codice_riferimento = ? AND tipo_entita = 'fornitore'
@@ -146,7 +144,7 @@ class ClassificazioniService(BaseService):
             True se la rimozione è avvenuta con successo
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with db_connection(self.db_path, caller='classificazioni_service', row_factory=None) as conn:
                 cursor = conn.execute('''
                     DELETE FROM classificazioni_costi 
                     WHERE codice_riferimento = ? AND tipo_entita = 'fornitore'
@@ -167,7 +165,7 @@ class ClassificazioniService(BaseService):
         Ottiene la lista dei codici fornitore filtrati per classificazione gerarchica.
         """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with db_connection(self.db_path, caller='classificazioni_service', row_factory=None) as conn:
                 query = "SELECT codice_riferimento FROM classificazioni_costi WHERE tipo_entita = 'fornitore'"
                 params = []
                 
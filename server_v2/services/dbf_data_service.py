@@ -3,12 +3,13 @@ Servizio per il recupero dati specifici da DBF (Pazienti, Prestazioni).
 """
 
 import logging
-from typing import Dict, Any, Optional
-
-import dbf # <--- NEW IMPORT
+import time
+from typing import Dict, Any, List, Optional
 
 from core.constants_v2 import COLONNE
 from utils.dbf_utils import DBFOptimizedReader, clean_dbf_value, safe_get_dbf_field, get_optimized_reader
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+from services.patient_index import get_patient_index
 
 logger = logging.getLogger(__name__)
 
@@ -17,29 +18,15 @@ class DbfDataService:
         self.reader = reader or get_optimized_reader()
 
     def get_patient_by_name(self, nome: str) -> Optional[Dict[str, Any]]:
-        """Cerca un paziente per nome (DB_PANOME), match case-insensitive."""
-        nome_norm = (nome or '').strip().lower()
-        if not nome_norm:
+        """Cerca un paziente per nome (DB_PANOME), match su nome normalizzato."""
+        if not (nome or '').strip():
             return None
         try:
-            patients_path = self.reader._get_dbf_path('PAZIENTI.DBF')
-            col_paz = COLONNE['pazienti']
-            nome_field = col_paz['nome']
-            with dbf.Table(patients_path, codepage='cp1252') as table:
-                for record in table:
-                    current_nome = clean_dbf_value(getattr(record, nome_field, ''))
-                    if str(current_nome).strip().lower() == nome_norm:
-                        patient_data = {}
-                        for logical_name, dbf_field in col_paz.items():
-                            patient_data[logical_name] = clean_dbf_value(
-                                getattr(record, dbf_field, '')
-                            )
-                        for field_name in table.field_names:
-                            patient_data[field_name] = clean_dbf_value(
-                                getattr(record, field_name, '')
-                            )
-                        return patient_data
-            return None
+            index = get_patient_index(self.reader._get_dbf_path('PAZIENTI.DBF'))
+            rows = index.find_by_name(nome)
+            if not rows:
+                return None
+            return self._record_to_dict(index.table, rows[0], COLONNE['pazienti'])
         except Exception as e:
             logger.error(f"Errore ricerca paziente per nome '{nome}': {e}", exc_info=True)
             return None
@@ -49,59 +36,40 @@ class DbfDataService:
         Recupera i dati di un singolo paziente tramite ID.
         """
         try:
-            patients_path = self.reader._get_dbf_path('PAZIENTI.DBF')
-            
-            # Carica tutti i pazienti (o usa cache se già caricati)
-            # Nota: _load_patients_optimized restituisce un dict {id: nome}, non i dati completi
-            # Dovremmo leggere il DBF PAZIENTI e filtrare per ID
-            
-            # Per ora, implementazione semplificata: legge il file e cerca l'ID
-            with dbf.Table(patients_path, codepage='cp1252') as table:
-                col_paz = COLONNE['pazienti']
-                id_field = col_paz['id'] # DB_CODE - No .lower() here
-
-                for record in table:
-                    current_id = clean_dbf_value(getattr(record, id_field)) # Use id_field directly
-                    if current_id == patient_id:
-                        # Trovato il paziente, estrai tutti i campi mappati
-                        patient_data = {}
-                        for logical_name, dbf_field in col_paz.items():
-                            patient_data[logical_name] = clean_dbf_value(getattr(record, dbf_field, '')) # No .lower() here
-                        
-                        # Aggiungi i campi DBF originali per i placeholder
-                        for field_name in table.field_names:
-                            patient_data[field_name] = clean_dbf_value(getattr(record, field_name, '')) # No .lower() here
-
-                        return patient_data
-            return None
+            index = get_patient_index(self.reader._get_dbf_path('PAZIENTI.DBF'))
+            rows = index.find_by_id(patient_id)  # DB_CODE
+            if not rows:
+                return None
+            return self._record_to_dict(index.table, rows[0], COLONNE['pazienti'])
         except Exception as e:
             logger.error(f"Errore nel recupero paziente {patient_id}: {e}", exc_info=True)
             return None
 
+    def _record_to_dict(self, table: MirrorTable, row: int, logical_fields: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Converte una riga del mirror nel dict usato per i placeholder:
+        campi logici (da COLONNE) + tutti i campi DBF originali.
+        """
+        record = table.records([row])[0]
+        data = {}
+        for logical_name, dbf_field in logical_fields.items():
+            data[logical_name] = clean_dbf_value(record.get(dbf_field.upper(), ''))
+        for field_name, value in record.items():
+            data[field_name] = clean_dbf_value(value)
+        return data
+
     def get_prestazione_by_id(self, prestazione_id: str) -> Optional[Dict[str, Any]]:
         """
         Recupera i dati di una singola prestazione tramite ID.
         """
         try:
             # Assumiamo che le prestazioni siano in PREVENT.DBF
-            prevent_path = self.reader._get_dbf_path('PREVENT.DBF')
-
-            with dbf.Table(prevent_path, codepage='cp1252') as table:
-                col_prev = COLONNE['preventivi']
-                id_prestazione_field = col_prev['id_prestazione'] # DB_PRONCOD - No .lower() here
-                
-                for record in table:
-                    current_id = clean_dbf_value(getattr(record, id_prestazione_field)) # Use id_prestazione_field directly
-                    if current_id == prestazione_id:
-                        prestazione_data = {}
-                        for logical_name, dbf_field in col_prev.items():
-                            prestazione_data[logical_name] = clean_dbf_value(getattr(record, dbf_field, '')) # No .lower() here
-                        
-                        # Aggiungi i campi DBF originali per i placeholder
-                        for field_name in table.field_names:
-                            prestazione_data[field_name] = clean_dbf_value(getattr(record, field_name, '')) # No .lower() here
-                        return prestazione_data
-            return None
+            table = get_dbf_mirror().table_at(self.reader._get_dbf_path('PREVENT.DBF'))
+            col_prev = COLONNE['preventivi']
+            row = table.lookup(col_prev['id_prestazione'], prestazione_id)  # DB_PRONCOD
+            if row is None:
+                return None
+            return self._record_to_dict(table, row, col_prev)
         except Exception as e:
             logger.error(f"Errore nel recupero prestazione {prestazione_id}: {e}", exc_info=True)
             return None
@@ -112,19 +80,14 @@ class DbfDataService:
         PREVENT.DB_PRELCOD -> ELENCO.DB_CODE -> ELENCO.DB_ELPACOD
         """
         try:
-            elenco_path = self.reader._get_dbf_path('ELENCO.DBF')
+            table = get_dbf_mirror().table_at(self.reader._get_dbf_path('ELENCO.DBF'))
             col_elenco = COLONNE['elenco']
-            id_field = col_elenco['id']  # DB_CODE
-            paziente_field = col_elenco['id_paziente']  # DB_ELPACOD
-
-            with dbf.Table(elenco_path, codepage='cp1252') as table:
-                for record in table:
-                    current_id = clean_dbf_value(getattr(record, id_field, ''))
-                    if current_id == piano_id:
-                        patient_id = clean_dbf_value(getattr(record, paziente_field, ''))
-                        if patient_id and str(patient_id).strip():
-                            return str(patient_id).strip()
-                        return None
+            row = table.lookup(col_elenco['id'], piano_id)  # DB_CODE
+            if row is None:
+                return None
+            patient_id = clean_dbf_value(table.values(col_elenco['id_paziente'], [row])[0])  # DB_ELPACOD
+            if patient_id and str(patient_id).strip():
+                return str(patient_id).strip()
             return None
         except Exception as e:
             logger.error(f"Errore nel recupero paziente dal piano {piano_id}: {e}", exc_info=True)
@@ -136,6 +99,20 @@ class DbfDataService:
         seguendo una configurazione di arricchimento.
         Modifica il dizionario source_record direttamente.
         """
+        self.enrich_records([source_record], enrichment_config)
+
+    def enrich_records(self, source_records: List[Dict[str, Any]], enrichment_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Arricchimento in blocco di un change set: le chiavi di join di tutti i
+        record vengono risolte con un solo accesso alla tabella target tramite
+        l'indice hash del DBF mirror (primo record in ordine di file, come la
+        scansione sequenziale). Modifica i dizionari direttamente.
+
+        Returns:
+            Statistiche del batch: record, chiavi distinte, risolte, mancanti, tempo in ms
+        """
+        start = time.perf_counter()
+        stats = {'records': len(source_records), 'keys': 0, 'resolved': 0, 'missing': 0, 'elapsed_ms': 0.0}
         try:
             source_field = enrichment_config.get('source_field')
             target_table_name = enrichment_config.get('target_table')
@@ -145,27 +122,38 @@ class DbfDataService:
 
             if not all([source_field, target_table_name, target_key_field, target_value_field, new_field_name]):
                 logger.warning("Configurazione di arricchimento incompleta. Salto.")
-                return
-
-            join_code = source_record.get(source_field)
-            if not join_code:
-                logger.warning(f"Campo sorgente '{source_field}' non trovato nel record. Salto arricchimento.")
-                return
-
-            target_path = self.reader._get_dbf_path(target_table_name)
-            with dbf.Table(target_path, codepage='cp1252') as table:
-                for record in table:
-                    current_join_code = clean_dbf_value(getattr(record, target_key_field, ''))
-                    if current_join_code == join_code:
-                        value_to_add = clean_dbf_value(getattr(record, target_value_field, ''))
-                        source_record[new_field_name] = value_to_add
-                        logger.info(f"Record arricchito con successo: '{new_field_name}' = '{value_to_add}'.")
-                        return
-            
-            logger.warning(f"Nessun record corrispondente trovato in {target_table_name} per il codice '{join_code}'.")
+                return stats
+
+            pending = [record for record in source_records if record.get(source_field)]
+            if len(pending) < len(source_records):
+                logger.warning(f"Campo sorgente '{source_field}' non trovato in {len(source_records) - len(pending)} record. Salto arricchimento.")
+            if not pending:
+                return stats
+
+            table = get_dbf_mirror().table_at(self.reader._get_dbf_path(target_table_name))
+            keys = list(dict.fromkeys(record[source_field] for record in pending))
+            rows = {key: table.lookup(target_key_field, key) for key in keys}
+            found = [row for row in rows.values() if row is not None]
+            values = dict(zip(found, (clean_dbf_value(v) for v in table.values(target_value_field, found))))
+
+            for record in pending:
+                row = rows[record[source_field]]
+                if row is not None:
+                    record[new_field_name] = values[row]
+
+            missing = [key for key, row in rows.items() if row is None]
+            if missing:
+                logger.warning(f"Nessun record corrispondente trovato in {target_table_name} per i codici {missing[:10]}.")
+            stats.update(keys=len(keys), resolved=len(keys) - len(missing), missing=len(missing))
 
         except Exception as e:
-            logger.error(f"Errore durante l'arricchimento del record: {e}", exc_info=True)
+            logger.error(f"Errore durante l'arricchimento dei record: {e}", exc_info=True)
+        finally:
+            stats['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 2)
+
+        logger.info(f"Arricchimento '{enrichment_config.get('new_field_name')}': {stats['resolved']}/{stats['keys']} chiavi "
+                    f"risolte per {stats['records']} record in {stats['elapsed_ms']}ms")
+        return stats
 
 # Singleton instance
 _dbf_data_service = None
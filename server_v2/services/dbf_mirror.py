@@ -0,0 +1,443 @@
+"""
+🪞 DBF Mirror per StudioDimaAI Server V2
+========================================
+
+Copia colonnare persistente delle tabelle del gestionale (APPUNTA, PAZIENTI,
+PREVENT, ELENCO, ...):
+
+- Ogni tabella viene decodificata una sola volta in array NumPy per colonna
+  (char come bytes a larghezza fissa, date come datetime64, numerici float64)
+- Lo stato viene salvato su disco (.npz) e ricaricato all'avvio
+- Ai refresh successivi si rileggono i byte grezzi, si confrontano gli hash
+  per record e si ri-decodificano solo i record aggiunti o modificati
+- Il cambio file viene rilevato da mtime/size (stat) e dal record count
+  dell'header
+
+I servizi leggono slice di colonne invece di riaprire il DBF con dbf.Table
+e costruire un oggetto Python per ogni record.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from core.config_manager import get_config
+from core.exceptions import DbfProcessingError
+from core.paths import DBF_MIRROR_DIR
+from utils.dbf_utils import (
+    DBF_ENCODING, DbfField, DbfHeader, DbfRecordDecoder,
+    dbf_column_values, decode_dbf_column, locate_dbf_memo, read_dbf_memo,
+)
+
+logger = logging.getLogger(__name__)
+
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+# =============================================================================
+# HASH PER RECORD
+# =============================================================================
+
+def _record_hashes(raw: np.ndarray) -> np.ndarray:
+    """Hash FNV-1a a 64 bit per record, calcolato a parole di 8 byte in forma vettoriale."""
+    count, width = raw.shape
+    hashes = np.full(count, _FNV_OFFSET, dtype=np.uint64)
+    if count == 0:
+        return hashes
+
+    padding = (-width) % 8
+    if padding:
+        raw = np.pad(raw, ((0, 0), (0, padding)))
+    words = np.ascontiguousarray(raw).view('<u8')
+    for column in range(words.shape[1]):
+        hashes ^= words[:, column]
+        hashes *= _FNV_PRIME
+    return hashes
+
+
+def _empty_like(column: np.ndarray, count: int) -> np.ndarray:
+    """Array vuoto dello stesso dtype della colonna (usato per estendere le colonne)."""
+    if column.dtype.kind == 'M':
+        return np.full(count, np.datetime64('NaT'), dtype=column.dtype)
+    if column.dtype.kind == 'f':
+        return np.full(count, np.nan, dtype=column.dtype)
+    return np.zeros(count, dtype=column.dtype)
+
+
+def header_meta(header: DbfHeader) -> Dict[str, Any]:
+    """Header DBF serializzabile in JSON (per i formati persistiti)."""
+    return {
+        'version': header.version,
+        'record_count': header.record_count,
+        'header_length': header.header_length,
+        'record_length': header.record_length,
+        'fields': [[f.name, f.type, f.offset, f.length, f.decimals] for f in header.fields],
+    }
+
+
+def header_from_meta(meta: Dict[str, Any]) -> DbfHeader:
+    """Inverso di header_meta."""
+    return DbfHeader(meta['version'], meta['record_count'], meta['header_length'], meta['record_length'],
+                     tuple(DbfField(*f) for f in meta['fields']))
+
+
+# =============================================================================
+# TABELLA MIRROR (IMMUTABILE PER GENERAZIONE)
+# =============================================================================
+
+class MirrorTable:
+    """
+    Vista colonnare di una tabella DBF ad una certa generazione.
+
+    L'istanza non viene mai modificata dopo la creazione: un refresh produce una
+    nuova MirrorTable, quindi i lettori possono usarla senza lock.
+    """
+
+    def __init__(self,
+                 name: str,
+                 path: str,
+                 header: DbfHeader,
+                 columns: Dict[str, np.ndarray],
+                 deleted: np.ndarray,
+                 hashes: np.ndarray,
+                 stat_signature: Tuple[int, int],
+                 generation: int = 1,
+                 changed_rows: Optional[np.ndarray] = None):
+        self.name = name
+        self.path = path
+        self.header = header
+        self.columns = columns
+        self.deleted = deleted
+        self.hashes = hashes
+        self.stat_signature = stat_signature
+        self.generation = generation
+        # Righe ri-decodificate rispetto alla generazione precedente (None = ricostruzione completa)
+        self.changed_rows = changed_rows
+        self.loaded_at = time.time()
+
+        self._fields = {f.name: f for f in header.data_fields}
+        self._derived: Dict[Any, Any] = {}
+        self._derived_lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return int(self.deleted.shape[0])
+
+    @property
+    def field_names(self) -> List[str]:
+        return list(self._fields)
+
+    def has_field(self, name: str) -> bool:
+        return name.upper() in self._fields
+
+    def field(self, name: str) -> DbfField:
+        try:
+            return self._fields[name.upper()]
+        except KeyError:
+            raise DbfProcessingError(f"Campo {name} non presente in {self.name}",
+                                     file_path=self.path, field_name=name)
+
+    def column(self, name: str) -> np.ndarray:
+        """Colonna tipizzata (bytes a larghezza fissa per i campi char)."""
+        return self.columns[self.field(name).name]
+
+    def live_mask(self) -> np.ndarray:
+        """Maschera dei record non cancellati."""
+        return ~self.deleted
+
+    def derived(self, key: Any, builder):
+        """
+        Cache di strutture derivate (colonne normalizzate, indici) legate a
+        questa generazione: viene scartata automaticamente al refresh.
+        """
+        with self._derived_lock:
+            if key not in self._derived:
+                self._derived[key] = builder()
+            return self._derived[key]
+
+    def stripped(self, name: str) -> np.ndarray:
+        """Colonna char con spazi iniziali/finali rimossi (bytes)."""
+        field = self.field(name)
+        return self.derived(('stripped', field.name), lambda: np.char.strip(self.columns[field.name]))
+
+    def numbers(self, name: str, default: float = 0.0) -> np.ndarray:
+        """Colonna numerica con i valori vuoti sostituiti da `default`."""
+        column = self.column(name)
+        return np.where(np.isnan(column), default, column) if column.dtype.kind == 'f' else column
+
+    def find(self, name: str, value: Any, include_deleted: bool = True) -> np.ndarray:
+        """Indici delle righe il cui campo char (normalizzato) vale `value`."""
+        needle = str(value).strip().encode(DBF_ENCODING, errors='ignore')
+        mask = self.stripped(name) == needle
+        if not include_deleted:
+            mask &= ~self.deleted
+        return np.flatnonzero(mask)
+
+    def lookup(self, name: str, value: Any) -> Optional[int]:
+        """
+        Prima riga (ordine file) il cui campo char normalizzato vale `value`,
+        tramite un indice hash costruito una volta per generazione.
+        """
+        field = self.field(name)
+
+        def build() -> Dict[bytes, int]:
+            keys, first = np.unique(self.stripped(field.name), return_index=True)
+            return dict(zip(keys.tolist(), first.tolist()))
+
+        index = self.derived(('lookup', field.name), build)
+        return index.get(str(value).strip().encode(DBF_ENCODING, errors='ignore'))
+
+    def values(self, name: str, rows: Optional[Iterable[int]] = None) -> List[Any]:
+        """Valori Python (str ripulite, date, numeri, bool) per le righe richieste."""
+        field = self.field(name)
+        column = self.columns[field.name]
+        selected = column if rows is None else column[np.asarray(rows, dtype=np.int64)]
+        return dbf_column_values(field, selected, self._read_memo)
+
+    def records(self,
+                rows: Optional[Iterable[int]] = None,
+                fields: Optional[Iterable[str]] = None,
+                include_deleted: bool = True) -> List[Dict[str, Any]]:
+        """Materializza le righe richieste come dict {NOME_CAMPO: valore}."""
+        if rows is None:
+            indices = np.arange(len(self)) if include_deleted else np.flatnonzero(~self.deleted)
+        else:
+            indices = np.asarray(list(rows) if not isinstance(rows, np.ndarray) else rows, dtype=np.int64)
+            if not include_deleted and indices.size:
+                indices = indices[~self.deleted[indices]]
+
+        names = [self.field(n).name for n in fields] if fields else self.field_names
+        columns = {n: self.values(n, indices) for n in names}
+        return [{n: columns[n][i] for n in names} for i in range(len(indices))]
+
+    # ------------------------------------------------------------------
+    # Memo (lettura lazy dal file .FPT / .DBT)
+    # ------------------------------------------------------------------
+
+    def _memo_path(self) -> Optional[str]:
+        return self.derived('memo_path', lambda: locate_dbf_memo(self.path))
+
+    def _read_memo(self, block: int) -> str:
+        return read_dbf_memo(self._memo_path() if block > 0 else None, block)
+
+
+# =============================================================================
+# MIRROR MANAGER
+# =============================================================================
+
+class DbfMirror:
+    """
+    Gestore delle tabelle mirror, condiviso da tutti i servizi che leggono DBF.
+
+    Caratteristiche:
+    - Una MirrorTable per file, ricaricata solo quando mtime/size cambiano
+    - Refresh incrementale basato su hash per record
+    - Persistenza su disco per partire incrementali anche dopo un riavvio
+    - Thread-safe: un lock per file, lettori senza lock
+    """
+
+    def __init__(self,
+                 mirror_dir: str = str(DBF_MIRROR_DIR),
+                 stat_interval: float = 1.0,
+                 persist_interval: float = 60.0):
+        self.mirror_dir = Path(mirror_dir)
+        self.mirror_dir.mkdir(parents=True, exist_ok=True)
+        self.stat_interval = stat_interval
+        self.persist_interval = persist_interval
+
+        self._tables: Dict[str, MirrorTable] = {}
+        self._last_stat: Dict[str, float] = {}
+        self._last_persist: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+        self._stats = {'full_builds': 0, 'incremental_refreshes': 0, 'rows_decoded': 0, 'unchanged_checks': 0}
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def table(self, table_key: str) -> MirrorTable:
+        """Tabella mirror per chiave logica (vedi DBF_TABLES), es. 'APPUNTA', 'pazienti'."""
+        return self.table_at(get_config().get_dbf_path(table_key))
+
+    def table_at(self, path: str) -> MirrorTable:
+        """Tabella mirror per percorso file, aggiornata se il file e' cambiato."""
+        key = self._key(path)
+        current = self._tables.get(key)
+        if current is not None and time.time() - self._last_stat.get(key, 0) < self.stat_interval:
+            return current
+        return self._refresh(key, path)
+
+    def invalidate(self, path_or_name: str) -> None:
+        """Forza la verifica del file al prossimo accesso (es. da evento file watcher)."""
+        needle = Path(path_or_name).stem.upper()
+        for key in list(self._last_stat):
+            if key == self._key(path_or_name) or Path(key).stem.upper() == needle:
+                self._last_stat[key] = 0
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato del mirror per monitoring."""
+        tables = {}
+        for key, table in list(self._tables.items()):
+            tables[table.name] = {
+                'path': table.path,
+                'records': len(table),
+                'deleted': int(table.deleted.sum()),
+                'generation': table.generation,
+                'memory_mb': round(sum(c.nbytes for c in table.columns.values()) / 1024 / 1024, 2),
+                'loaded_at': datetime.fromtimestamp(table.loaded_at).isoformat(),
+            }
+        return {'tables': tables, 'stats': dict(self._stats), 'mirror_dir': str(self.mirror_dir)}
+
+    # ------------------------------------------------------------------
+    # Refresh
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normcase(os.path.abspath(path))
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _refresh(self, key: str, path: str) -> MirrorTable:
+        with self._lock_for(key):
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                raise DbfProcessingError(f"File DBF non accessibile: {path}", file_path=path, cause=e)
+
+            signature = (st.st_mtime_ns, st.st_size)
+            current = self._tables.get(key)
+            if current is None:
+                current = self._load_persisted(key, path)
+
+            self._last_stat[key] = time.time()
+            if current is not None and current.stat_signature == signature:
+                self._tables[key] = current
+                self._stats['unchanged_checks'] += 1
+                return current
+
+            start = time.time()
+            name = Path(path).stem.upper()
+            with DbfRecordDecoder(path) as decoder:
+                header, raw = decoder.header, decoder.raw
+                hashes = _record_hashes(raw)
+                if current is None or current.header.layout != header.layout:
+                    table = self._build_full(name, path, header, raw, hashes, signature, current)
+                else:
+                    table = self._build_incremental(current, header, raw, hashes, signature)
+
+            self._tables[key] = table
+            elapsed = (time.time() - start) * 1000
+            decoded = len(table) if table.changed_rows is None else len(table.changed_rows)
+            self._stats['rows_decoded'] += decoded
+            logger.debug(f"DBF mirror {name}: {decoded}/{len(table)} record decodificati in {elapsed:.1f}ms")
+
+            if table.changed_rows is None or time.time() - self._last_persist.get(key, 0) >= self.persist_interval:
+                self._persist(key, table)
+            return table
+
+    def _build_full(self, name, path, header, raw, hashes, signature, previous) -> MirrorTable:
+        columns = {f.name: decode_dbf_column(raw, f) for f in header.data_fields}
+        deleted = raw[:, 0] == ord('*')
+        self._stats['full_builds'] += 1
+        generation = previous.generation + 1 if previous is not None else 1
+        return MirrorTable(name, path, header, columns, deleted, hashes, signature, generation)
+
+    def _build_incremental(self, current: MirrorTable, header, raw, hashes, signature) -> MirrorTable:
+        old_count, new_count = len(current), raw.shape[0]
+        common = min(old_count, new_count)
+        changed = np.flatnonzero(current.hashes[:common] != hashes[:common])
+        rows = np.concatenate([changed, np.arange(common, new_count)]).astype(np.int64)
+
+        patch = raw[rows]
+        columns = {}
+        for field in header.data_fields:
+            old_column = current.columns[field.name]
+            column = np.concatenate([old_column[:common], _empty_like(old_column, new_count - common)])
+            if rows.size:
+                column[rows] = decode_dbf_column(patch, field)
+            columns[field.name] = column
+
+        deleted = np.concatenate([current.deleted[:common], np.zeros(new_count - common, dtype=bool)])
+        if rows.size:
+            deleted[rows] = patch[:, 0] == ord('*')
+
+        self._stats['incremental_refreshes'] += 1
+        return MirrorTable(current.name, current.path, header, columns, deleted, hashes,
+                           signature, current.generation + 1, changed_rows=rows)
+
+    # ------------------------------------------------------------------
+    # Persistenza
+    # ------------------------------------------------------------------
+
+    def _mirror_file(self, table_name: str) -> Path:
+        return self.mirror_dir / f"{table_name}.npz"
+
+    def _persist(self, key: str, table: MirrorTable) -> None:
+        try:
+            meta = {
+                'path': table.path,
+                'stat_signature': list(table.stat_signature),
+                'generation': table.generation,
+                'header': header_meta(table.header),
+            }
+            arrays = {f"col_{name}": column for name, column in table.columns.items()}
+            buffer = io.BytesIO()
+            np.savez(buffer, _meta=np.array(json.dumps(meta)), _deleted=table.deleted,
+                     _hashes=table.hashes, **arrays)
+
+            target = self._mirror_file(table.name)
+            tmp = target.with_suffix('.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(buffer.getvalue())
+            os.replace(tmp, target)
+            self._last_persist[key] = time.time()
+        except Exception as e:
+            logger.warning(f"Salvataggio mirror {table.name} fallito: {e}")
+
+    def _load_persisted(self, key: str, path: str) -> Optional[MirrorTable]:
+        target = self._mirror_file(Path(path).stem.upper())
+        if not target.exists():
+            return None
+        try:
+            with np.load(target, allow_pickle=False) as data:
+                meta = json.loads(str(data['_meta']))
+                if self._key(meta['path']) != key:
+                    return None
+                header = header_from_meta(meta['header'])
+                columns = {name[4:]: data[name] for name in data.files if name.startswith('col_')}
+                table = MirrorTable(Path(path).stem.upper(), path, header, columns,
+                                    data['_deleted'], data['_hashes'],
+                                    tuple(meta['stat_signature']), meta.get('generation', 1))
+            self._last_persist[key] = time.time()
+            logger.debug(f"DBF mirror {table.name}: caricato da {target} ({len(table)} record)")
+            return table
+        except Exception as e:
+            logger.warning(f"Mirror persistito {target} non leggibile, ricostruzione completa: {e}")
+            return None
+
+
+# Singleton instance
+_dbf_mirror = None
+_dbf_mirror_lock = threading.Lock()
+
+def get_dbf_mirror() -> DbfMirror:
+    """Get singleton DBF mirror instance."""
+    global _dbf_mirror
+    if _dbf_mirror is None:
+        with _dbf_mirror_lock:
+            if _dbf_mirror is None:
+                _dbf_mirror = DbfMirror()
+    return _dbf_mirror
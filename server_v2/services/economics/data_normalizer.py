@@ -1,17 +1,23 @@
 """
 Data Normalizer per il modulo Economics.
 Legge i file DBF e produce DataFrame pandas normalizzati e coerenti.
+
+I frame sono materializzati per anno dal FrameStore (frame_store.py): ogni
+partizione si ricostruisce solo quando cambiano i record del suo anno.
 """
 
+import functools
 import logging
-import dbf
+import numpy as np
 import pandas as pd
-from datetime import datetime, date
 from typing import Optional
-from decimal import Decimal
 
 from core.config_manager import get_config
 from core.constants_v2 import COLONNE, DBF_TABLES, TIPI_APPUNTAMENTO, MEDICI, PRIMANOTA_MOVIMENTI_INTERNI
+from core.shared_cache import file_version
+from core.single_flight import get_single_flight
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+from services.economics.frame_store import FrameSpec, get_frame_store
 from utils.dbf_utils import clean_dbf_value
 
 logger = logging.getLogger(__name__)
@@ -23,30 +29,6 @@ def _get_dbf_path(table_key: str) -> str:
     return config.get_dbf_path(table_key)
 
 
-def _safe_float(value, default=0.0) -> float:
-    """Converte un valore in float in modo sicuro."""
-    if value is None:
-        return default
-    try:
-        if isinstance(value, Decimal):
-            return float(value)
-        return float(value)
-    except (ValueError, TypeError):
-        return default
-
-
-def _safe_int(value, default=0) -> int:
-    """Converte un valore in int in modo sicuro."""
-    if value is None:
-        return default
-    try:
-        if isinstance(value, Decimal):
-            return int(value)
-        return int(value)
-    except (ValueError, TypeError):
-        return default
-
-
 def _dbf_time_to_minutes(val: float) -> int:
     """
     Converte un orario in formato DBF (es. 17.25 = 17:25) in minuti totali.
@@ -58,244 +40,211 @@ def _dbf_time_to_minutes(val: float) -> int:
     return ore * 60 + minuti
 
 
-def _safe_date(value) -> Optional[date]:
-    """Converte un valore in date in modo sicuro."""
-    if value is None:
-        return None
-    if isinstance(value, datetime):
-        return value.date()
-    if isinstance(value, date):
-        return value
-    return None
+def _coalesced(table_key: str):
+    """
+    Le chiamate concorrenti con lo stesso (file, versione, anno) attendono un
+    solo caricamento; chi riceve un DataFrame condiviso ne ottiene una copia.
+    """
+    def decorate(loader):
+        @functools.wraps(loader)
+        def wrapper(anno: Optional[int] = None) -> pd.DataFrame:
+            path = _get_dbf_path(table_key)
+            key = (loader.__name__, path, file_version(path), anno)
+            df, shared = get_single_flight('economics.frames').do(key, lambda: loader(anno))
+            return df.copy() if shared else df
+        return wrapper
+    return decorate
+
+
+def _mirror_table(table_key: str) -> MirrorTable:
+    """Tabella colonnare dal mirror DBF (rilegge solo i record modificati)."""
+    return get_dbf_mirror().table_at(_get_dbf_path(table_key))
+
+
+def _clean_values(table: MirrorTable, field: str, rows: np.ndarray) -> list:
+    """Valori delle righe selezionate normalizzati con clean_dbf_value."""
+    return [clean_dbf_value(v) for v in table.values(field, rows)]
+
+
+def _dbf_times_to_minutes(values: np.ndarray) -> np.ndarray:
+    """Versione vettoriale di _dbf_time_to_minutes."""
+    ore = np.trunc(values)
+    return (ore * 60 + np.round((values - ore) * 100)).astype(np.int64)
+
+
+def _load_frame(spec: FrameSpec, anno: Optional[int], label: str) -> pd.DataFrame:
+    """Frame dal FrameStore; in caso di errore di lettura un DataFrame vuoto."""
+    try:
+        return get_frame_store().frame(spec, _mirror_table(spec.table_key), anno)
+    except Exception as e:
+        logger.error(f"Errore lettura {label}: {e}")
+        return pd.DataFrame()
+
+
+# =============================================================================
+# COSTRUZIONE FRAME (righe gia' selezionate per anno)
+# =============================================================================
+
+def _build_production(table: MirrorTable, rows: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame({
+        'fatturaid': _clean_values(table, 'DB_CODE', rows),
+        'pazienteid': _clean_values(table, 'DB_FAPACOD', rows),
+        'data': table.column('DB_FADATA')[rows].astype('datetime64[D]'),
+        'importo': table.numbers('DB_FAIMPON')[rows].astype(float),
+        'numero': _clean_values(table, 'DB_FANUMER', rows),
+        'modo_pagamento': _clean_values(table, 'DB_FAPAGAM', rows),
+    })
+
+
+def _build_appointments(table: MirrorTable, rows: np.ndarray) -> pd.DataFrame:
+    col = COLONNE['appuntamenti']
+    ora_inizio = table.numbers(col['ora_inizio'])[rows].astype(float)
+    ora_fine = table.numbers(col['ora_fine'])[rows].astype(float)
+    medici = table.numbers(col['medico'])[rows].astype(np.int64)
+    tipi = _clean_values(table, col['tipo'], rows)
+
+    # Converte da formato DBF (ore.minuti base 60) a minuti totali
+    min_inizio = _dbf_times_to_minutes(ora_inizio)
+    min_fine = _dbf_times_to_minutes(ora_fine)
+
+    return pd.DataFrame({
+        'data': table.column(col['data'])[rows].astype('datetime64[D]'),
+        'ora_inizio': ora_inizio,
+        'ora_fine': ora_fine,
+        'pazienteid': _clean_values(table, col['id_paziente'], rows),
+        'tipo': tipi,
+        'tipo_nome': [TIPI_APPUNTAMENTO.get(t, f'Tipo sconosciuto ({t})') for t in tipi],
+        'medico': medici,
+        'medico_nome': [MEDICI.get(int(m), f'Medico {m}') for m in medici],
+        'studio': table.numbers(col['studio'])[rows].astype(np.int64),
+        'durata_minuti': np.where(min_fine > min_inizio, min_fine - min_inizio, 0),
+    })
+
+
+def _build_costs(table: MirrorTable, rows: np.ndarray) -> pd.DataFrame:
+    col = COLONNE['spese_fornitori']
+    costo_netto = table.numbers(col['costo_netto'])[rows].astype(float)
+    costo_iva = table.numbers(col['costo_iva'])[rows].astype(float)
+    return pd.DataFrame({
+        'id': _clean_values(table, col['id'], rows),
+        'codice_fornitore': _clean_values(table, col['codice_fornitore'], rows),
+        'descrizione': _clean_values(table, col['descrizione'], rows),
+        'costo_netto': costo_netto,
+        'costo_iva': costo_iva,
+        'data_spesa': table.column(col['data_spesa'])[rows].astype('datetime64[D]'),
+        'costo_totale': costo_netto + costo_iva,
+    })
+
+
+_STATO_MAP = {1: 'Da Eseguire', 2: 'In Corso', 3: 'Eseguito'}
+
+
+def _build_estimates(table: MirrorTable, rows: np.ndarray) -> pd.DataFrame:
+    col = COLONNE['preventivi']
+    stati = table.numbers(col['stato_prestazione'])[rows].astype(np.int64)
+    return pd.DataFrame({
+        'id_piano': _clean_values(table, col['id_piano'], rows),
+        'id_prestazione': _clean_values(table, col['id_prestazione'], rows),
+        'codice_prestazione': _clean_values(table, col['codice_prestazione'], rows),
+        'data': table.column(col['data_prestazione'])[rows].astype('datetime64[D]'),
+        'spesa': table.numbers(col['spesa'])[rows].astype(float),
+        'medico': table.numbers(col['medico'])[rows].astype(np.int64),
+        'stato': stati,
+        'stato_nome': [_STATO_MAP.get(int(s), f'Stato sconosciuto ({s})') for s in stati],
+    })
+
+
+def _primanota_uscite(table: MirrorTable) -> np.ndarray:
+    """Solo uscite (importi negativi), esclusi i movimenti interni cassa-banca."""
+    col = COLONNE['primanota']
+    tipi_op = table.numbers(col['tipo_operazione']).astype(np.int64)
+    return (table.numbers(col['importo']) < 0) & ~np.isin(tipi_op, list(PRIMANOTA_MOVIMENTI_INTERNI))
 
 
+def _build_primanota(table: MirrorTable, rows: np.ndarray) -> pd.DataFrame:
+    col = COLONNE['primanota']
+    return pd.DataFrame({
+        'data': table.column(col['data'])[rows].astype('datetime64[D]'),
+        'importo': np.abs(table.numbers(col['importo'])[rows]).astype(float),
+        'descrizione': _clean_values(table, col['descrizione'], rows),
+        'tipo_operazione': table.numbers(col['tipo_operazione'])[rows].astype(np.int64),
+        'tipo_chi': table.numbers(col['tipo_chi'])[rows].astype(np.int64),
+        'conto': _clean_values(table, col['conto'], rows),
+    })
+
+
+PRODUCTION = FrameSpec(
+    name='production', table_key='fatture', date_field='DB_FADATA', date_column='data', build=_build_production,
+    row_filter=lambda table: table.numbers('DB_FAIMPON') > 0,
+    categorical=('modo_pagamento',),
+)
+APPOINTMENTS = FrameSpec(
+    name='appointments', table_key='APPUNTA', date_field=COLONNE['appuntamenti']['data'], date_column='data',
+    build=_build_appointments, categorical=('tipo', 'tipo_nome', 'medico_nome'),
+)
+COSTS = FrameSpec(
+    name='costs', table_key='spese', date_field=COLONNE['spese_fornitori']['data_spesa'], date_column='data_spesa',
+    build=_build_costs, categorical=('codice_fornitore',),
+)
+# I preventivi senza data restano inclusi anche con filtro per anno
+ESTIMATES = FrameSpec(
+    name='estimates', table_key='preventivi', date_field=COLONNE['preventivi']['data_prestazione'], date_column='data',
+    build=_build_estimates, keep_missing=True, categorical=('codice_prestazione', 'stato_nome'),
+)
+PRIMANOTA = FrameSpec(
+    name='primanota', table_key='primanota', date_field=COLONNE['primanota']['data'], date_column='data',
+    build=_build_primanota, row_filter=_primanota_uscite, categorical=('conto',),
+)
+
+
+# =============================================================================
+# API PUBBLICA
+# =============================================================================
+
+@_coalesced('fatture')
 def get_df_production(anno: Optional[int] = None) -> pd.DataFrame:
     """
     Legge FATTURE.DBF e restituisce un DataFrame normalizzato.
 
     Colonne output: fatturaid, pazienteid, data, importo, numero, modo_pagamento
     """
-    col = COLONNE.get('fatture')
-    if not col:
-        # Fallback ai nomi DBF diretti se non in COLONNE
-        col = {
-            'fatturaid': 'DB_CODE',
-            'fatturapazienteid': 'DB_FAPACOD',
-            'fatturadata': 'DB_FADATA',
-            'fatturaimporto': 'DB_FAIMPON',
-            'fatturanumero': 'DB_FANUMER',
-            'fatturamodopagamento': 'DB_FAPAGAM',
-        }
-
-    # Mapping: nome DBF field -> nome logico nel DF output
-    # FATTURE non e' in COLONNE standard, usiamo i nomi noti dal progetto
-    field_map = {
-        'DB_CODE': 'fatturaid',
-        'DB_FAPACOD': 'pazienteid',
-        'DB_FADATA': 'data',
-        'DB_FAIMPON': 'importo',
-        'DB_FANUMER': 'numero',
-        'DB_FAPAGAM': 'modo_pagamento',
-    }
-
-    records = []
-    try:
-        path = _get_dbf_path('fatture')
-        with dbf.Table(path, codepage='cp1252') as table:
-            for record in table:
-                try:
-                    raw_date = getattr(record, 'db_fadata', None)
-                    record_date = _safe_date(raw_date)
-
-                    if record_date is None:
-                        continue
-
-                    if anno is not None and record_date.year != anno:
-                        continue
-
-                    importo = _safe_float(getattr(record, 'db_faimpon', 0))
-                    if importo <= 0:
-                        continue
-
-                    records.append({
-                        'fatturaid': clean_dbf_value(getattr(record, 'db_code', '')),
-                        'pazienteid': clean_dbf_value(getattr(record, 'db_fapacod', '')),
-                        'data': record_date,
-                        'importo': importo,
-                        'numero': clean_dbf_value(getattr(record, 'db_fanumer', '')),
-                        'modo_pagamento': clean_dbf_value(getattr(record, 'db_fapagam', '')),
-                    })
-                except Exception:
-                    continue
-    except Exception as e:
-        logger.error(f"Errore lettura FATTURE.DBF: {e}")
-
-    df = pd.DataFrame(records)
-    if not df.empty:
-        df['data'] = pd.to_datetime(df['data'])
-        df['anno'] = df['data'].dt.year
-        df['mese'] = df['data'].dt.month
-
+    df = _load_frame(PRODUCTION, anno, 'FATTURE.DBF')
     logger.info(f"get_df_production: {len(df)} fatture caricate" + (f" (anno={anno})" if anno else ""))
     return df
 
 
+@_coalesced('APPUNTA')
 def get_df_appointments(anno: Optional[int] = None) -> pd.DataFrame:
     """
     Legge APPUNTA.DBF e restituisce un DataFrame normalizzato.
 
     Colonne output: data, ora_inizio, ora_fine, pazienteid, tipo, tipo_nome, medico, medico_nome, studio, durata_minuti
     """
-    col = COLONNE['appuntamenti']
-
-    records = []
-    try:
-        path = _get_dbf_path('APPUNTA')
-        with dbf.Table(path, codepage='cp1252') as table:
-            for record in table:
-                try:
-                    raw_date = getattr(record, col['data'].lower(), None)
-                    record_date = _safe_date(raw_date)
-
-                    if record_date is None:
-                        continue
-
-                    if anno is not None and record_date.year != anno:
-                        continue
-
-                    tipo = clean_dbf_value(getattr(record, col['tipo'].lower(), ''))
-                    ora_inizio = _safe_float(getattr(record, col['ora_inizio'].lower(), 0))
-                    ora_fine = _safe_float(getattr(record, col['ora_fine'].lower(), 0))
-                    medico_id = _safe_int(getattr(record, col['medico'].lower(), 0))
-
-                    # Converte da formato DBF (ore.minuti base 60) a minuti totali
-                    min_inizio = _dbf_time_to_minutes(ora_inizio)
-                    min_fine = _dbf_time_to_minutes(ora_fine)
-                    durata_minuti = max(0, min_fine - min_inizio) if min_fine > min_inizio else 0
-
-                    records.append({
-                        'data': record_date,
-                        'ora_inizio': ora_inizio,
-                        'ora_fine': ora_fine,
-                        'pazienteid': clean_dbf_value(getattr(record, col['id_paziente'].lower(), '')),
-                        'tipo': tipo,
-                        'tipo_nome': TIPI_APPUNTAMENTO.get(tipo, f'Tipo sconosciuto ({tipo})'),
-                        'medico': medico_id,
-                        'medico_nome': MEDICI.get(medico_id, f'Medico {medico_id}'),
-                        'studio': _safe_int(getattr(record, col['studio'].lower(), 1)),
-                        'durata_minuti': durata_minuti,
-                    })
-                except Exception:
-                    continue
-    except Exception as e:
-        logger.error(f"Errore lettura APPUNTA.DBF: {e}")
-
-    df = pd.DataFrame(records)
-    if not df.empty:
-        df['data'] = pd.to_datetime(df['data'])
-        df['anno'] = df['data'].dt.year
-        df['mese'] = df['data'].dt.month
-
+    df = _load_frame(APPOINTMENTS, anno, 'APPUNTA.DBF')
     logger.info(f"get_df_appointments: {len(df)} appuntamenti caricati" + (f" (anno={anno})" if anno else ""))
     return df
 
 
+@_coalesced('spese')
 def get_df_costs(anno: Optional[int] = None) -> pd.DataFrame:
     """
     Legge SPESAFOR.DBF e restituisce un DataFrame normalizzato.
 
     Colonne output: id, codice_fornitore, descrizione, costo_netto, costo_iva, data_spesa, costo_totale
     """
-    col = COLONNE['spese_fornitori']
-
-    records = []
-    try:
-        path = _get_dbf_path('spese')
-        with dbf.Table(path, codepage='cp1252') as table:
-            for record in table:
-                try:
-                    raw_date = getattr(record, col['data_spesa'].lower(), None)
-                    record_date = _safe_date(raw_date)
-
-                    if record_date is None:
-                        continue
-
-                    if anno is not None and record_date.year != anno:
-                        continue
-
-                    costo_netto = _safe_float(getattr(record, col['costo_netto'].lower(), 0))
-                    costo_iva = _safe_float(getattr(record, col['costo_iva'].lower(), 0))
-
-                    records.append({
-                        'id': clean_dbf_value(getattr(record, col['id'].lower(), '')),
-                        'codice_fornitore': clean_dbf_value(getattr(record, col['codice_fornitore'].lower(), '')),
-                        'descrizione': clean_dbf_value(getattr(record, col['descrizione'].lower(), '')),
-                        'costo_netto': costo_netto,
-                        'costo_iva': costo_iva,
-                        'data_spesa': record_date,
-                        'costo_totale': costo_netto + costo_iva,
-                    })
-                except Exception:
-                    continue
-    except Exception as e:
-        logger.error(f"Errore lettura SPESAFOR.DBF: {e}")
-
-    df = pd.DataFrame(records)
-    if not df.empty:
-        df['data_spesa'] = pd.to_datetime(df['data_spesa'])
-        df['anno'] = df['data_spesa'].dt.year
-        df['mese'] = df['data_spesa'].dt.month
-
+    df = _load_frame(COSTS, anno, 'SPESAFOR.DBF')
     logger.info(f"get_df_costs: {len(df)} spese caricate" + (f" (anno={anno})" if anno else ""))
     return df
 
 
+@_coalesced('preventivi')
 def get_df_estimates(anno: Optional[int] = None) -> pd.DataFrame:
     """
     Legge PREVENT.DBF e restituisce un DataFrame normalizzato.
 
     Colonne output: id_piano, codice_prestazione, data, spesa, medico, stato, stato_nome
     """
-    col = COLONNE['preventivi']
-
-    STATO_MAP = {1: 'Da Eseguire', 2: 'In Corso', 3: 'Eseguito'}
-
-    records = []
-    try:
-        path = _get_dbf_path('preventivi')
-        with dbf.Table(path, codepage='cp1252') as table:
-            for record in table:
-                try:
-                    raw_date = getattr(record, col['data_prestazione'].lower(), None)
-                    record_date = _safe_date(raw_date)
-
-                    if anno is not None and record_date is not None and record_date.year != anno:
-                        continue
-
-                    stato = _safe_int(getattr(record, col['stato_prestazione'].lower(), 0))
-                    spesa = _safe_float(getattr(record, col['spesa'].lower(), 0))
-
-                    records.append({
-                        'id_piano': clean_dbf_value(getattr(record, col['id_piano'].lower(), '')),
-                        'id_prestazione': clean_dbf_value(getattr(record, col['id_prestazione'].lower(), '')),
-                        'codice_prestazione': clean_dbf_value(getattr(record, col['codice_prestazione'].lower(), '')),
-                        'data': record_date,
-                        'spesa': spesa,
-                        'medico': _safe_int(getattr(record, col['medico'].lower(), 0)),
-                        'stato': stato,
-                        'stato_nome': STATO_MAP.get(stato, f'Stato sconosciuto ({stato})'),
-                    })
-                except Exception:
-                    continue
-    except Exception as e:
-        logger.error(f"Errore lettura PREVENT.DBF: {e}")
-
-    df = pd.DataFrame(records)
-    if not df.empty and 'data' in df.columns:
-        df['data'] = pd.to_datetime(df['data'])
-        df['anno'] = df['data'].dt.year
-        df['mese'] = df['data'].dt.month
-
+    df = _load_frame(ESTIMATES, anno, 'PREVENT.DBF')
     logger.info(f"get_df_estimates: {len(df)} preventivi caricati" + (f" (anno={anno})" if anno else ""))
     return df
 
@@ -305,6 +254,7 @@ def get_df_payments(anno: Optional[int] = None) -> pd.DataFrame:
     return get_df_production(anno=anno)
 
 
+@_coalesced('primanota')
 def get_df_primanota(anno: Optional[int] = None) -> pd.DataFrame:
     """
     Legge PRIMANO.DBF e restituisce un DataFrame normalizzato con solo le uscite.
@@ -314,53 +264,6 @@ def get_df_primanota(anno: Optional[int] = None) -> pd.DataFrame:
 
     Colonne output: data, importo, descrizione, tipo_operazione, tipo_chi, conto
     """
-    col = COLONNE['primanota']
-
-    records = []
-    try:
-        path = _get_dbf_path('primanota')
-        with dbf.Table(path, codepage='cp1252') as table:
-            for record in table:
-                try:
-                    raw_date = getattr(record, col['data'].lower(), None)
-                    record_date = _safe_date(raw_date)
-
-                    if record_date is None:
-                        continue
-
-                    if anno is not None and record_date.year != anno:
-                        continue
-
-                    importo = _safe_float(getattr(record, col['importo'].lower(), 0))
-
-                    # Solo uscite (importi negativi)
-                    if importo >= 0:
-                        continue
-
-                    tipo_op = _safe_int(getattr(record, col['tipo_operazione'].lower(), 0))
-
-                    # Escludi movimenti interni cassa-banca
-                    if tipo_op in PRIMANOTA_MOVIMENTI_INTERNI:
-                        continue
-
-                    records.append({
-                        'data': record_date,
-                        'importo': abs(importo),
-                        'descrizione': clean_dbf_value(getattr(record, col['descrizione'].lower(), '')),
-                        'tipo_operazione': tipo_op,
-                        'tipo_chi': _safe_int(getattr(record, col['tipo_chi'].lower(), 0)),
-                        'conto': clean_dbf_value(getattr(record, col['conto'].lower(), '')),
-                    })
-                except Exception:
-                    continue
-    except Exception as e:
-        logger.error(f"Errore lettura PRIMANO.DBF: {e}")
-
-    df = pd.DataFrame(records)
-    if not df.empty:
-        df['data'] = pd.to_datetime(df['data'])
-        df['anno'] = df['data'].dt.year
-        df['mese'] = df['data'].dt.month
-
+    df = _load_frame(PRIMANOTA, anno, 'PRIMANO.DBF')
     logger.info(f"get_df_primanota: {len(df)} movimenti caricati" + (f" (anno={anno})" if anno else ""))
     return df
@@ -0,0 +1,226 @@
+"""
+Frame Store per il modulo Economics.
+
+Materializza i DataFrame normalizzati di data_normalizer per partizioni annuali:
+
+- Ogni partizione (tipo di frame, anno) viene costruita una volta dalle colonne
+  del DBF mirror e scritta su disco (Parquet se pyarrow è disponibile, altrimenti
+  pickle) con dtype categorici per le colonne testuali ripetitive
+- Firma per anno calcolata dagli hash per record del mirror: quando il DBF cambia
+  si ricostruiscono solo gli anni toccati dalle modifiche
+- Partizioni in memoria nella cache condivisa (namespace 'economics_frames'),
+  su disco per ripartire senza ricostruire dopo un riavvio
+"""
+
+import importlib.util
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from core.paths import ECONOMICS_FRAMES_DIR
+from core.shared_cache import get_shared_cache
+from services.dbf_mirror import MirrorTable
+
+logger = logging.getLogger(__name__)
+
+# Anno fittizio della partizione con le righe senza data
+NO_DATE = 0
+
+_HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+_FORMAT = 'parquet' if _HAS_PYARROW else 'pkl'
+
+# Moltiplicatore per mescolare posizione della riga e hash nella firma annuale
+_ROW_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+@dataclass(frozen=True)
+class FrameSpec:
+    """
+    Descrizione di un frame partizionabile per anno.
+
+    date_field è il campo data del DBF usato per partizionare, date_column la
+    colonna corrispondente nel frame; build(table, rows) costruisce il DataFrame
+    (senza colonne anno/mese) per le righe indicate; row_filter(table) è una
+    maschera opzionale applicata prima del partizionamento; keep_missing include
+    le righe senza data in ogni lettura.
+    """
+    name: str
+    table_key: str
+    date_field: str
+    date_column: str
+    build: Callable[[MirrorTable, np.ndarray], pd.DataFrame]
+    row_filter: Optional[Callable[[MirrorTable], np.ndarray]] = None
+    keep_missing: bool = False
+    categorical: Tuple[str, ...] = field(default_factory=tuple)
+
+
+def year_partitions(table: MirrorTable, date_field: str) -> Tuple[np.ndarray, Dict[int, str]]:
+    """
+    (anno per riga, {anno: firma}) per la colonna data indicata; le righe senza
+    data finiscono nell'anno NO_DATE. La firma cambia se cambia il contenuto o
+    la posizione di una qualunque riga dell'anno.
+    """
+    def build():
+        days = table.column(date_field).astype('datetime64[D]')
+        years = np.where(np.isnat(days), NO_DATE, days.astype('datetime64[Y]').astype(np.int64) + 1970)
+        n = len(years)
+        if not n:
+            return years, {}
+        mixed = table.hashes ^ (np.arange(n, dtype=np.uint64) * _ROW_MIX)
+        order = np.argsort(years, kind='stable')
+        keys, starts = np.unique(years[order], return_index=True)
+        sums = np.add.reduceat(mixed[order], starts)
+        counts = np.diff(np.append(starts, n))
+        signatures = {
+            int(year): f"{int(count):x}-{int(total):016x}"
+            for year, count, total in zip(keys, counts, sums)
+        }
+        return years, signatures
+
+    return table.derived(('year_partitions', date_field.upper()), build)
+
+
+class FrameStore:
+    """Partizioni annuali materializzate dei frame economics."""
+
+    def __init__(self, store_dir: str = str(ECONOMICS_FRAMES_DIR)):
+        self.store_dir = Path(store_dir)
+        self._lock = threading.Lock()
+        self._stats = {'built': 0, 'loaded_from_disk': 0, 'write_errors': 0}
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def frame(self, spec: FrameSpec, table: MirrorTable, anno: Optional[int] = None) -> pd.DataFrame:
+        """
+        Frame normalizzato per `anno` (tutti gli anni se None), righe in ordine
+        di file; un risultato vuoto è un DataFrame senza colonne.
+        """
+        years, signatures = year_partitions(table, spec.date_field)
+        if anno is not None:
+            wanted = [anno] if anno in signatures else []
+        else:
+            wanted = [year for year in signatures if year != NO_DATE]
+        if spec.keep_missing and NO_DATE in signatures:
+            wanted.append(NO_DATE)
+
+        parts = [self._partition(spec, table, years, year, signatures[year]) for year in wanted]
+        parts = [part for part in parts if not part.empty]
+        if not parts:
+            return pd.DataFrame()
+
+        df = parts[0] if len(parts) == 1 else pd.concat(parts).sort_index(kind='stable')
+        df = df.reset_index(drop=True)
+        for column in spec.categorical:
+            if column in df.columns and isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype(object)
+        return df
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Scarta le partizioni in memoria (di un frame o di tutti)."""
+        get_shared_cache().namespace('economics_frames').invalidate(
+            predicate=(lambda key: key[0] == name) if name else None
+        )
+
+    def get_status(self) -> Dict[str, object]:
+        with self._lock:
+            stats = dict(self._stats)
+        return {
+            'store_dir': str(self.store_dir),
+            'format': _FORMAT,
+            'stats': stats,
+            'memory': get_shared_cache().namespace('economics_frames').get_stats(),
+        }
+
+    # ------------------------------------------------------------------
+    # Partizioni
+    # ------------------------------------------------------------------
+
+    def _partition(self, spec: FrameSpec, table: MirrorTable, years: np.ndarray,
+                   year: int, signature: str) -> pd.DataFrame:
+        return get_shared_cache().namespace('economics_frames').get_or_load(
+            (spec.name, table.path, year),
+            lambda: self._load_or_build(spec, table, years, year, signature),
+            version=signature,
+        )
+
+    def _load_or_build(self, spec: FrameSpec, table: MirrorTable, years: np.ndarray,
+                       year: int, signature: str) -> pd.DataFrame:
+        path = self._partition_path(spec, table, year, signature)
+        if path.exists():
+            try:
+                df = pd.read_parquet(path) if _FORMAT == 'parquet' else pd.read_pickle(path)
+                with self._lock:
+                    self._stats['loaded_from_disk'] += 1
+                return df
+            except Exception as e:
+                logger.warning(f"Partizione {path.name} illeggibile, ricostruzione: {e}")
+
+        mask = years == year
+        if spec.row_filter is not None:
+            mask &= spec.row_filter(table)
+        rows = np.flatnonzero(mask)
+        df = spec.build(table, rows) if rows.size else pd.DataFrame()
+        df = self._typed(spec, df, rows)
+        with self._lock:
+            self._stats['built'] += 1
+        self._write(path, df)
+        return df
+
+    @staticmethod
+    def _typed(spec: FrameSpec, df: pd.DataFrame, rows: np.ndarray) -> pd.DataFrame:
+        """Indice = riga del DBF, colonne anno/mese e categorie per le colonne ripetitive."""
+        if df.empty:
+            return df
+        df.index = rows
+        df[spec.date_column] = pd.to_datetime(df[spec.date_column]).astype('datetime64[ns]')
+        df['anno'] = df[spec.date_column].dt.year
+        df['mese'] = df[spec.date_column].dt.month
+        for column in spec.categorical:
+            # Solo colonne di sole stringhe: i None resterebbero NaN dopo la conversione
+            if column in df.columns and df[column].map(type).eq(str).all():
+                df[column] = df[column].astype('category')
+        return df
+
+    def _partition_path(self, spec: FrameSpec, table: MirrorTable, year: int, signature: str) -> Path:
+        return self.store_dir / spec.name / f"{table.name}_{year}_{signature}.{_FORMAT}"
+
+    def _write(self, path: Path, df: pd.DataFrame) -> None:
+        """Scrive la partizione e rimuove le versioni precedenti dello stesso anno."""
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            prefix = path.name.rsplit('_', 1)[0] + '_'
+            for old in path.parent.glob(f"{prefix}*"):
+                if old != path:
+                    old.unlink(missing_ok=True)
+            tmp = path.with_suffix(path.suffix + '.tmp')
+            if _FORMAT == 'parquet':
+                df.to_parquet(tmp)
+            else:
+                df.to_pickle(tmp)
+            os.replace(tmp, path)
+        except Exception as e:
+            with self._lock:
+                self._stats['write_errors'] += 1
+            logger.warning(f"Scrittura partizione {path.name} fallita: {e}")
+
+
+# Istanza globale
+_frame_store: Optional[FrameStore] = None
+_frame_store_lock = threading.Lock()
+
+def get_frame_store() -> FrameStore:
+    """Get the global economics frame store instance."""
+    global _frame_store
+    if _frame_store is None:
+        with _frame_store_lock:
+            if _frame_store is None:
+                _frame_store = FrameStore()
+    return _frame_store
@@ -7,8 +7,9 @@ import logging
 import math
 import re
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 
+import numpy as np
 import pandas as pd
 
 
@@ -25,6 +26,7 @@ def _safe_num(val, default=0.0):
         return default
 
 from core.database_manager import get_database_manager
+from core.shared_cache import get_shared_cache
 from services.economics.data_normalizer import (
     get_df_production,
     get_df_appointments,
@@ -60,34 +62,8 @@ _PRIMANOTA_ESCLUSIONI = [
     'moto filippo',
 ]
 
-# Compila i pattern una volta sola
-_PRIMANOTA_ESCLUSIONI_RE = [re.compile(p, re.IGNORECASE) for p in _PRIMANOTA_ESCLUSIONI]
-
-
-def _is_costo_studio(descrizione: str, tipo_operazione: int) -> bool:
-    """
-    Determina se un movimento primanota e' un costo dello studio.
-
-    Args:
-        descrizione: Testo descrittivo del movimento (DB_PRCHI)
-        tipo_operazione: Tipo operazione (DB_PRTIPOP)
-
-    Returns:
-        True se e' un costo dello studio, False se e' personale/da escludere
-    """
-    # Tipo 4, 5, 8, 11 = costi operativi studio (sempre inclusi)
-    # Tipo 1 = normalmente incasso paziente, ma qui abbiamo solo uscite (importi negativi)
-    # quindi sono costi misclassificati nel gestionale
-    if tipo_operazione in (1, 4, 5, 8, 11):
-        return True
-
-    # Tipo 6, 12 = misto, classifico per descrizione
-    desc_lower = (descrizione or '').lower().strip()
-    for pattern in _PRIMANOTA_ESCLUSIONI_RE:
-        if pattern.search(desc_lower):
-            return False
-
-    return True
+# Compila i pattern una volta sola, in un'unica alternativa per il match vettoriale
+_PRIMANOTA_ESCLUSIONI_RE = re.compile('|'.join(f'(?:{p})' for p in _PRIMANOTA_ESCLUSIONI), re.IGNORECASE)
 
 
 def _ensure_cache_table():
@@ -197,6 +173,11 @@ def _save_to_cache(records: List[Dict[str, Any]]):
 
 def invalidate_cache(anno: Optional[int] = None):
     """Invalida la cache per un anno specifico o tutta."""
+    memory = get_shared_cache().namespace('economics')
+    if anno:
+        memory.invalidate(predicate=lambda key: key[:2] == ('monthly', anno))
+    else:
+        memory.invalidate(predicate=lambda key: key[0] == 'monthly')
     try:
         _ensure_cache_table()
         db = get_database_manager()
@@ -223,7 +204,7 @@ def get_monthly_summary(
     Args:
         anno_inizio: Anno di inizio (default: anno corrente)
         anno_fine: Anno di fine (default: uguale a anno_inizio)
-        use_cache: Se True, usa la cache SQLite
+        use_cache: Se True, usa la cache (memoria condivisa, poi SQLite)
         ore_disponibili: Ore disponibili al mese per calcolo saturazione
 
     Returns:
@@ -234,31 +215,45 @@ def get_monthly_summary(
     if anno_fine is None:
         anno_fine = anno_inizio
 
+    memory = get_shared_cache().namespace('economics')
     all_records = []
 
     for anno in range(anno_inizio, anno_fine + 1):
-        # Prova cache
+        key = ('monthly', anno, ore_disponibili)
         if use_cache:
-            cached = _get_cached_data(anno)
-            if cached:
-                all_records.extend(cached)
-                logger.info(f"Monthly summary anno {anno}: cache hit ({len(cached)} mesi)")
-                continue
-
-        # Calcola da DBF
-        year_records = _compute_monthly_for_year(anno, ore_disponibili)
-        all_records.extend(year_records)
-
-        # Salva in cache
-        if year_records:
-            try:
-                _save_to_cache(year_records)
-            except Exception as e:
-                logger.warning(f"Errore salvataggio cache anno {anno}: {e}")
+            # Richieste concorrenti per lo stesso anno attendono un solo calcolo
+            year_records = memory.get_or_load(key, lambda: _load_monthly_for_year(anno, ore_disponibili))
+        else:
+            year_records = _compute_and_save(anno, ore_disponibili)
+            memory.set(key, year_records)
+        # Copie: i chiamanti possono arricchire i record senza toccare la cache
+        all_records.extend(dict(rec) for rec in year_records)
 
     return all_records
 
 
+def _load_monthly_for_year(anno: int, ore_disponibili: float) -> List[Dict[str, Any]]:
+    """Anno dalla cache SQLite, oppure calcolato da DBF e salvato."""
+    cached = _get_cached_data(anno)
+    if cached:
+        logger.info(f"Monthly summary anno {anno}: cache hit ({len(cached)} mesi)")
+        return cached
+    return _compute_and_save(anno, ore_disponibili)
+
+
+def _compute_and_save(anno: int, ore_disponibili: float) -> List[Dict[str, Any]]:
+    # Calcola da DBF
+    year_records = _compute_monthly_for_year(anno, ore_disponibili)
+
+    # Salva in cache
+    if year_records:
+        try:
+            _save_to_cache(year_records)
+        except Exception as e:
+            logger.warning(f"Errore salvataggio cache anno {anno}: {e}")
+    return year_records
+
+
 def _load_classificazioni_fornitori() -> Dict[str, int]:
     """
     Carica il mapping codice_fornitore -> tipo_di_costo dalla tabella classificazioni_costi.
@@ -282,6 +277,39 @@ def _load_classificazioni_fornitori() -> Dict[str, int]:
     return mapping
 
 
+def _per_mese(df: pd.DataFrame, column: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Somma (NaN/Inf contati come 0) e numero di righe per mese, indicizzati 1..12
+    (posizione 0 inutilizzata).
+    """
+    somme = np.zeros(13)
+    conteggi = np.zeros(13, dtype=np.int64)
+    if df.empty:
+        return somme, conteggi
+    valori = pd.to_numeric(df[column], errors='coerce').astype(float)
+    valori = valori.where(np.isfinite(valori), 0.0)
+    mesi = df['mese'].to_numpy(dtype=np.int64)
+    np.add.at(somme, mesi, valori.to_numpy())
+    np.add.at(conteggi, mesi, 1)
+    return somme, conteggi
+
+
+def _mask_costi_studio(df_prima: pd.DataFrame) -> pd.Series:
+    """
+    Maschera dei movimenti primanota che sono costi dello studio (False per
+    quelli personali/da escludere).
+
+    Tipo 4, 5, 8, 11 = costi operativi studio (sempre inclusi).
+    Tipo 1 = normalmente incasso paziente, ma qui abbiamo solo uscite (importi
+    negativi) quindi sono costi misclassificati nel gestionale.
+    Tipo 6, 12 = misto, classifico per descrizione (DB_PRCHI).
+    """
+    sempre_inclusi = df_prima['tipo_operazione'].isin((1, 4, 5, 8, 11))
+    descrizioni = df_prima['descrizione'].fillna('').astype(str).str.lower().str.strip()
+    esclusi = descrizioni.str.contains(_PRIMANOTA_ESCLUSIONI_RE)
+    return sempre_inclusi | ~esclusi
+
+
 def _compute_monthly_for_year(anno: int, ore_disponibili: float) -> List[Dict[str, Any]]:
     """Calcola i dati mensili per un singolo anno leggendo i DBF."""
     logger.info(f"Calcolo monthly summary per anno {anno} da DBF...")
@@ -295,60 +323,49 @@ def _compute_monthly_for_year(anno: int, ore_disponibili: float) -> List[Dict[st
     # Carica classificazioni fornitori per split costi
     classif_map = _load_classificazioni_fornitori()
 
+    # Aggregazioni mensili vettoriali: un groupby per frame invece di un filtro per mese
+    produzione_mese, num_fatture_mese = _per_mese(df_prod, 'importo')
+
+    if not df_app.empty:
+        app_clinici = df_app[~df_app['tipo'].isin(TIPI_NON_CLINICI)]
+    else:
+        app_clinici = df_app
+    minuti_mese, num_app_mese = _per_mese(app_clinici, 'durata_minuti')
+
+    # Costi (spese fornitori) con classificazione diretti/indiretti
+    costi_mese, num_spese_mese = _per_mese(df_costs, 'costo_totale')
+    # 1=diretto, 2=indiretto, 3=non deducibile, None=non classificato
+    costi_per_tipo = {tipo: np.zeros(13) for tipo in (1, 2, 3, None)}
+    if not df_costs.empty:
+        tipo_costo = df_costs['codice_fornitore'].map(classif_map)
+        for tipo in (1, 2, 3):
+            costi_per_tipo[tipo], _ = _per_mese(df_costs[tipo_costo == tipo], 'costo_totale')
+        costi_per_tipo[None], _ = _per_mese(df_costs[~tipo_costo.isin((1, 2, 3))], 'costo_totale')
+
+    # Costi primanota (stipendi, tasse, INPS, assicurazioni, ecc.)
+    if not df_prima.empty:
+        df_prima = df_prima[_mask_costi_studio(df_prima)]
+    primanota_mese, _ = _per_mese(df_prima, 'importo')
+
     records = []
 
     for mese in range(1, 13):
         # Produzione (fatture)
-        prod_mese = df_prod[df_prod['mese'] == mese] if not df_prod.empty else pd.DataFrame()
-        produzione = _safe_num(prod_mese['importo'].sum()) if not prod_mese.empty else 0.0
+        produzione = _safe_num(produzione_mese[mese])
         incasso = produzione  # Per ora produzione = incasso (fatture emesse)
-        num_fatture = len(prod_mese)
+        num_fatture = int(num_fatture_mese[mese])
 
         # Ore cliniche (appuntamenti, escludendo Ferie e Manutenzione)
-        app_mese = df_app[df_app['mese'] == mese] if not df_app.empty else pd.DataFrame()
-        if not app_mese.empty:
-            app_clinici = app_mese[~app_mese['tipo'].isin(TIPI_NON_CLINICI)]
-            ore_cliniche = _safe_num(app_clinici['durata_minuti'].sum() / 60.0)
-            num_appuntamenti = len(app_clinici)
-        else:
-            ore_cliniche = 0.0
-            num_appuntamenti = 0
-
-        # Costi (spese fornitori) con classificazione diretti/indiretti
-        costs_mese = df_costs[df_costs['mese'] == mese] if not df_costs.empty else pd.DataFrame()
-        costi_totali = 0.0
-        costi_diretti = 0.0
-        costi_indiretti = 0.0
-        costi_non_deducibili = 0.0
-        costi_non_classificati = 0.0
-        costi_primanota = 0.0
-        num_spese = 0
-
-        if not costs_mese.empty:
-            num_spese = len(costs_mese)
-            for _, spesa in costs_mese.iterrows():
-                importo = _safe_num(spesa['costo_totale'])
-                costi_totali += importo
-                cod_forn = spesa.get('codice_fornitore', '')
-                tipo = classif_map.get(cod_forn)
-                if tipo == 1:
-                    costi_diretti += importo
-                elif tipo == 2:
-                    costi_indiretti += importo
-                elif tipo == 3:
-                    costi_non_deducibili += importo
-                else:
-                    costi_non_classificati += importo
-
-        # Costi primanota (stipendi, tasse, INPS, assicurazioni, ecc.)
-        prima_mese = df_prima[df_prima['mese'] == mese] if not df_prima.empty else pd.DataFrame()
-        if not prima_mese.empty:
-            for _, mov in prima_mese.iterrows():
-                desc = mov.get('descrizione', '')
-                tipo_op = mov.get('tipo_operazione', 0)
-                if _is_costo_studio(desc, tipo_op):
-                    importo = _safe_num(mov['importo'])
-                    costi_primanota += importo
+        ore_cliniche = _safe_num(minuti_mese[mese] / 60.0)
+        num_appuntamenti = int(num_app_mese[mese])
+
+        costi_totali = float(costi_mese[mese])
+        costi_diretti = float(costi_per_tipo[1][mese])
+        costi_indiretti = float(costi_per_tipo[2][mese])
+        costi_non_deducibili = float(costi_per_tipo[3][mese])
+        costi_non_classificati = float(costi_per_tipo[None][mese])
+        costi_primanota = float(primanota_mese[mese])
+        num_spese = int(num_spese_mese[mese])
 
         # Aggrega primanota in costi indiretti e totali
         costi_indiretti += costi_primanota
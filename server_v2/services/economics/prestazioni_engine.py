@@ -6,6 +6,8 @@ Report distribuzione appuntamenti e prestazioni eseguite.
 import logging
 import math
 import dbf
+import numpy as np
+import pandas as pd
 from datetime import datetime
 from typing import Optional, Dict, Any, List
 
@@ -315,23 +317,27 @@ def _calcola_distribuzione_prestazioni_anno(anno: int, onorario_map: Dict) -> Di
 
     # --- Per categoria ONORARIO ---
     # Raggruppa per categoria tramite id_prestazione -> ONORARIO.DB_ONTIPO
+    # (categorie nell'ordine di prima comparsa, somme in ordine di file)
+    id_prest_str = df_eseguiti['id_prestazione'].map(lambda v: str(v).strip() if v else '')
+    info_per_id = {i: onorario_map.get(i, {}) for i in id_prest_str.unique()}
+    chiavi = id_prest_str.map(lambda i: info_per_id[i].get('categoria_id') or 0)
+    codici, categorie = pd.factorize(chiavi)
+    spese = df_eseguiti['spesa'].astype(float)
+    spese = spese.where(np.isfinite(spese), 0.0).to_numpy()
+    fatturati = np.zeros(len(categorie))
+    np.add.at(fatturati, codici, spese)
+    conteggi = np.bincount(codici, minlength=len(categorie))
+    _, prime_righe = np.unique(codici, return_index=True)
+
     categorie_agg = {}
-    for _, row in df_eseguiti.iterrows():
-        id_prest_str = str(row['id_prestazione']).strip() if row['id_prestazione'] else ''
-        info_onor = onorario_map.get(id_prest_str, {})
-        cat_id = info_onor.get('categoria_id')
-        cat_nome = info_onor.get('categoria_nome', 'Non Definito')
-
-        key = cat_id if cat_id else 0
-        if key not in categorie_agg:
-            categorie_agg[key] = {
-                'categoria_id': cat_id,
-                'categoria_nome': cat_nome,
-                'count': 0,
-                'fatturato': 0.0,
-            }
-        categorie_agg[key]['count'] += 1
-        categorie_agg[key]['fatturato'] += _safe(row['spesa'])
+    for codice, riga in enumerate(prime_righe):
+        info_onor = info_per_id[id_prest_str.iloc[riga]]
+        categorie_agg[categorie[codice]] = {
+            'categoria_id': info_onor.get('categoria_id'),
+            'categoria_nome': info_onor.get('categoria_nome', 'Non Definito'),
+            'count': int(conteggi[codice]),
+            'fatturato': float(fatturati[codice]),
+        }
 
     categorie_list = []
     for cat_data in categorie_agg.values():
@@ -10,14 +10,14 @@ Version: 2.0.0
 
 import logging
 import threading
-import time
 from datetime import datetime
 from pathlib import Path
-from typing import Callable, Optional
+from typing import Callable, Dict, Optional
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from services.change_pipeline import ChangePipeline
 from services.snapshot_manager import get_snapshot_manager
 
 logger = logging.getLogger(__name__)
@@ -68,8 +68,9 @@ class FileWatcher:
         self.snapshot_manager = get_snapshot_manager()
         self.change_callback = None  # Callback per notificare cambiamenti
         self.monitored_files: Dict[str, str] = {} # Mappa filename.upper() -> table_name
-        self.last_trigger_time: Dict[str, float] = {} # Debounce per file
-        self.debounce_seconds = 5 # Evita trigger multipli
+        self.debounce_seconds = 1.5 # Silenzio richiesto sul file prima del confronto
+        # Raffiche di eventi -> un solo confronto per tabella, su worker dedicati
+        self.pipeline = ChangePipeline(self._dispatch_change, debounce_seconds=self.debounce_seconds)
         
         # logger.info("FileWatcher initialized")
     
@@ -143,7 +144,7 @@ class FileWatcher:
     def _on_any_dbf_event(self, event_type: str, file_path: str):
         """
         Callback generico per eventi su file DBF.
-        Applica debouncing e notifica il change_callback se il file è monitorato.
+        Inoltra gli eventi dei file monitorati alla pipeline (debounce e coalescenza per tabella).
         """
         file_name = Path(file_path).name.upper()
         
@@ -153,15 +154,12 @@ class FileWatcher:
 
         table_name = self.monitored_files[file_name]
 
-        # Debounce: evita trigger multipli per lo stesso file
-        current_time = time.time()
-        last_time = self.last_trigger_time.get(file_name, 0)
-        if (current_time - last_time) < self.debounce_seconds:
-            return
-        self.last_trigger_time[file_name] = current_time
-
         logger.debug(f"File event '{event_type}' detected for monitored file: {file_name}") # Downgraded to DEBUG
-        logger.debug(f"FileWatcher: Chiamata callback per {file_name} (table: {table_name})")
+        self.pipeline.submit(table_name)
+
+    def _dispatch_change(self, table_name: str):
+        """Eseguito da un worker della pipeline a raffica conclusa."""
+        logger.debug(f"FileWatcher: Chiamata callback per tabella {table_name}")
         
         # Chiama il callback principale del FileWatcher (che è in monitoring_service)
         if self.change_callback:
@@ -178,7 +176,8 @@ class FileWatcher:
         """
         return {
             "is_running": self.is_running,
-            "observer_active": self.observer.is_alive() if self.observer else False
+            "observer_active": self.observer.is_alive() if self.observer else False,
+            "pipeline": self.pipeline.get_stats()
         }
 
 # Singleton instance
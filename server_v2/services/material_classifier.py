@@ -0,0 +1,321 @@
+"""
+🏷️ Material Classifier per StudioDimaAI Server V2
+=================================================
+
+Motore di classificazione delle righe fattura usato da MaterialiMigrationService:
+
+- KeywordMatcher: tutte le parole chiave (categorie dentali, esclusioni,
+  parole delle frasi composte) compilate in un'unica regex a trie. Una sola
+  scansione della descrizione restituisce l'insieme delle parole chiave
+  contenute, con la stessa semantica "sottostringa" dei test `in` precedenti
+- clean_material_name: pulizia del nome con regex precompilate e cache
+- MaterialPatternIndex: pattern esistenti (materiali già classificati)
+  puliti una volta e indicizzati per token e trigrammi; la similarità viene
+  calcolata solo sui candidati migliori (sottostringhe e top-k per token)
+"""
+
+import heapq
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+# =============================================================================
+# KEYWORD MATCHER
+# =============================================================================
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Regex a trie delle parole: in ogni punto preferisce la parola più lunga."""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+class KeywordMatcher:
+    """
+    Trova quali parole di un vocabolario compaiono come sottostringa di un testo.
+
+    La regex restituisce per ogni posizione la parola più lunga che vi inizia;
+    le parole più corte nella stessa posizione (o dentro quella trovata) sono
+    sue sottostringhe e si ottengono dalla chiusura precalcolata `_implied`.
+    """
+
+    def __init__(self, vocabulary: Iterable[str]):
+        words = sorted({w for w in vocabulary if w})
+        self._regex = re.compile(f'(?=({_trie_pattern(words)}))') if words else None
+        self._implied: Dict[str, FrozenSet[str]] = {
+            word: frozenset(other for other in words if other in word) for word in words
+        }
+
+    def find(self, text: str) -> Set[str]:
+        if self._regex is None or not text:
+            return set()
+        found: Set[str] = set()
+        for longest in {m.group(1) for m in self._regex.finditer(text)}:
+            found |= self._implied[longest]
+        return found
+
+
+class KeywordClassifier:
+    """
+    Classificazione per categoria con lo stesso punteggio di
+    MaterialiMigrationService.classify_material_type, calcolato solo per le
+    categorie che hanno almeno una parola chiave nel testo.
+    """
+
+    def __init__(self,
+                 dental_keywords: Dict[str, Sequence[str]],
+                 exclude_keywords: Sequence[str],
+                 weights: Dict[str, int],
+                 unknown_threshold: float):
+        self.categories = [(categoria, list(keywords)) for categoria, keywords in dental_keywords.items()]
+        self.exclude = frozenset(exclude_keywords)
+        self.weights = weights
+        self.unknown_threshold = unknown_threshold
+
+        # Parola trovata -> categorie da valutare (parole chiave e parole delle frasi)
+        self._touches: Dict[str, Set[int]] = defaultdict(set)
+        vocabulary = set(self.exclude)
+        for position, (_, keywords) in enumerate(self.categories):
+            for keyword in keywords:
+                vocabulary.add(keyword)
+                self._touches[keyword].add(position)
+                if ' ' in keyword:
+                    for word in keyword.split():
+                        vocabulary.add(word)
+                        self._touches[word].add(position)
+        self.matcher = KeywordMatcher(vocabulary)
+
+    def classify(self, text_lower: str) -> Tuple[str, float]:
+        found = self.matcher.find(text_lower)
+        if found & self.exclude:
+            return 'non_dental', 0
+
+        touched = sorted({position for word in found for position in self._touches.get(word, ())})
+        best: Tuple[str, float] = ('unknown', 0)
+        for position in touched:
+            categoria, keywords = self.categories[position]
+            confidence = self._score(text_lower, keywords, found)
+            if confidence > best[1]:
+                best = (categoria, confidence)
+
+        if best[1] < self.unknown_threshold:
+            best = ('unknown', best[1])
+        return best
+
+    def _score(self, text_lower: str, keywords: List[str], found: Set[str]) -> float:
+        w = self.weights
+        confidence = 0
+        matches = exact_matches = 0
+        for keyword in keywords:
+            if keyword in found:
+                matches += 1
+                if keyword == text_lower:
+                    confidence += w['exact']
+                    exact_matches += 1
+                else:
+                    confidence += min(w['partial'], len(keyword) * 5)
+            elif ' ' in keyword and all(word in found for word in keyword.split()):
+                matches += 1
+                confidence += min(w['phrase'], len(keyword) * 4)
+
+        if matches > 1:
+            confidence += matches * w['multiple']
+        if exact_matches > 0:
+            confidence += exact_matches * w['exact_bonus']
+        if len(text_lower) < 5:
+            confidence *= 0.5
+        return confidence
+
+
+# =============================================================================
+# PULIZIA NOMI
+# =============================================================================
+
+_CLEAN_STEPS = [(re.compile(pattern), repl) for pattern, repl in (
+    (r'[^\w\s]', ' '),
+    # Misure e dimensioni
+    (r'\b\d+[x×]\d+\b', ''),   # 6X, 3X, etc.
+    (r'\b[a-z]\d+\b', ''),     # A3, C14, etc.
+    (r'\b\d+st\b', ''),        # 4ST, 6ST, etc.
+    (r'\b\d+%\b', ''),         # Percentuali
+    (r'\b\d+ml\b', ''),        # 10ml, 5ml, etc.
+    (r'\b\d+cc\b', ''),        # 10cc, 5cc, etc.
+    (r'\b\d+gr\b', ''),        # 10gr, 5gr, etc.
+    (r'\b\d+mg\b', ''),        # 10mg, 5mg, etc.
+    # Suffissi comuni
+    (r'\b(lt|refill|sterile|steril|r\d+|6x|sterile)\b', ''),
+    (r'\s+', ' '),
+)]
+
+
+@lru_cache(maxsize=65536)
+def clean_material_name(name: str) -> str:
+    """Nome in minuscolo senza varianti, misure e codici (per il matching)."""
+    if not name:
+        return ""
+    cleaned = str(name).lower().strip()
+    for regex, repl in _CLEAN_STEPS:
+        cleaned = regex.sub(repl, cleaned)
+    return cleaned.strip()
+
+
+# =============================================================================
+# PATTERN INDEX
+# =============================================================================
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class MaterialPatternIndex:
+    """
+    Pattern esistenti puliti e indicizzati una volta sola.
+
+    Una similarità >= `threshold` (0.5) richiede almeno un token in comune
+    oppure che un nome contenga l'altro. I candidati sono:
+    - i pattern in relazione di sottostringa con la descrizione (indice per
+      trigrammi, verificati con `in`);
+    - i `top_k` pattern con più token in comune, pesati per rarità (IDF).
+      I token presenti in troppi pattern (codici, "conf", "pz") non
+      generano candidati se la descrizione ne ha di più rari.
+    Le regole specifiche (RECIPROC, FILES) usano il primo pattern che le
+    soddisfa, precalcolato.
+    """
+
+    def __init__(self,
+                 patterns: List[Dict[str, Any]],
+                 similarity: Callable[[str, str], float],
+                 threshold: float = 0.5,
+                 top_k: int = 150):
+        self.patterns = patterns
+        self.similarity = similarity
+        self.threshold = threshold
+        self.top_k = top_k
+        self.cleaned = [clean_material_name(p.get('nome') or '') for p in patterns]
+
+        self._by_token: Dict[str, List[int]] = defaultdict(list)
+        self._by_trigram: Dict[str, List[int]] = defaultdict(list)
+        self._anchor: Dict[str, List[int]] = defaultdict(list)  # trigramma più raro del pattern
+        self._short: List[int] = []                                # pattern < 3 caratteri
+        pattern_trigrams = []
+        for i, name in enumerate(self.cleaned):
+            for token in set(name.split()):
+                self._by_token[token].append(i)
+            grams = _trigrams(name)
+            pattern_trigrams.append(grams)
+            for gram in grams:
+                self._by_trigram[gram].append(i)
+        for i, grams in enumerate(pattern_trigrams):
+            if not self.cleaned[i]:
+                continue
+            if grams:
+                self._anchor[min(grams, key=lambda g: (len(self._by_trigram[g]), g))].append(i)
+            else:
+                self._short.append(i)
+        self._idf = {token: math.log(1 + len(patterns) / len(ids)) for token, ids in self._by_token.items()}
+        self._stop_df = max(top_k, len(patterns) // 20)
+
+        self._rules = {
+            'reciproc_paper': self._first(lambda n, p: 'reciproc' in n and any(w in n for w in ('carta', 'paper', 'points'))),
+            'reciproc_gutta': self._first(lambda n, p: 'reciproc' in n and 'gutta' in n),
+            'reciproc_files': self._first(lambda n, p: 'reciproc' in n and 'files' in n),
+            'files': self._first(lambda n, p: 'files' in n and 'reciproc' not in n),
+            'endo_manual': self._first(lambda n, p: p['classification']['brancanome'] == 'ENDODONZIA'
+                                       and p['classification']['sottocontonome'] == 'STRUMENTI MANUALI'),
+        }
+        self.stats = {'lookups': 0, 'candidates': 0}
+
+    def _first(self, predicate) -> Optional[int]:
+        for i, (name, pattern) in enumerate(zip(self.cleaned, self.patterns)):
+            if predicate(name, pattern):
+                return i
+        return None
+
+    def _rule_match(self, rule: str, confidence: int, label: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        i = self._rules[rule]
+        if i is None:
+            return None
+        return {
+            'classification': self.patterns[i]['classification'],
+            'confidence': confidence,
+            'matched_pattern': label or self.patterns[i]['nome'],
+        }
+
+    def candidates(self, desc_clean: str) -> List[int]:
+        found: Set[int] = {i for i in self._short if self.cleaned[i] in desc_clean}
+        grams = _trigrams(desc_clean)
+        # Pattern contenuti nella descrizione: il loro trigramma àncora è nella descrizione
+        for gram in grams:
+            found.update(i for i in self._anchor.get(gram, ()) if self.cleaned[i] in desc_clean)
+        # Descrizione contenuta nel pattern: tutti i suoi trigrammi sono nel pattern
+        if grams:
+            postings = min((self._by_trigram.get(g, ()) for g in grams), key=len)
+            found.update(i for i in postings if desc_clean in self.cleaned[i])
+
+        scores: Dict[int, float] = defaultdict(float)
+        tokens = sorted(set(desc_clean.split()), key=lambda t: len(self._by_token.get(t, ())))
+        for token in tokens:
+            ids = self._by_token.get(token)
+            if not ids or (len(ids) > self._stop_df and scores):
+                continue
+            weight = self._idf[token]
+            for i in ids:
+                scores[i] += weight
+        found.update(i for i, _ in heapq.nlargest(self.top_k, scores.items(), key=lambda kv: (kv[1], -kv[0])))
+        return sorted(found)
+
+    def match(self, descrizione: str) -> Optional[Dict[str, Any]]:
+        """Algoritmo di MaterialiMigrationService._find_pattern_match sui soli candidati."""
+        if not self.patterns:
+            return None
+        self.stats['lookups'] += 1
+
+        desc_clean = clean_material_name(descrizione)
+        desc_lower = desc_clean.lower()
+
+        if 'reciproc' in desc_lower:
+            rule = None
+            if any(word in desc_lower for word in ['carta', 'paper', 'points']):
+                rule = 'reciproc_paper'
+            elif 'gutta' in desc_lower:
+                rule = 'reciproc_gutta'
+            elif 'files' in desc_lower:
+                rule = 'reciproc_files'
+            result = self._rule_match(rule, 95) if rule else None
+            if result:
+                return result
+        elif 'files' in desc_lower:
+            result = (self._rule_match('files', 95)
+                      or self._rule_match('endo_manual', 90, "Regola hardcoded: FILES senza RECIPROC"))
+            if result:
+                return result
+
+        best_match = None
+        best_score = 0
+        candidates = self.candidates(desc_clean)
+        self.stats['candidates'] += len(candidates)
+        for i in candidates:
+            similarity = self.similarity(desc_clean, self.cleaned[i])
+            if similarity > best_score and similarity >= self.threshold:
+                best_score = similarity
+                best_match = {
+                    'classification': self.patterns[i]['classification'],
+                    'confidence': int(similarity * 100),
+                    'matched_pattern': self.patterns[i]['nome'],
+                }
+        return best_match
@@ -15,8 +15,10 @@ from datetime import datetime
 from .base_service import BaseService
 from utils.dbf_utils import DBFOptimizedReader, clean_materiali_data, normalize_dbf_data
 from core.exceptions import ValidationError, DatabaseError, DbfProcessingError
+from core.database_manager import db_connection
 from core.paths import STUDIO_DIMA_DB_PATH
 from core.config_manager import get_config
+from .material_classifier import KeywordClassifier, MaterialPatternIndex, clean_material_name
 
 logger = logging.getLogger(__name__)
 
@@ -99,6 +101,20 @@ class MaterialiMigrationService(BaseService):
         # INIZIALIZZAZIONE MAPPING FORNITORI (GPT suggestion)
         self._initialize_supplier_mappings()
         
+        # CLASSIFICATORE A SINGOLA SCANSIONE (parole chiave compilate una volta)
+        self.keyword_classifier = KeywordClassifier(
+            self.dental_keywords,
+            self.exclude_keywords,
+            weights={
+                'exact': self.WEIGHT_EXACT_MATCH,
+                'partial': self.WEIGHT_PARTIAL_MATCH,
+                'multiple': self.WEIGHT_MULTIPLE_MATCHES,
+                'exact_bonus': self.WEIGHT_EXACT_BONUS,
+                'phrase': self.WEIGHT_PHRASE_MATCH,
+            },
+            unknown_threshold=self.CONFIDENCE_THRESHOLD_UNKNOWN,
+        )
+        
         # CACHE LIMITATA (GPT suggestion)
         self._classification_cache = {}
         self._supplier_cache = {}
@@ -153,67 +169,8 @@ class MaterialiMigrationService(BaseService):
         if cache_key in self._classification_cache:
             return self._classification_cache[cache_key]
         
-        descrizione_lower = descrizione.lower().strip()
-        
-        # Verifica se è un materiale da escludere (logica intelligente come backend v1)
-        for exclude_word in self.exclude_keywords:
-            if exclude_word in descrizione_lower:
-                result = ('non_dental', 0)
-                self._classification_cache[cache_key] = result
-                return result
-        
-        # Cerca corrispondenze con parole chiave dentali
-        best_match = ('unknown', 0)
-        category_scores = {}
-        
-        for categoria, keywords in self.dental_keywords.items():
-            confidence = 0
-            matches = 0
-            exact_matches = 0
-            partial_matches = 0
-            
-            for keyword in keywords:
-                if keyword in descrizione_lower:
-                    matches += 1
-                    
-                    # Peso maggiore per match esatti
-                    if keyword == descrizione_lower:
-                        confidence += self.WEIGHT_EXACT_MATCH
-                        exact_matches += 1
-                    # Match parziale con peso basato sulla lunghezza
-                    else:
-                        weight = min(self.WEIGHT_PARTIAL_MATCH, len(keyword) * 5)  # Peso proporzionale alla lunghezza
-                        confidence += weight
-                        partial_matches += 1
-                
-                # Controllo aggiuntivo per frasi composte (es. "lidocaina 2%")
-                elif ' ' in keyword:
-                    words = keyword.split()
-                    if all(word in descrizione_lower for word in words):
-                        matches += 1
-                        confidence += min(self.WEIGHT_PHRASE_MATCH, len(keyword) * 4)  # Peso leggermente inferiore per frasi
-                        partial_matches += 1
-            
-            # Bonus per multiple matches nella stessa categoria
-            if matches > 1:
-                confidence += matches * self.WEIGHT_MULTIPLE_MATCHES
-            
-            # Bonus per match esatti
-            if exact_matches > 0:
-                confidence += exact_matches * self.WEIGHT_EXACT_BONUS
-            
-            # Penalità per descrizioni troppo generiche
-            if len(descrizione_lower) < 5:
-                confidence *= 0.5
-            
-            category_scores[categoria] = confidence
-            
-            if confidence > best_match[1]:
-                best_match = (categoria, confidence)
-        
-        # Se la confidence è troppo bassa, classifica come unknown (CONSTANTE CONFIGURABILE)
-        if best_match[1] < self.CONFIDENCE_THRESHOLD_UNKNOWN:
-            best_match = ('unknown', best_match[1])
+        # Esclusioni e parole chiave dentali in un'unica scansione della descrizione
+        best_match = self.keyword_classifier.classify(cache_key)
         
         # Cache del risultato con limite (GPT suggestion)
         self._manage_cache_size()
@@ -539,8 +496,8 @@ class MaterialiMigrationService(BaseService):
             'already_imported': 0
         }
         
-        # Carica pattern esistenti per il matching
-        existing_patterns = self._load_existing_patterns()
+        # Carica pattern esistenti per il matching (puliti e indicizzati una volta)
+        pattern_index = self._build_pattern_index(self._load_existing_patterns())
         
         for material in materials_data:
             descrizione = material.get('nome', '')
@@ -583,7 +540,7 @@ class MaterialiMigrationService(BaseService):
                 stats['already_imported'] += 1
             else:
                 # TERZA: Prova pattern matching per classificazione specifica
-                pattern_match = self._find_pattern_match(descrizione, existing_patterns)
+                pattern_match = pattern_index.match(descrizione)
                 if pattern_match:
                     # Usa classificazione specifica dal pattern
                     classification_data = pattern_match['classification']
@@ -655,71 +612,67 @@ class MaterialiMigrationService(BaseService):
             Dizionario con statistiche della migrazione
         """
         try:
-            import sqlite3
             stats = {'inserted': 0, 'updated': 0, 'errors': 0, 'errors_list': []}
             
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            cursor = conn.cursor()
-            
-            for material in dental_materials:
-                try:
-                    # Verifica se il materiale esiste già usando la struttura esistente
-                    existing_query = """
-                        SELECT id FROM materiali 
-                        WHERE codicearticolo = ? AND fornitoreid = ?
-                    """
-                    existing = cursor.execute(existing_query, (
-                        material['codicearticolo'],
-                        material['fornitoreid']
-                    )).fetchone()
-                    
-                    if existing:
-                        # Aggiorna materiale esistente
-                        update_query = """
-                            UPDATE materiali SET
-                                nome = ?, fornitorenome = ?, costo_unitario = ?,
-                                confidence = ?, confermato = ?, occorrenze = ?,
-                                categoria_contabile = ?, contoid = ?, brancaid = ?, sottocontoid = ?,
-                                contonome = ?, brancanome = ?, sottocontonome = ?
-                            WHERE id = ?
-                        """
-                        cursor.execute(update_query, (
-                            material['nome'], material['fornitorenome'], material['costo_unitario'],
-                            material['confidence'], material['confermato'], material['occorrenze'],
-                            material['categoria_contabile'], material['contoid'], 
-                            material['brancaid'], material['sottocontoid'],
-                            material['contonome'], material['brancanome'], material['sottocontonome'],
-                            existing[0]
-                        ))
-                        stats['updated'] += 1
-                    else:
-                        # Inserisci nuovo materiale usando la struttura esistente
-                        insert_query = """
-                            INSERT INTO materiali (
-                                codicearticolo, nome, fornitoreid, fornitorenome, costo_unitario,
-                                confidence, confermato, occorrenze, categoria_contabile,
-                                contoid, brancaid, sottocontoid, contonome, brancanome, sottocontonome
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='materiali_migration_service', row_factory=None) as conn:
+                cursor = conn.cursor()
+            
+                for material in dental_materials:
+                    try:
+                        # Verifica se il materiale esiste già usando la struttura esistente
+                        existing_query = """
+                            SELECT id FROM materiali 
+                            WHERE codicearticolo = ? AND fornitoreid = ?
                         """
-                        cursor.execute(insert_query, (
-                            material['codicearticolo'], material['nome'],
-                            material['fornitoreid'], material['fornitorenome'], material['costo_unitario'],
-                            material['confidence'], material['confermato'], material['occorrenze'],
-                            material['categoria_contabile'], material['contoid'], 
-                            material['brancaid'], material['sottocontoid'],
-                            material['contonome'], material['brancanome'], material['sottocontonome']
-                        ))
-                        stats['inserted'] += 1
+                        existing = cursor.execute(existing_query, (
+                            material['codicearticolo'],
+                            material['fornitoreid']
+                        )).fetchone()
+                    
+                        if existing:
+                            # Aggiorna materiale esistente
+                            update_query = """
+                                UPDATE materiali SET
+                                    nome = ?, fornitorenome = ?, costo_unitario = ?,
+                                    confidence = ?, confermato = ?, occorrenze = ?,
+                                    categoria_contabile = ?, contoid = ?, brancaid = ?, sottocontoid = ?,
+                                    contonome = ?, brancanome = ?, sottocontonome = ?
+                                WHERE id = ?
+                            """
+                            cursor.execute(update_query, (
+                                material['nome'], material['fornitorenome'], material['costo_unitario'],
+                                material['confidence'], material['confermato'], material['occorrenze'],
+                                material['categoria_contabile'], material['contoid'], 
+                                material['brancaid'], material['sottocontoid'],
+                                material['contonome'], material['brancanome'], material['sottocontonome'],
+                                existing[0]
+                            ))
+                            stats['updated'] += 1
+                        else:
+                            # Inserisci nuovo materiale usando la struttura esistente
+                            insert_query = """
+                                INSERT INTO materiali (
+                                    codicearticolo, nome, fornitoreid, fornitorenome, costo_unitario,
+                                    confidence, confermato, occorrenze, categoria_contabile,
+                                    contoid, brancaid, sottocontoid, contonome, brancanome, sottocontonome
+                                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """
+                            cursor.execute(insert_query, (
+                                material['codicearticolo'], material['nome'],
+                                material['fornitoreid'], material['fornitorenome'], material['costo_unitario'],
+                                material['confidence'], material['confermato'], material['occorrenze'],
+                                material['categoria_contabile'], material['contoid'], 
+                                material['brancaid'], material['sottocontoid'],
+                                material['contonome'], material['brancanome'], material['sottocontonome']
+                            ))
+                            stats['inserted'] += 1
                         
-                except Exception as e:
-                    stats['errors'] += 1
-                    error_msg = f"Error processing material {material.get('nome', 'Unknown')}: {str(e)}"
-                    stats['errors_list'].append(error_msg)
-                    logger.error(error_msg)
-                    continue
-            
-            conn.commit()
-            conn.close()
+                    except Exception as e:
+                        stats['errors'] += 1
+                        error_msg = f"Error processing material {material.get('nome', 'Unknown')}: {str(e)}"
+                        stats['errors_list'].append(error_msg)
+                        logger.error(error_msg)
+                        continue
             
             logger.info(f"Migration completed: {stats['inserted']} inserted, {stats['updated']} updated, {stats['errors']} errors")
             return stats
@@ -743,7 +696,7 @@ class MaterialiMigrationService(BaseService):
             materials_data = self.read_spesafo_data()
             
             # Step 2: Filtra materiali dentali
-            dental_materials = self.filter_dental_materials(materials_data)
+            dental_materials = self.filter_materials_by_classification(materials_data)
             
             # Step 3: Migra nel database
             migration_stats = self.migrate_materials_to_db(dental_materials)
@@ -791,33 +744,31 @@ class MaterialiMigrationService(BaseService):
     def _get_existing_material_classification(self, nome: str, fornitore_id: str, fattura_id: str = None) -> dict:
         """Recupera la classificazione di un materiale già esistente nella tabella materiali."""
         try:
-            import sqlite3
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            cursor = conn.cursor()
-            
-            # Cerca il materiale esistente con la sua classificazione
-            if fattura_id:
-                cursor.execute("""
-                    SELECT 
-                        contoid, brancaid, sottocontoid,
-                        contonome, brancanome, sottocontonome
-                    FROM materiali 
-                    WHERE nome = ? AND fornitoreid = ? AND fattura_id = ?
-                    AND contoid IS NOT NULL AND contonome IS NOT NULL
-                """, (nome, fornitore_id, fattura_id))
-            else:
-                cursor.execute("""
-                    SELECT 
-                        contoid, brancaid, sottocontoid,
-                        contonome, brancanome, sottocontonome
-                    FROM materiali 
-                    WHERE nome = ? AND fornitoreid = ?
-                    AND contoid IS NOT NULL AND contonome IS NOT NULL
-                    ORDER BY id DESC LIMIT 1
-                """, (nome, fornitore_id))
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='materiali_migration_service', row_factory=None) as conn:
+                cursor = conn.cursor()
             
-            result = cursor.fetchone()
-            conn.close()
+                # Cerca il materiale esistente con la sua classificazione
+                if fattura_id:
+                    cursor.execute("""
+                        SELECT 
+                            contoid, brancaid, sottocontoid,
+                            contonome, brancanome, sottocontonome
+                        FROM materiali 
+                        WHERE nome = ? AND fornitoreid = ? AND fattura_id = ?
+                        AND contoid IS NOT NULL AND contonome IS NOT NULL
+                    """, (nome, fornitore_id, fattura_id))
+                else:
+                    cursor.execute("""
+                        SELECT 
+                            contoid, brancaid, sottocontoid,
+                            contonome, brancanome, sottocontonome
+                        FROM materiali 
+                        WHERE nome = ? AND fornitoreid = ?
+                        AND contoid IS NOT NULL AND contonome IS NOT NULL
+                        ORDER BY id DESC LIMIT 1
+                    """, (nome, fornitore_id))
+            
+                result = cursor.fetchone()
             
             if result:
                 return {
@@ -837,26 +788,24 @@ class MaterialiMigrationService(BaseService):
     def _get_classification_data(self, fornitore_id: str) -> dict:
         """Recupera i dati di classificazione per un fornitore dalla tabella classificazioni_costi."""
         try:
-            import sqlite3
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            cursor = conn.cursor()
-            
-            # Cerca per fornitore_id (codice_riferimento) con JOIN per recuperare i nomi
-            cursor.execute("""
-                SELECT 
-                    cc.contoid, cc.brancaid, cc.sottocontoid,
-                    c.nome as contonome,
-                    b.nome as brancanome,
-                    s.nome as sottocontonome
-                FROM classificazioni_costi cc
-                LEFT JOIN conti c ON cc.contoid = c.id
-                LEFT JOIN branche b ON cc.brancaid = b.id
-                LEFT JOIN sottoconti s ON cc.sottocontoid = s.id
-                WHERE cc.codice_riferimento = ? AND cc.tipo_entita = 'fornitore'
-            """, (fornitore_id,))
-            
-            result = cursor.fetchone()
-            conn.close()
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='materiali_migration_service', row_factory=None) as conn:
+                cursor = conn.cursor()
+            
+                # Cerca per fornitore_id (codice_riferimento) con JOIN per recuperare i nomi
+                cursor.execute("""
+                    SELECT 
+                        cc.contoid, cc.brancaid, cc.sottocontoid,
+                        c.nome as contonome,
+                        b.nome as brancanome,
+                        s.nome as sottocontonome
+                    FROM classificazioni_costi cc
+                    LEFT JOIN conti c ON cc.contoid = c.id
+                    LEFT JOIN branche b ON cc.brancaid = b.id
+                    LEFT JOIN sottoconti s ON cc.sottocontoid = s.id
+                    WHERE cc.codice_riferimento = ? AND cc.tipo_entita = 'fornitore'
+                """, (fornitore_id,))
+            
+                result = cursor.fetchone()
             
             if result:
                 return {
@@ -881,40 +830,38 @@ class MaterialiMigrationService(BaseService):
             Lista di pattern con classificazione
         """
         try:
-            import sqlite3
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            cursor = conn.cursor()
-            
-            # Carica materiali già classificati con i loro nomi e classificazioni
-            cursor.execute("""
-                SELECT 
-                    m.nome,
-                    m.fornitoreid,
-                    m.contoid, m.brancaid, m.sottocontoid,
-                    m.contonome,
-                    m.brancanome,
-                    m.sottocontonome
-                FROM materiali m
-                WHERE m.nome IS NOT NULL AND m.nome != ''
-                AND m.contonome IS NOT NULL AND m.contonome != ''
-            """)
-            
-            patterns = []
-            for row in cursor.fetchall():
-                patterns.append({
-                    'nome': row[0],
-                    'fornitoreid': row[1],
-                    'classification': {
-                        'contoid': row[2],
-                        'brancaid': row[3],
-                        'sottocontoid': row[4],
-                        'contonome': row[5] or '',
-                        'brancanome': row[6] or '',
-                        'sottocontonome': row[7] or ''
-                    }
-                })
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='materiali_migration_service', row_factory=None) as conn:
+                cursor = conn.cursor()
+            
+                # Carica materiali già classificati con i loro nomi e classificazioni
+                cursor.execute("""
+                    SELECT 
+                        m.nome,
+                        m.fornitoreid,
+                        m.contoid, m.brancaid, m.sottocontoid,
+                        m.contonome,
+                        m.brancanome,
+                        m.sottocontonome
+                    FROM materiali m
+                    WHERE m.nome IS NOT NULL AND m.nome != ''
+                    AND m.contonome IS NOT NULL AND m.contonome != ''
+                """)
+            
+                patterns = []
+                for row in cursor.fetchall():
+                    patterns.append({
+                        'nome': row[0],
+                        'fornitoreid': row[1],
+                        'classification': {
+                            'contoid': row[2],
+                            'brancaid': row[3],
+                            'sottocontoid': row[4],
+                            'contonome': row[5] or '',
+                            'brancanome': row[6] or '',
+                            'sottocontonome': row[7] or ''
+                        }
+                    })
             
-            conn.close()
             logger.info(f"Caricati {len(patterns)} pattern esistenti")
             return patterns
             
@@ -922,6 +869,10 @@ class MaterialiMigrationService(BaseService):
             logger.error(f"Errore nel caricamento pattern esistenti: {e}")
             return []
     
+    def _build_pattern_index(self, existing_patterns: List[Dict[str, Any]]) -> MaterialPatternIndex:
+        """Indicizza i pattern esistenti (nomi puliti, token, trigrammi) per il matching."""
+        return MaterialPatternIndex(existing_patterns, self._calculate_similarity)
+    
     def _find_pattern_match(self, descrizione: str, existing_patterns: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Trova un pattern match per la descrizione del materiale.
@@ -935,87 +886,7 @@ class MaterialiMigrationService(BaseService):
         """
         if not existing_patterns:
             return None
-        
-        descrizione_clean = self._clean_material_name(descrizione)
-        desc_lower = descrizione_clean.lower()
-        
-        # Regole specifiche per RECIPROC
-        if 'reciproc' in desc_lower:
-            if any(word in desc_lower for word in ['carta', 'paper', 'points']):
-                # Cerca pattern RECIPROC + carta/paper
-                for pattern in existing_patterns:
-                    pattern_clean = self._clean_material_name(pattern['nome']).lower()
-                    if 'reciproc' in pattern_clean and any(word in pattern_clean for word in ['carta', 'paper', 'points']):
-                        return {
-                            'classification': pattern['classification'],
-                            'confidence': 95,
-                            'matched_pattern': pattern['nome']
-                        }
-            
-            elif 'gutta' in desc_lower:
-                # Cerca pattern RECIPROC + gutta
-                for pattern in existing_patterns:
-                    pattern_clean = self._clean_material_name(pattern['nome']).lower()
-                    if 'reciproc' in pattern_clean and 'gutta' in pattern_clean:
-                        return {
-                            'classification': pattern['classification'],
-                            'confidence': 95,
-                            'matched_pattern': pattern['nome']
-                        }
-            
-            elif 'files' in desc_lower:
-                # Cerca pattern RECIPROC + files
-                for pattern in existing_patterns:
-                    pattern_clean = self._clean_material_name(pattern['nome']).lower()
-                    if 'reciproc' in pattern_clean and 'files' in pattern_clean:
-                        return {
-                            'classification': pattern['classification'],
-                            'confidence': 95,
-                            'matched_pattern': pattern['nome']
-                        }
-        
-        # Regola per FILES senza RECIPROC = ENDODONZIA-STRUMENTI MANUALI
-        elif 'files' in desc_lower and 'reciproc' not in desc_lower:
-            # Cerca pattern FILES senza RECIPROC
-            for pattern in existing_patterns:
-                pattern_clean = self._clean_material_name(pattern['nome']).lower()
-                if 'files' in pattern_clean and 'reciproc' not in pattern_clean:
-                    return {
-                        'classification': pattern['classification'],
-                        'confidence': 95,
-                        'matched_pattern': pattern['nome']
-                    }
-            
-            # Se non trova pattern, usa classificazione hardcoded
-            # Cerca un pattern di ENDODONZIA-STRUMENTI MANUALI come riferimento
-            for pattern in existing_patterns:
-                if (pattern['classification']['brancanome'] == 'ENDODONZIA' and 
-                    pattern['classification']['sottocontonome'] == 'STRUMENTI MANUALI'):
-                    return {
-                        'classification': pattern['classification'],
-                        'confidence': 90,
-                        'matched_pattern': f"Regola hardcoded: FILES senza RECIPROC"
-                    }
-        
-        # Algoritmo generale per altri materiali
-        best_match = None
-        best_score = 0
-        
-        for pattern in existing_patterns:
-            pattern_name_clean = self._clean_material_name(pattern['nome'])
-            
-            # Calcola similarità
-            similarity = self._calculate_similarity(descrizione_clean, pattern_name_clean)
-            
-            if similarity > best_score and similarity >= 0.5:
-                best_score = similarity
-                best_match = {
-                    'classification': pattern['classification'],
-                    'confidence': int(similarity * 100),
-                    'matched_pattern': pattern['nome']
-                }
-        
-        return best_match
+        return self._build_pattern_index(existing_patterns).match(descrizione)
     
     def _clean_material_name(self, name: str) -> str:
         """
@@ -1027,34 +898,7 @@ class MaterialiMigrationService(BaseService):
         Returns:
             Nome pulito per il matching
         """
-        if not name:
-            return ""
-        
-        # Converti in lowercase e rimuovi spazi extra
-        cleaned = str(name).lower().strip()
-        
-        # Rimuovi caratteri speciali comuni
-        import re
-        cleaned = re.sub(r'[^\w\s]', ' ', cleaned)
-        
-        # Rimuovi pattern comuni che non influenzano la classificazione
-        # Misure e dimensioni
-        cleaned = re.sub(r'\b\d+[x×]\d+\b', '', cleaned)  # 6X, 3X, etc.
-        cleaned = re.sub(r'\b[a-z]\d+\b', '', cleaned)    # A3, C14, etc.
-        cleaned = re.sub(r'\b\d+st\b', '', cleaned)       # 4ST, 6ST, etc.
-        cleaned = re.sub(r'\b\d+%\b', '', cleaned)        # Percentuali
-        cleaned = re.sub(r'\b\d+ml\b', '', cleaned)       # 10ml, 5ml, etc.
-        cleaned = re.sub(r'\b\d+cc\b', '', cleaned)       # 10cc, 5cc, etc.
-        cleaned = re.sub(r'\b\d+gr\b', '', cleaned)       # 10gr, 5gr, etc.
-        cleaned = re.sub(r'\b\d+mg\b', '', cleaned)       # 10mg, 5mg, etc.
-        
-        # Rimuovi suffissi comuni
-        cleaned = re.sub(r'\b(lt|refill|sterile|steril|r\d+|6x|sterile)\b', '', cleaned)
-        
-        # Rimuovi spazi multipli
-        cleaned = re.sub(r'\s+', ' ', cleaned)
-        
-        return cleaned.strip()
+        return clean_material_name(name)
     
     def _calculate_similarity(self, name1: str, name2: str) -> float:
         """
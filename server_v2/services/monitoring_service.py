@@ -28,6 +28,13 @@ from services.snapshot_manager import get_snapshot_manager
 from services.file_watcher import get_file_watcher
 from services.automation_service import AutomationService
 from services.dbf_data_service import get_dbf_data_service
+from services.dbf_mirror import get_dbf_mirror
+from services.patient_index import refresh_patient_indexes
+from services.recall_index import refresh_recall_indexes
+from services.occupancy_index import refresh_occupancy_indexes
+from services.appointment_day_index import refresh_appointment_day_indexes
+from services.appointment_rollup import refresh_appointment_rollups
+from services.spese_index import refresh_spese_indexes
 from utils.dbf_utils import get_optimized_reader
 from core.constants_v2 import DBF_TABLES
 
@@ -86,6 +93,8 @@ class MonitoringService:
         
         self.lock = threading.RLock()
         self.active_monitors: Dict[str, MonitorInstance] = {}
+        # Un lock per tabella: le modifiche a tabelle diverse si elaborano in parallelo
+        self._table_locks: Dict[str, threading.Lock] = {}
         
         print("DEBUG: Initializing AutomationService...")
         self.automation_service = AutomationService()
@@ -244,15 +253,41 @@ class MonitoringService:
                 logger.error(f"Errore fermata monitor {monitor_id}: {e}")
                 return False
 
-    def handle_file_change(self, table_name: str):
+    def _refresh_dbf_indexes(self, table_name: str, logical_table_name: str) -> None:
+        """Invalida il DBF mirror e aggiorna gli indici derivati della tabella cambiata."""
+        try:
+            get_dbf_mirror().invalidate(table_name)
+            if logical_table_name == 'pazienti':
+                refresh_patient_indexes()
+                refresh_recall_indexes()
+            elif logical_table_name in ('preventivi', 'elenco'):
+                refresh_recall_indexes()
+            elif logical_table_name == 'APPUNTA':
+                refresh_occupancy_indexes()
+                refresh_appointment_day_indexes()
+                refresh_appointment_rollups()
+            elif logical_table_name in ('spese', 'fornitori'):
+                refresh_spese_indexes()
+        except Exception as e:
+            logger.warning(f"Aggiornamento indici DBF per {table_name} fallito: {e}")
+
+    def _table_lock(self, logical_table_name: str) -> threading.Lock:
         with self.lock:
+            return self._table_locks.setdefault(logical_table_name, threading.Lock())
+
+    def handle_file_change(self, table_name: str):
+        physical_table_base_name = table_name.lower()
+        logical_table_name = self._dbf_filename_to_logical_name.get(physical_table_base_name, physical_table_base_name)
+
+        with self._table_lock(logical_table_name):
             # logger.debug(f"MODIFICA RILEVATA: File {table_name}.DBF. Avvio processo.")
             self.logs.append({'timestamp': datetime.now().isoformat(), 'message': f"Rilevata variazione file {table_name}.DBF", 'type': 'info'})
-            
-            physical_table_base_name = table_name.lower()
-            logical_table_name = self._dbf_filename_to_logical_name.get(physical_table_base_name, physical_table_base_name)
-            
-            active_monitors_for_table = [inst for inst in self.active_monitors.values() if inst.config.table_name == logical_table_name and inst.status == MonitorStatus.RUNNING]
+
+            # Mirror e indici vanno riallineati anche senza monitor attivi sulla tabella
+            self._refresh_dbf_indexes(table_name, logical_table_name)
+
+            with self.lock:
+                active_monitors_for_table = [inst for inst in self.active_monitors.values() if inst.config.table_name == logical_table_name and inst.status == MonitorStatus.RUNNING]
 
             if not active_monitors_for_table:
                 logger.warning(f"Nessun monitor attivo per la tabella {logical_table_name}.")
@@ -266,24 +301,28 @@ class MonitoringService:
 
             # logger.debug(f"Processando {len(changes)} modifiche per la tabella {logical_table_name}.")
 
-            for change_obj in changes:
-                record_data = change_obj.get('new_data')
-                if not record_data:
-                    continue
+            # Arricchimento (se definito): un solo batch per monitor sull'intero change set,
+            # su copie dei record, cosi' ogni trigger vede solo i campi del proprio monitor
+            live_changes = [c for c in changes if c.get('new_data')]
+            changes_by_monitor = {}
+            for instance in active_monitors_for_table:
+                if live_changes and instance.config.metadata and instance.config.metadata.get('enrichment'):
+                    own = [{**c, 'new_data': dict(c['new_data'])} for c in live_changes]
+                    self.dbf_data_service.enrich_records([c['new_data'] for c in own], instance.config.metadata['enrichment'])
+                    changes_by_monitor[id(instance)] = own
 
+            for position, change_obj in enumerate(live_changes):
                 for instance in active_monitors_for_table:
-                    # Arricchimento (se definito)
-                    if instance.config.metadata and instance.config.metadata.get('enrichment'):
-                        self.dbf_data_service.enrich_record(record_data, instance.config.metadata['enrichment'])
-
                     # Logica Trigger
-                    self._process_trigger_for_change(change_obj, instance)
+                    own = changes_by_monitor.get(id(instance))
+                    self._process_trigger_for_change(own[position] if own else change_obj, instance)
 
             self.snapshot_manager.update_snapshot(logical_table_name)
             current_time = datetime.now().isoformat()
-            for instance in active_monitors_for_table:
-                instance.change_count += len(changes)
-                instance.last_change = current_time
+            with self.lock:
+                for instance in active_monitors_for_table:
+                    instance.change_count += len(changes)
+                    instance.last_change = current_time
 
     def _process_trigger_for_change(self, change_obj: Dict[str, Any], monitor_instance: MonitorInstance):
         logical_table_name = monitor_instance.config.table_name
@@ -0,0 +1,218 @@
+"""
+🗓️ Occupancy Index per StudioDimaAI Server V2
+=============================================
+
+Indice di occupazione delle agende costruito da APPUNTA.DBF:
+
+- Per ogni (operatore, giorno) la lista ordinata degli intervalli occupati
+  (minuti dalla mezzanotte) e il flag di assenza ("lara no" e simili)
+- Costruzione in un solo passaggio vettoriale sulle colonne del DBF mirror
+- Aggiornamento incrementale: si confrontano gli hash per record del mirror e
+  si spostano tra i bucket solo le righe aggiunte o modificate
+
+La ricerca slot (slot_finder_service) diventa aritmetica sugli intervalli in
+memoria invece di una scansione di APPUNTA per ogni giorno dell'orizzonte.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.config_manager import get_config
+from core.constants_v2 import COLONNE
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+
+logger = logging.getLogger(__name__)
+
+# Stringa di assenza specifica per operatore: un appuntamento finto con questo
+# testo in note/descrizione blocca l'intera giornata (es. Lara a settimane alterne)
+MARKER_ASSENZA: Dict[int, str] = {2: 'lara no'}
+
+BucketKey = Tuple[int, date]
+
+
+def dbf_times_to_minutes(times: np.ndarray) -> np.ndarray:
+    """
+    Versione vettoriale di slot_finder_service._dbf_time_to_minutes:
+    9.5 = 9:50 (parte decimale * 10 = minuti), valori vuoti = 0.
+    """
+    times = np.nan_to_num(np.asarray(times, dtype=np.float64))
+    ore = np.trunc(times)
+    return (ore * 60 + np.round((times - ore) * 10) * 10).astype(np.int64)
+
+
+class OccupancyIndex:
+    """
+    Occupazione per (operatore, giorno) di un file APPUNTA.DBF.
+
+    Come la lettura per giorno che sostituisce, considera tutti i record del
+    file (anche quelli marcati come cancellati).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._table: Optional[MirrorTable] = None
+        self._hashes = np.zeros(0, dtype=np.uint64)
+
+        # Stato per riga: bucket, intervallo occupato (None se vuoto) e marker di assenza
+        self._row_keys: List[Optional[BucketKey]] = []
+        self._row_intervals: List[Optional[Tuple[int, int]]] = []
+        self._row_blocked: List[bool] = []
+
+        self._buckets: Dict[BucketKey, Set[int]] = defaultdict(set)
+        self._cache: Dict[BucketKey, Tuple[List[Tuple[int, int]], bool]] = {}
+        self._stats = {'full_builds': 0, 'incremental_updates': 0, 'rows_indexed': 0, 'lookups': 0}
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def occupati(self, operatore_id: int, giorno: date) -> Tuple[List[Tuple[int, int]], bool]:
+        """
+        Restituisce (occupati, giorno_bloccato) per l'operatore nel giorno:
+        intervalli (inizio_min, fine_min) ordinati e flag di assenza.
+        """
+        key = (int(operatore_id), giorno)
+        with self._lock:
+            self._ensure_current()
+            self._stats['lookups'] += 1
+            cached = self._cache.get(key)
+            if cached is None:
+                rows = self._buckets.get(key, ())
+                blocked = any(self._row_blocked[r] for r in rows)
+                intervals = sorted(self._row_intervals[r] for r in rows if self._row_intervals[r] is not None)
+                cached = self._cache[key] = (intervals, blocked)
+            return list(cached[0]), cached[1]
+
+    def refresh(self) -> None:
+        """Riallinea subito l'indice al file (es. su evento del file watcher)."""
+        get_dbf_mirror().invalidate(self.path)
+        with self._lock:
+            self._ensure_current()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato dell'indice per monitoring."""
+        with self._lock:
+            return {
+                'path': self.path,
+                'rows': len(self._row_keys),
+                'buckets': len(self._buckets),
+                'generation': self._table.generation if self._table is not None else None,
+                'stats': dict(self._stats),
+            }
+
+    # ------------------------------------------------------------------
+    # Sincronizzazione con il mirror
+    # ------------------------------------------------------------------
+
+    def _ensure_current(self) -> MirrorTable:
+        table = get_dbf_mirror().table_at(self.path)
+        if table is self._table:
+            return table
+
+        start = time.time()
+        old_count, new_count = len(self._row_keys), len(table)
+        if self._table is None or new_count < old_count:
+            self._row_keys, self._row_intervals, self._row_blocked = [], [], []
+            self._buckets.clear()
+            self._cache.clear()
+            rows = np.arange(new_count, dtype=np.int64)
+            self._stats['full_builds'] += 1
+        else:
+            changed = np.flatnonzero(self._hashes[:old_count] != table.hashes[:old_count])
+            rows = np.concatenate([changed, np.arange(old_count, new_count)]).astype(np.int64)
+            if rows.size:
+                self._stats['incremental_updates'] += 1
+
+        if rows.size:
+            self._index_rows(table, rows)
+            logger.debug(f"Occupancy index {table.name}: {rows.size}/{new_count} righe "
+                         f"indicizzate in {(time.time() - start) * 1000:.1f}ms")
+        self._hashes = table.hashes.copy()
+        self._table = table
+        return table
+
+    def _index_rows(self, table: MirrorTable, rows: np.ndarray) -> None:
+        col = COLONNE['appuntamenti']
+        days = table.column(col['data'])[rows].astype('datetime64[D]')
+        operatori = table.numbers(col['medico'])[rows].astype(np.int64)
+        inizi = dbf_times_to_minutes(table.numbers(col['ora_inizio'])[rows])
+        fini = dbf_times_to_minutes(table.numbers(col['ora_fine'])[rows])
+
+        # Il testo di note/descrizione si decodifica solo per gli operatori con marker
+        blocked = np.zeros(rows.size, dtype=bool)
+        for operatore_id, marker in MARKER_ASSENZA.items():
+            positions = np.flatnonzero(operatori == operatore_id)
+            if not positions.size:
+                continue
+            note, descrizioni = (
+                table.values(col[key], rows[positions]) if table.has_field(col[key]) else [''] * positions.size
+                for key in ('note', 'descrizione')
+            )
+            blocked[positions] = [
+                marker in (n or '').lower() or marker in (d or '').lower()
+                for n, d in zip(note, descrizioni)
+            ]
+
+        if len(self._row_keys) < len(table):
+            missing = len(table) - len(self._row_keys)
+            self._row_keys.extend([None] * missing)
+            self._row_intervals.extend([None] * missing)
+            self._row_blocked.extend([False] * missing)
+
+        keys = [
+            (operatore_id, giorno) if giorno is not None else None
+            for operatore_id, giorno in zip(operatori.tolist(), days.astype(object).tolist())
+        ]
+        intervals = [(i, f) if f > i else None for i, f in zip(inizi.tolist(), fini.tolist())]
+        for row, key, interval, is_blocked in zip(rows.tolist(), keys, intervals, blocked.tolist()):
+            self._move(row, key)
+            self._row_intervals[row] = interval
+            self._row_blocked[row] = is_blocked
+        self._stats['rows_indexed'] += len(rows)
+
+    def _move(self, row: int, key: Optional[BucketKey]) -> None:
+        old = self._row_keys[row]
+        if old is not None:
+            self._cache.pop(old, None)
+            bucket = self._buckets.get(old)
+            if bucket is not None:
+                bucket.discard(row)
+                if not bucket:
+                    del self._buckets[old]
+        self._row_keys[row] = key
+        if key is not None:
+            self._buckets[key].add(row)
+            self._cache.pop(key, None)
+
+
+# Registry per percorso
+_occupancy_indexes: Dict[str, OccupancyIndex] = {}
+_occupancy_indexes_lock = threading.Lock()
+
+def get_occupancy_index(path: Optional[str] = None) -> OccupancyIndex:
+    """Get the shared occupancy index for `path` (default: APPUNTA.DBF from config)."""
+    path = path or get_config().get_dbf_path('APPUNTA')
+    key = os.path.normcase(os.path.abspath(path))
+    with _occupancy_indexes_lock:
+        if key not in _occupancy_indexes:
+            _occupancy_indexes[key] = OccupancyIndex(path)
+        return _occupancy_indexes[key]
+
+
+def refresh_occupancy_indexes() -> None:
+    """Riallinea tutti gli indici di occupazione istanziati (chiamato dal file watcher)."""
+    with _occupancy_indexes_lock:
+        indexes = list(_occupancy_indexes.values())
+    for index in indexes:
+        try:
+            index.refresh()
+        except Exception as e:
+            logger.warning(f"Refresh occupancy index {index.path} fallito: {e}")
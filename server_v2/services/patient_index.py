@@ -0,0 +1,469 @@
+"""
+🔎 Patient Index per StudioDimaAI Server V2
+==========================================
+
+Indice in memoria dell'anagrafica pazienti (PAZIENTI.DBF) per lookup puntuali:
+
+- Hash index su DB_CODE, nome normalizzato, telefono normalizzato e codice fiscale
+- Indice a trigrammi per la ricerca per sottostringa (nome/CF e telefono/cellulare)
+- Indice a trigrammi "padded" sul nome normalizzato per la ricerca fuzzy
+- Persistenza su SQLite (sidecar): al riavvio si ricaricano le chiavi gia'
+  normalizzate e si riallineano solo i record con hash cambiato
+- Sincronizzazione incrementale con il DBF mirror: ad ogni lookup si confrontano
+  gli hash per record del mirror e si reindicizzano solo le righe cambiate
+
+I servizi (DbfDataService, PazientiService) usano l'indice per trovare le righe
+e il mirror per materializzare i record.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from bisect import insort
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.config_manager import get_config
+from core.constants_v2 import COLONNE
+from core.database_manager import db_connection
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+
+logger = logging.getLogger(__name__)
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+# Separatore tra campi nel testo indicizzato: non compare mai in una query
+_FIELD_SEPARATOR = '\x00'
+
+
+# =============================================================================
+# NORMALIZZAZIONE
+# =============================================================================
+
+def normalize_name(value: Any) -> str:
+    """Nome normalizzato: minuscolo, senza accenti e punteggiatura, spazi singoli."""
+    if not value:
+        return ''
+    text = unicodedata.normalize('NFKD', str(value))
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return _NON_ALNUM.sub(' ', text).strip()
+
+
+def normalize_phone(value: Any) -> str:
+    """Numero di telefono normalizzato: solo cifre, senza prefisso internazionale italiano."""
+    digits = ''.join(c for c in str(value or '') if c.isdigit())
+    if digits.startswith('0039'):
+        digits = digits[4:]
+    elif digits.startswith('39') and len(digits) >= 12:
+        digits = digits[2:]
+    return digits
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _name_trigrams(name_norm: str) -> Set[str]:
+    """Trigrammi con padding usati per la similarita' fuzzy (come pg_trgm)."""
+    return _trigrams(f"  {name_norm} ") if name_norm else set()
+
+
+# =============================================================================
+# VOCE INDICIZZATA
+# =============================================================================
+
+class _Entry:
+    """Chiavi normalizzate di una riga di PAZIENTI.DBF."""
+
+    __slots__ = ('id', 'nome', 'nome_norm', 'cf', 'telefono', 'cellulare', 'phones')
+
+    def __init__(self, id: str, nome: str, cf: str, telefono: str, cellulare: str):
+        self.id = id
+        self.nome = nome
+        self.nome_norm = normalize_name(nome)
+        self.cf = cf
+        self.telefono = telefono
+        self.cellulare = cellulare
+        self.phones = tuple(p for p in {normalize_phone(telefono), normalize_phone(cellulare)} if p)
+
+    @property
+    def text(self) -> str:
+        """Testo per la ricerca per sottostringa su nome e codice fiscale."""
+        return f"{self.nome.lower()}{_FIELD_SEPARATOR}{self.cf.lower()}"
+
+    @property
+    def phone_text(self) -> str:
+        """Testo per la ricerca per sottostringa su telefono e cellulare."""
+        return f"{self.telefono}{_FIELD_SEPARATOR}{self.cellulare}"
+
+
+# =============================================================================
+# INDICE
+# =============================================================================
+
+class PatientIndex:
+    """
+    Indice dei pazienti di un file PAZIENTI.DBF.
+
+    Le righe restituite sono indici di riga del DBF (ordine file, record
+    cancellati inclusi come nella lettura con dbf.Table) e vanno
+    materializzate con `table.records(rows)`.
+    """
+
+    def __init__(self, path: str, index_dir: str = "data/patient_index"):
+        self.path = path
+        self.index_dir = Path(index_dir)
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.index_dir / f"{Path(path).stem.upper()}.sqlite"
+
+        col = COLONNE['pazienti']
+        self._fields = {
+            'id': col['id'],
+            'nome': col['nome'],
+            'cf': 'DB_PACODFI',
+            'telefono': col['telefono'],
+            'cellulare': col['cellulare'],
+        }
+
+        self._lock = threading.RLock()
+        self._table: Optional[MirrorTable] = None
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._entries: List[Optional[_Entry]] = []
+        self._by_id: Dict[str, List[int]] = defaultdict(list)
+        self._by_name: Dict[str, List[int]] = defaultdict(list)
+        self._by_phone: Dict[str, List[int]] = defaultdict(list)
+        self._by_cf: Dict[str, List[int]] = defaultdict(list)
+        self._text_grams: Dict[str, Set[int]] = defaultdict(set)
+        self._phone_grams: Dict[str, Set[int]] = defaultdict(set)
+        self._fuzzy_grams: Dict[str, Set[int]] = defaultdict(set)
+
+        self._stats = {'full_builds': 0, 'incremental_updates': 0, 'rows_indexed': 0,
+                       'loaded_from_disk': False, 'lookups': 0}
+        self._loaded = False
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    @property
+    def table(self) -> MirrorTable:
+        """Generazione del mirror su cui e' allineato l'indice."""
+        return self._ensure_current()
+
+    def find_by_id(self, patient_id: Any) -> List[int]:
+        """Righe con DB_CODE uguale a `patient_id` (confronto su valore ripulito)."""
+        return self._lookup(self._by_id, str(patient_id or '').strip())
+
+    def find_by_name(self, nome: Any) -> List[int]:
+        """Righe con nome uguale a `nome` dopo normalizzazione (case/accenti/punteggiatura)."""
+        return self._lookup(self._by_name, normalize_name(nome))
+
+    def find_by_phone(self, telefono: Any) -> List[int]:
+        """Righe con telefono o cellulare uguale a `telefono` dopo normalizzazione."""
+        return self._lookup(self._by_phone, normalize_phone(telefono))
+
+    def find_by_codice_fiscale(self, codice_fiscale: Any) -> List[int]:
+        """Righe con codice fiscale uguale (case-insensitive)."""
+        return self._lookup(self._by_cf, str(codice_fiscale or '').strip().upper())
+
+    def contacts(self, patient_ids: Iterable[Any]) -> Dict[str, Dict[str, str]]:
+        """
+        Nome, cellulare e telefono per più DB_CODE in una volta; per ogni codice
+        vale l'ultima riga non cancellata del file. I codici assenti non compaiono.
+        """
+        with self._lock:
+            table = self._ensure_current()
+            self._stats['lookups'] += 1
+            result = {}
+            for patient_id in patient_ids:
+                key = str(patient_id or '').strip()
+                for row in reversed(self._by_id.get(key, ()) if key else ()):
+                    entry = self._entries[row]
+                    if entry is not None and not table.deleted[row]:
+                        result[key] = {'nome': entry.nome, 'cell': entry.cellulare, 'tel': entry.telefono}
+                        break
+            return result
+
+    def search(self, query: str = '', telefono: str = '', limit: int = 20) -> List[int]:
+        """
+        Ricerca per sottostringa con la stessa semantica della scansione lineare:
+        `telefono` contenuto in telefono/cellulare, altrimenti `query` contenuta
+        (case-insensitive) in nome o codice fiscale. Solo righe con DB_CODE valorizzato,
+        in ordine di file, al massimo `limit`.
+        """
+        telefono = (telefono or '').strip()
+        needle = telefono or (query or '').lower().strip()
+        if not needle or limit <= 0:
+            return []
+
+        with self._lock:
+            self._ensure_current()
+            self._stats['lookups'] += 1
+            grams, attr = (self._phone_grams, 'phone_text') if telefono else (self._text_grams, 'text')
+            if len(needle) >= 3:
+                candidates = self._intersect(grams, _trigrams(needle))
+            else:
+                candidates = range(len(self._entries))
+
+            rows = []
+            for row in sorted(candidates):
+                entry = self._entries[row]
+                if entry is not None and entry.id and needle in getattr(entry, attr):
+                    rows.append(row)
+                    if len(rows) >= limit:
+                        break
+            return rows
+
+    def search_fuzzy(self, nome: str, limit: int = 10, min_score: float = 0.3) -> List[Tuple[int, float]]:
+        """
+        Ricerca fuzzy sul nome: similarita' di Jaccard tra trigrammi (tollera
+        refusi, inversioni di lettere, accenti). Restituisce (riga, score) ordinati per score.
+        """
+        query_grams = _name_trigrams(normalize_name(nome))
+        if not query_grams:
+            return []
+
+        with self._lock:
+            self._ensure_current()
+            self._stats['lookups'] += 1
+            shared: Dict[int, int] = defaultdict(int)
+            for gram in query_grams:
+                for row in self._fuzzy_grams.get(gram, ()):
+                    shared[row] += 1
+
+            scored = []
+            for row, common in shared.items():
+                entry = self._entries[row]
+                if entry is None or not entry.id:
+                    continue
+                total = len(query_grams) + len(_name_trigrams(entry.nome_norm)) - common
+                score = common / total if total else 0.0
+                if score >= min_score:
+                    scored.append((row, round(score, 4)))
+            scored.sort(key=lambda item: (-item[1], item[0]))
+            return scored[:limit]
+
+    def refresh(self) -> None:
+        """Riallinea subito l'indice al file (es. su evento del file watcher)."""
+        get_dbf_mirror().invalidate(self.path)
+        self._ensure_current()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Stato dell'indice per monitoring."""
+        with self._lock:
+            return {
+                'path': self.path,
+                'index_file': str(self.db_path),
+                'rows': len(self._entries),
+                'ids': len(self._by_id),
+                'names': len(self._by_name),
+                'phones': len(self._by_phone),
+                'generation': self._table.generation if self._table is not None else None,
+                'stats': dict(self._stats),
+            }
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def _lookup(self, index: Dict[str, List[int]], key: str) -> List[int]:
+        if not key:
+            return []
+        with self._lock:
+            self._ensure_current()
+            self._stats['lookups'] += 1
+            return list(index.get(key, ()))
+
+    @staticmethod
+    def _intersect(grams: Dict[str, Set[int]], needed: Set[str]) -> Set[int]:
+        postings = sorted((grams.get(g, set()) for g in needed), key=len)
+        if not postings or not postings[0]:
+            return set()
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+    # ------------------------------------------------------------------
+    # Sincronizzazione con il mirror
+    # ------------------------------------------------------------------
+
+    def _ensure_current(self) -> MirrorTable:
+        table = get_dbf_mirror().table_at(self.path)
+        if table is self._table:
+            return table
+
+        with self._lock:
+            if table is self._table:
+                return table
+            if not self._loaded:
+                self._loaded = True
+                self._load_persisted()
+
+            start = time.time()
+            old_count, new_count = len(self._entries), len(table)
+            if not self._entries or new_count < old_count:
+                rows = np.arange(new_count, dtype=np.int64)
+                self._clear()
+                self._stats['full_builds'] += 1
+            else:
+                changed = np.flatnonzero(self._hashes[:old_count] != table.hashes[:old_count])
+                rows = np.concatenate([changed, np.arange(old_count, new_count)]).astype(np.int64)
+                if rows.size:
+                    self._stats['incremental_updates'] += 1
+
+            if rows.size:
+                self._index_rows(table, rows)
+                self._persist(table, rows)
+                logger.debug(f"Patient index {table.name}: {rows.size}/{new_count} righe "
+                             f"indicizzate in {(time.time() - start) * 1000:.1f}ms")
+            self._hashes = table.hashes.copy()
+            self._table = table
+            return table
+
+    def _clear(self) -> None:
+        self._entries = []
+        for index in (self._by_id, self._by_name, self._by_phone, self._by_cf,
+                      self._text_grams, self._phone_grams, self._fuzzy_grams):
+            index.clear()
+
+    def _index_rows(self, table: MirrorTable, rows: np.ndarray) -> None:
+        columns = {
+            key: table.values(name, rows) if table.has_field(name) else [''] * len(rows)
+            for key, name in self._fields.items()
+        }
+        if len(self._entries) < len(table):
+            self._entries.extend([None] * (len(table) - len(self._entries)))
+
+        for pos, row in enumerate(rows.tolist()):
+            values = {key: str(column[pos] or '').strip() for key, column in columns.items()}
+            self._set_entry(row, _Entry(**values))
+        self._stats['rows_indexed'] += len(rows)
+
+    def _set_entry(self, row: int, entry: Optional[_Entry]) -> None:
+        old = self._entries[row]
+        if old is not None:
+            self._unlink(row, old)
+        self._entries[row] = entry
+        if entry is not None:
+            self._link(row, entry)
+
+    def _link(self, row: int, entry: _Entry) -> None:
+        for index, key in self._keys(entry):
+            insort(index[key], row)
+        for gram in _trigrams(entry.text):
+            self._text_grams[gram].add(row)
+        for gram in _trigrams(entry.phone_text):
+            self._phone_grams[gram].add(row)
+        for gram in _name_trigrams(entry.nome_norm):
+            self._fuzzy_grams[gram].add(row)
+
+    def _unlink(self, row: int, entry: _Entry) -> None:
+        for index, key in self._keys(entry):
+            bucket = index.get(key)
+            if bucket is not None and row in bucket:
+                bucket.remove(row)
+                if not bucket:
+                    del index[key]
+        for grams, text in ((self._text_grams, entry.text), (self._phone_grams, entry.phone_text)):
+            for gram in _trigrams(text):
+                grams[gram].discard(row)
+        for gram in _name_trigrams(entry.nome_norm):
+            self._fuzzy_grams[gram].discard(row)
+
+    def _keys(self, entry: _Entry) -> Iterable[Tuple[Dict[str, List[int]], str]]:
+        if entry.id:
+            yield self._by_id, entry.id
+        if entry.nome_norm:
+            yield self._by_name, entry.nome_norm
+        if entry.cf:
+            yield self._by_cf, entry.cf.upper()
+        for phone in entry.phones:
+            yield self._by_phone, phone
+
+    # ------------------------------------------------------------------
+    # Persistenza (SQLite sidecar)
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _connect(self):
+        with db_connection(str(self.db_path), caller='patient_index', row_factory=None) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS patients (
+                    row INTEGER PRIMARY KEY,
+                    record_hash TEXT NOT NULL,
+                    id TEXT, nome TEXT, cf TEXT, telefono TEXT, cellulare TEXT
+                )
+            """)
+            yield conn
+
+    def _persist(self, table: MirrorTable, rows: np.ndarray) -> None:
+        try:
+            data = [
+                (row, format(int(table.hashes[row]), '016x'), e.id, e.nome, e.cf, e.telefono, e.cellulare)
+                for row in rows.tolist()
+                for e in (self._entries[row],) if e is not None
+            ]
+            with self._connect() as conn:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('path', ?)", (os.path.abspath(self.path),))
+                conn.execute("DELETE FROM patients WHERE row >= ?", (len(self._entries),))
+                conn.executemany("INSERT OR REPLACE INTO patients VALUES (?, ?, ?, ?, ?, ?, ?)", data)
+        except Exception as e:
+            logger.warning(f"Salvataggio patient index {self.db_path} fallito: {e}")
+
+    def _load_persisted(self) -> None:
+        if not self.db_path.exists():
+            return
+        try:
+            with self._connect() as conn:
+                meta = dict(conn.execute("SELECT key, value FROM meta").fetchall())
+                if os.path.normcase(meta.get('path', '')) != os.path.normcase(os.path.abspath(self.path)):
+                    return
+                stored = conn.execute(
+                    "SELECT row, record_hash, id, nome, cf, telefono, cellulare FROM patients ORDER BY row"
+                ).fetchall()
+        except Exception as e:
+            logger.warning(f"Patient index {self.db_path} non leggibile, ricostruzione completa: {e}")
+            return
+
+        if not stored or stored[-1][0] != len(stored) - 1:
+            return
+        self._entries = [None] * len(stored)
+        self._hashes = np.array([int(r[1], 16) for r in stored], dtype=np.uint64)
+        for row, _, id, nome, cf, telefono, cellulare in stored:
+            self._set_entry(row, _Entry(id, nome, cf, telefono, cellulare))
+        self._stats['loaded_from_disk'] = True
+        logger.debug(f"Patient index caricato da {self.db_path} ({len(stored)} righe)")
+
+
+# Registry per percorso (i servizi possono risolvere PAZIENTI.DBF in modi diversi)
+_patient_indexes: Dict[str, PatientIndex] = {}
+_patient_indexes_lock = threading.Lock()
+
+def get_patient_index(path: Optional[str] = None) -> PatientIndex:
+    """Get the shared patient index for `path` (default: PAZIENTI.DBF from config)."""
+    path = path or get_config().get_dbf_path('pazienti')
+    key = os.path.normcase(os.path.abspath(path))
+    with _patient_indexes_lock:
+        if key not in _patient_indexes:
+            _patient_indexes[key] = PatientIndex(path)
+        return _patient_indexes[key]
+
+def refresh_patient_indexes() -> None:
+    """Riallinea tutti gli indici pazienti istanziati (chiamato dal file watcher)."""
+    with _patient_indexes_lock:
+        indexes = list(_patient_indexes.values())
+    for index in indexes:
+        try:
+            index.refresh()
+        except Exception as e:
+            logger.warning(f"Refresh patient index {index.path} fallito: {e}")
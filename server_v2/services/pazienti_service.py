@@ -1,18 +1,22 @@
 """Pazienti Service for StudioDimaAI Server V2."""
 
+import base64
 import pandas as pd
 import logging
-from typing import Dict, Any, Optional, List
+import numpy as np
+from typing import Dict, Any, Optional, List, Tuple
 from .base_service import BaseService
-from core.exceptions import DatabaseError
+from core.database_manager import fetch_all
+from core.exceptions import DatabaseError, ValidationError
 
 # DBF reading utilities - use direct DBF libraries 
 import os
 from pathlib import Path
 try:
-    import dbf
     from utils.dbf_utils import clean_dbf_value, safe_get_dbf_field
     from core.config_manager import get_config
+    from services.dbf_mirror import get_dbf_mirror
+    from services.patient_index import get_patient_index
 except ImportError as e:
     logger = logging.getLogger(__name__)
     logger.error(f"Could not import DBF utilities: {e}")
@@ -40,12 +44,38 @@ PAZIENTI_FIELDS = {
     'non_in_cura': 'DB_PANONCU'
 }
 
+# Campi opzionali esposti nella lista paginata (nell'ordine storico della risposta)
+PAZIENTI_LIST_OPTIONAL_FIELDS = (
+    'codice_fiscale', 'data_nascita', 'sesso', 'telefono', 'cellulare', 'email',
+    'indirizzo', 'citta', 'provincia', 'cap', 'note', 'ultima_visita',
+    'tipo_richiamo', 'da_richiamare', 'non_in_cura'
+)
+
+# Chiavi aggiunte o sovrascritte dal merge con la tabella richiami
+PAZIENTI_RICHIAMI_FIELDS = {
+    'is_in_richiami_table', 'tipo_richiamo_gestionale', 'tipo_richiamo', 'tempo_richiamo',
+    'da_richiamare', 'data_richiamo', 'richiamato_il', 'sms_sent', 'ultima_visita'
+}
+
+# Chiavi selezionabili con il parametro `fields` della lista
+PAZIENTI_LIST_FIELDS = {'id', 'nome'} | set(PAZIENTI_LIST_OPTIONAL_FIELDS) | PAZIENTI_RICHIAMI_FIELDS
+
 logger = logging.getLogger(__name__)
 
 class PazientiService(BaseService):
     
-    def get_pazienti_paginated(self, page=1, per_page=50, filters=None) -> Dict[str, Any]:
-        """Get paginated list of pazienti from DBF files."""
+    def get_pazienti_paginated(self, page=1, per_page=50, filters=None,
+                               cursor: Optional[str] = None,
+                               fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Get paginated list of pazienti from DBF files.
+
+        I filtri vengono applicati come maschere sulle colonne del mirror e solo
+        le righe della pagina vengono decodificate e unite ai dati richiami.
+        Con `cursor` (restituito come `next_cursor`) la paginazione e' keyset sulla
+        posizione del record nel DBF, stabile anche se il file cresce tra due pagine.
+        `fields` limita le chiavi restituite per ogni paziente.
+        """
         try:
             # Get DBF file path using config manager
             pazienti_path = self._get_pazienti_dbf_path()
@@ -54,127 +84,25 @@ class PazientiService(BaseService):
                 self.logger.warning(f"Pazienti DBF file not found: {pazienti_path}")
                 raise DatabaseError(f"Pazienti DBF file not found: {pazienti_path}")
             
-            # Read DBF file directly using dbf library
-            pazienti_raw = []
-            with dbf.Table(pazienti_path, codepage='cp1252') as table:
-                for record in table:
-                    try:
-                        # Extract fields using constants mapping - access directly by field name
-                        paziente_id = clean_dbf_value(record[PAZIENTI_FIELDS['id']])
-                        paziente_nome = clean_dbf_value(record[PAZIENTI_FIELDS['nome']])
-                        
-                        if paziente_id and paziente_nome:
-                            # Extract all available fields
-                            paziente_data = {
-                                'id': str(paziente_id).strip(),
-                                'nome': str(paziente_nome).strip()
-                            }
-                            
-                            # Add optional fields if available
-                            try:
-                                if 'codice_fiscale' in PAZIENTI_FIELDS:
-                                    cf = clean_dbf_value(record[PAZIENTI_FIELDS['codice_fiscale']])
-                                    if cf:
-                                        paziente_data['codice_fiscale'] = str(cf).strip()
-                                        
-                                if 'data_nascita' in PAZIENTI_FIELDS:
-                                    data_nascita = clean_dbf_value(record[PAZIENTI_FIELDS['data_nascita']])
-                                    if data_nascita:
-                                        paziente_data['data_nascita'] = self._format_date_field(data_nascita)
-                                        
-                                if 'sesso' in PAZIENTI_FIELDS:
-                                    sesso = clean_dbf_value(record[PAZIENTI_FIELDS['sesso']])
-                                    if sesso:
-                                        paziente_data['sesso'] = str(sesso).strip()
-                                        
-                                if 'telefono' in PAZIENTI_FIELDS:
-                                    telefono = clean_dbf_value(record[PAZIENTI_FIELDS['telefono']])
-                                    if telefono:
-                                        paziente_data['telefono'] = str(telefono).strip()
-                                        
-                                if 'cellulare' in PAZIENTI_FIELDS:
-                                    cellulare = clean_dbf_value(record[PAZIENTI_FIELDS['cellulare']])
-                                    if cellulare:
-                                        paziente_data['cellulare'] = str(cellulare).strip()
-                                        
-                                if 'email' in PAZIENTI_FIELDS:
-                                    email = clean_dbf_value(record[PAZIENTI_FIELDS['email']])
-                                    if email:
-                                        paziente_data['email'] = str(email).strip()
-                                        
-                                if 'indirizzo' in PAZIENTI_FIELDS:
-                                    indirizzo = clean_dbf_value(record[PAZIENTI_FIELDS['indirizzo']])
-                                    if indirizzo:
-                                        paziente_data['indirizzo'] = str(indirizzo).strip()
-                                        
-                                if 'citta' in PAZIENTI_FIELDS:
-                                    citta = clean_dbf_value(record[PAZIENTI_FIELDS['citta']])
-                                    if citta:
-                                        paziente_data['citta'] = str(citta).strip()
-                                        
-                                if 'provincia' in PAZIENTI_FIELDS:
-                                    provincia = clean_dbf_value(record[PAZIENTI_FIELDS['provincia']])
-                                    if provincia:
-                                        paziente_data['provincia'] = str(provincia).strip()
-                                        
-                                if 'cap' in PAZIENTI_FIELDS:
-                                    cap = clean_dbf_value(record[PAZIENTI_FIELDS['cap']])
-                                    if cap:
-                                        paziente_data['cap'] = str(cap).strip()
-                                        
-                                if 'note' in PAZIENTI_FIELDS:
-                                    note = clean_dbf_value(record[PAZIENTI_FIELDS['note']])
-                                    if note:
-                                        paziente_data['note'] = str(note).strip()
-                                        
-                                if 'ultima_visita' in PAZIENTI_FIELDS:
-                                    ultima_visita = clean_dbf_value(record[PAZIENTI_FIELDS['ultima_visita']])
-                                    if ultima_visita:
-                                        paziente_data['ultima_visita'] = self._format_date_field(ultima_visita)
-                                        
-                                if 'mesi_richiamo' in PAZIENTI_FIELDS:
-                                    mesi = clean_dbf_value(record[PAZIENTI_FIELDS['mesi_richiamo']])
-                                    if mesi and str(mesi).isdigit():
-                                        paziente_data['mesi_richiamo'] = int(mesi)
-                                        
-                                if 'tipo_richiamo' in PAZIENTI_FIELDS:
-                                    tipo = clean_dbf_value(record[PAZIENTI_FIELDS['tipo_richiamo']])
-                                    if tipo:
-                                        paziente_data['tipo_richiamo'] = str(tipo).strip()
-                                        
-                                if 'da_richiamare' in PAZIENTI_FIELDS:
-                                    da_richiamare = clean_dbf_value(record[PAZIENTI_FIELDS['da_richiamare']])
-                                    if da_richiamare:
-                                        paziente_data['da_richiamare'] = str(da_richiamare).strip()
-                                        
-                                if 'non_in_cura' in PAZIENTI_FIELDS:
-                                    non_in_cura = clean_dbf_value(record[PAZIENTI_FIELDS['non_in_cura']])
-                                    if non_in_cura:
-                                        paziente_data['non_in_cura'] = bool(non_in_cura)
-                                        
-                            except Exception as field_error:
-                                # Skip optional fields if they cause errors, but keep the record
-                                self.logger.debug(f"Error extracting optional fields for paziente {paziente_id}: {field_error}")
-                            
-                            pazienti_raw.append(paziente_data)
-                            
-                    except Exception as record_error:
-                        # Skip problematic records but continue processing
-                        self.logger.debug(f"Error processing record: {record_error}")
-                        continue
+            # Filter push-down: righe candidate in ordine di file
+            table, rows = self._filter_rows(pazienti_path, filters)
+            total = len(rows)
             
-            # Apply filters
-            if filters:
-                pazienti_raw = self._apply_filters(pazienti_raw, filters)
-            
-            # Merge with richiami table data
-            pazienti_raw = self._merge_with_richiami_data(pazienti_raw)
-            
-            # Calculate pagination
-            total = len(pazienti_raw)
-            start = (page - 1) * per_page
+            # Calculate pagination (keyset se e' presente il cursore)
+            if cursor:
+                start = int(np.searchsorted(rows, self._decode_cursor(cursor), side='right'))
+            else:
+                start = (page - 1) * per_page
             end = start + per_page
-            pazienti_page = pazienti_raw[start:end]
+            page_rows = rows[start:end]
+            
+            # Decodifica e merge richiami solo per la pagina
+            projection = set(fields) | {'id'} if fields else None
+            pazienti_page = self._read_pazienti_from_mirror(table, page_rows, projection)
+            if projection is None or projection & PAZIENTI_RICHIAMI_FIELDS:
+                pazienti_page = self._merge_with_richiami_data(pazienti_page)
+            if projection is not None:
+                pazienti_page = [{k: v for k, v in p.items() if k in projection} for p in pazienti_page]
             
             return {
                 'success': True,
@@ -186,15 +114,133 @@ class PazientiService(BaseService):
                         'total': total,
                         'pages': (total + per_page - 1) // per_page,
                         'has_next': end < total,
-                        'has_prev': page > 1
+                        'has_prev': start > 0,
+                        'next_cursor': self._encode_cursor(int(page_rows[-1])) if end < total and len(page_rows) else None
                     }
                 }
             }
             
+        except ValidationError:
+            raise
         except Exception as e:
             self.logger.error(f"Error getting pazienti: {e}")
             raise DatabaseError(f"Failed to get pazienti: {str(e)}")
 
+    def _filter_rows(self, pazienti_path: str, filters: Optional[Dict]) -> Tuple[Any, np.ndarray]:
+        """
+        Righe del DBF che compaiono nella lista (DB_CODE e nome valorizzati) e
+        soddisfano i filtri, calcolate sulle colonne del mirror.
+        """
+        filters = filters or {}
+        index = get_patient_index(pazienti_path) if filters.get('search') else None
+        table = index.table if index is not None else get_dbf_mirror().table_at(pazienti_path)
+        flags = table.derived('pazienti_list_flags', lambda: self._list_flags(table))
+
+        mask = flags['listed'].copy()
+        if index is not None:
+            # Stessa semantica di ricerca per sottostringa su nome / codice fiscale
+            matches = np.zeros(len(table), dtype=bool)
+            matches[index.search(filters['search'], limit=len(table))] = True
+            mask &= matches
+        if filters.get('da_richiamare') is not None:
+            mask &= flags['da_richiamare']
+        if filters.get('in_cura') is not None and filters['in_cura']:
+            mask &= ~flags['non_in_cura']
+        return table, np.flatnonzero(mask)
+
+    @staticmethod
+    def _list_flags(table) -> Dict[str, np.ndarray]:
+        """Maschere per i filtri della lista, calcolate una volta per generazione del mirror."""
+        def flag(key, test):
+            field = PAZIENTI_FIELDS[key]
+            if not table.has_field(field):
+                return np.zeros(len(table), dtype=bool)
+            return np.fromiter((test(v) for v in table.values(field)), dtype=bool, count=len(table))
+
+        return {
+            'listed': (table.stripped(PAZIENTI_FIELDS['id']) != b'') & (table.stripped(PAZIENTI_FIELDS['nome']) != b''),
+            'da_richiamare': flag('da_richiamare', lambda v: bool(v) and str(v).strip() == 'S'),
+            'non_in_cura': flag('non_in_cura', bool),
+        }
+
+    @staticmethod
+    def _encode_cursor(row: int) -> str:
+        return base64.urlsafe_b64encode(f"r:{row}".encode()).decode().rstrip('=')
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> int:
+        try:
+            text = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            prefix, row = text.split(':', 1)
+            if prefix != 'r' or int(row) < 0:
+                raise ValueError(text)
+            return int(row)
+        except Exception:
+            raise ValidationError("Invalid pagination cursor", field_name='cursor', field_value=cursor)
+
+    def _read_pazienti_from_mirror(self, table, rows: np.ndarray,
+                                   projection: Optional[set] = None) -> List[Dict[str, Any]]:
+        """Costruisce i dict paziente per le righe date leggendo le colonne dal DBF mirror."""
+        ids = table.values(PAZIENTI_FIELDS['id'], rows)
+        nomi = table.values(PAZIENTI_FIELDS['nome'], rows)
+
+        # Con la projection si decodificano solo le colonne richieste (ultima_visita e
+        # tipo_richiamo servono anche al merge con i richiami)
+        wanted = PAZIENTI_LIST_OPTIONAL_FIELDS if projection is None else [
+            key for key in PAZIENTI_LIST_OPTIONAL_FIELDS
+            if key in projection or (key in ('ultima_visita', 'tipo_richiamo') and projection & PAZIENTI_RICHIAMI_FIELDS)
+        ]
+        optional = {
+            key: table.values(PAZIENTI_FIELDS[key], rows)
+            for key in wanted
+            if table.has_field(PAZIENTI_FIELDS[key])
+        }
+
+        pazienti = []
+        for pos in range(len(rows)):
+            paziente_data = {'id': str(ids[pos]).strip(), 'nome': str(nomi[pos]).strip()}
+            for key, values in optional.items():
+                value = values[pos]
+                if not value:
+                    continue
+                if key in ('data_nascita', 'ultima_visita'):
+                    paziente_data[key] = self._format_date_field(value)
+                elif key == 'non_in_cura':
+                    paziente_data[key] = bool(value)
+                else:
+                    paziente_data[key] = str(value).strip()
+            pazienti.append(paziente_data)
+        return pazienti
+
+    def get_richiami_dbf_records(self) -> List[Dict[str, Any]]:
+        """
+        Campi richiamo del gestionale per tutti i pazienti in lista, senza merge
+        con la tabella richiami (input di RichiamiService.bulk_upsert).
+        """
+        table, rows = self._filter_rows(self._get_pazienti_dbf_path(), None)
+        keys = ('id', 'nome', 'ultima_visita', 'tipo_richiamo', 'tempo_richiamo', 'da_richiamare')
+        columns = {
+            key: table.values(PAZIENTI_FIELDS[key], rows) if table.has_field(PAZIENTI_FIELDS[key]) else [None] * len(rows)
+            for key in keys
+        }
+
+        records = []
+        for pos in range(len(rows)):
+            tempo = columns['tempo_richiamo'][pos]
+            try:
+                tempo = int(tempo) if tempo else None
+            except (TypeError, ValueError):
+                tempo = None
+            records.append({
+                'paziente_id': str(columns['id'][pos]).strip(),
+                'nome': str(columns['nome'][pos]).strip(),
+                'data_ultima_visita': self._format_date_field(columns['ultima_visita'][pos]),
+                'tipo_richiamo': str(columns['tipo_richiamo'][pos] or '').strip() or None,
+                'tempo_richiamo': tempo,
+                'da_richiamare': str(columns['da_richiamare'][pos] or '').strip(),
+            })
+        return records
+
     def get_paziente_by_id(self, paziente_id: str) -> Dict[str, Any]:
         """Get single paziente by ID."""
         try:
@@ -203,15 +249,14 @@ class PazientiService(BaseService):
             if not os.path.exists(pazienti_path):
                 raise DatabaseError(f"Pazienti DBF file not found: {pazienti_path}")
             
-            with dbf.Table(pazienti_path, codepage='cp1252') as table:
-                for record in table:
-                    if str(record[PAZIENTI_FIELDS['id']]) == str(paziente_id):
-                        paziente_data = self._extract_paziente_data(record)
-                        if paziente_data:
-                            return {
-                                'success': True,
-                                'data': paziente_data
-                            }
+            index = get_patient_index(pazienti_path)
+            for record in self._records_at(index.table, index.find_by_id(paziente_id)):
+                paziente_data = self._extract_paziente_data(record)
+                if paziente_data:
+                    return {
+                        'success': True,
+                        'data': paziente_data
+                    }
             
             return {
                 'success': False,
@@ -231,31 +276,12 @@ class PazientiService(BaseService):
             if not os.path.exists(pazienti_path):
                 raise DatabaseError(f"Pazienti DBF file not found: {pazienti_path}")
 
-            results = []
-            query_lower = query.lower().strip()
-            telefono_clean = telefono.strip()
-
-            with dbf.Table(pazienti_path, codepage='cp1252') as table:
-                for record in table:
-                    if len(results) >= limit:
-                        break
-
-                    if record[PAZIENTI_FIELDS['id']]:
-                        match = False
-
-                        if telefono_clean:
-                            tel = str(clean_dbf_value(record[PAZIENTI_FIELDS['telefono']]))
-                            cell = str(clean_dbf_value(record[PAZIENTI_FIELDS['cellulare']]))
-                            match = telefono_clean in tel or telefono_clean in cell
-                        elif query_lower:
-                            nome = clean_dbf_value(record[PAZIENTI_FIELDS['nome']])
-                            cf = clean_dbf_value(record[PAZIENTI_FIELDS['codice_fiscale']])
-                            match = query_lower in nome.lower() or query_lower in cf.lower()
-
-                        if match:
-                            paziente = self._extract_paziente_data(record)
-                            if paziente:
-                                results.append(paziente)
+            index = get_patient_index(pazienti_path)
+            rows = index.search(query, telefono=telefono, limit=limit)
+            results = [
+                paziente for paziente in map(self._extract_paziente_data, self._records_at(index.table, rows))
+                if paziente
+            ]
             
             return {
                 'success': True,
@@ -268,6 +294,14 @@ class PazientiService(BaseService):
             self.logger.error(f"Error searching pazienti: {e}")
             raise DatabaseError(f"Failed to search pazienti: {str(e)}")
 
+    def _records_at(self, table, rows: List[int]) -> List[Dict[str, Any]]:
+        """Record del mirror per le righe date, con tutti i campi di PAZIENTI_FIELDS."""
+        fields = [f for f in PAZIENTI_FIELDS.values() if table.has_field(f)]
+        return [
+            {field: record.get(field, '') for field in PAZIENTI_FIELDS.values()}
+            for record in table.records(rows, fields=fields)
+        ] if rows else []
+
     def _extract_paziente_data(self, record) -> Optional[Dict[str, Any]]:
         """Extract paziente data from DBF record."""
         try:
@@ -312,33 +346,6 @@ class PazientiService(BaseService):
         except:
             return str(value) if value else None
 
-    def _apply_filters(self, pazienti: List[Dict], filters: Dict) -> List[Dict]:
-        """Apply filters to pazienti list."""
-        if not filters:
-            return pazienti
-        
-        filtered = pazienti
-        
-        # Filter by search term
-        if filters.get('search'):
-            search_term = filters['search'].lower()
-            filtered = [p for p in filtered 
-                       if (search_term in p.get('nome', '').lower() or
-                           search_term in p.get('codice_fiscale', '').lower())]
-        
-        # Filter by da_richiamare
-        if filters.get('da_richiamare') is not None:
-            filtered = [p for p in filtered 
-                       if p.get('da_richiamare') == 'S']
-        
-        # Filter by non_in_cura
-        if filters.get('in_cura') is not None:
-            in_cura = filters['in_cura']
-            filtered = [p for p in filtered 
-                       if p.get('non_in_cura') != in_cura]
-        
-        return filtered
-
     def _merge_with_richiami_data(self, pazienti: List[Dict]) -> List[Dict]:
         """Merge pazienti data with richiami table data."""
         if not pazienti:
@@ -361,7 +368,6 @@ class PazientiService(BaseService):
             
             richiami_data = {}
             try:
-                import sqlite3
                 db_path = os.path.join(
                     os.path.dirname(os.path.dirname(__file__)), 
                     'instance', 
@@ -369,15 +375,8 @@ class PazientiService(BaseService):
                 )
                 
                 if os.path.exists(db_path):
-                    conn = sqlite3.connect(db_path)
-                    conn.row_factory = sqlite3.Row
-                    cursor = conn.cursor()
-                    cursor.execute(query, paziente_ids)
-                    
-                    for row in cursor.fetchall():
-                        richiami_data[row['paziente_id']] = dict(row)
-                    
-                    conn.close()
+                    for row in fetch_all(query, paziente_ids, db_path=db_path, caller='pazienti_service'):
+                        richiami_data[row['paziente_id']] = row
             except Exception as e:
                 self.logger.warning(f"Could not fetch richiami data: {e}")
             
@@ -411,6 +410,10 @@ class PazientiService(BaseService):
             self.logger.error(f"Error merging richiami data: {e}")
             return pazienti
 
+    def get_pazienti_dbf_path(self) -> str:
+        """Path of the PAZIENTI.DBF file in use (for indexes built on it)."""
+        return self._get_pazienti_dbf_path()
+
     def _get_pazienti_dbf_path(self) -> str:
         """Get path to pazienti DBF file."""
         try:
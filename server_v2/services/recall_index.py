@@ -0,0 +1,455 @@
+"""
+📣 Recall Index per StudioDimaAI Server V2
+=========================================
+
+Tabella materializzata dei richiami dietro /richiami/pazienti-da-richiamare:
+una voce per paziente da richiamare con tipi richiamo, scadenza prevista,
+flag cellulare, sesso e data di nascita.
+
+- Sorgenti: PAZIENTI.DBF (mirror), tabella `richiami` (SQLite, sovrascrive
+  tipo, mesi, stato e ultima visita) e ultima igiene da ELENCO+PREVENT
+  (build_last_igiene_lookup, per i pazienti con tipo '2')
+- Aggiornamento incrementale: si ricalcolano solo le righe PAZIENTI con hash
+  cambiato e i pazienti la cui voce richiami o ultima igiene e' cambiata
+- Partizioni per codice tipo ordinate per scadenza: scaduti, giorni di
+  ritardo ed "entro" diventano range con searchsorted; sesso, eta' e
+  cellulare sono maschere sulle righe del range. I dict vengono costruiti
+  solo per le righe restituite
+"""
+
+import calendar
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from core.config_manager import get_config
+from core.constants_v2 import TIPO_RICHIAMI
+from core.database_manager import db_connection
+from core.shared_cache import file_version
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+from services.slot_finder_service import build_last_igiene_lookup
+
+logger = logging.getLogger(__name__)
+
+RICHIAMI_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'instance', 'studio_dima.db')
+
+# Campi PAZIENTI.DBF letti per la voce richiamo
+_FIELDS = {
+    'id': 'DB_CODE',
+    'nome': 'DB_PANOME',
+    'data_nascita': 'DB_PADANAS',
+    'sesso': 'DB_PASESSO',
+    'telefono': 'DB_PATELEF',
+    'cellulare': 'DB_PACELLU',
+    'ultima_visita': 'DB_PAULTVI',
+    'tipo_richiamo': 'DB_PARIMOT',
+    'da_richiamare': 'DB_PARICHI',
+}
+
+_NO_DUE = np.iinfo(np.int64).max
+_NO_BIRTH = np.iinfo(np.int64).min
+
+
+# =============================================================================
+# DATE
+# =============================================================================
+
+def months_between(d1: date, d2: date) -> int:
+    return (d2.year - d1.year) * 12 + (d2.month - d1.month)
+
+
+def add_months(d: date, months: int) -> date:
+    m = d.month - 1 + months
+    year = d.year + m // 12
+    month = m % 12 + 1
+    day = min(d.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day)
+
+
+def parse_date(value) -> Optional[date]:
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    for fmt in ('%Y-%m-%d', '%d/%m/%Y', '%Y%m%d'):
+        try:
+            return datetime.strptime(str(value), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _iso(value) -> Optional[str]:
+    """Data DBF come nella lista pazienti (PazientiService._format_date_field)."""
+    if not value:
+        return None
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    text = str(value)
+    return f"{text[:4]}-{text[4:6]}-{text[6:8]}" if len(text) >= 8 else text
+
+
+def _text(value) -> str:
+    return str(value).strip() if value else ''
+
+
+# =============================================================================
+# VOCE RICHIAMO
+# =============================================================================
+
+class _Recall:
+    """Voce di un paziente da richiamare (parte indipendente dalla data odierna)."""
+    __slots__ = ('id', 'nome', 'cellulare', 'telefono', 'sesso', 'data_nascita',
+                 'tipo', 'mesi', 'ultima_visita', 'base', 'due')
+
+    def __init__(self, id, nome, cellulare, telefono, sesso, data_nascita, tipo, mesi, ultima_visita, base):
+        self.id = id
+        self.nome = nome
+        self.cellulare = cellulare
+        self.telefono = telefono
+        self.sesso = sesso
+        self.data_nascita = data_nascita
+        self.tipo = tipo
+        self.mesi = mesi
+        self.ultima_visita = ultima_visita
+        self.base = base
+        self.due = add_months(base, mesi) if base and mesi else None
+
+    def to_dict(self, today: date) -> Dict[str, Any]:
+        scaduto = self.due is not None and self.due <= today
+        return {
+            'id':                     self.id,
+            'nome':                   self.nome,
+            'cellulare':              self.cellulare,
+            'telefono':               self.telefono,
+            'sesso':                  self.sesso,
+            'data_nascita':           self.data_nascita,
+            'tipo_richiamo':          self.tipo,
+            'tipo_richiamo_nomi':     [TIPO_RICHIAMI[c] for c in self.tipo if c in TIPO_RICHIAMI],
+            'mesi_richiamo':          self.mesi,
+            'ultima_visita':          self.ultima_visita,
+            'data_richiamo_prevista': self.due.isoformat() if self.due else None,
+            'mesi_dalla_visita':      months_between(self.base, today) if self.due else None,
+            'scaduto':                scaduto,
+            'giorni_ritardo':         (today - self.due).days if scaduto else 0,
+        }
+
+
+class _Partition:
+    """Righe con un codice tipo: con scadenza ordinate per (scadenza, riga), senza scadenza per riga."""
+    __slots__ = ('due_rows', 'due_days', 'undated_rows')
+
+    def __init__(self, rows: np.ndarray, due: np.ndarray):
+        dated = due[rows] != _NO_DUE
+        order = np.lexsort((rows[dated], due[rows[dated]]))
+        self.due_rows = rows[dated][order]
+        self.due_days = due[self.due_rows]
+        self.undated_rows = rows[~dated]
+
+
+_EMPTY_PARTITION = _Partition(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+
+def _igiene_version() -> Tuple:
+    """Generazioni nel mirror di ELENCO e PREVENT, da cui dipende build_last_igiene_lookup."""
+    try:
+        config, mirror = get_config(), get_dbf_mirror()
+        return tuple(mirror.table_at(config.get_dbf_path(name)).generation for name in ('elenco', 'preventivi'))
+    except Exception:
+        return ()
+
+
+# =============================================================================
+# INDICE
+# =============================================================================
+
+class RecallIndex:
+    """Tabella dei richiami di un file PAZIENTI.DBF."""
+
+    def __init__(self, path: str, richiami_db_path: str = RICHIAMI_DB_PATH):
+        self.path = path
+        self.richiami_db_path = richiami_db_path
+
+        self._lock = threading.RLock()
+        self._table: Optional[MirrorTable] = None
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._ids: List[str] = []
+        self._rows_by_id: Dict[str, List[int]] = {}
+        self._entries: List[Optional[_Recall]] = []
+        self._richiami: Dict[str, Tuple] = {}
+        self._richiami_version: Any = None
+        self._igiene: Dict[str, Tuple[date, int]] = {}
+        self._igiene_version: Any = None
+
+        # Colonne per riga (solo pazienti da richiamare; gli altri hanno due=_NO_DUE e active=False)
+        self._active = np.zeros(0, dtype=bool)
+        self._due = np.zeros(0, dtype=np.int64)
+        self._female = np.zeros(0, dtype=bool)
+        self._has_cell = np.zeros(0, dtype=bool)
+        self._birth = np.zeros(0, dtype=np.int64)  # anno * 12 + mese
+        self._partitions: Dict[Optional[str], _Partition] = {}
+
+        self._stats = {'full_builds': 0, 'incremental_updates': 0, 'rows_computed': 0, 'queries': 0}
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def select(self,
+               filtro: str = '',
+               tipo_filtro: Optional[str] = None,
+               eta_max: int = 16,
+               solo_cellulare: bool = True,
+               scaduti_solo: bool = False,
+               ritardo_max_giorni: int = 3650,
+               entro: Optional[date] = None,
+               limit: Optional[int] = None,
+               today: Optional[date] = None) -> List[Dict[str, Any]]:
+        """
+        Pazienti da richiamare con i filtri dell'endpoint pazienti-da-richiamare,
+        dal piu' in ritardo (a parita' di ritardo in ordine di file).
+        """
+        today = today or date.today()
+        with self._lock:
+            self._ensure_current()
+            self._stats['queries'] += 1
+            partition = self._partitions.get(tipo_filtro[0] if tipo_filtro else None, _EMPTY_PARTITION)
+            rows = self._rows_in_range(partition, today, scaduti_solo, ritardo_max_giorni, entro)
+
+            if tipo_filtro and len(tipo_filtro) > 1:
+                rows = rows[[tipo_filtro in self._entries[r].tipo for r in rows.tolist()]]
+            if filtro == 'donne':
+                rows = rows[self._female[rows]]
+            if filtro == 'bambini':
+                birth = self._birth[rows]
+                age = (today.year * 12 + today.month - birth) // 12
+                rows = rows[(birth != _NO_BIRTH) & (age <= eta_max)]
+            if solo_cellulare:
+                rows = rows[self._has_cell[rows]]
+            if limit:
+                rows = rows[:limit]
+            entries = [self._entries[r] for r in rows.tolist()]
+        return [entry.to_dict(today) for entry in entries]
+
+    def refresh(self) -> None:
+        """Riallinea subito l'indice alle sorgenti (es. su evento del file watcher)."""
+        get_dbf_mirror().invalidate(self.path)
+        with self._lock:
+            self._ensure_current()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'path': self.path,
+                'da_richiamare': int(self._active.sum()),
+                'con_scadenza': int((self._due[self._active] != _NO_DUE).sum()),
+                'tipi': sorted(k for k in self._partitions if k is not None),
+                'stats': dict(self._stats),
+            }
+
+    @staticmethod
+    def _rows_in_range(partition: _Partition, today: date, scaduti_solo: bool,
+                       ritardo_max_giorni: int, entro: Optional[date]) -> np.ndarray:
+        """
+        Righe della partizione nei limiti di ritardo/scadenza: prima quelle in
+        ritardo (scadenza crescente), poi le altre con 0 giorni di ritardo
+        (scadute oggi, future, senza scadenza) in ordine di file.
+        """
+        days = partition.due_days
+        today_day = today.toordinal()
+        late_start = int(np.searchsorted(days, today_day - ritardo_max_giorni, side='left'))
+        late_end = int(np.searchsorted(days, today_day, side='left'))
+        due_end = int(np.searchsorted(days, today_day, side='right'))
+        upper = len(days)
+        if entro is not None:
+            upper = int(np.searchsorted(days, entro.toordinal(), side='right'))
+            late_end, due_end = min(late_end, upper), min(due_end, upper)
+        if ritardo_max_giorni < 0:
+            return partition.due_rows[:0]
+
+        late = partition.due_rows[late_start:late_end]
+        if scaduti_solo:
+            rest = partition.due_rows[late_end:due_end]
+        elif entro is not None:
+            rest = partition.due_rows[late_end:max(upper, late_end)]
+        else:
+            rest = np.concatenate([partition.due_rows[late_end:], partition.undated_rows])
+        return np.concatenate([late, np.sort(rest)])
+
+    # ------------------------------------------------------------------
+    # Sincronizzazione con le sorgenti
+    # ------------------------------------------------------------------
+
+    def _ensure_current(self) -> None:
+        table = get_dbf_mirror().table_at(self.path)
+        richiami_version = file_version(self.richiami_db_path, self.richiami_db_path + '-wal')
+        igiene_version = _igiene_version()
+        if (table is self._table and richiami_version == self._richiami_version
+                and igiene_version == self._igiene_version):
+            return
+
+        start = time.time()
+        changed_ids: Set[str] = set()
+        if richiami_version != self._richiami_version:
+            richiami = self._load_richiami()
+            changed_ids |= {k for k in richiami.keys() | self._richiami.keys()
+                            if richiami.get(k) != self._richiami.get(k)}
+            self._richiami, self._richiami_version = richiami, richiami_version
+        if igiene_version != self._igiene_version:
+            igiene = build_last_igiene_lookup()
+            changed_ids |= {k for k in igiene.keys() | self._igiene.keys() if igiene.get(k) != self._igiene.get(k)}
+            self._igiene, self._igiene_version = igiene, igiene_version
+
+        rows = np.zeros(0, dtype=np.int64)
+        if table is not self._table:
+            old_count, new_count = len(self._ids), len(table)
+            if self._table is None or new_count < old_count:
+                rows = np.arange(new_count, dtype=np.int64)
+                self._resize(0)
+                self._stats['full_builds'] += 1
+            else:
+                changed = np.flatnonzero(self._hashes[:old_count] != table.hashes[:old_count])
+                rows = np.concatenate([changed, np.arange(old_count, new_count)]).astype(np.int64)
+            self._resize(new_count)
+            self._update_rows(table, rows, refresh_ids=True)
+            self._hashes = table.hashes.copy()
+            self._table = table
+
+        rows_by_id = np.array(sorted({r for pid in changed_ids for r in self._rows_by_id.get(pid, ())}
+                                     - set(rows.tolist())), dtype=np.int64)
+        self._update_rows(table, rows_by_id, refresh_ids=False)
+
+        total = rows.size + rows_by_id.size
+        if total:
+            self._stats['incremental_updates'] += 1
+            self._build_partitions()
+            logger.debug(f"Recall index {table.name}: {total}/{len(table)} righe ricalcolate "
+                         f"in {(time.time() - start) * 1000:.1f}ms")
+
+    def _resize(self, count: int) -> None:
+        def fit(array: np.ndarray, fill) -> np.ndarray:
+            resized = np.full(count, fill, dtype=array.dtype)
+            keep = min(count, array.size)
+            resized[:keep] = array[:keep]
+            return resized
+
+        self._ids = (self._ids + [''] * count)[:count]
+        self._entries = (self._entries + [None] * count)[:count]
+        self._active = fit(self._active, False)
+        self._due = fit(self._due, _NO_DUE)
+        self._female = fit(self._female, False)
+        self._has_cell = fit(self._has_cell, False)
+        self._birth = fit(self._birth, _NO_BIRTH)
+
+    def _update_rows(self, table: MirrorTable, rows: np.ndarray, refresh_ids: bool) -> None:
+        if not rows.size:
+            return
+        columns = {
+            key: table.values(name, rows) if table.has_field(name) else [None] * len(rows)
+            for key, name in _FIELDS.items()
+        }
+        for pos, row in enumerate(rows.tolist()):
+            entry = self._compute({key: column[pos] for key, column in columns.items()})
+            self._ids[row] = _text(columns['id'][pos]) if _text(columns['nome'][pos]) else ''
+            self._entries[row] = entry
+            self._active[row] = entry is not None
+            self._due[row] = entry.due.toordinal() if entry is not None and entry.due else _NO_DUE
+            self._female[row] = entry is not None and entry.sesso.upper() == 'F'
+            self._has_cell[row] = entry is not None and bool(entry.cellulare)
+            birth = parse_date(columns['data_nascita'][pos]) if entry is not None else None
+            self._birth[row] = birth.year * 12 + birth.month if birth else _NO_BIRTH
+        self._stats['rows_computed'] += int(rows.size)
+
+        if refresh_ids:
+            rows_by_id: Dict[str, List[int]] = defaultdict(list)
+            for row, pid in enumerate(self._ids):
+                if pid:
+                    rows_by_id[pid].append(row)
+            self._rows_by_id = dict(rows_by_id)
+
+    def _compute(self, values: Dict[str, Any]) -> Optional[_Recall]:
+        """Voce richiamo di un record PAZIENTI (None se non e' da richiamare)."""
+        paziente_id, nome = _text(values['id']), _text(values['nome'])
+        if not paziente_id or not nome:
+            return None
+
+        tipo = _text(values['tipo_richiamo'])
+        da_richiamare = _text(values['da_richiamare'])
+        visita = values['ultima_visita']  # date dal DBF, stringa dalla tabella richiami
+        ultima_visita = _iso(visita)
+        mesi = None
+        richiamo = self._richiami.get(paziente_id)
+        if richiamo is not None:
+            # La tabella richiami sovrascrive i dati del gestionale (come nella lista pazienti)
+            data_ultima_visita, tipo, raw_mesi, da_richiamare = richiamo
+            tipo, da_richiamare = _text(tipo), _text(da_richiamare)
+            if data_ultima_visita:
+                ultima_visita = visita = data_ultima_visita
+            try:
+                mesi = int(raw_mesi) if raw_mesi else None
+            except (TypeError, ValueError):
+                mesi = None
+        if da_richiamare.upper() != 'S':
+            return None
+
+        # Per i pazienti con igiene ('2' nel tipo) la data di partenza e' l'ultima igiene in PREVENT.DBF
+        igiene = self._igiene.get(paziente_id) if '2' in tipo else None
+        base = igiene[0] if igiene else parse_date(visita)
+        return _Recall(paziente_id, nome, _text(values['cellulare']), _text(values['telefono']),
+                       _text(values['sesso']), _iso(values['data_nascita']), tipo, mesi, ultima_visita, base)
+
+    def _build_partitions(self) -> None:
+        active = np.flatnonzero(self._active)
+        by_code: Dict[str, List[int]] = defaultdict(list)
+        for row in active.tolist():
+            for code in set(self._entries[row].tipo):
+                by_code[code].append(row)
+        partitions = {None: _Partition(active, self._due)}
+        for code, rows in by_code.items():
+            partitions[code] = _Partition(np.array(rows, dtype=np.int64), self._due)
+        self._partitions = partitions
+
+    def _load_richiami(self) -> Dict[str, Tuple]:
+        """{paziente_id: (data_ultima_visita, tipo_richiamo, tempo_richiamo, da_richiamare)}."""
+        if not os.path.exists(self.richiami_db_path):
+            return {}
+        try:
+            with db_connection(self.richiami_db_path, caller='recall_index', row_factory=None) as conn:
+                rows = conn.execute("""
+                    SELECT paziente_id, data_ultima_visita, tipo_richiamo, tempo_richiamo, da_richiamare
+                    FROM richiami ORDER BY id
+                """).fetchall()
+        except Exception as e:
+            logger.warning(f"Could not fetch richiami data: {e}")
+            return {}
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+
+# Registry per percorso
+_recall_indexes: Dict[str, RecallIndex] = {}
+_recall_indexes_lock = threading.Lock()
+
+def get_recall_index(path: str) -> RecallIndex:
+    """Get the shared recall index for PAZIENTI.DBF at `path`."""
+    key = os.path.normcase(os.path.abspath(path))
+    with _recall_indexes_lock:
+        if key not in _recall_indexes:
+            _recall_indexes[key] = RecallIndex(path)
+        return _recall_indexes[key]
+
+
+def refresh_recall_indexes() -> None:
+    """Riallinea tutti gli indici richiami istanziati (chiamato dal file watcher)."""
+    with _recall_indexes_lock:
+        indexes = list(_recall_indexes.values())
+    for index in indexes:
+        try:
+            index.refresh()
+        except Exception as e:
+            logger.warning(f"Refresh recall index {index.path} fallito: {e}")
@@ -3,10 +3,10 @@ Motore di dispatch reminder - gestisce logica continuos/split basata su config D
 """
 
 import logging
-import sqlite3
 from datetime import date, timedelta
 from typing import Optional, Dict, Any
 
+from core.database_manager import db_connection
 from core.paths import STUDIO_DIMA_DB_PATH
 from core.reminder_db import ensure_reminder_tables
 
@@ -28,12 +28,10 @@ class ReminderDispatchEngine:
         """
         ensure_reminder_tables()
         try:
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM studio_opening_hours WHERE day_of_week = ?", (day_of_week,))
-            row = cur.fetchone()
-            conn.close()
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='reminder_dispatch_engine') as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT * FROM studio_opening_hours WHERE day_of_week = ?", (day_of_week,))
+                row = cur.fetchone()
             return dict(row) if row else None
         except Exception as e:
             logger.error(f"Errore lettura config per giorno {day_of_week}: {e}")
@@ -107,13 +105,11 @@ class ReminderDispatchEngine:
         ensure_reminder_tables()
         result = {}
         try:
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM studio_opening_hours ORDER BY day_of_week")
-            for row in cur.fetchall():
-                result[row['day_of_week']] = dict(row)
-            conn.close()
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='reminder_dispatch_engine') as conn:
+                cur = conn.cursor()
+                cur.execute("SELECT * FROM studio_opening_hours ORDER BY day_of_week")
+                for row in cur.fetchall():
+                    result[row['day_of_week']] = dict(row)
         except Exception as e:
             logger.error(f"Errore lettura config completa: {e}")
         
@@ -132,8 +128,6 @@ class ReminderDispatchEngine:
         """
         ensure_reminder_tables()
         try:
-            conn = sqlite3.connect(str(STUDIO_DIMA_DB_PATH))
-            
             # Costruisci SET clause dinamicamente
             allowed_fields = {
                 'enabled', 'continuous_hours',
@@ -144,19 +138,17 @@ class ReminderDispatchEngine:
             update_fields = {k: v for k, v in config_update.items() if k in allowed_fields}
             
             if not update_fields:
-                conn.close()
                 return False
             
             set_clause = ', '.join([f"{k} = ?" for k in update_fields.keys()])
             values = list(update_fields.values()) + [day_of_week]
             
-            cur = conn.cursor()
-            cur.execute(
-                f"UPDATE studio_opening_hours SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE day_of_week = ?",
-                values
-            )
-            conn.commit()
-            conn.close()
+            with db_connection(STUDIO_DIMA_DB_PATH, caller='reminder_dispatch_engine') as conn:
+                cur = conn.cursor()
+                cur.execute(
+                    f"UPDATE studio_opening_hours SET {set_clause}, updated_at = CURRENT_TIMESTAMP WHERE day_of_week = ?",
+                    values
+                )
             
             logger.info(f"Config aggiornata per giorno {day_of_week}: {update_fields}")
             return True
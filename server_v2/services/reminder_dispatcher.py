@@ -0,0 +1,171 @@
+"""
+Esecuzione concorrente e rate-limited degli invii reminder.
+
+Usato da appointment_reminder_service.run_reminders:
+- Pool di worker limitato per verifiche WhatsApp e invii
+- Token bucket per canale (whatsapp, sms, verifica numeri Evolution)
+- Retry con backoff esponenziale solo sugli esiti marcati `retryable`
+- Chiavi di idempotenza: un appuntamento non può essere in invio due volte,
+  nemmeno da due esecuzioni concorrenti (scheduler + API manuale)
+- Tempi e contatori per canale per il log del job
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Limitatore a token bucket: `rate` token al secondo, raffiche fino a `capacity`.
+    Le richieste prenotano il token (il saldo può andare in negativo) e attendono
+    il proprio turno, quindi l'ordine di arrivo è rispettato.
+    """
+
+    def __init__(self, rate: float, capacity: float,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Consuma un token; restituisce i secondi di attesa."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, 0.0)
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+@dataclass
+class DispatchSettings:
+    """Parametri del dispatcher (override da variabili d'ambiente REMINDER_*)."""
+    workers: int = int(os.getenv('REMINDER_WORKERS', '4'))
+    check_workers: int = int(os.getenv('REMINDER_CHECK_WORKERS', '4'))
+    retries: int = int(os.getenv('REMINDER_RETRIES', '2'))
+    backoff_seconds: float = float(os.getenv('REMINDER_BACKOFF_SECONDS', '0.5'))
+    # messaggi al secondo e raffica massima per canale
+    rates: Dict[str, float] = field(default_factory=lambda: {
+        'whatsapp': float(os.getenv('REMINDER_WA_RATE', '1')),
+        'sms': float(os.getenv('REMINDER_SMS_RATE', '5')),
+        'wa_check': float(os.getenv('REMINDER_WA_CHECK_RATE', '5')),
+    })
+    bursts: Dict[str, float] = field(default_factory=lambda: {'whatsapp': 3, 'sms': 5, 'wa_check': 5})
+
+
+@dataclass
+class DispatchJob:
+    """Invio di un reminder: `send()` restituisce il dict esito dei send_*_reminder."""
+    key: str
+    channel: str
+    send: Callable[[], Dict[str, Any]]
+    context: Dict[str, Any] = field(default_factory=dict)
+
+
+# Chiavi in invio in questo processo (idempotenza tra esecuzioni concorrenti)
+_inflight: Set[str] = set()
+_inflight_lock = threading.Lock()
+
+
+class ReminderDispatcher:
+    """Pool di worker con rate limit per canale e retry."""
+
+    def __init__(self, settings: Optional[DispatchSettings] = None):
+        self.settings = settings or DispatchSettings()
+        self.buckets = {
+            channel: TokenBucket(rate, self.settings.bursts.get(channel, 1))
+            for channel, rate in self.settings.rates.items()
+        }
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {'attempts': 0, 'retries': 0, 'rate_limit_wait_ms': {}, 'duplicates_skipped': 0}
+
+    def map_concurrent(self, fn: Callable[[Any], Any], items: Iterable[Any], channel: Optional[str] = None) -> List[Any]:
+        """Applica `fn` in parallelo (check_workers), con rate limit opzionale; risultati in ordine."""
+        items = list(items)
+        if not items:
+            return []
+
+        def call(item):
+            if channel:
+                self._throttle(channel)
+            return fn(item)
+
+        with ThreadPoolExecutor(max_workers=min(self.settings.check_workers, len(items))) as pool:
+            return list(pool.map(call, items))
+
+    def dispatch(self, jobs: List[DispatchJob],
+                 on_result: Callable[[DispatchJob, Dict[str, Any]], None]) -> None:
+        """
+        Esegue gli invii sul pool; `on_result` viene chiamato nel thread chiamante
+        appena ogni invio termina (log e statistiche restano sequenziali).
+        """
+        claimed = []
+        for job in jobs:
+            with _inflight_lock:
+                if job.key in _inflight:
+                    self.stats['duplicates_skipped'] += 1
+                    continue
+                _inflight.add(job.key)
+            claimed.append(job)
+        if not claimed:
+            return
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(self.settings.workers, len(claimed))) as pool:
+                futures = {pool.submit(self._run, job): job for job in claimed}
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'success': False, 'channel': job.channel, 'error': str(e)}
+                    try:
+                        on_result(job, result)
+                    finally:
+                        with _inflight_lock:
+                            _inflight.discard(job.key)
+        finally:
+            with _inflight_lock:
+                _inflight.difference_update(job.key for job in claimed)
+
+    def _run(self, job: DispatchJob) -> Dict[str, Any]:
+        attempts = self.settings.retries + 1
+        for attempt in range(attempts):
+            self._throttle(job.channel)
+            with self._lock:
+                self.stats['attempts'] += 1
+                if attempt:
+                    self.stats['retries'] += 1
+            result = job.send()
+            if result.get('success') or not result.get('retryable') or attempt == attempts - 1:
+                result['attempts'] = attempt + 1
+                return result
+            delay = self.settings.backoff_seconds * (2 ** attempt)
+            logger.info(f"Reminder {job.key}: errore transitorio ({result.get('error')}), nuovo tentativo tra {delay:.1f}s")
+            time.sleep(delay)
+        return result
+
+    def _throttle(self, channel: str) -> None:
+        bucket = self.buckets.get(channel)
+        if bucket is None:
+            return
+        waited = bucket.acquire()
+        if waited:
+            with self._lock:
+                waits = self.stats['rate_limit_wait_ms']
+                waits[channel] = round(waits.get(channel, 0.0) + waited * 1000, 1)
@@ -4,12 +4,11 @@ Replica la logica di server/app/core/ricette_db.py adattata all'architettura V2
 """
 
 import os
-import sqlite3
 import logging
 from typing import List, Dict, Any, Optional
 from datetime import datetime
 
-from core.database_manager import get_database_manager
+from core.database_manager import db_connection, get_database_manager
 from core.exceptions import DatabaseError, ValidationError
 from .base_service import BaseService
 
@@ -49,87 +48,84 @@ class RicetteDbService(BaseService):
     def _init_ricette_db(self):
         """Inizializza il database delle ricette - copia esatta da V1"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Tabella ricette elettroniche - schema identico a V1
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS ricette_elettroniche (
-                    -- Chiave primaria
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+            with db_connection(self.db_path, caller='ricette_db_service', row_factory=None) as conn:
+                cursor = conn.cursor()
+            
+                # Tabella ricette elettroniche - schema identico a V1
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS ricette_elettroniche (
+                        -- Chiave primaria
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
                     
-                    -- === IDENTIFICATIVI RICETTA (da Sistema TS) ===
-                    nre TEXT NOT NULL,                      -- Numero Ricetta Elettronica
-                    codice_pin TEXT NOT NULL,               -- PIN per farmacista
-                    protocollo_transazione TEXT,            -- Protocollo transazione
-                    stato TEXT NOT NULL DEFAULT 'inviata',  -- 'inviata', 'annullata', 'erogata'
-                    categoria_ricetta TEXT,                 -- categoria ricetta
+                        -- === IDENTIFICATIVI RICETTA (da Sistema TS) ===
+                        nre TEXT NOT NULL,                      -- Numero Ricetta Elettronica
+                        codice_pin TEXT NOT NULL,               -- PIN per farmacista
+                        protocollo_transazione TEXT,            -- Protocollo transazione
+                        stato TEXT NOT NULL DEFAULT 'inviata',  -- 'inviata', 'annullata', 'erogata'
+                        categoria_ricetta TEXT,                 -- categoria ricetta
                     
-                    -- === DATI MEDICO COMPLETI ===
-                    cf_medico TEXT NOT NULL,
-                    medico_cognome TEXT NOT NULL,
-                    medico_nome TEXT NOT NULL,
-                    specializzazione TEXT NOT NULL,
-                    nr_iscrizione_albo TEXT NOT NULL,
-                    medico_indirizzo TEXT,
-                    medico_telefono TEXT,
+                        -- === DATI MEDICO COMPLETI ===
+                        cf_medico TEXT NOT NULL,
+                        medico_cognome TEXT NOT NULL,
+                        medico_nome TEXT NOT NULL,
+                        specializzazione TEXT NOT NULL,
+                        nr_iscrizione_albo TEXT NOT NULL,
+                        medico_indirizzo TEXT,
+                        medico_telefono TEXT,
                     
-                    -- === DATI PAZIENTE ===
-                    cf_assistito TEXT NOT NULL,
-                    paziente_cognome TEXT NOT NULL,
-                    paziente_nome TEXT NOT NULL,
-                    paziente_indirizzo TEXT,
-                    paziente_cap TEXT,
-                    paziente_citta TEXT,
-                    paziente_provincia TEXT,
+                        -- === DATI PAZIENTE ===
+                        cf_assistito TEXT NOT NULL,
+                        paziente_cognome TEXT NOT NULL,
+                        paziente_nome TEXT NOT NULL,
+                        paziente_indirizzo TEXT,
+                        paziente_cap TEXT,
+                        paziente_citta TEXT,
+                        paziente_provincia TEXT,
                     
-                    -- === DATI PRESCRIZIONE E FARMACO ===
-                    data_compilazione DATETIME NOT NULL,
-                    tipo_prescrizione TEXT DEFAULT 'farmaceutica',
+                        -- === DATI PRESCRIZIONE E FARMACO ===
+                        data_compilazione DATETIME NOT NULL,
+                        tipo_prescrizione TEXT DEFAULT 'farmaceutica',
                     
-                    -- Diagnosi snapshot
-                    codice_diagnosi TEXT NOT NULL,
-                    descrizione_diagnosi TEXT NOT NULL,
+                        -- Diagnosi snapshot
+                        codice_diagnosi TEXT NOT NULL,
+                        descrizione_diagnosi TEXT NOT NULL,
                     
-                    -- Farmaco snapshot
-                    gruppo_equivalenza_farmaco TEXT NOT NULL,    -- principio attivo
-                    prodotto_aic TEXT NOT NULL,                  -- nome commerciale
-                    codice_farmaco TEXT NOT NULL,               -- codice interno
-                    quantita INTEGER DEFAULT 1,                 -- quantità (1 per ripetibili)
-                    posologia TEXT NOT NULL,
-                    sostituibilita TEXT DEFAULT 'sostituibile',
-                    numero_ripetizioni INTEGER DEFAULT 1,
-                    validita TEXT,                               -- validità ricetta
-                    durata_trattamento TEXT NOT NULL,
-                    note TEXT,
+                        -- Farmaco snapshot
+                        gruppo_equivalenza_farmaco TEXT NOT NULL,    -- principio attivo
+                        prodotto_aic TEXT NOT NULL,                  -- nome commerciale
+                        codice_farmaco TEXT NOT NULL,               -- codice interno
+                        quantita INTEGER DEFAULT 1,                 -- quantità (1 per ripetibili)
+                        posologia TEXT NOT NULL,
+                        sostituibilita TEXT DEFAULT 'sostituibile',
+                        numero_ripetizioni INTEGER DEFAULT 1,
+                        validita TEXT,                               -- validità ricetta
+                        durata_trattamento TEXT NOT NULL,
+                        note TEXT,
                     
-                    -- === GESTIONE ANNULLAMENTO ===
-                    data_annullamento DATETIME NULL,
-                    motivo_annullamento TEXT NULL,
+                        -- === GESTIONE ANNULLAMENTO ===
+                        data_annullamento DATETIME NULL,
+                        motivo_annullamento TEXT NULL,
                     
-                    -- === METADATI TECNICI ===
-                    ambiente TEXT NOT NULL DEFAULT 'test',      -- 'test' o 'prod'
-                    response_xml TEXT NOT NULL,                 -- XML completo risposta
-                    pdf_base64 TEXT,                            -- PDF ricetta per ristampa immediata
+                        -- === METADATI TECNICI ===
+                        ambiente TEXT NOT NULL DEFAULT 'test',      -- 'test' o 'prod'
+                        response_xml TEXT NOT NULL,                 -- XML completo risposta
+                        pdf_base64 TEXT,                            -- PDF ricetta per ristampa immediata
                     
-                    -- Timestamps
-                    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Indici per performance - identici a V1
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_nre ON ricette_elettroniche(nre)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cf_assistito ON ricette_elettroniche(cf_assistito)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cf_medico ON ricette_elettroniche(cf_medico)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_stato ON ricette_elettroniche(stato)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_data_compilazione ON ricette_elettroniche(data_compilazione)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_protocollo_transazione ON ricette_elettroniche(protocollo_transazione)')
-            
-            conn.commit()
-            conn.close()
-            
-            self.logger.info(f"Database ricette inizializzato: {self.db_path}")
+                        -- Timestamps
+                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    )
+                ''')
+            
+                # Indici per performance - identici a V1
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_nre ON ricette_elettroniche(nre)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_cf_assistito ON ricette_elettroniche(cf_assistito)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_cf_medico ON ricette_elettroniche(cf_medico)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_stato ON ricette_elettroniche(stato)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_data_compilazione ON ricette_elettroniche(data_compilazione)')
+                cursor.execute('CREATE INDEX IF NOT EXISTS idx_protocollo_transazione ON ricette_elettroniche(protocollo_transazione)')
+            
+                self.logger.info(f"Database ricette inizializzato: {self.db_path}")
             
         except Exception as e:
             self.logger.error(f"Errore inizializzazione database ricette: {e}")
@@ -165,64 +161,62 @@ class RicetteDbService(BaseService):
             ]
             self.validate_required_fields(ricetta_data, required_fields)
             
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Query identica a V1
-            cursor.execute('''
-                INSERT INTO ricette_elettroniche (
-                    nre, codice_pin, protocollo_transazione, stato,
-                    cf_medico, medico_cognome, medico_nome, specializzazione, nr_iscrizione_albo,
-                    medico_indirizzo, medico_telefono,
-                    cf_assistito, paziente_cognome, paziente_nome, paziente_indirizzo,
-                    paziente_cap, paziente_citta, paziente_provincia,
-                    data_compilazione, tipo_prescrizione,
-                    codice_diagnosi, descrizione_diagnosi,
-                    gruppo_equivalenza_farmaco, prodotto_aic, codice_farmaco,
-                    quantita, posologia, durata_trattamento, note,
-                    ambiente, response_xml, pdf_base64
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                ricetta_data['nre'],
-                ricetta_data['codice_pin'],
-                ricetta_data.get('protocollo_transazione'),
-                ricetta_data.get('stato', 'inviata'),
-                ricetta_data['cf_medico'],
-                ricetta_data['medico_cognome'],
-                ricetta_data['medico_nome'],
-                ricetta_data['specializzazione'],
-                ricetta_data['nr_iscrizione_albo'],
-                ricetta_data.get('medico_indirizzo'),
-                ricetta_data.get('medico_telefono'),
-                ricetta_data['cf_assistito'],
-                ricetta_data['paziente_cognome'],
-                ricetta_data['paziente_nome'],
-                ricetta_data.get('paziente_indirizzo'),
-                ricetta_data.get('paziente_cap'),
-                ricetta_data.get('paziente_citta'),
-                ricetta_data.get('paziente_provincia'),
-                ricetta_data['data_compilazione'],
-                ricetta_data.get('tipo_prescrizione', 'farmaceutica'),
-                ricetta_data['codice_diagnosi'],
-                ricetta_data['descrizione_diagnosi'],
-                ricetta_data['gruppo_equivalenza_farmaco'],
-                ricetta_data['prodotto_aic'],
-                ricetta_data['codice_farmaco'],
-                ricetta_data.get('quantita', 1),
-                ricetta_data['posologia'],
-                ricetta_data['durata_trattamento'],
-                ricetta_data.get('note'),
-                ricetta_data.get('ambiente', 'test'),
-                ricetta_data['response_xml'],
-                ricetta_data.get('pdf_base64')
-            ))
-            
-            ricetta_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-            
-            self.logger.info(f"Ricetta salvata: ID {ricetta_id}, NRE {ricetta_data['nre']}")
-            return ricetta_id
+            with db_connection(self.db_path, caller='ricette_db_service', row_factory=None) as conn:
+                cursor = conn.cursor()
+            
+                # Query identica a V1
+                cursor.execute('''
+                    INSERT INTO ricette_elettroniche (
+                        nre, codice_pin, protocollo_transazione, stato,
+                        cf_medico, medico_cognome, medico_nome, specializzazione, nr_iscrizione_albo,
+                        medico_indirizzo, medico_telefono,
+                        cf_assistito, paziente_cognome, paziente_nome, paziente_indirizzo,
+                        paziente_cap, paziente_citta, paziente_provincia,
+                        data_compilazione, tipo_prescrizione,
+                        codice_diagnosi, descrizione_diagnosi,
+                        gruppo_equivalenza_farmaco, prodotto_aic, codice_farmaco,
+                        quantita, posologia, durata_trattamento, note,
+                        ambiente, response_xml, pdf_base64
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    ricetta_data['nre'],
+                    ricetta_data['codice_pin'],
+                    ricetta_data.get('protocollo_transazione'),
+                    ricetta_data.get('stato', 'inviata'),
+                    ricetta_data['cf_medico'],
+                    ricetta_data['medico_cognome'],
+                    ricetta_data['medico_nome'],
+                    ricetta_data['specializzazione'],
+                    ricetta_data['nr_iscrizione_albo'],
+                    ricetta_data.get('medico_indirizzo'),
+                    ricetta_data.get('medico_telefono'),
+                    ricetta_data['cf_assistito'],
+                    ricetta_data['paziente_cognome'],
+                    ricetta_data['paziente_nome'],
+                    ricetta_data.get('paziente_indirizzo'),
+                    ricetta_data.get('paziente_cap'),
+                    ricetta_data.get('paziente_citta'),
+                    ricetta_data.get('paziente_provincia'),
+                    ricetta_data['data_compilazione'],
+                    ricetta_data.get('tipo_prescrizione', 'farmaceutica'),
+                    ricetta_data['codice_diagnosi'],
+                    ricetta_data['descrizione_diagnosi'],
+                    ricetta_data['gruppo_equivalenza_farmaco'],
+                    ricetta_data['prodotto_aic'],
+                    ricetta_data['codice_farmaco'],
+                    ricetta_data.get('quantita', 1),
+                    ricetta_data['posologia'],
+                    ricetta_data['durata_trattamento'],
+                    ricetta_data.get('note'),
+                    ricetta_data.get('ambiente', 'test'),
+                    ricetta_data['response_xml'],
+                    ricetta_data.get('pdf_base64')
+                ))
+            
+                ricetta_id = cursor.lastrowid
+            
+                self.logger.info(f"Ricetta salvata: ID {ricetta_id}, NRE {ricetta_data['nre']}")
+                return ricetta_id
             
         except ValidationError:
             raise
@@ -242,19 +236,17 @@ class RicetteDbService(BaseService):
             Dati ricetta o None se non trovata
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with db_connection(self.db_path, caller='ricette_db_service', row_factory=None) as conn:
+                cursor = conn.cursor()
             
-            cursor.execute('SELECT * FROM ricette_elettroniche WHERE nre = ?', (nre,))
-            result = cursor.fetchone()
+                cursor.execute('SELECT * FROM ricette_elettroniche WHERE nre = ?', (nre,))
+                result = cursor.fetchone()
             
-            if result:
-                columns = [description[0] for description in cursor.description]
-                conn.close()
-                return dict(zip(columns, result))
+                if result:
+                    columns = [description[0] for description in cursor.description]
+                    return dict(zip(columns, result))
             
-            conn.close()
-            return None
+                return None
             
         except Exception as e:
             self.logger.error(f"Errore recupero ricetta per NRE {nre}: {e}")
@@ -272,20 +264,19 @@ class RicetteDbService(BaseService):
             Lista ricette del paziente
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with db_connection(self.db_path, caller='ricette_db_service', row_factory=None) as conn:
+                cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT * FROM ricette_elettroniche 
-                WHERE cf_assistito = ? 
-                ORDER BY data_compilazione DESC
-            ''', (cf_assistito,))
+                cursor.execute('''
+                    SELECT * FROM ricette_elettroniche 
+                    WHERE cf_assistito = ? 
+                    ORDER BY data_compilazione DESC
+                ''', (cf_assistito,))
             
-            results = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            conn.close()
+                results = cursor.fetchall()
+                columns = [description[0] for description in cursor.description]
             
-            return [dict(zip(columns, row)) for row in results]
+                return [dict(zip(columns, row)) for row in results]
             
         except Exception as e:
             self.logger.error(f"Errore recupero ricette paziente {cf_assistito}: {e}")
@@ -303,20 +294,19 @@ class RicetteDbService(BaseService):
             Lista di tutte le ricette
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
+            with db_connection(self.db_path, caller='ricette_db_service', row_factory=None) as conn:
+                cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT * FROM ricette_elettroniche 
-                ORDER BY data_compilazione DESC
-                LIMIT ?
-            ''', (limit,))
+                cursor.execute('''
+                    SELECT * FROM ricette_elettroniche 
+                    ORDER BY data_compilazione DESC
+                    LIMIT ?
+                ''', (limit,))
             
-            results = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            conn.close()
+                results = cursor.fetchall()
+                columns = [description[0] for description in cursor.description]
             
-            return [dict(zip(columns, row)) for row in results]
+                return [dict(zip(columns, row)) for row in results]
             
         except Exception as e:
             self.logger.error(f"Errore recupero tutte le ricette: {e}")
@@ -336,36 +326,34 @@ class RicetteDbService(BaseService):
             True se aggiornata con successo
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            if nuovo_stato == 'annullata':
-                cursor.execute('''
-                    UPDATE ricette_elettroniche 
-                    SET stato = ?, 
-                        data_annullamento = CURRENT_TIMESTAMP,
-                        motivo_annullamento = ?,
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE nre = ?
-                ''', (nuovo_stato, motivo, nre))
-            else:
-                cursor.execute('''
-                    UPDATE ricette_elettroniche 
-                    SET stato = ?, 
-                        updated_at = CURRENT_TIMESTAMP
-                    WHERE nre = ?
-                ''', (nuovo_stato, nre))
-            
-            conn.commit()
-            success = cursor.rowcount > 0
-            conn.close()
-            
-            if success:
-                self.logger.info(f"Ricetta {nre} aggiornata a stato '{nuovo_stato}': {motivo or 'nessun motivo'}")
-            else:
-                self.logger.warning(f"Ricetta {nre} non trovata per aggiornamento stato")
-            
-            return success
+            with db_connection(self.db_path, caller='ricette_db_service', row_factory=None) as conn:
+                cursor = conn.cursor()
+            
+                if nuovo_stato == 'annullata':
+                    cursor.execute('''
+                        UPDATE ricette_elettroniche 
+                        SET stato = ?, 
+                            data_annullamento = CURRENT_TIMESTAMP,
+                            motivo_annullamento = ?,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE nre = ?
+                    ''', (nuovo_stato, motivo, nre))
+                else:
+                    cursor.execute('''
+                        UPDATE ricette_elettroniche 
+                        SET stato = ?, 
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE nre = ?
+                    ''', (nuovo_stato, nre))
+            
+                success = cursor.rowcount > 0
+            
+                if success:
+                    self.logger.info(f"Ricetta {nre} aggiornata a stato '{nuovo_stato}': {motivo or 'nessun motivo'}")
+                else:
+                    self.logger.warning(f"Ricetta {nre} non trovata per aggiornamento stato")
+            
+                return success
             
         except Exception as e:
             self.logger.error(f"Errore aggiornamento stato ricetta {nre}: {e}")
@@ -4,11 +4,11 @@ Richiami Service for StudioDimaAI Server V2.
 Service for managing patient recalls in separate SQLite table.
 """
 
-import sqlite3
 import os
 import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
+from core.database_manager import db_connection
 from core.exceptions import DatabaseError, ValidationError
 
 logger = logging.getLogger(__name__)
@@ -32,84 +32,74 @@ class RichiamiService:
         if _TABLES_READY:
             return
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute('''
-                CREATE TABLE IF NOT EXISTS richiami (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    paziente_id TEXT NOT NULL,
-                    nome TEXT NOT NULL,
-                    data_ultima_visita TEXT,
-                    data_richiamo TEXT,
-                    richiamato_il TEXT,
-                    tipo_richiamo TEXT,
-                    tempo_richiamo INTEGER,
-                    da_richiamare TEXT CHECK(da_richiamare IN ('S', 'N', 'R')) DEFAULT 'S',
-                    sms_sent BOOLEAN DEFAULT 0,
-                    note TEXT,
-                    created_at TEXT DEFAULT (datetime('now')),
-                    updated_at TEXT DEFAULT (datetime('now'))
-                )
-            ''')
-            conn.commit()
-            conn.close()
+            with db_connection(self.db_path, caller='richiami_service') as conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS richiami (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        paziente_id TEXT NOT NULL,
+                        nome TEXT NOT NULL,
+                        data_ultima_visita TEXT,
+                        data_richiamo TEXT,
+                        richiamato_il TEXT,
+                        tipo_richiamo TEXT,
+                        tempo_richiamo INTEGER,
+                        da_richiamare TEXT CHECK(da_richiamare IN ('S', 'N', 'R')) DEFAULT 'S',
+                        sms_sent BOOLEAN DEFAULT 0,
+                        note TEXT,
+                        created_at TEXT DEFAULT (datetime('now')),
+                        updated_at TEXT DEFAULT (datetime('now'))
+                    )
+                ''')
             _TABLES_READY = True
         except Exception as e:
             self.logger.error(f"RichiamiService: errore creazione tabella richiami: {e}")
 
-    def _get_connection(self) -> sqlite3.Connection:
-        """Get database connection."""
+    def _get_connection(self):
+        """Get the thread's database connection (context manager)."""
         if not os.path.exists(self.db_path):
             raise DatabaseError(f"Database not found: {self.db_path}")
         
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        return db_connection(self.db_path, caller='richiami_service')
     
     def create_richiamo(self, paziente_id: str, nome: str, data_ultima_visita: Optional[str] = None,
                        tipo_richiamo: Optional[str] = None, tempo_richiamo: Optional[int] = None) -> Dict[str, Any]:
         """Create a new richiamo for a patient."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Calcola data richiamo se abbiamo i dati necessari
-            data_richiamo = None
-            if data_ultima_visita and tempo_richiamo:
-                try:
-                    ultima = datetime.fromisoformat(data_ultima_visita.replace('Z', '+00:00'))
-                    richiamo_date = ultima + timedelta(days=tempo_richiamo * 30)  # approssimazione mesi
-                    data_richiamo = richiamo_date.isoformat()[:10]  # solo data YYYY-MM-DD
-                except ValueError:
-                    self.logger.warning(f"Invalid date format: {data_ultima_visita}")
-            
-            cursor.execute("""
-                INSERT INTO richiami (
-                    paziente_id, nome, data_ultima_visita, data_richiamo,
-                    tipo_richiamo, tempo_richiamo, da_richiamare
-                ) VALUES (?, ?, ?, ?, ?, ?, 'S')
-            """, (paziente_id, nome, data_ultima_visita, data_richiamo, 
-                  tipo_richiamo, tempo_richiamo))
-            
-            richiamo_id = cursor.lastrowid
-            conn.commit()
-            
-            # Recupera il record creato
-            richiamo = self.get_richiamo_by_id(richiamo_id)
-            
-            return {
-                'success': True,
-                'data': richiamo['data'] if richiamo['success'] else None,
-                'message': 'Richiamo creato con successo'
-            }
-            
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                # Calcola data richiamo se abbiamo i dati necessari
+                data_richiamo = None
+                if data_ultima_visita and tempo_richiamo:
+                    try:
+                        ultima = datetime.fromisoformat(data_ultima_visita.replace('Z', '+00:00'))
+                        richiamo_date = ultima + timedelta(days=tempo_richiamo * 30)  # approssimazione mesi
+                        data_richiamo = richiamo_date.isoformat()[:10]  # solo data YYYY-MM-DD
+                    except ValueError:
+                        self.logger.warning(f"Invalid date format: {data_ultima_visita}")
+
+                cursor.execute("""
+                    INSERT INTO richiami (
+                        paziente_id, nome, data_ultima_visita, data_richiamo,
+                        tipo_richiamo, tempo_richiamo, da_richiamare
+                    ) VALUES (?, ?, ?, ?, ?, ?, 'S')
+                """, (paziente_id, nome, data_ultima_visita, data_richiamo, 
+                      tipo_richiamo, tempo_richiamo))
+
+                richiamo_id = cursor.lastrowid
+
+                # Recupera il record creato
+                richiamo = self.get_richiamo_by_id(richiamo_id)
+
+                return {
+                    'success': True,
+                    'data': richiamo['data'] if richiamo['success'] else None,
+                    'message': 'Richiamo creato con successo'
+                }
+
         except Exception as e:
-            if conn:
-                conn.rollback()
             self.logger.error(f"Error creating richiamo: {e}")
             raise DatabaseError(f"Failed to create richiamo: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
     
     def update_richiamo_status(self, paziente_id: str, da_richiamare: str, 
                               data_richiamo: Optional[str] = None) -> Dict[str, Any]:
@@ -118,316 +108,395 @@ class RichiamiService:
             if da_richiamare not in ['S', 'N', 'R']:
                 raise ValidationError("da_richiamare must be S, N, or R")
             
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Trova richiamo esistente per paziente
-            cursor.execute("""
-                SELECT id FROM richiami 
-                WHERE paziente_id = ? AND da_richiamare != 'R'
-                ORDER BY created_at DESC LIMIT 1
-            """, (paziente_id,))
-            
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Aggiorna record esistente
-                if da_richiamare == 'R':
-                    # Segnato come richiamato
-                    richiamato_il = data_richiamo or datetime.now().isoformat()[:10]
-                    cursor.execute("""
-                        UPDATE richiami 
-                        SET da_richiamare = ?, richiamato_il = ?
-                        WHERE id = ?
-                    """, (da_richiamare, richiamato_il, existing['id']))
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                # Trova richiamo esistente per paziente
+                cursor.execute("""
+                    SELECT id FROM richiami 
+                    WHERE paziente_id = ? AND da_richiamare != 'R'
+                    ORDER BY created_at DESC LIMIT 1
+                """, (paziente_id,))
+
+                existing = cursor.fetchone()
+
+                if existing:
+                    # Aggiorna record esistente
+                    if da_richiamare == 'R':
+                        # Segnato come richiamato
+                        richiamato_il = data_richiamo or datetime.now().isoformat()[:10]
+                        cursor.execute("""
+                            UPDATE richiami 
+                            SET da_richiamare = ?, richiamato_il = ?
+                            WHERE id = ?
+                        """, (da_richiamare, richiamato_il, existing['id']))
+                    else:
+                        # Cambia solo stato
+                        cursor.execute("""
+                            UPDATE richiami 
+                            SET da_richiamare = ?, richiamato_il = NULL
+                            WHERE id = ?
+                        """, (da_richiamare, existing['id']))
+
+                    richiamo_id = existing['id']
                 else:
-                    # Cambia solo stato
+                    # Nessun richiamo esistente - crea nuovo
                     cursor.execute("""
-                        UPDATE richiami 
-                        SET da_richiamare = ?, richiamato_il = NULL
-                        WHERE id = ?
-                    """, (da_richiamare, existing['id']))
-                
-                richiamo_id = existing['id']
-            else:
-                # Nessun richiamo esistente - crea nuovo
-                cursor.execute("""
-                    INSERT INTO richiami (
-                        paziente_id, nome, data_ultima_visita, data_richiamo,
-                        tipo_richiamo, tempo_richiamo, da_richiamare
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (paziente_id, f'Paziente {paziente_id}', None, None, '1', 6, da_richiamare))
-                
-                richiamo_id = cursor.lastrowid
-            
-            conn.commit()
-            
-            # Recupera il record aggiornato
-            richiamo = self.get_richiamo_by_id(richiamo_id)
-            
-            return {
-                'success': True,
-                'data': richiamo['data'] if richiamo['success'] else None,
-                'message': 'Stato richiamo aggiornato con successo'
-            }
-            
+                        INSERT INTO richiami (
+                            paziente_id, nome, data_ultima_visita, data_richiamo,
+                            tipo_richiamo, tempo_richiamo, da_richiamare
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (paziente_id, f'Paziente {paziente_id}', None, None, '1', 6, da_richiamare))
+
+                    richiamo_id = cursor.lastrowid
+
+                # Recupera il record aggiornato
+                richiamo = self.get_richiamo_by_id(richiamo_id)
+
+                return {
+                    'success': True,
+                    'data': richiamo['data'] if richiamo['success'] else None,
+                    'message': 'Stato richiamo aggiornato con successo'
+                }
+
         except Exception as e:
-            if conn:
-                conn.rollback()
             self.logger.error(f"Error updating richiamo status: {e}")
             raise DatabaseError(f"Failed to update richiamo status: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
     
     def update_richiamo_config(self, paziente_id: str, tipo_richiamo: str, 
                               tempo_richiamo: int, paziente_data: Dict[str, Any] = None) -> Dict[str, Any]:
         """Update richiamo configuration (tipo and tempo) for a patient."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            # Trova richiamo attivo per paziente
-            cursor.execute("""
-                SELECT id, data_ultima_visita FROM richiami 
-                WHERE paziente_id = ? AND da_richiamare = 'S'
-                ORDER BY created_at DESC LIMIT 1
-            """, (paziente_id,))
-            
-            existing = cursor.fetchone()
-            
-            if existing:
-                # Ricalcola data richiamo se abbiamo ultima visita
-                data_richiamo = None
-                data_ultima_visita = existing['data_ultima_visita']
-                
-                # Se abbiamo dati del paziente, usa quelli più freschi
-                if paziente_data and paziente_data.get('ultima_visita'):
-                    data_ultima_visita = paziente_data['ultima_visita']
-                
-                if data_ultima_visita:
-                    try:
-                        ultima = datetime.fromisoformat(data_ultima_visita.replace('Z', '+00:00'))
-                        richiamo_date = ultima + timedelta(days=tempo_richiamo * 30)
-                        data_richiamo = richiamo_date.isoformat()[:10]
-                    except ValueError:
-                        pass
-                
-                # Aggiorna con tutti i dati disponibili
-                cursor.execute("""
-                    UPDATE richiami 
-                    SET tipo_richiamo = ?, tempo_richiamo = ?, data_richiamo = ?, data_ultima_visita = ?
-                    WHERE id = ?
-                """, (tipo_richiamo, tempo_richiamo, data_richiamo, data_ultima_visita, existing['id']))
-                
-                richiamo_id = existing['id']
-            else:
-                # Crea nuovo richiamo con tutti i dati
-                nome = paziente_data.get('nome', f'Paziente {paziente_id}') if paziente_data else f'Paziente {paziente_id}'
-                data_ultima_visita = paziente_data.get('ultima_visita') if paziente_data else None
-                
-                # Calcola data richiamo se possibile
-                data_richiamo = None
-                if data_ultima_visita:
-                    try:
-                        ultima = datetime.fromisoformat(data_ultima_visita.replace('Z', '+00:00'))
-                        richiamo_date = ultima + timedelta(days=tempo_richiamo * 30)
-                        data_richiamo = richiamo_date.isoformat()[:10]
-                    except ValueError:
-                        pass
-                
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                # Trova richiamo attivo per paziente
                 cursor.execute("""
-                    INSERT INTO richiami (
-                        paziente_id, nome, data_ultima_visita, data_richiamo,
-                        tipo_richiamo, tempo_richiamo, da_richiamare
-                    ) VALUES (?, ?, ?, ?, ?, ?, 'S')
-                """, (paziente_id, nome, data_ultima_visita, data_richiamo, 
-                      tipo_richiamo, tempo_richiamo))
-                
-                richiamo_id = cursor.lastrowid
-            
-            conn.commit()
-            
-            # Recupera il record aggiornato
-            richiamo = self.get_richiamo_by_id(richiamo_id)
-            
-            return {
-                'success': True,
-                'data': richiamo['data'] if richiamo['success'] else None,
-                'message': 'Configurazione richiamo aggiornata con successo'
-            }
-            
+                    SELECT id, data_ultima_visita FROM richiami 
+                    WHERE paziente_id = ? AND da_richiamare = 'S'
+                    ORDER BY created_at DESC LIMIT 1
+                """, (paziente_id,))
+
+                existing = cursor.fetchone()
+
+                if existing:
+                    # Ricalcola data richiamo se abbiamo ultima visita
+                    data_richiamo = None
+                    data_ultima_visita = existing['data_ultima_visita']
+
+                    # Se abbiamo dati del paziente, usa quelli più freschi
+                    if paziente_data and paziente_data.get('ultima_visita'):
+                        data_ultima_visita = paziente_data['ultima_visita']
+
+                    if data_ultima_visita:
+                        try:
+                            ultima = datetime.fromisoformat(data_ultima_visita.replace('Z', '+00:00'))
+                            richiamo_date = ultima + timedelta(days=tempo_richiamo * 30)
+                            data_richiamo = richiamo_date.isoformat()[:10]
+                        except ValueError:
+                            pass
+
+                    # Aggiorna con tutti i dati disponibili
+                    cursor.execute("""
+                        UPDATE richiami 
+                        SET tipo_richiamo = ?, tempo_richiamo = ?, data_richiamo = ?, data_ultima_visita = ?
+                        WHERE id = ?
+                    """, (tipo_richiamo, tempo_richiamo, data_richiamo, data_ultima_visita, existing['id']))
+
+                    richiamo_id = existing['id']
+                else:
+                    # Crea nuovo richiamo con tutti i dati
+                    nome = paziente_data.get('nome', f'Paziente {paziente_id}') if paziente_data else f'Paziente {paziente_id}'
+                    data_ultima_visita = paziente_data.get('ultima_visita') if paziente_data else None
+
+                    # Calcola data richiamo se possibile
+                    data_richiamo = None
+                    if data_ultima_visita:
+                        try:
+                            ultima = datetime.fromisoformat(data_ultima_visita.replace('Z', '+00:00'))
+                            richiamo_date = ultima + timedelta(days=tempo_richiamo * 30)
+                            data_richiamo = richiamo_date.isoformat()[:10]
+                        except ValueError:
+                            pass
+
+                    cursor.execute("""
+                        INSERT INTO richiami (
+                            paziente_id, nome, data_ultima_visita, data_richiamo,
+                            tipo_richiamo, tempo_richiamo, da_richiamare
+                        ) VALUES (?, ?, ?, ?, ?, ?, 'S')
+                    """, (paziente_id, nome, data_ultima_visita, data_richiamo, 
+                          tipo_richiamo, tempo_richiamo))
+
+                    richiamo_id = cursor.lastrowid
+
+                # Recupera il record aggiornato
+                richiamo = self.get_richiamo_by_id(richiamo_id)
+
+                return {
+                    'success': True,
+                    'data': richiamo['data'] if richiamo['success'] else None,
+                    'message': 'Configurazione richiamo aggiornata con successo'
+                }
+
         except Exception as e:
-            if conn:
-                conn.rollback()
             self.logger.error(f"Error updating richiamo config: {e}")
             raise DatabaseError(f"Failed to update richiamo config: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
     
     def get_richiamo_by_id(self, richiamo_id: int) -> Dict[str, Any]:
         """Get richiamo by ID."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("SELECT * FROM richiami WHERE id = ?", (richiamo_id,))
-            row = cursor.fetchone()
-            
-            if row:
-                return {
-                    'success': True,
-                    'data': dict(row)
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': 'RICHIAMO_NOT_FOUND',
-                    'message': f'Richiamo {richiamo_id} non trovato'
-                }
-                
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute("SELECT * FROM richiami WHERE id = ?", (richiamo_id,))
+                row = cursor.fetchone()
+
+                if row:
+                    return {
+                        'success': True,
+                        'data': dict(row)
+                    }
+                else:
+                    return {
+                        'success': False,
+                        'error': 'RICHIAMO_NOT_FOUND',
+                        'message': f'Richiamo {richiamo_id} non trovato'
+                    }
+
         except Exception as e:
             self.logger.error(f"Error getting richiamo {richiamo_id}: {e}")
             raise DatabaseError(f"Failed to get richiamo: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
     
     def get_richiami_paziente(self, paziente_id: str) -> Dict[str, Any]:
         """Get all richiami for a patient."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT * FROM richiami 
-                WHERE paziente_id = ?
-                ORDER BY created_at DESC
-            """, (paziente_id,))
-            
-            rows = cursor.fetchall()
-            richiami = [dict(row) for row in rows]
-            
-            return {
-                'success': True,
-                'data': richiami,
-                'count': len(richiami)
-            }
-            
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute("""
+                    SELECT * FROM richiami 
+                    WHERE paziente_id = ?
+                    ORDER BY created_at DESC
+                """, (paziente_id,))
+
+                rows = cursor.fetchall()
+                richiami = [dict(row) for row in rows]
+
+                return {
+                    'success': True,
+                    'data': richiami,
+                    'count': len(richiami)
+                }
+
         except Exception as e:
             self.logger.error(f"Error getting richiami for paziente {paziente_id}: {e}")
             raise DatabaseError(f"Failed to get richiami: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
     
     def get_richiami_da_fare(self, limit: Optional[int] = None) -> Dict[str, Any]:
         """Get list of richiami that need to be done (scaduti or da fare oggi)."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            oggi = datetime.now().isoformat()[:10]
-            
-            query = """
-                SELECT * FROM richiami 
-                WHERE da_richiamare = 'S' 
-                AND (data_richiamo IS NULL OR data_richiamo <= ?)
-                ORDER BY data_richiamo ASC, created_at ASC
-            """
-            
-            params = [oggi]
-            if limit:
-                query += " LIMIT ?"
-                params.append(limit)
-            
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            richiami = [dict(row) for row in rows]
-            
-            return {
-                'success': True,
-                'data': richiami,
-                'count': len(richiami)
-            }
-            
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                oggi = datetime.now().isoformat()[:10]
+
+                query = """
+                    SELECT * FROM richiami 
+                    WHERE da_richiamare = 'S' 
+                    AND (data_richiamo IS NULL OR data_richiamo <= ?)
+                    ORDER BY data_richiamo ASC, created_at ASC
+                """
+
+                params = [oggi]
+                if limit:
+                    query += " LIMIT ?"
+                    params.append(limit)
+
+                cursor.execute(query, params)
+                rows = cursor.fetchall()
+                richiami = [dict(row) for row in rows]
+
+                return {
+                    'success': True,
+                    'data': richiami,
+                    'count': len(richiami)
+                }
+
         except Exception as e:
             self.logger.error(f"Error getting richiami da fare: {e}")
             raise DatabaseError(f"Failed to get richiami da fare: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
     
     def get_statistiche_richiami(self) -> Dict[str, Any]:
         """Get richiami statistics."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            oggi = datetime.now().isoformat()[:10]
-            
-            # Contatori
-            cursor.execute("SELECT COUNT(*) as da_fare FROM richiami WHERE da_richiamare = 'S' AND (data_richiamo IS NULL OR data_richiamo <= ?)", (oggi,))
-            da_fare = cursor.fetchone()['da_fare']
-            
-            cursor.execute("SELECT COUNT(*) as scaduti FROM richiami WHERE da_richiamare = 'S' AND data_richiamo < ?", (oggi,))
-            scaduti = cursor.fetchone()['scaduti']
-            
-            cursor.execute("SELECT COUNT(*) as completati FROM richiami WHERE da_richiamare = 'R'")
-            completati = cursor.fetchone()['completati']
-            
-            cursor.execute("SELECT COUNT(*) as totale FROM richiami")
-            totale = cursor.fetchone()['totale']
-            
-            return {
-                'success': True,
-                'data': {
-                    'da_fare': da_fare,
-                    'scaduti': scaduti,
-                    'completati': completati,
-                    'totale': totale
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                oggi = datetime.now().isoformat()[:10]
+
+                # Contatori
+                cursor.execute("SELECT COUNT(*) as da_fare FROM richiami WHERE da_richiamare = 'S' AND (data_richiamo IS NULL OR data_richiamo <= ?)", (oggi,))
+                da_fare = cursor.fetchone()['da_fare']
+
+                cursor.execute("SELECT COUNT(*) as scaduti FROM richiami WHERE da_richiamare = 'S' AND data_richiamo < ?", (oggi,))
+                scaduti = cursor.fetchone()['scaduti']
+
+                cursor.execute("SELECT COUNT(*) as completati FROM richiami WHERE da_richiamare = 'R'")
+                completati = cursor.fetchone()['completati']
+
+                cursor.execute("SELECT COUNT(*) as totale FROM richiami")
+                totale = cursor.fetchone()['totale']
+
+                return {
+                    'success': True,
+                    'data': {
+                        'da_fare': da_fare,
+                        'scaduti': scaduti,
+                        'completati': completati,
+                        'totale': totale
+                    }
                 }
-            }
-            
+
         except Exception as e:
             self.logger.error(f"Error getting richiami statistics: {e}")
             raise DatabaseError(f"Failed to get statistics: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
     
     def mark_sms_sent(self, richiamo_id: int) -> Dict[str, Any]:
         """Mark SMS as sent for a richiamo."""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                UPDATE richiami 
-                SET sms_sent = 1
-                WHERE id = ?
-            """, (richiamo_id,))
-            
-            if cursor.rowcount == 0:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute("""
+                    UPDATE richiami 
+                    SET sms_sent = 1
+                    WHERE id = ?
+                """, (richiamo_id,))
+
+                if cursor.rowcount == 0:
+                    return {
+                        'success': False,
+                        'error': 'RICHIAMO_NOT_FOUND',
+                        'message': f'Richiamo {richiamo_id} non trovato'
+                    }
+
                 return {
-                    'success': False,
-                    'error': 'RICHIAMO_NOT_FOUND',
-                    'message': f'Richiamo {richiamo_id} non trovato'
+                    'success': True,
+                    'message': 'SMS contrassegnato come inviato'
                 }
-            
-            conn.commit()
-            
-            return {
-                'success': True,
-                'message': 'SMS contrassegnato come inviato'
-            }
-            
+
         except Exception as e:
-            if conn:
-                conn.rollback()
             self.logger.error(f"Error marking SMS sent: {e}")
             raise DatabaseError(f"Failed to mark SMS sent: {str(e)}")
-        finally:
-            if conn:
-                conn.close()
\ No newline at end of file
+
+    def bulk_upsert(self, records: List[Dict[str, Any]], update_existing: bool = True) -> Dict[str, Any]:
+        """
+        Allinea la tabella richiami ai dati richiamo del gestionale in una sola transazione.
+
+        `records`: dict con paziente_id, nome, data_ultima_visita, tipo_richiamo,
+        tempo_richiamo e da_richiamare (S/N/R, gli altri valori vengono saltati).
+        Ogni record viene confrontato con il richiamo corrente del paziente
+        (l'ultimo creato), letti tutti con una sola query; inserimenti e
+        aggiornamenti vanno in un unico executemany con INSERT ... ON CONFLICT(id).
+        Con update_existing=False i pazienti gia' presenti non vengono modificati.
+
+        Returns:
+            Report con i contatori, gli id inseriti e i campi cambiati per gli aggiornamenti
+        """
+        report = {
+            'inserted': 0, 'updated': 0, 'unchanged': 0, 'existing': 0, 'skipped': 0,
+            'total': len(records), 'inserted_ids': [], 'changes': [],
+        }
+        oggi = datetime.now().isoformat()[:10]
+        try:
+            with self._get_connection() as conn:
+                current = {
+                    row['paziente_id']: row
+                    for row in conn.execute("""
+                        SELECT id, paziente_id, nome, data_ultima_visita, tipo_richiamo,
+                               tempo_richiamo, da_richiamare, richiamato_il
+                        FROM richiami ORDER BY created_at, id
+                    """)
+                }
+
+                rows = []
+                seen = set()
+                for record in records:
+                    paziente_id = str(record.get('paziente_id') or '').strip()
+                    da_richiamare = str(record.get('da_richiamare') or '').strip().upper()
+                    if not paziente_id or da_richiamare not in ('S', 'N', 'R') or paziente_id in seen:
+                        report['skipped'] += 1
+                        continue
+                    seen.add(paziente_id)
+
+                    try:
+                        tempo_richiamo = int(record.get('tempo_richiamo') or 0) or None
+                    except (TypeError, ValueError):
+                        tempo_richiamo = None
+                    values = {
+                        'nome': record.get('nome') or f'Paziente {paziente_id}',
+                        'data_ultima_visita': record.get('data_ultima_visita') or None,
+                        'tipo_richiamo': record.get('tipo_richiamo') or None,
+                        'tempo_richiamo': tempo_richiamo,
+                        'da_richiamare': da_richiamare,
+                    }
+
+                    existing = current.get(paziente_id)
+                    if existing is None:
+                        report['inserted'] += 1
+                        report['inserted_ids'].append(paziente_id)
+                        richiamato_il = oggi if da_richiamare == 'R' else None
+                    else:
+                        changed = {k: [existing[k], v] for k, v in values.items() if existing[k] != v}
+                        if not changed:
+                            report['unchanged'] += 1
+                            continue
+                        if not update_existing:
+                            report['existing'] += 1
+                            continue
+                        report['updated'] += 1
+                        report['changes'].append({'paziente_id': paziente_id, 'fields': changed})
+                        richiamato_il = None
+                        if da_richiamare == 'R':
+                            # Gia' richiamato: si conserva la data del richiamo
+                            richiamato_il = (existing['richiamato_il'] if existing['da_richiamare'] == 'R' else None) or oggi
+
+                    rows.append((
+                        existing['id'] if existing is not None else None, paziente_id, values['nome'],
+                        values['data_ultima_visita'],
+                        self._calcola_data_richiamo(values['data_ultima_visita'], tempo_richiamo),
+                        richiamato_il, values['tipo_richiamo'], tempo_richiamo, da_richiamare,
+                    ))
+
+                conn.executemany("""
+                    INSERT INTO richiami (
+                        id, paziente_id, nome, data_ultima_visita, data_richiamo,
+                        richiamato_il, tipo_richiamo, tempo_richiamo, da_richiamare
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        nome = excluded.nome,
+                        data_ultima_visita = excluded.data_ultima_visita,
+                        data_richiamo = excluded.data_richiamo,
+                        richiamato_il = excluded.richiamato_il,
+                        tipo_richiamo = excluded.tipo_richiamo,
+                        tempo_richiamo = excluded.tempo_richiamo,
+                        da_richiamare = excluded.da_richiamare,
+                        updated_at = datetime('now')
+                """, rows)
+
+                return {'success': True, 'data': report}
+
+        except Exception as e:
+            self.logger.error(f"Error in bulk upsert richiami: {e}")
+            raise DatabaseError(f"Failed to bulk upsert richiami: {str(e)}")
+
+    def _calcola_data_richiamo(self, data_ultima_visita: Optional[str], tempo_richiamo: Optional[int]) -> Optional[str]:
+        """Data richiamo come in create_richiamo (ultima visita + mesi * 30 giorni)."""
+        if not data_ultima_visita or not tempo_richiamo:
+            return None
+        try:
+            ultima = datetime.fromisoformat(data_ultima_visita.replace('Z', '+00:00'))
+        except ValueError:
+            self.logger.warning(f"Invalid date format: {data_ultima_visita}")
+            return None
+        return (ultima + timedelta(days=tempo_richiamo * 30)).isoformat()[:10]
@@ -7,14 +7,21 @@ Formato orario DBF: float decimale visuale
   9.0  = 9:00
 """
 
-import dbf
+import functools
 import logging
 import re
 from datetime import date, datetime, timedelta
-from typing import Optional
+from itertools import islice
+from typing import Iterator, Optional
+
+import numpy as np
 
 from core.constants_v2 import COLONNE, MEDICI
 from core.config_manager import get_config
+from core.shared_cache import file_version
+from core.single_flight import get_single_flight
+from services.dbf_mirror import DBF_ENCODING, get_dbf_mirror
+from services.occupancy_index import get_occupancy_index
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +37,31 @@ def _get_prevent_path() -> str:
     return get_config().get_dbf_path('preventivi')
 
 
+def _piano_to_patient() -> dict[str, str]:
+    """Mappa piano di cura (ELENCO.DB_CODE) → paziente (ELENCO.DB_ELPACOD)."""
+    col_el = COLONNE['elenco']
+    elenco = get_dbf_mirror().table_at(_get_elenco_path())
+    return {
+        pid: paz
+        for pid, paz in zip(elenco.values(col_el['id']), elenco.values(col_el['id_paziente']))
+        if paz and pid
+    }
+
+
+def _coalesced(builder):
+    """
+    Lookup bulk su ELENCO/PREVENT: le chiamate concorrenti (es. dashboard che
+    apre richiami e slot insieme) con gli stessi file attendono un solo calcolo.
+    """
+    @functools.wraps(builder)
+    def wrapper():
+        key = (builder.__name__, file_version(_get_elenco_path(), _get_prevent_path()))
+        result, shared = get_single_flight('slot_finder.lookups').do(key, builder)
+        return dict(result) if shared else result
+    return wrapper
+
+
+@_coalesced
 def build_last_igiene_lookup() -> dict[str, tuple[date, int]]:
     """
     Legge ELENCO.DBF e PREVENT.DBF una sola volta e restituisce un dizionario
@@ -43,68 +75,85 @@ def build_last_igiene_lookup() -> dict[str, tuple[date, int]]:
 
     Usato per calcoli bulk nell'endpoint pazienti-da-richiamare, evitando N letture DBF.
     """
-    col_el = COLONNE['elenco']
-    f_el_id  = col_el['id'].lower()
-    f_el_paz = col_el['id_paziente'].lower()
-
     # piano_id → patient_db_code
-    piano_to_patient: dict[str, str] = {}
     try:
-        with dbf.Table(_get_elenco_path(), codepage='cp1252') as table:
-            for record in table:
-                try:
-                    paz = str(getattr(record, f_el_paz, '') or '').strip()
-                    pid = str(getattr(record, f_el_id, '') or '').strip()
-                    if paz and pid:
-                        piano_to_patient[pid] = paz
-                except Exception:
-                    continue
+        piano_to_patient = _piano_to_patient()
     except Exception as e:
         logger.error(f"build_last_igiene_lookup: errore ELENCO.DBF: {e}")
         return {}
 
     col_pr = COLONNE['preventivi']
-    f_pr_piano  = col_pr['id_piano'].lower()
-    f_pr_medico = col_pr['medico'].lower()
-    f_pr_lavor  = col_pr['codice_prestazione'].lower()   # DB_PRLAVOR
-    f_pr_data   = col_pr['data_prestazione'].lower()
-    f_pr_stato  = col_pr['stato_prestazione'].lower()
 
     # patient_db_code → (best_date, medico_id)
     result: dict[str, tuple[date, int]] = {}
 
     try:
-        with dbf.Table(_get_prevent_path(), codepage='cp1252') as table:
-            for record in table:
-                try:
-                    stato = int(getattr(record, f_pr_stato, 0) or 0)
-                    if stato != 3:  # 3 = Eseguito
-                        continue
-                    lavor = str(getattr(record, f_pr_lavor, '') or '').strip().lower()
-                    if lavor != 'ig':
-                        continue
-                    piano = str(getattr(record, f_pr_piano, '') or '').strip()
-                    patient_id = piano_to_patient.get(piano)
-                    if not patient_id:
-                        continue
-                    pdata = getattr(record, f_pr_data, None)
-                    if not pdata:
-                        continue
-                    try:
-                        medico_id = int(getattr(record, f_pr_medico, None) or 0)
-                    except (TypeError, ValueError):
-                        medico_id = 0
-                    existing = result.get(patient_id)
-                    if existing is None or pdata > existing[0]:
-                        result[patient_id] = (pdata, medico_id)
-                except Exception:
-                    continue
+        prevent = get_dbf_mirror().table_at(_get_prevent_path())
+        # Filtro vettoriale: stato 3 (Eseguito) e lavor 'ig'
+        mask = prevent.numbers(col_pr['stato_prestazione']) == 3
+        mask &= np.char.lower(prevent.stripped(col_pr['codice_prestazione'])) == b'ig'
+        rows = np.flatnonzero(mask)
+
+        piani = prevent.values(col_pr['id_piano'], rows)
+        date_prestazioni = prevent.values(col_pr['data_prestazione'], rows)
+        medici = prevent.numbers(col_pr['medico'])[rows].astype(int).tolist()
+
+        for piano, pdata, medico_id in zip(piani, date_prestazioni, medici):
+            patient_id = piano_to_patient.get(piano)
+            if not patient_id or not pdata:
+                continue
+            existing = result.get(patient_id)
+            if existing is None or pdata > existing[0]:
+                result[patient_id] = (pdata, medico_id)
     except Exception as e:
         logger.error(f"build_last_igiene_lookup: errore PREVENT.DBF: {e}")
 
     return result
 
 
+@_coalesced
+def build_last_igienista_lookup() -> dict[str, tuple[date, int]]:
+    """
+    Versione bulk di trova_ultimo_igienista: {patient_db_code: (last_date, medico_id)}
+    con l'ultima prestazione eseguita (stato=3) da un'igienista (_IGIENISTI_IDS),
+    calcolata con una sola lettura di ELENCO.DBF e PREVENT.DBF.
+
+    A parità di data vince la prima prestazione in ordine di file, come nella
+    ricerca per singolo paziente.
+    """
+    try:
+        piano_to_patient = _piano_to_patient()
+    except Exception as e:
+        logger.error(f"build_last_igienista_lookup: errore ELENCO.DBF: {e}")
+        return {}
+
+    col_pr = COLONNE['preventivi']
+    result: dict[str, tuple[date, int]] = {}
+
+    try:
+        prevent = get_dbf_mirror().table_at(_get_prevent_path())
+        mask = prevent.numbers(col_pr['stato_prestazione']) == 3  # 3 = Eseguito (GUARDIA_MAP)
+        mask &= np.isin(prevent.numbers(col_pr['medico']), list(_IGIENISTI_IDS))
+        rows = np.flatnonzero(mask)
+
+        piani = prevent.values(col_pr['id_piano'], rows)
+        date_prestazioni = prevent.values(col_pr['data_prestazione'], rows)
+        medici = prevent.numbers(col_pr['medico'])[rows].astype(int).tolist()
+
+        for piano, pdata, medico_id in zip(piani, date_prestazioni, medici):
+            patient_id = piano_to_patient.get(piano)
+            if not patient_id or not pdata:
+                continue
+            existing = result.get(patient_id)
+            if existing is None or pdata > existing[0]:
+                result[patient_id] = (pdata, medico_id)
+    except Exception as e:
+        logger.error(f"build_last_igienista_lookup: errore PREVENT.DBF: {e}")
+        return {}
+
+    return result
+
+
 def trova_ultimo_igienista(db_code: str) -> tuple[int | None, str | None]:
     """
     Cerca in ELENCO.DBF + PREVENT.DBF l'ultima prestazione eseguita da un'igienista
@@ -115,23 +164,11 @@ def trova_ultimo_igienista(db_code: str) -> tuple[int | None, str | None]:
         (None, None) se il paziente non ha mai avuto un'igiene registrata.
     """
     col_el = COLONNE['elenco']
-    f_el_id  = col_el['id'].lower()
-    f_el_paz = col_el['id_paziente'].lower()
-
-    db_code_stripped = db_code.strip()
-    piano_ids: set[str] = set()
 
     try:
-        with dbf.Table(_get_elenco_path(), codepage='cp1252') as table:
-            for record in table:
-                try:
-                    paz = str(getattr(record, f_el_paz, '') or '').strip()
-                    if paz == db_code_stripped:
-                        pid = str(getattr(record, f_el_id, '') or '').strip()
-                        if pid:
-                            piano_ids.add(pid)
-                except Exception:
-                    continue
+        elenco = get_dbf_mirror().table_at(_get_elenco_path())
+        rows = elenco.find(col_el['id_paziente'], db_code)
+        piano_ids: set[str] = {pid for pid in elenco.values(col_el['id'], rows) if pid}
     except Exception as e:
         logger.error(f"Errore lettura ELENCO.DBF per paziente {db_code}: {e}")
         return None, None
@@ -140,38 +177,25 @@ def trova_ultimo_igienista(db_code: str) -> tuple[int | None, str | None]:
         return None, None
 
     col_pr = COLONNE['preventivi']
-    f_pr_piano  = col_pr['id_piano'].lower()
-    f_pr_medico = col_pr['medico'].lower()
-    f_pr_data   = col_pr['data_prestazione'].lower()
-    f_pr_stato  = col_pr['stato_prestazione'].lower()
 
     best_date = None
     best_medico_id = None
 
     try:
-        with dbf.Table(_get_prevent_path(), codepage='cp1252') as table:
-            for record in table:
-                try:
-                    stato = int(getattr(record, f_pr_stato, 0) or 0)
-                    if stato != 3:  # 3 = Eseguito (GUARDIA_MAP)
-                        continue
-                    piano = str(getattr(record, f_pr_piano, '') or '').strip()
-                    if piano not in piano_ids:
-                        continue
-                    try:
-                        medico_id = int(getattr(record, f_pr_medico, None) or 0)
-                    except (TypeError, ValueError):
-                        continue
-                    if medico_id not in _IGIENISTI_IDS:
-                        continue
-                    pdata = getattr(record, f_pr_data, None)
-                    if not pdata:
-                        continue
-                    if best_date is None or pdata > best_date:
-                        best_date = pdata
-                        best_medico_id = medico_id
-                except Exception:
-                    continue
+        prevent = get_dbf_mirror().table_at(_get_prevent_path())
+        mask = prevent.numbers(col_pr['stato_prestazione']) == 3  # 3 = Eseguito (GUARDIA_MAP)
+        mask &= np.isin(prevent.numbers(col_pr['medico']), list(_IGIENISTI_IDS))
+        mask &= np.isin(prevent.stripped(col_pr['id_piano']),
+                        [p.encode(DBF_ENCODING, errors='ignore') for p in piano_ids])
+        rows = np.flatnonzero(mask)
+
+        medici = prevent.numbers(col_pr['medico'])[rows].astype(int).tolist()
+        for pdata, medico_id in zip(prevent.values(col_pr['data_prestazione'], rows), medici):
+            if not pdata:
+                continue
+            if best_date is None or pdata > best_date:
+                best_date = pdata
+                best_medico_id = medico_id
     except Exception as e:
         logger.error(f"Errore lettura PREVENT.DBF per paziente {db_code}: {e}")
         return None, None
@@ -250,49 +274,15 @@ def _leggi_occupati_per_giorno(
     path: str,
 ) -> tuple[list[tuple[int, int]], bool]:
     """
-    Legge APPUNTA.DBF e restituisce (occupati, giorno_bloccato).
+    Restituisce (occupati, giorno_bloccato) dall'indice di occupazione di APPUNTA.DBF.
     giorno_bloccato=True se esiste un appuntamento finto tipo "lara no"
     che segnala assenza dell'operatore per tutta la giornata.
     """
-    occupati = []
-    giorno_bloccato = False
-    col = COLONNE['appuntamenti']
-    f_data    = col['data'].lower()
-    f_inizio  = col['ora_inizio'].lower()
-    f_fine    = col['ora_fine'].lower()
-    f_medico  = col['medico'].lower()
-    f_note    = col['note'].lower()
-    f_desc    = col['descrizione'].lower()
-    # Stringa di assenza specifica per ogni operatore (es. "lara no")
-    MARKER_ASSENZA = {2: 'lara no'}
-    marker = MARKER_ASSENZA.get(operatore_id)
-
     try:
-        with dbf.Table(path, codepage='cp1252') as table:
-            for record in table:
-                try:
-                    rec_data = getattr(record, f_data, None)
-                    if not rec_data or rec_data != giorno:
-                        continue
-                    rec_medico = int(getattr(record, f_medico, 0) or 0)
-                    if rec_medico != operatore_id:
-                        continue
-                    if marker:
-                        note = str(getattr(record, f_note, '') or '').lower()
-                        desc = str(getattr(record, f_desc, '') or '').lower()
-                        if marker in note or marker in desc:
-                            giorno_bloccato = True
-                            break
-                    inizio = _dbf_time_to_minutes(float(getattr(record, f_inizio, 0) or 0))
-                    fine   = _dbf_time_to_minutes(float(getattr(record, f_fine,   0) or 0))
-                    if fine > inizio:
-                        occupati.append((inizio, fine))
-                except Exception:
-                    continue
+        return get_occupancy_index(path).occupati(operatore_id, giorno)
     except Exception as e:
         logger.error(f"Errore lettura APPUNTA.DBF: {e}")
-
-    return sorted(occupati), giorno_bloccato
+        return [], False
 
 
 def _slot_liberi_in_finestra(
@@ -332,6 +322,62 @@ def _slot_liberi_in_finestra(
     return slot
 
 
+def _iter_slot_liberi(
+    operatore_id: int,
+    durata_minuti: int,
+    passo: int,
+    giorni_avanti: int,
+    inizio: date,
+    path: str,
+    prenotati: Optional[dict[tuple[int, date], list[tuple[int, int]]]] = None,
+) -> Iterator[tuple[date, int, int]]:
+    """
+    Genera (giorno, inizio_min, fine_min) degli slot liberi in ordine cronologico.
+    `prenotati` aggiunge intervalli gia' assegnati (per operatore e giorno) a quelli di APPUNTA.
+    """
+    orari = ORARI_OPERATORI.get(operatore_id, {})
+
+    for delta in range(giorni_avanti):
+        giorno = inizio + timedelta(days=delta)
+        weekday = giorno.weekday()  # 0=Lun ... 6=Dom
+
+        if _is_festivo(giorno):
+            continue
+
+        finestre = orari.get(weekday)
+        if not finestre:
+            continue  # operatore non lavora questo giorno
+
+        occupati, bloccato = _leggi_occupati_per_giorno(giorno, operatore_id, path)
+        if bloccato:
+            continue  # giorno di assenza (appuntamento finto "lara no" ecc.)
+        if prenotati and prenotati.get((operatore_id, giorno)):
+            occupati = sorted(occupati + prenotati[(operatore_id, giorno)])
+
+        for fin_inizio, fin_fine in finestre:
+            # filtra occupati rilevanti per questa finestra
+            occ_finestra = [
+                (i, f) for i, f in occupati
+                if f > fin_inizio and i < fin_fine
+            ]
+            slots = _slot_liberi_in_finestra(
+                fin_inizio, fin_fine, occ_finestra, durata_minuti, passo
+            )
+            for s_inizio, s_fine in slots:
+                yield giorno, s_inizio, s_fine
+
+
+def _slot_dict(giorno: date, s_inizio: int, s_fine: int, operatore_id: int) -> dict:
+    return {
+        'data':          giorno.isoformat(),
+        'giorno_nome':   giorno.strftime('%A %d/%m/%Y'),
+        'inizio':        _minutes_to_hhmm(s_inizio),
+        'fine':          _minutes_to_hhmm(s_fine),
+        'operatore':     MEDICI.get(operatore_id, f"Operatore {operatore_id}"),
+        'operatore_id':  operatore_id,
+    }
+
+
 def trova_slot_liberi(
     operatore_id: int,
     durata_minuti: int = 60,
@@ -353,51 +399,101 @@ def trova_slot_liberi(
     Returns:
         Lista di dict con chiavi: data, inizio, fine, operatore, operatore_id
     """
-    orari = ORARI_OPERATORI.get(operatore_id)
-    if not orari:
+    if not ORARI_OPERATORI.get(operatore_id):
         logger.warning(f"Nessun orario configurato per operatore {operatore_id}")
         return []
 
     passo = passo_minuti if passo_minuti is not None else durata_minuti
-    nome_operatore = MEDICI.get(operatore_id, f"Operatore {operatore_id}")
-    path = _get_appunta_path()
-    inizio = data_inizio or date.today()
-    risultati = []
+    slots = _iter_slot_liberi(operatore_id, durata_minuti, passo, giorni_avanti,
+                              data_inizio or date.today(), _get_appunta_path())
+    return [_slot_dict(giorno, s_inizio, s_fine, operatore_id)
+            for giorno, s_inizio, s_fine in islice(slots, max(max_slot, 0))]
 
-    for delta in range(giorni_avanti):
-        giorno = inizio + timedelta(days=delta)
-        weekday = giorno.weekday()  # 0=Lun ... 6=Dom
 
-        if _is_festivo(giorno):
-            continue
+def profilo_slot_richiamo(tipo_richiamo: str, operatore_igiene: Optional[int]) -> dict:
+    """
+    Operatori, durata e tipo di appuntamento da proporre per un richiamo.
 
-        finestre = orari.get(weekday)
-        if not finestre:
-            continue  # operatore non lavora questo giorno
+    - tipo_richiamo contiene '2' (igiene): l'ultima igienista (Lara 2 / Anet 5)
+      oppure entrambe, slot da 50 minuti
+    - altri tipi: Dr. Nicola (1), slot da 30 minuti
+    """
+    if '2' in (tipo_richiamo or ''):
+        if operatore_igiene == 2:
+            operatori, suggerito = [2], 'lara'
+        elif operatore_igiene == 5:
+            operatori, suggerito = [5], 'anet'
+        else:
+            operatori, suggerito = [2, 5], 'entrambe'
+        return {'operatori': operatori, 'operatore_suggerito': suggerito, 'tipo': 'igiene', 'durata': 50}
+    return {'operatori': [1], 'operatore_suggerito': 'nicola', 'tipo': 'altro', 'durata': 30}
 
-        occupati, bloccato = _leggi_occupati_per_giorno(giorno, operatore_id, path)
-        if bloccato:
-            continue  # giorno di assenza (appuntamento finto "lara no" ecc.)
 
-        for fin_inizio, fin_fine in finestre:
-            # filtra occupati rilevanti per questa finestra
-            occ_finestra = [
-                (i, f) for i, f in occupati
-                if f > fin_inizio and i < fin_fine
-            ]
-            slots = _slot_liberi_in_finestra(
-                fin_inizio, fin_fine, occ_finestra, durata_minuti, passo
-            )
-            for s_inizio, s_fine in slots:
-                risultati.append({
-                    'data':          giorno.isoformat(),
-                    'giorno_nome':   giorno.strftime('%A %d/%m/%Y'),
-                    'inizio':        _minutes_to_hhmm(s_inizio),
-                    'fine':          _minutes_to_hhmm(s_fine),
-                    'operatore':     nome_operatore,
-                    'operatore_id':  operatore_id,
-                })
-                if len(risultati) >= max_slot:
-                    return risultati
+def pianifica_slot_batch(
+    pazienti: list[dict],
+    giorni_avanti: int = 14,
+    alternative: int = 0,
+    data_inizio: Optional[date] = None,
+) -> list[dict]:
+    """
+    Assegna a ciascun paziente uno slot libero senza conflitti tra i pazienti del lotto.
+
+    Le letture DBF avvengono una sola volta: ultima igienista per tutti i pazienti
+    (build_last_igienista_lookup) e indice di occupazione di APPUNTA. L'assegnazione
+    e' greedy nell'ordine ricevuto (es. piu' in ritardo prima): ogni paziente prende
+    lo slot libero piu' vicino tra i suoi operatori, che viene poi trattato come
+    occupato per i pazienti successivi.
+
+    Args:
+        pazienti:      dict con chiavi 'id' (DB_CODE), 'nome', 'tipo_richiamo'
+        giorni_avanti: orizzonte della ricerca in giorni
+        alternative:   numero di slot alternativi (non riservati) da restituire
+        data_inizio:   primo giorno da controllare (default: oggi)
+
+    Returns:
+        Una voce per paziente, nello stesso ordine: paziente, tipo, operatore_suggerito,
+        ultima_igiene, slot (None se non disponibile) e alternative.
+    """
+    path = _get_appunta_path()
+    inizio = data_inizio or date.today()
+    igienisti = build_last_igienista_lookup() if any('2' in (p.get('tipo_richiamo') or '') for p in pazienti) else {}
+    prenotati: dict[tuple[int, date], list[tuple[int, int]]] = {}
+    risultati = []
+
+    for paziente in pazienti:
+        db_code = str(paziente.get('id') or '').strip()
+        tipo_richiamo = (paziente.get('tipo_richiamo') or '').strip()
+        ultima = igienisti.get(db_code) if '2' in tipo_richiamo else None
+        operatore_igiene = ultima[1] if ultima else None
+        profilo = profilo_slot_richiamo(tipo_richiamo, operatore_igiene)
+        durata = profilo['durata']
+
+        candidati = []
+        for op_id in profilo['operatori']:
+            slots = _iter_slot_liberi(op_id, durata, durata, giorni_avanti, inizio, path, prenotati)
+            candidati.extend((giorno, s_inizio, s_fine, op_id) for giorno, s_inizio, s_fine in islice(slots, alternative + 1))
+        candidati.sort(key=lambda c: (c[0], c[1]))
+
+        slot = None
+        if candidati:
+            giorno, s_inizio, s_fine, op_id = candidati[0]
+            prenotati.setdefault((op_id, giorno), []).append((s_inizio, s_fine))
+            slot = _slot_dict(giorno, s_inizio, s_fine, op_id)
+
+        risultati.append({
+            'paziente': {
+                'db_code': db_code,
+                'nome': (paziente.get('nome') or '').strip(),
+                'tipo_richiamo': tipo_richiamo,
+            },
+            'tipo': profilo['tipo'],
+            'operatore_suggerito': profilo['operatore_suggerito'],
+            'ultima_igiene': {
+                'operatore_id': operatore_igiene,
+                'data': ultima[0].strftime('%Y-%m-%d') if ultima else None,
+            } if profilo['tipo'] == 'igiene' else None,
+            'slot': slot,
+            'alternative': [_slot_dict(*c) for c in candidati[1:alternative + 1]],
+        })
 
     return risultati
@@ -5,47 +5,124 @@
 Gestisce lo stato corrente dei record DBF per il sistema di sincronizzazione incrementale:
 - Creazione snapshot iniziale delle tabelle DBF monitorate
 - Aggiornamento snapshot in tempo reale
-- Persistenza su disco per recovery automatico
-- Hash-based change detection per performance
+- Persistenza su disco per recovery automatico (SnapshotStore: base binaria
+  compressa + delta dei record cambiati, caricata solo quando serve)
+- Change detection sui byte grezzi dei record: lo snapshot conserva l'immagine
+  del file (generazione del DBF mirror) e il confronto avviene per offset sugli
+  hash per record, decodificando solo i record cambiati (nuovi, modificati,
+  cancellati)
 
 Author: Claude Code Studio Architect
 Version: 2.0.0
 """
 
-import os
-import json
 import hashlib
 import logging
 import threading
+import time
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Set
+from typing import Callable, Dict, List, Any, Optional, Set
 from pathlib import Path
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+
+import numpy as np
 
 from core.config_manager import get_config
 from core.constants_v2 import DBF_TABLES, get_dbf_table_info
-from utils.dbf_utils import get_optimized_reader
+from services.dbf_mirror import DbfMirror, MirrorTable, get_dbf_mirror
+from services.snapshot_store import SnapshotStore
 
 logger = logging.getLogger(__name__)
 
-@dataclass
-class SnapshotRecord:
-    """Record singolo nello snapshot."""
-    record_id: str
-    data: Dict[str, Any]
-    hash: str
-    timestamp: str
+# Tabelle con identità di record stabile (vedi _generate_record_id): un record
+# riscritto allo stesso offset con un'altra identità è un record nuovo
+_KEYED_TABLES = ('APPUNTA', 'pazienti')
+
+# Moltiplicatore per mescolare posizione della riga e hash nella firma del contenuto
+_ROW_MIX = np.uint64(0x9E3779B97F4A7C15)
 
 @dataclass
 class TableSnapshot:
     """Snapshot completo di una tabella DBF."""
     table_name: str
-    records: Dict[str, SnapshotRecord]  # record_id -> SnapshotRecord
     file_path: str
     file_hash: str
     last_modified: str
     record_count: int
     created_at: str
+    image: Optional[MirrorTable] = None  # immagine del file (None = non ancora caricata da disco)
+
+
+def image_records(image: MirrorTable, rows: np.ndarray) -> List[Dict[str, Any]]:
+    """Record decodificati come dict {CAMPO: valore} con le date in formato ISO."""
+    records = image.records(rows)
+    for record in records:
+        for name, value in record.items():
+            if hasattr(value, 'isoformat'):
+                record[name] = value.isoformat()
+    return records
+
+
+def image_signature(image: MirrorTable) -> str:
+    """Firma del contenuto (numero record + hash per record mescolati con la posizione)."""
+    n = len(image)
+    mixed = image.hashes ^ (np.arange(n, dtype=np.uint64) * _ROW_MIX)
+    return f"{n:x}-{int(mixed.sum(dtype=np.uint64)):016x}"
+
+
+def diff_images(old: MirrorTable,
+                new: MirrorTable,
+                record_id: Optional[Callable[[Dict[str, Any]], str]] = None) -> List[Dict[str, Any]]:
+    """
+    Confronta due immagini dello stesso DBF e restituisce le modifiche in ordine di file.
+
+    I record sono confrontati per offset tramite gli hash dei byte grezzi (flag di
+    cancellazione compreso) e vengono decodificati solo quelli cambiati. Se il file
+    si è accorciato (pack) o ha cambiato struttura gli offset non sono più
+    confrontabili e i record vengono abbinati per contenuto. Con `record_id` un record riscritto con un'altra
+    identità produce 'deleted' + 'new', e un record cancellato e riscritto altrove
+    con la stessa identità produce 'modified'.
+
+    Returns:
+        {'type': 'new', 'new_data'}, {'type': 'modified', 'old_data', 'new_data'},
+        {'type': 'deleted', 'old_data'}
+    """
+    n_old, n_new = len(old), len(new)
+    old_live, new_live = ~old.deleted, ~new.deleted
+
+    if n_new >= n_old and old.header.layout == new.header.layout:
+        changed = np.flatnonzero(old.hashes != new.hashes[:n_old])
+        paired = changed[old_live[changed] & new_live[changed]]
+        removed = changed[old_live[changed] & ~new_live[changed]]
+        appended = np.arange(n_old, n_new)
+        added = np.concatenate([changed[~old_live[changed] & new_live[changed]],
+                                appended[new_live[appended]]])
+    else:
+        old_rows, new_rows = np.flatnonzero(old_live), np.flatnonzero(new_live)
+        paired = np.empty(0, dtype=np.int64)
+        removed = old_rows[~np.isin(old.hashes[old_rows], new.hashes[new_rows])]
+        added = new_rows[~np.isin(new.hashes[new_rows], old.hashes[old_rows])]
+
+    events = []  # (riga, evento)
+    for row, before, after in zip(paired.tolist(), image_records(old, paired), image_records(new, paired)):
+        if record_id is not None and record_id(before) != record_id(after):
+            events.append((row, {'type': 'deleted', 'old_data': before}))
+            events.append((row, {'type': 'new', 'new_data': after}))
+        else:
+            events.append((row, {'type': 'modified', 'old_data': before, 'new_data': after}))
+
+    gone = dict(zip(removed.tolist(), image_records(old, removed)))
+    by_id = {record_id(data): row for row, data in gone.items()} if record_id is not None else {}
+    for row, data in zip(added.tolist(), image_records(new, added)):
+        previous = by_id.pop(record_id(data), None) if by_id else None
+        if previous is not None:
+            events.append((row, {'type': 'modified', 'old_data': gone.pop(previous), 'new_data': data}))
+        else:
+            events.append((row, {'type': 'new', 'new_data': data}))
+    events.extend((row, {'type': 'deleted', 'old_data': data}) for row, data in gone.items())
+
+    events.sort(key=lambda item: item[0])
+    return [event for _, event in events]
 
 class SnapshotManager:
     """
@@ -59,7 +136,7 @@ class SnapshotManager:
     - Thread-safe operations
     """
     
-    def __init__(self, snapshot_dir: str = "data/snapshots"):
+    def __init__(self, snapshot_dir: str = "data/snapshots", mirror: Optional[DbfMirror] = None):
         self.config = get_config()
         self.snapshot_dir = Path(snapshot_dir)
         self.snapshot_dir.mkdir(parents=True, exist_ok=True)
@@ -70,8 +147,14 @@ class SnapshotManager:
         # Cache snapshot in memoria
         self.snapshots: Dict[str, TableSnapshot] = {}
         
-        # DBF reader ottimizzato
-        self.dbf_reader = get_optimized_reader()
+        # Immagini dei file lette dal DBF mirror
+        self.mirror = mirror or get_dbf_mirror()
+        
+        # Persistenza binaria (base + delta per tabella)
+        self.store = SnapshotStore(str(self.snapshot_dir))
+        
+        # Immagine confrontata dall'ultima get_changes, adottata da update_snapshot
+        self._pending: Dict[str, MirrorTable] = {}
         
         # Tabelle monitorate (dinamiche)
         self.monitored_tables: Set[str] = set()
@@ -177,8 +260,10 @@ class SnapshotManager:
                     # Se non esiste snapshot, usa ConfigManager
                     file_path = self.config.get_dbf_path(table_name)
                 
-                # Ricrea snapshot con file_path
-                success = self._create_table_snapshot(table_name, file_path)
+                # Adotta l'immagine già confrontata da get_changes: le scritture
+                # arrivate nel frattempo restano da segnalare al prossimo confronto
+                success = self._create_table_snapshot(table_name, file_path,
+                                                      image=self._pending.pop(table_name, None))
                 
                 if success:
                     # logger.info(f"Snapshot updated for {table_name}")
@@ -239,11 +324,9 @@ class SnapshotManager:
             
             for table in tables_to_load:
                 try:
-                    snapshot_file = self.snapshot_dir / f"{table}_snapshot.json"
-                    
-                    if snapshot_file.exists():
+                    if self.store.exists(table):
                         # logger.info(f"Loading existing snapshot for {table}")
-                        success = self._load_table_snapshot(table, snapshot_file)
+                        success = self._load_table_snapshot(table)
                         results[table] = success
                         
                         if success:
@@ -291,6 +374,7 @@ class SnapshotManager:
             A list of dictionaries, each representing a change.
             For new records: {'type': 'new', 'new_data': <record_data>}
             For modified records: {'type': 'modified', 'old_data': <old_record_data>, 'new_data': <new_record_data>}
+            For deleted records: {'type': 'deleted', 'old_data': <old_record_data>}
         """
         #logger.info(f"SNAPSHOT_MANAGER.get_changes: Richiesta per tabella: {table_name}") # NEW LOG
         with self.lock:
@@ -300,30 +384,28 @@ class SnapshotManager:
                 return []
 
             try:
-                current_records_data = self._read_dbf_records(table_name, old_snapshot.file_path)
-                if not current_records_data:
+                self.mirror.invalidate(old_snapshot.file_path)
+                current = self.mirror.table_at(old_snapshot.file_path)
+                self._pending[table_name] = current
+
+                if old_snapshot.image is None:
+                    # Snapshot caricato da disco: l'immagine si ricostruisce al primo confronto
+                    old_snapshot.image = self.store.load_image(table_name, old_snapshot.file_path)
+                if old_snapshot.image is None:
+                    logger.info(f"SNAPSHOT_MANAGER.get_changes: baseline per {table_name} dall'immagine corrente.")
+                    return []
+                if current is old_snapshot.image:
                     return []
 
-                changes = []
-                old_records = old_snapshot.records
-
-                for record_data in current_records_data:
-                    record_id = self._generate_record_id(record_data, table_name)
-                    record_hash = self._calculate_record_hash(record_data)
-
-                    old_record = old_records.get(record_id)
-
-                    if not old_record:
-                        # New record
-                        changes.append({'type': 'new', 'new_data': record_data})
-                    elif old_record.hash != record_hash:
-                        # Modified record
-                        changes.append({
-                            'type': 'modified',
-                            'old_data': old_record.data,
-                            'new_data': record_data
-                        })
-                
+                start = time.perf_counter()
+                keyed = table_name in _KEYED_TABLES
+                changes = diff_images(
+                    old_snapshot.image, current,
+                    record_id=(lambda data: self._generate_record_id(data, table_name)) if keyed else None,
+                )
+                logger.debug(f"Confronto {table_name}: {len(changes)} modifiche su {len(current)} record "
+                             f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+
                 if changes:
                     logger.info(f"Detected {len(changes)} changes for table {table_name}.")
 
@@ -344,6 +426,7 @@ class SnapshotManager:
             status = {
                 'total_tables': len(self.monitored_tables),
                 'snapshots_loaded': len(self.snapshots),
+                'store': self.store.get_stats(),
                 'tables': {}
             }
             
@@ -366,43 +449,11 @@ class SnapshotManager:
             
             return status
     
-    def _read_dbf_records(self, table_name: str, file_path: str = None) -> List[Dict[str, Any]]:
-        """Legge tutti i record da un file DBF generico."""
-        try:
-            from dbfread import DBF
-
-            if file_path is None:
-                raise ValueError(f"file_path is required for table {table_name}")
-            
-            if not os.path.exists(file_path):
-                logger.error(f"DBF file not found: {file_path}")
-                return []
-            
-            dbf = DBF(file_path, encoding='latin-1')
-            records = []
-
-            for record in dbf:
-                try:
-                    record_dict = {}
-                    for field, value in record.items():
-                        if hasattr(value, 'isoformat'):
-                            record_dict[field] = value.isoformat()
-                        else:
-                            record_dict[field] = value
-                    records.append(record_dict)
-                except Exception as e:
-                    logger.warning(f"Skipping record in {table_name} due to processing error: {e} - Record: {record}")
-
-            logger.debug(f"Read {len(records)} records from {os.path.basename(file_path)}.")
-            return records
-            
-        except Exception as e:
-            logger.error(f"Error reading generic DBF {os.path.basename(file_path)}: {e}", exc_info=True)
-            return []
-    
-    def _create_table_snapshot(self, table_name: str, file_path: str = None) -> bool:
+    def _create_table_snapshot(self, table_name: str, file_path: str = None,
+                               image: Optional[MirrorTable] = None) -> bool:
         """
-        Crea snapshot completo di una tabella DBF.
+        Crea snapshot completo di una tabella DBF (dall'immagine indicata o da
+        quella corrente del mirror).
         """
         #logger.debug(f"SNAPSHOT: Inizio creazione snapshot per {table_name} da file: {file_path}") # Downgraded to DEBUG
         try:
@@ -414,40 +465,18 @@ class SnapshotManager:
                 logger.error(f"SNAPSHOT: file_path è obbligatorio per la tabella {table_name}")
                 raise ValueError(f"file_path is required for table {table_name}")
             
-            # Calcola hash del file
-            file_hash = self._calculate_file_hash(file_path)
-            if not file_hash: # NEW CHECK
-                logger.error(f"SNAPSHOT: Impossibile calcolare hash del file {file_path}")
-                return False
-
-            file_mtime = datetime.fromtimestamp(os.path.getmtime(file_path)).isoformat()
-            
-            # Leggi i record dal file DBF
-            records_data = self._read_dbf_records(table_name, file_path)
-            #logger.debug(f"SNAPSHOT: Letti {len(records_data)} record da {file_path}") # Downgraded to DEBUG
-            
-            # Crea snapshot records
-            snapshot_records = {}
-            for record_data in records_data:
-                record_id = self._generate_record_id(record_data, table_name)
-                record_hash = self._calculate_record_hash(record_data)
-                
-                snapshot_records[record_id] = SnapshotRecord(
-                    record_id=record_id,
-                    data=record_data,
-                    hash=record_hash,
-                    timestamp=datetime.now().isoformat()
-                )
+            if image is None:
+                image = self.mirror.table_at(file_path)
             
             # Crea snapshot
             snapshot = TableSnapshot(
                 table_name=table_name,
-                records=snapshot_records,
                 file_path=file_path,
-                file_hash=file_hash,
-                last_modified=file_mtime,
-                record_count=len(snapshot_records),
-                created_at=datetime.now().isoformat()
+                file_hash=image_signature(image),
+                last_modified=datetime.fromtimestamp(image.stat_signature[0] / 1e9).isoformat(),
+                record_count=int(image.live_mask().sum()),
+                created_at=datetime.now().isoformat(),
+                image=image
             )
             
             # Salva in memoria e su disco
@@ -461,29 +490,24 @@ class SnapshotManager:
             logger.error(f"SNAPSHOT: Errore durante la creazione dello snapshot per {table_name}: {e}", exc_info=True) # Added exc_info
             return False
     
-    def _load_table_snapshot(self, table_name: str, snapshot_file: Path) -> bool:
+    def _load_table_snapshot(self, table_name: str) -> bool:
         """
-        Carica snapshot da file JSON.
+        Carica i metadati dello snapshot persistito; l'immagine del file viene
+        ricostruita solo al primo confronto (get_changes).
         
         Args:
             table_name: Nome tabella
-            snapshot_file: Path al file snapshot
             
         Returns:
             True se caricamento riuscito
         """
         try:
-            with open(snapshot_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Ricostruisci snapshot
-            records = {}
-            for record_id, record_data in data.get('records', {}).items():
-                records[record_id] = SnapshotRecord(**record_data)
+            data = self.store.load_meta(table_name)
+            if data is None:
+                return False
             
             snapshot = TableSnapshot(
                 table_name=data['table_name'],
-                records=records,
                 file_path=data['file_path'],
                 file_hash=data['file_hash'],
                 last_modified=data['last_modified'],
@@ -500,7 +524,7 @@ class SnapshotManager:
     
     def _save_table_snapshot(self, table_name: str) -> bool:
         """
-        Salva snapshot su disco.
+        Salva snapshot su disco (delta dei record cambiati rispetto all'ultimo salvataggio).
         
         Args:
             table_name: Nome tabella
@@ -510,26 +534,18 @@ class SnapshotManager:
         """
         try:
             snapshot = self.snapshots.get(table_name)
-            if not snapshot:
+            if not snapshot or snapshot.image is None:
                 return False
             
-            snapshot_file = self.snapshot_dir / f"{table_name}_snapshot.json"
-            
-            # Converti snapshot in dict per JSON serialization
-            data = {
+            meta = {
                 'table_name': snapshot.table_name,
-                'records': {rid: asdict(record) for rid, record in snapshot.records.items()},
                 'file_path': snapshot.file_path,
                 'file_hash': snapshot.file_hash,
                 'last_modified': snapshot.last_modified,
                 'record_count': snapshot.record_count,
                 'created_at': snapshot.created_at
             }
-            
-            with open(snapshot_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
-            
-            return True
+            return self.store.save(table_name, meta, snapshot.image)
             
         except Exception as e:
             logger.error(f"Error saving snapshot for {table_name}: {e}")
@@ -605,40 +621,6 @@ class SnapshotManager:
             data_str = str(sorted(record_data.items()))
             return hashlib.md5(data_str.encode()).hexdigest()[:16]
     
-    def _calculate_record_hash(self, record_data: Dict[str, Any]) -> str:
-        """
-        Calcola hash di un record per change detection.
-        
-        Args:
-            record_data: Dati del record
-            
-        Returns:
-            Hash MD5 del record
-        """
-        # Ordina i campi per hash consistente
-        sorted_data = sorted(record_data.items())
-        data_str = str(sorted_data)
-        return hashlib.md5(data_str.encode()).hexdigest()
-    
-    def _calculate_file_hash(self, file_path: str) -> str:
-        """
-        Calcola hash di un file DBF.
-        
-        Args:
-            file_path: Path al file
-            
-        Returns:
-            Hash MD5 del file
-        """
-        try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except Exception as e:
-            logger.error(f"Error calculating file hash for {file_path}: {e}")
-            return ""
 
 
 # Singleton instance
@@ -0,0 +1,252 @@
+"""
+💾 Snapshot Store per StudioDimaAI Server V2
+============================================
+
+Persistenza binaria degli snapshot del SnapshotManager:
+
+- Una base compressa (.npz) per tabella con gli hash a 64 bit per record
+  (indicizzati per offset, quindi già ordinati per id), i flag di cancellazione,
+  le colonne decodificate dell'immagine e i metadati dello snapshot
+- Gli aggiornamenti vengono aggiunti come segmenti delta versionati con i soli
+  record cambiati; oltre `max_deltas` segmenti si riscrive la base
+- Lettura lazy: i metadati si leggono senza toccare le colonne e l'immagine
+  viene ricostruita solo quando serve un confronto
+
+Sostituisce i vecchi `{tabella}_snapshot.json` con i dati completi di ogni record.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.dbf_mirror import MirrorTable, header_from_meta, header_meta
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+
+class SnapshotStore:
+    """
+    Base + delta per tabella in `store_dir`.
+
+    Il contenuto su disco di ogni tabella corrisponde sempre ad una immagine
+    (MirrorTable): i delta sono calcolati rispetto all'ultima immagine scritta,
+    confrontando gli hash per offset come fa il DBF mirror.
+    """
+
+    def __init__(self, store_dir: str = "data/snapshots", max_deltas: int = 16):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.max_deltas = max_deltas
+        self._lock = threading.Lock()
+        # tabella -> (id base, numero delta, immagine scritta)
+        self._state: Dict[str, Tuple[str, int, MirrorTable]] = {}
+        self._stats = {'base_writes': 0, 'delta_writes': 0, 'rows_written': 0, 'loads': 0, 'write_errors': 0}
+
+    # ------------------------------------------------------------------
+    # API pubblica
+    # ------------------------------------------------------------------
+
+    def exists(self, table_name: str) -> bool:
+        return self._base_file(table_name).exists()
+
+    def save(self, table_name: str, meta: Dict[str, Any], image: MirrorTable) -> bool:
+        """Persiste lo snapshot: delta dei record cambiati se possibile, altrimenti nuova base."""
+        with self._lock:
+            try:
+                state = self._state.get(table_name) or self._adopt(table_name, meta, image)
+                if state is not None and state[2] is image:
+                    return True
+                if state is None or state[1] >= self.max_deltas or not self._appendable(state[2], image):
+                    self._write_base(table_name, meta, image)
+                else:
+                    self._write_delta(table_name, meta, image, state)
+                return True
+            except Exception as e:
+                self._stats['write_errors'] += 1
+                logger.error(f"Salvataggio snapshot {table_name} fallito: {e}")
+                return False
+
+    def load_meta(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Metadati dell'ultimo snapshot persistito, senza caricare le colonne."""
+        try:
+            files = self._segments(table_name)
+            return self._read_meta(files[-1]) if files else None
+        except Exception as e:
+            logger.warning(f"Metadati snapshot {table_name} non leggibili: {e}")
+            return None
+
+    def load_image(self, table_name: str, file_path: str) -> Optional[MirrorTable]:
+        """Ricostruisce l'immagine persistita applicando i delta alla base."""
+        with self._lock:
+            try:
+                files = self._segments(table_name)
+                if not files:
+                    return None
+                with np.load(files[0], allow_pickle=False) as data:
+                    meta = json.loads(str(data['_meta']))
+                    header = header_from_meta(meta['header'])
+                    columns = {name[4:]: data[name] for name in data.files if name.startswith('col_')}
+                    deleted, hashes = data['_deleted'], data['_hashes']
+
+                for delta in files[1:]:
+                    with np.load(delta, allow_pickle=False) as data:
+                        meta = json.loads(str(data['_meta']))
+                        rows, length = data['_rows'], int(meta['length'])
+                        columns = {name: self._patched(column, length, rows, data[f"col_{name}"])
+                                   for name, column in columns.items()}
+                        deleted = self._patched(deleted, length, rows, data['_deleted'])
+                        hashes = self._patched(hashes, length, rows, data['_hashes'])
+
+                image = MirrorTable(Path(file_path).stem.upper(), file_path, header, columns, deleted, hashes,
+                                    tuple(meta['stat_signature']), meta.get('generation', 1))
+                self._state[table_name] = (meta['base_id'], len(files) - 1, image)
+                self._stats['loads'] += 1
+                return image
+            except Exception as e:
+                logger.warning(f"Snapshot persistito {table_name} non leggibile: {e}")
+                return None
+
+    def remove(self, table_name: str) -> None:
+        with self._lock:
+            self._state.pop(table_name, None)
+            for path in self._segments(table_name, all_bases=True):
+                path.unlink(missing_ok=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                'disk_mb': round(sum(p.stat().st_size for p in self.store_dir.glob('*.npz')) / 1024 / 1024, 2),
+            }
+
+    # ------------------------------------------------------------------
+    # Scrittura
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _appendable(previous: MirrorTable, image: MirrorTable) -> bool:
+        """Un delta basta se il file non si è accorciato e la struttura non è cambiata."""
+        return len(image) >= len(previous) and previous.header.layout == image.header.layout
+
+    def _adopt(self, table_name: str, meta: Dict[str, Any],
+               image: MirrorTable) -> Optional[Tuple[str, int, MirrorTable]]:
+        """
+        Dopo un riavvio: se su disco c'è già lo stesso contenuto (stessa firma e
+        struttura) l'immagine corrente ne prende il posto senza riscrivere nulla.
+        """
+        try:
+            files = self._segments(table_name)
+            stored = self._read_meta(files[-1]) if files else None
+        except Exception:
+            return None
+        if stored is None:
+            return None
+        if (stored.get('file_hash') != meta.get('file_hash')
+                or stored.get('header') != header_meta(image.header)):
+            return None
+        state = self._state[table_name] = (stored['base_id'], len(files) - 1, image)
+        return state
+
+    def _write_base(self, table_name: str, meta: Dict[str, Any], image: MirrorTable) -> None:
+        base_id = uuid.uuid4().hex
+        arrays = {f"col_{name}": column for name, column in image.columns.items()}
+        self._write(self._base_file(table_name), self._meta(meta, image, base_id),
+                    _deleted=image.deleted, _hashes=image.hashes, **arrays)
+
+        for path in self._segments(table_name, all_bases=True)[1:]:
+            path.unlink(missing_ok=True)
+        legacy = self.store_dir / f"{table_name}_snapshot.json"
+        if legacy.exists():
+            legacy.unlink()
+            logger.info(f"Snapshot JSON {legacy.name} sostituito dal formato binario")
+
+        self._state[table_name] = (base_id, 0, image)
+        self._stats['base_writes'] += 1
+        self._stats['rows_written'] += len(image)
+
+    def _write_delta(self, table_name: str, meta: Dict[str, Any], image: MirrorTable,
+                     state: Tuple[str, int, MirrorTable]) -> None:
+        base_id, count, previous = state
+        common = len(previous)
+        changed = np.flatnonzero(previous.hashes != image.hashes[:common])
+        rows = np.concatenate([changed, np.arange(common, len(image))]).astype(np.int64)
+
+        arrays = {f"col_{name}": column[rows] for name, column in image.columns.items()}
+        self._write(self._delta_file(table_name, count + 1), self._meta(meta, image, base_id),
+                    _rows=rows, _deleted=image.deleted[rows], _hashes=image.hashes[rows], **arrays)
+
+        self._state[table_name] = (base_id, count + 1, image)
+        self._stats['delta_writes'] += 1
+        self._stats['rows_written'] += int(rows.size)
+
+    @staticmethod
+    def _meta(meta: Dict[str, Any], image: MirrorTable, base_id: str) -> Dict[str, Any]:
+        return {
+            **meta,
+            'format': FORMAT_VERSION,
+            'base_id': base_id,
+            'length': len(image),
+            'generation': image.generation,
+            'stat_signature': list(image.stat_signature),
+            'header': header_meta(image.header),
+        }
+
+    @staticmethod
+    def _write(target: Path, meta: Dict[str, Any], **arrays) -> None:
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, _meta=np.array(json.dumps(meta)), **arrays)
+        tmp = target.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp, target)
+
+    # ------------------------------------------------------------------
+    # Lettura
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _patched(column: np.ndarray, length: int, rows: np.ndarray, values: np.ndarray) -> np.ndarray:
+        common = min(len(column), length)
+        patched = np.empty(length, dtype=column.dtype)
+        patched[:common] = column[:common]
+        patched[rows] = values
+        return patched
+
+    @staticmethod
+    def _read_meta(path: Path) -> Dict[str, Any]:
+        with np.load(path, allow_pickle=False) as data:
+            return json.loads(str(data['_meta']))
+
+    def _base_file(self, table_name: str) -> Path:
+        return self.store_dir / f"{table_name}.base.npz"
+
+    def _delta_file(self, table_name: str, number: int) -> Path:
+        return self.store_dir / f"{table_name}.delta-{number:06d}.npz"
+
+    def _segments(self, table_name: str, all_bases: bool = False) -> List[Path]:
+        """
+        Base seguita dai delta in ordine di versione; i delta di basi precedenti
+        (scrittura interrotta) vengono ignorati salvo `all_bases`.
+        """
+        base = self._base_file(table_name)
+        if not base.exists():
+            return sorted(self.store_dir.glob(f"{table_name}.delta-*.npz")) if all_bases else []
+        deltas = sorted(self.store_dir.glob(f"{table_name}.delta-*.npz"))
+        if all_bases:
+            return [base] + deltas
+        base_id = self._read_meta(base)['base_id']
+        valid = []
+        for number, path in enumerate(deltas, start=1):
+            if path != self._delta_file(table_name, number) or self._read_meta(path).get('base_id') != base_id:
+                break
+            valid.append(path)
+        return [base] + valid
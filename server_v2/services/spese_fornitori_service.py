@@ -1,6 +1,7 @@
 """Spese Fornitori Service for StudioDimaAI Server V2."""
 import os
 import dbf
+import numpy as np
 import pandas as pd
 import logging
 from typing import Dict, Any, Optional, List
@@ -10,6 +11,7 @@ from utils.dbf_utils import clean_dbf_value, safe_get_dbf_field
 from core.config_manager import get_config
 from datetime import datetime
 from .classificazioni_service import ClassificazioniService
+from .spese_index import SpeseIndex, get_spese_index, parse_supplier_ids
 
 # Constants for spese DBF fields (from server v1 constants)
 SPESE_FIELDS = {
@@ -59,120 +61,33 @@ class SpeseFornitoriService(BaseService):
                     'has_prev': False
                 }
             
-            # Extract filters
-            fornitore_id = filters.get('codice_fornitore') if filters else None
-            anno = filters.get('anno') if filters else None
-            conto_id = filters.get('conto_id') if filters else None
-            branca_id = filters.get('branca_id') if filters else None
-            sottoconto_id = filters.get('sottoconto_id') if filters else None
-            
-            # Pre-fetch suppliers for category/branch/subaccount filter if needed
-            allowed_suppliers = None
-            if conto_id or branca_id or sottoconto_id:
-                try:
-                    class_service = ClassificazioniService()
-                    allowed_suppliers = set(class_service.get_supplier_ids_by_classification(
-                        contoid=conto_id, 
-                        brancaid=branca_id, 
-                        sottocontoid=sottoconto_id
-                    ))
-                    self.logger.info(f"Filtering by Classification: {len(allowed_suppliers)} suppliers found.")
-                except Exception as e:
-                    self.logger.error(f"Error fetching suppliers for classification: {e}")
-                    allowed_suppliers = set()
-
-            # Load Suppliers Mapping from FORNITOR.DBF
-            supplier_names = {}
-            try:
-                fornitori_path = self._get_fornitori_dbf_path()
-                if os.path.exists(fornitori_path):
-                     with dbf.Table(fornitori_path, codepage='cp1252') as table_forn:
-                        for record in table_forn:
-                            f_code = str(clean_dbf_value(getattr(record, 'db_code', ''))).strip()
-                            f_name = clean_dbf_value(getattr(record, 'db_fonome', ''))
-                            if f_code:
-                                supplier_names[f_code] = f_name
-            except Exception as e:
-                self.logger.error(f"Error loading suppliers mapping: {e}")
-
-            # Read DBF file
-            spese_raw = []
-            with dbf.Table(spese_path, codepage='cp1252') as table:
-                for record in table:
-                    # Skip invalid records
-                    if not getattr(record, 'db_code', None):
-                        continue
-                    
-                    # Filter by Supplier if provided
-                    supplier_code = clean_dbf_value(getattr(record, 'db_spfocod', None))
-                    supplier_code_str = str(supplier_code).strip()
-                    
-                    if fornitore_id:
-                        # Handle multi-id selection (comma separated)
-                        target_ids = [t.strip() for t in str(fornitore_id).split(',')]
-                        if supplier_code_str not in target_ids:
-                            continue
-                    
-                    # Filter by Classification (Conto/Branca/Sottoconto) if provided
-                    if allowed_suppliers is not None:
-                        if supplier_code_str not in allowed_suppliers:
-                            continue
-
-                    # Filter by Year if provided (optimize early filtering)
-                    if anno:
-                        data_spesa = getattr(record, 'db_spdata', None)
-                        if not data_spesa:
-                            continue
-                        
-                        try:
-                            if isinstance(data_spesa, datetime):
-                                spesa_year = data_spesa.year
-                            else:
-                                spesa_year = pd.to_datetime(data_spesa).year
-                                
-                            if spesa_year != int(anno):
-                                continue
-                        except:
-                            continue
-
-                    # Build spesa record using correct field names
-                    supplier_name = supplier_names.get(supplier_code_str, supplier_code_str) # Default to code if name not found
-                    
-                    spesa = {
-                        'id': clean_dbf_value(getattr(record, 'db_code', None)),
-                        'codice_fornitore': supplier_code_str,
-                        'nome_fornitore': supplier_name,
-                        'data_spesa': clean_dbf_value(getattr(record, 'db_spdata', None)),
-                        'numero_documento': clean_dbf_value(getattr(record, 'db_spnumer', None)),
-                        'descrizione': clean_dbf_value(getattr(record, 'db_spdescr', None)),
-                        'costo_netto': self._safe_float(getattr(record, 'db_spcosto', None)),
-                        'costo_iva': self._safe_float(getattr(record, 'db_spcoiva', None)),
-                        'note': clean_dbf_value(getattr(record, 'db_note', None))
-                    }
-                    
-                    # Calculate total
-                    spesa['totale'] = (spesa['costo_netto'] or 0) + (spesa['costo_iva'] or 0)
-                    
-                    spese_raw.append(spesa)
-            
-            # Apply additional filters (date range, search)
-            if filters:
-                spese_raw = self._apply_filters(spese_raw, filters)
-            
-            # Sort: Name ASC first, then Date DESC
-            spese_raw.sort(key=lambda x: (x.get('nome_fornitore') or '').lower())
-            spese_raw.sort(key=lambda x: x.get('data_spesa') or '', reverse=True)
+            filters = filters or {}
+            date_from = date_to = None
+            if 'data_inizio' in filters and 'data_fine' in filters:
+                date_from = pd.to_datetime(filters['data_inizio']).date()
+                date_to = pd.to_datetime(filters['data_fine']).date()
+
+            # Query sull'indice (anno = partizione, fornitori/classificazione = lookup)
+            index = self._get_spese_index(spese_path)
+            snapshot, positions = index.select(
+                anno=filters.get('anno'),
+                supplier_ids=parse_supplier_ids(filters.get('codice_fornitore')),
+                allowed_suppliers=self._classification_filter(
+                    filters.get('conto_id'), filters.get('branca_id'), filters.get('sottoconto_id')),
+                date_from=date_from,
+                date_to=date_to,
+                search=filters.get('search'),
+            )
             
             # Calculate pagination
-            total = len(spese_raw)
+            total = int(positions.size)
             per_page = int(per_page)
             if per_page <= 0: per_page = 10
             
             pages = (total + per_page - 1) // per_page
-            start_idx = (page - 1) * per_page
-            end_idx = start_idx + per_page
             
-            spese_page = spese_raw[start_idx:end_idx]
+            # Sort (data desc, nome asc) già applicato dall'indice: si decodifica solo la pagina
+            spese_page = index.page(snapshot, positions, page, per_page)
             
             return {
                 'spese': spese_page,
@@ -195,80 +110,25 @@ class SpeseFornitoriService(BaseService):
         The list is filtered by classification if parameters are provided.
         """
         try:
-            # 1. Get filtered supplier IDs from Classification
-            allowed_suppliers = None
-            if conto_id or branca_id or sottoconto_id:
-                try:
-                    class_service = ClassificazioniService()
-                    allowed_suppliers = set(class_service.get_supplier_ids_by_classification(
-                        contoid=conto_id, 
-                        brancaid=branca_id, 
-                        sottocontoid=sottoconto_id
-                    ))
-                except Exception as e:
-                    self.logger.error(f"Error fetching suppliers for classification: {e}")
-                    allowed_suppliers = set()
-            
-            # 2. Load Supplier Names map
-            supplier_names = {}
-            try:
-                fornitori_path = self._get_fornitori_dbf_path()
-                if os.path.exists(fornitori_path):
-                     with dbf.Table(fornitori_path, codepage='cp1252') as table_forn:
-                        for record in table_forn:
-                            f_code = str(clean_dbf_value(getattr(record, 'db_code', ''))).strip()
-                            f_name = clean_dbf_value(getattr(record, 'db_fonome', ''))
-                            if f_code:
-                                supplier_names[f_code] = f_name
-            except Exception as e:
-                self.logger.error(f"Error loading suppliers mapping: {e}")
-
-            # 3. Read Spese DBF and collect unique supplier IDs for the year
-            active_supplier_ids = set()
             spese_path = self._get_spese_dbf_path()
             
             if not os.path.exists(spese_path):
                  return []
-                 
-            with dbf.Table(spese_path, codepage='cp1252') as table:
-                for record in table:
-                    # Filter by Year first
-                    if anno:
-                        data_spesa = getattr(record, 'db_spdata', None)
-                        if not data_spesa:
-                            continue
-                        try:
-                             if isinstance(data_spesa, datetime):
-                                spesa_year = data_spesa.year
-                             else:
-                                spesa_year = pd.to_datetime(data_spesa).year
-                             if spesa_year != int(anno):
-                                continue
-                        except:
-                            continue
-                            
-                    # Get Supplier Code
-                    supplier_code = clean_dbf_value(getattr(record, 'db_spfocod', None))
-                    supplier_code_str = str(supplier_code).strip()
-                    
-                    if not supplier_code_str:
-                        continue
-                        
-                    # Filter by Classification
-                    if allowed_suppliers is not None:
-                        if supplier_code_str not in allowed_suppliers:
-                            continue
-                            
-                    active_supplier_ids.add(supplier_code_str)
-
-            # 4. Build Result List
-            # 4. Build Result List (Deduplicate by Name)
+
+            index = self._get_spese_index(spese_path)
+            snapshot, positions = index.select(
+                anno=anno,
+                allowed_suppliers=self._classification_filter(conto_id, branca_id, sottoconto_id),
+            )
+
+            # Build Result List (Deduplicate by Name)
             suppliers_by_name = {}
-            for supp_id in active_supplier_ids:
-                name = supplier_names.get(supp_id, f"Fornitore {supp_id}")
-                if name not in suppliers_by_name:
-                    suppliers_by_name[name] = []
-                suppliers_by_name[name].append(supp_id)
+            for code_id in np.unique(snapshot.code_ids[positions]).tolist():
+                supp_id = snapshot.codes[code_id]
+                if not supp_id:
+                    continue
+                name = snapshot.supplier_name(code_id, f"Fornitore {supp_id}")
+                suppliers_by_name.setdefault(name, []).append(supp_id)
             
             active_suppliers = []
             for name, ids in suppliers_by_name.items():
@@ -304,94 +164,29 @@ class SpeseFornitoriService(BaseService):
             if not os.path.exists(spese_path):
                 return {'success': False, 'error': f"Spese DBF not found: {spese_path}"}
             
-            # 1. Pre-fetch suppliers for category/branch/subaccount filter if needed
-            allowed_suppliers = None
-            if conto_id or branca_id or sottoconto_id:
-                try:
-                    class_service = ClassificazioniService()
-                    allowed_suppliers = set(class_service.get_supplier_ids_by_classification(
-                        contoid=conto_id, 
-                        brancaid=branca_id, 
-                        sottocontoid=sottoconto_id
-                    ))
-                except Exception as e:
-                    self.logger.error(f"Error fetching suppliers for classification: {e}")
-                    allowed_suppliers = set()
-
-            # 2. Load Supplier Names map (Code -> Name)
-            supplier_names = {}
-            try:
-                fornitori_path = self._get_fornitori_dbf_path()
-                if os.path.exists(fornitori_path):
-                     with dbf.Table(fornitori_path, codepage='cp1252') as table_forn:
-                        for record in table_forn:
-                            f_code = str(clean_dbf_value(getattr(record, 'db_code', ''))).strip()
-                            f_name = clean_dbf_value(getattr(record, 'db_fonome', ''))
-                            if f_code:
-                                supplier_names[f_code] = f_name
-            except Exception as e:
-                self.logger.error(f"Error loading suppliers mapping: {e}")
-
-            stats = {} # { 'Nome Fornitore': { 'ids': set(), 'netto': 0, 'iva': 0, 'totale': 0, 'count': 0 } }
-            
-            with dbf.Table(spese_path, codepage='cp1252') as table:
-                for record in table:
-                    # Skip invalid records
-                    if not getattr(record, 'db_code', None):
-                        continue
-
-                    # Filter by year
-                    data_spesa = getattr(record, 'db_spdata', None)
-                    if not data_spesa:
-                        continue
-                        
-                    try:
-                        if isinstance(data_spesa, datetime):
-                            spesa_year = data_spesa.year
-                        else:
-                            spesa_year = pd.to_datetime(data_spesa).year
-                            
-                        if spesa_year != int(anno):
-                            continue
-                    except:
-                        continue
-                        
-                    # Get Supplier Code
-                    forn_code = clean_dbf_value(getattr(record, 'db_spfocod', None))
-                    if not forn_code:
-                        continue
-                    
-                    forn_code = str(forn_code).strip()
-
-                    # Filter by Classification
-                    if allowed_suppliers is not None:
-                        if forn_code not in allowed_suppliers:
-                            continue
-                    
-                    # Get Supplier Name
-                    forn_name = supplier_names.get(forn_code, f"Fornitore {forn_code}")
-                    
-                    # Initialize stats for supplier name if new
-                    if forn_name not in stats:
-                        stats[forn_name] = {
-                            'nome': forn_name,
-                            'ids': set(),
-                            'netto': 0.0,
-                            'iva': 0.0,
-                            'totale': 0.0,
-                            'num_fatture': 0
-                        }
-                    
-                    stats[forn_name]['ids'].add(forn_code)
-                    
-                    # Aggregate values
-                    netto = self._safe_float(getattr(record, 'db_spcosto', 0)) or 0
-                    iva = self._safe_float(getattr(record, 'db_spcoiva', 0)) or 0
-                    
-                    stats[forn_name]['netto'] += netto
-                    stats[forn_name]['iva'] += iva
-                    stats[forn_name]['totale'] += (netto + iva)
-                    stats[forn_name]['num_fatture'] += 1
+            index = self._get_spese_index(spese_path)
+            snapshot, positions = index.select(
+                anno=int(anno),
+                allowed_suppliers=self._classification_filter(conto_id, branca_id, sottoconto_id),
+            )
+
+            stats = {} # { 'Nome Fornitore': { 'ids': [], 'netto': 0, 'iva': 0, 'totale': 0, 'count': 0 } }
+            for code_id, netto, iva, count in index.totals_by_supplier(snapshot, positions):
+                forn_code = snapshot.codes[code_id]
+                if not forn_code:
+                    continue
+                forn_name = snapshot.supplier_name(code_id, f"Fornitore {forn_code}")
+                
+                # Initialize stats for supplier name if new
+                if forn_name not in stats:
+                    stats[forn_name] = {'nome': forn_name, 'ids': [], 'netto': 0.0, 'iva': 0.0,
+                                        'totale': 0.0, 'num_fatture': 0}
+                
+                stats[forn_name]['ids'].append(forn_code)
+                stats[forn_name]['netto'] += netto
+                stats[forn_name]['iva'] += iva
+                stats[forn_name]['totale'] += (netto + iva)
+                stats[forn_name]['num_fatture'] += count
             
             # Format results
             results = []
@@ -408,7 +203,7 @@ class SpeseFornitoriService(BaseService):
             # Sort by total amount descending
             results.sort(key=lambda x: x['importo_totale'], reverse=True)
             
-            self.logger.info(f"Riepilogo Spese: found {len(results)} suppliers out of {len(table)} records.")
+            self.logger.info(f"Riepilogo Spese: found {len(results)} suppliers out of {positions.size} records.")
             
             return {
                 'success': True, 
@@ -662,59 +457,16 @@ class SpeseFornitoriService(BaseService):
                 return {'success': False, 'error': 'File DBF spese non trovato'}
             
             # Extract filters
-            fornitore_id = filters.get('codice_fornitore') if filters else None
-            anno = filters.get('anno') if filters else None
-            conto_id = filters.get('conto_id') if filters else None
-            
-            allowed_suppliers = None
-            if conto_id:
-                try:
-                    class_service = ClassificazioniService()
-                    allowed_suppliers = set(class_service.get_fornitori_by_conto(conto_id))
-                except:
-                    allowed_suppliers = set()
-
-            total_costo = 0.0
-            total_iva = 0.0
-            count = 0
-            
-            with dbf.Table(spese_path, codepage='cp1252') as table:
-                for record in table:
-                     # Skip invalid records
-                    if not getattr(record, 'db_code', None):
-                        continue
-                    
-                    supplier_code = clean_dbf_value(getattr(record, 'db_spfocod', None))
-                    supplier_code_str = str(supplier_code).strip()
-                    
-                    if fornitore_id:
-                        if supplier_code_str != str(fornitore_id).strip():
-                            continue
-
-                    if allowed_suppliers is not None:
-                        if supplier_code_str not in allowed_suppliers:
-                            continue
-
-                    if anno:
-                        data_spesa = getattr(record, 'db_spdata', None)
-                        if not data_spesa:
-                            continue
-                        try:
-                            if isinstance(data_spesa, datetime):
-                                spesa_year = data_spesa.year
-                            else:
-                                spesa_year = pd.to_datetime(data_spesa).year
-                            if spesa_year != int(anno):
-                                continue
-                        except:
-                            continue
-                    
-                    costo = self._safe_float(getattr(record, 'db_spcosto', None)) or 0
-                    iva = self._safe_float(getattr(record, 'db_spcoiva', None)) or 0
-                    
-                    total_costo += costo
-                    total_iva += iva
-                    count += 1
+            filters = filters or {}
+            index = self._get_spese_index(spese_path)
+            snapshot, positions = index.select(
+                anno=filters.get('anno'),
+                supplier_ids=parse_supplier_ids(filters.get('codice_fornitore')),
+                allowed_suppliers=self._classification_filter(filters.get('conto_id')),
+            )
+
+            total_costo = float(snapshot.netto[positions].sum())
+            total_iva = float(snapshot.iva[positions].sum())
             
             return {
                 'success': True,
@@ -722,7 +474,7 @@ class SpeseFornitoriService(BaseService):
                     'total_costo': total_costo,
                     'total_iva': total_iva,
                     'total_grand': total_costo + total_iva,
-                    'count': count
+                    'count': int(positions.size)
                 }
             }
 
@@ -730,6 +482,32 @@ class SpeseFornitoriService(BaseService):
             self.logger.error(f"Error getting stats: {e}")
             return {'success': False, 'error': str(e)}
 
+    def _get_spese_index(self, spese_path: str) -> SpeseIndex:
+        """Indice condiviso di SPESAFOR.DBF (con i nomi da FORNITOR.DBF se presente)."""
+        try:
+            fornitori_path = self._get_fornitori_dbf_path()
+        except Exception as e:
+            self.logger.error(f"Error loading suppliers mapping: {e}")
+            fornitori_path = None
+        return get_spese_index(spese_path, fornitori_path)
+
+    def _classification_filter(self, conto_id=None, branca_id=None, sottoconto_id=None) -> Optional[set]:
+        """Codici fornitore ammessi dalla classificazione (None = nessun filtro)."""
+        if not (conto_id or branca_id or sottoconto_id):
+            return None
+        try:
+            class_service = ClassificazioniService()
+            allowed_suppliers = set(class_service.get_supplier_ids_by_classification(
+                contoid=conto_id, 
+                brancaid=branca_id, 
+                sottocontoid=sottoconto_id
+            ))
+            self.logger.info(f"Filtering by Classification: {len(allowed_suppliers)} suppliers found.")
+            return allowed_suppliers
+        except Exception as e:
+            self.logger.error(f"Error fetching suppliers for classification: {e}")
+            return set()
+
     def _safe_float(self, value) -> Optional[float]:
         """Safely convert value to float."""
         if pd.isna(value) or value is None:
@@ -739,35 +517,6 @@ class SpeseFornitoriService(BaseService):
         except (ValueError, TypeError):
             return None
     
-    def _apply_filters(self, spese: List[Dict], filters: Dict) -> List[Dict]:
-        """Apply additional filters to expenses list."""
-        if not filters:
-            return spese
-        
-        filtered_spese = spese
-        
-        # Date range filter
-        if 'data_inizio' in filters and 'data_fine' in filters:
-            data_inizio = pd.to_datetime(filters['data_inizio'])
-            data_fine = pd.to_datetime(filters['data_fine'])
-            
-            filtered_spese = [
-                spesa for spesa in filtered_spese
-                if spesa.get('data_spesa') and 
-                data_inizio <= pd.to_datetime(spesa['data_spesa']) <= data_fine
-            ]
-        
-        # Search filter
-        if 'search' in filters and filters['search']:
-            search_term = filters['search'].lower()
-            filtered_spese = [
-                spesa for spesa in filtered_spese
-                if (search_term in (spesa.get('descrizione') or '').lower() or
-                    search_term in (spesa.get('numero_documento') or '').lower())
-            ]
-        
-        return filtered_spese
-    
     def _get_spese_dbf_path(self) -> str:
         """Get path to spese fornitori DBF file using config manager."""
         try:
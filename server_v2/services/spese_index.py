@@ -0,0 +1,289 @@
+"""
+🧾 Spese Index per StudioDimaAI Server V2
+=========================================
+
+Motore di query per le fatture fornitori (SPESAFOR.DBF) sopra al DBF mirror:
+
+- Righe valide (non cancellate, con codice) già ordinate come la lista
+  fatture: data decrescente, poi nome fornitore crescente
+- Partizioni per anno e indice dei fornitori (codice -> id intero, nome da
+  FORNITOR.DBF) costruiti una volta per generazione dei due file
+- Filtri (fornitori, classificazione, anno, intervallo date, ricerca) come
+  maschere vettoriali sulla partizione; i dict vengono costruiti solo per le
+  righe della pagina richiesta
+
+get_spese, get_riepilogo_spese, get_stats e get_active_suppliers di
+SpeseFornitoriService leggono da qui invece di scandire i DBF ad ogni chiamata.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from services.dbf_mirror import MirrorTable, get_dbf_mirror
+from utils.dbf_utils import clean_dbf_value
+
+logger = logging.getLogger(__name__)
+
+# Giorno usato per le righe senza data: ultime nell'ordinamento per data decrescente
+_NO_DAY = np.iinfo(np.int64).min // 2
+_NO_YEAR = -1
+
+# Campi SPESAFOR / FORNITOR
+F_CODE = 'DB_CODE'
+F_FORNITORE = 'DB_SPFOCOD'
+F_DATA = 'DB_SPDATA'
+F_NUMERO = 'DB_SPNUMER'
+F_DESCR = 'DB_SPDESCR'
+F_NETTO = 'DB_SPCOSTO'
+F_IVA = 'DB_SPCOIVA'
+F_NOTE = 'DB_NOTE'
+F_FORN_CODE = 'DB_CODE'
+F_FORN_NOME = 'DB_FONOME'
+
+
+def parse_supplier_ids(value: Any) -> List[str]:
+    """Filtro fornitore: uno o più codici separati da virgola."""
+    if value is None:
+        return []
+    return [part.strip() for part in str(value).split(',') if part.strip()]
+
+
+class _Snapshot:
+    """Strutture derivate per una coppia di generazioni (SPESAFOR, FORNITOR)."""
+
+    def __init__(self, spese: MirrorTable, fornitori: Optional[MirrorTable]):
+        self.table = spese
+        self.generations = (spese.generation, fornitori.generation if fornitori is not None else None)
+
+        live = ~spese.deleted & (spese.stripped(F_CODE) != b'')
+        rows = np.flatnonzero(live)
+
+        # Fornitori: id intero per codice, nome da FORNITOR.DBF
+        codes = spese.stripped(F_FORNITORE)[rows]
+        unique_codes, code_ids = np.unique(codes, return_inverse=True)
+        self.codes: List[str] = [c.decode('cp1252', errors='ignore') for c in unique_codes.tolist()]
+        self.code_index: Dict[str, int] = {code: i for i, code in enumerate(self.codes)}
+        self.names: List[Optional[str]] = [None] * len(self.codes)
+        if fornitori is not None and fornitori.has_field(F_FORN_NOME):
+            for i, code in enumerate(self.codes):
+                row = fornitori.lookup(F_FORN_CODE, code) if code else None
+                if row is not None:
+                    self.names[i] = clean_dbf_value(fornitori.values(F_FORN_NOME, [row])[0])
+
+        days = spese.column(F_DATA)[rows].astype('datetime64[D]')
+        has_day = ~np.isnat(days)
+        day_numbers = np.where(has_day, days.astype(np.int64), _NO_DAY)
+        years = np.where(has_day, days.astype('datetime64[Y]').astype(np.int64) + 1970, _NO_YEAR)
+
+        # Ordine della lista: data decrescente, nome fornitore (o codice) crescente, ordine file
+        name_keys = [(self.names[i] or self.codes[i]).lower() for i in range(len(self.codes))]
+        name_rank = np.empty(len(self.codes), dtype=np.int64)
+        name_rank[sorted(range(len(self.codes)), key=name_keys.__getitem__)] = np.arange(len(self.codes))
+        order = np.lexsort((rows, name_rank[code_ids], -day_numbers))
+
+        self.rows = rows[order]
+        self.code_ids = code_ids[order].astype(np.int64)
+        self.days = day_numbers[order]
+        self.years = years[order]
+        self.netto = spese.numbers(F_NETTO)[self.rows]
+        self.iva = spese.numbers(F_IVA)[self.rows]
+
+        # Partizioni per anno: posizioni nell'ordine globale
+        self.partitions: Dict[int, np.ndarray] = {}
+        by_year = np.argsort(self.years, kind='stable')
+        keys, starts = np.unique(self.years[by_year], return_index=True)
+        for key, group in zip(keys.tolist(), np.split(by_year, starts[1:])):
+            self.partitions[int(key)] = group
+
+    def supplier_name(self, code_id: int, default: Optional[str] = None) -> Optional[str]:
+        name = self.names[code_id]
+        return name if name else default
+
+
+class SpeseIndex:
+    """Indice delle fatture fornitori di un file SPESAFOR.DBF."""
+
+    def __init__(self, spese_path: str, fornitori_path: Optional[str] = None):
+        self.spese_path = spese_path
+        self.fornitori_path = fornitori_path
+        self._lock = threading.RLock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._stats = {'builds': 0, 'queries': 0, 'rows_decoded': 0}
+
+    # ------------------------------------------------------------------
+    # Query
+    # ------------------------------------------------------------------
+
+    def select(self,
+               anno: Optional[int] = None,
+               supplier_ids: Optional[Iterable[str]] = None,
+               allowed_suppliers: Optional[Set[str]] = None,
+               date_from: Optional[np.datetime64] = None,
+               date_to: Optional[np.datetime64] = None,
+               search: Optional[str] = None) -> Tuple[_Snapshot, np.ndarray]:
+        """
+        Posizioni (nell'ordine della lista) delle fatture che soddisfano i filtri.
+        `allowed_suppliers` è il filtro di classificazione (None = nessun filtro).
+        """
+        snap = self._current()
+        with self._lock:
+            self._stats['queries'] += 1
+
+        if anno:
+            positions = snap.partitions.get(int(anno), np.zeros(0, dtype=np.int64))
+        else:
+            positions = np.arange(len(snap.rows), dtype=np.int64)
+
+        for codes in (list(supplier_ids) if supplier_ids else None, allowed_suppliers):
+            if codes is None or not positions.size:
+                continue
+            wanted = [snap.code_index[c] for c in codes if c in snap.code_index]
+            positions = positions[np.isin(snap.code_ids[positions], wanted)]
+
+        if date_from is not None and date_to is not None and positions.size:
+            days = snap.days[positions]
+            lo = np.datetime64(date_from, 'D').astype(np.int64)
+            hi = np.datetime64(date_to, 'D').astype(np.int64)
+            positions = positions[(days != _NO_DAY) & (days >= lo) & (days <= hi)]
+
+        if search and positions.size:
+            term = str(search).lower()
+            rows = snap.rows[positions]
+            match = np.zeros(positions.size, dtype=bool)
+            for name in (F_DESCR, F_NUMERO):
+                if snap.table.has_field(name):
+                    match |= np.char.find(self._lowered(snap.table, name)[rows], term) >= 0
+            positions = positions[match]
+
+        return snap, positions
+
+    def page(self, snap: _Snapshot, positions: np.ndarray, page: int, per_page: int) -> List[Dict[str, Any]]:
+        """Costruisce i dict solo per le righe della pagina."""
+        start = max(page - 1, 0) * per_page
+        selected = positions[start:start + per_page]
+        with self._lock:
+            self._stats['rows_decoded'] += int(selected.size)
+        return self.materialize(snap, selected)
+
+    def materialize(self, snap: _Snapshot, positions: np.ndarray) -> List[Dict[str, Any]]:
+        table = snap.table
+        rows = snap.rows[positions]
+
+        def values(name):
+            if not table.has_field(name):
+                return [None] * len(rows)
+            return [clean_dbf_value(v) for v in table.values(name, rows)]
+
+        ids, dates, numeri, descrizioni, note = (values(n) for n in (F_CODE, F_DATA, F_NUMERO, F_DESCR, F_NOTE))
+        netti, ive = table.values(F_NETTO, rows), table.values(F_IVA, rows)
+
+        spese = []
+        for i, position in enumerate(positions.tolist()):
+            code_id = int(snap.code_ids[position])
+            code = snap.codes[code_id]
+            netto = float(netti[i]) if netti[i] is not None else None
+            iva = float(ive[i]) if ive[i] is not None else None
+            spese.append({
+                'id': ids[i],
+                'codice_fornitore': code,
+                'nome_fornitore': snap.supplier_name(code_id, code),
+                'data_spesa': dates[i],
+                'numero_documento': numeri[i],
+                'descrizione': descrizioni[i],
+                'costo_netto': netto,
+                'costo_iva': iva,
+                'note': note[i],
+                'totale': (netto or 0) + (iva or 0),
+            })
+        return spese
+
+    def totals_by_supplier(self, snap: _Snapshot, positions: np.ndarray) -> List[Tuple[int, float, float, int]]:
+        """(id fornitore, netto, iva, numero fatture) per i fornitori presenti nelle posizioni."""
+        code_ids = snap.code_ids[positions]
+        size = len(snap.codes)
+        netto = np.bincount(code_ids, weights=snap.netto[positions], minlength=size)
+        iva = np.bincount(code_ids, weights=snap.iva[positions], minlength=size)
+        count = np.bincount(code_ids, minlength=size)
+        present = np.flatnonzero(count)
+        return [(int(i), float(netto[i]), float(iva[i]), int(count[i])) for i in present.tolist()]
+
+    def refresh(self) -> None:
+        """Riallinea subito l'indice ai file (es. su evento del file watcher)."""
+        mirror = get_dbf_mirror()
+        mirror.invalidate(self.spese_path)
+        if self.fornitori_path:
+            mirror.invalidate(self.fornitori_path)
+        self._current()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            snap = self._snapshot
+            return {
+                'path': self.spese_path,
+                'rows': len(snap.rows) if snap is not None else 0,
+                'suppliers': len(snap.codes) if snap is not None else 0,
+                'years': sorted(y for y in snap.partitions if y != _NO_YEAR) if snap is not None else [],
+                'stats': dict(self._stats),
+            }
+
+    # ------------------------------------------------------------------
+    # Sincronizzazione con il mirror
+    # ------------------------------------------------------------------
+
+    def _current(self) -> _Snapshot:
+        mirror = get_dbf_mirror()
+        spese = mirror.table_at(self.spese_path)
+        fornitori = None
+        if self.fornitori_path and os.path.exists(self.fornitori_path):
+            try:
+                fornitori = mirror.table_at(self.fornitori_path)
+            except Exception as e:
+                logger.error(f"Error loading suppliers mapping: {e}")
+
+        generations = (spese.generation, fornitori.generation if fornitori is not None else None)
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.table is spese and snap.generations == generations:
+                return snap
+            start = time.time()
+            snap = self._snapshot = _Snapshot(spese, fornitori)
+            self._stats['builds'] += 1
+            logger.debug(f"Spese index {spese.name}: {len(snap.rows)} fatture, {len(snap.codes)} fornitori "
+                         f"in {(time.time() - start) * 1000:.1f}ms")
+            return snap
+
+    @staticmethod
+    def _lowered(table: MirrorTable, name: str) -> np.ndarray:
+        """Colonna char decodificata e in minuscolo per la ricerca (cache per generazione)."""
+        return table.derived(('lowered', name.upper()),
+                             lambda: np.char.lower(np.char.decode(table.stripped(name), 'cp1252', 'ignore')))
+
+
+# Registry per percorso
+_spese_indexes: Dict[str, SpeseIndex] = {}
+_spese_indexes_lock = threading.Lock()
+
+def get_spese_index(spese_path: str, fornitori_path: Optional[str] = None) -> SpeseIndex:
+    """Get the shared spese index for `spese_path`."""
+    key = os.path.normcase(os.path.abspath(spese_path))
+    with _spese_indexes_lock:
+        index = _spese_indexes.get(key)
+        if index is None or index.fornitori_path != fornitori_path:
+            index = _spese_indexes[key] = SpeseIndex(spese_path, fornitori_path)
+        return index
+
+
+def refresh_spese_indexes() -> None:
+    """Riallinea tutti gli indici spese istanziati (chiamato dal file watcher)."""
+    with _spese_indexes_lock:
+        indexes = list(_spese_indexes.values())
+    for index in indexes:
+        try:
+            index.refresh()
+        except Exception as e:
+            logger.warning(f"Refresh spese index {index.spese_path} fallito: {e}")
@@ -0,0 +1,48 @@
+"""Fixture condivise dai test sugli archivi DBF: file di prova in tmp_path e mirror isolato."""
+import os
+from contextlib import contextmanager
+
+import dbf
+import pytest
+
+import services.dbf_mirror as dbf_mirror
+from services.dbf_mirror import DbfMirror
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    """Mirror in tmp_path senza intervallo sugli stat, restituito da get_dbf_mirror() per tutto il test."""
+    instance = DbfMirror(mirror_dir=str(tmp_path / "mirror"), stat_interval=0)
+    monkeypatch.setattr(dbf_mirror, "_dbf_mirror", instance)
+    return instance
+
+
+@pytest.fixture
+def dbf_file(tmp_path, mirror):
+    """Factory: crea tmp_path/<nome> con la struttura e le righe indicate e ne restituisce il path."""
+    def crea(nome, struttura, righe=()):
+        path = tmp_path / nome
+        table = dbf.Table(str(path), struttura, codepage="cp1252")
+        table.open(dbf.READ_WRITE)
+        for riga in righe:
+            table.append(riga)
+        table.close()
+        return path
+    return crea
+
+
+@pytest.fixture
+def modifica_dbf():
+    """Context manager: apre il DBF in scrittura e all'uscita avanza l'mtime di un secondo.
+
+    Le modifiche ravvicinate possono cadere nello stesso tick dell'mtime; lo spostamento
+    esplicito garantisce che il mirror le veda come una nuova versione del file.
+    """
+    @contextmanager
+    def modifica(path):
+        with dbf.Table(str(path), codepage="cp1252") as table:
+            table.open(dbf.READ_WRITE)
+            yield table
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    return modifica
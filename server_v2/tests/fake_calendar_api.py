@@ -0,0 +1,251 @@
+"""
+Google Calendar API finta per i test di sync.
+
+Server HTTP locale con la parte di API usata dal sync engine: eventi
+insert/update/patch/delete/list (con pageToken, timeMin/timeMax, updatedMin e
+syncToken) e richieste batch multipart. `service()` restituisce un client
+googleapiclient puntato al server, quindi il codice di produzione gira senza
+modifiche.
+"""
+
+import itertools
+import json
+import os
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+import googleapiclient
+
+_EVENT_PATH = re.compile(r'^/calendars/([^/]+)/events(?:/([^/?]+))?$')
+
+
+def _discovery_document(root_url):
+    path = os.path.join(os.path.dirname(googleapiclient.__file__), 'discovery_cache', 'documents', 'calendar.v3.json')
+    with open(path, encoding='utf-8') as f:
+        doc = json.load(f)
+    doc['rootUrl'] = root_url
+    doc['servicePath'] = ''
+    doc['baseUrl'] = root_url
+    doc['batchPath'] = 'batch/calendar/v3'
+    return doc
+
+
+class FakeCalendarApi:
+    """
+    Stato in memoria dei calendari.
+
+    rate_limit_per_batch: oltre questo numero di richieste in un batch le
+    successive ricevono 403 rateLimitExceeded (quota per utente al secondo).
+    """
+
+    def __init__(self, rate_limit_per_batch=None):
+        self.rate_limit_per_batch = rate_limit_per_batch
+        self.calendars = {}
+        self.counters = {'http_calls': 0, 'batches': 0, 'requests': 0, 'rate_limited': 0, 'lists': 0}
+        self.batch_sizes = []
+        self._seq = itertools.count(1)
+        self._sequence = 0
+        self._token_floor = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    # ------------------------------------------------------------------
+    # Ciclo di vita
+    # ------------------------------------------------------------------
+
+    def start(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _handle(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                with api._lock:
+                    api.counters['http_calls'] += 1
+                    if self.path.startswith('/batch/'):
+                        status, headers, payload = api._batch(self.headers.get('Content-Type'), body)
+                    else:
+                        api.counters['requests'] += 1
+                        status, payload = api._dispatch(self.command, self.path, body)
+                        headers = {'Content-Type': 'application/json'}
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    def service(self):
+        return build_from_document(_discovery_document(self.url), http=httplib2.Http())
+
+    # ------------------------------------------------------------------
+    # Helper per i test
+    # ------------------------------------------------------------------
+
+    def add_event(self, calendar_id, event):
+        with self._lock:
+            return self._store(calendar_id, dict(event, id=event.get('id') or uuid.uuid4().hex))
+
+    def events(self, calendar_id):
+        return {eid: e for eid, e in self.calendars.get(calendar_id, {}).items() if e['status'] != 'cancelled'}
+
+    def expire_sync_tokens(self):
+        """I syncToken emessi finora non sono più validi (risposta 410)."""
+        self._sequence = next(self._seq)
+        self._token_floor = self._sequence
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def _store(self, calendar_id, event):
+        self._sequence = next(self._seq)
+        event['updated'] = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+        event['_seq'] = self._sequence
+        event['etag'] = f'"{self._sequence}"'
+        event.setdefault('status', 'confirmed')
+        self.calendars.setdefault(calendar_id, {})[event['id']] = event
+        return self._public(event)
+
+    @staticmethod
+    def _public(event):
+        return {k: v for k, v in event.items() if not k.startswith('_')}
+
+    @staticmethod
+    def _error(status, reason, message=''):
+        return status, {'error': {'code': status, 'message': message or reason,
+                                  'errors': [{'reason': reason, 'message': message or reason}]}}
+
+    def _dispatch(self, method, path, body):
+        parsed = urlparse(path)
+        match = _EVENT_PATH.match(parsed.path)
+        if not match:
+            return self._error(404, 'notFound')
+        calendar_id, event_id = unquote(match.group(1)), match.group(2) and unquote(match.group(2))
+        payload = json.loads(body) if body else {}
+        events = self.calendars.setdefault(calendar_id, {})
+        current = events.get(event_id) if event_id else None
+
+        if method == 'GET' and event_id is None:
+            return self._list(calendar_id, parse_qs(parsed.query))
+        if method == 'POST':
+            new_id = payload.get('id') or uuid.uuid4().hex
+            if new_id in events and events[new_id]['status'] != 'cancelled':
+                return self._error(409, 'duplicate', 'The requested identifier already exists.')
+            return 200, self._store(calendar_id, dict(payload, id=new_id, status='confirmed'))
+        if current is None:
+            return self._error(404, 'notFound')
+        if method == 'DELETE':
+            if current['status'] == 'cancelled':
+                return self._error(410, 'deleted', 'Resource has been deleted')
+            self._store(calendar_id, dict(current, status='cancelled'))
+            return 204, b''
+        if current['status'] == 'cancelled':
+            return self._error(404, 'notFound')
+        if method == 'PUT':
+            return 200, self._store(calendar_id, dict(payload, id=event_id, status='confirmed'))
+        if method == 'PATCH':
+            return 200, self._store(calendar_id, {**current, **payload})
+        if method == 'GET':
+            return 200, self._public(current)
+        return self._error(405, 'methodNotAllowed')
+
+    def _list(self, calendar_id, query):
+        self.counters['lists'] += 1
+        get = lambda key: query.get(key, [None])[0]
+        items = sorted(self.calendars.get(calendar_id, {}).values(), key=lambda e: e['_seq'])
+
+        sync_token = get('syncToken')
+        if sync_token is not None:
+            if int(sync_token) < self._token_floor:
+                return self._error(410, 'fullSyncRequired', 'Sync token is no longer valid')
+            items = [e for e in items if e['_seq'] > int(sync_token)]
+        else:
+            if get('showDeleted') != 'true':
+                items = [e for e in items if e['status'] != 'cancelled']
+            if get('updatedMin'):
+                items = [e for e in items if e['updated'] >= get('updatedMin')]
+            start = lambda e: _parse((e.get('start') or {}).get('dateTime'))
+            end = lambda e: _parse((e.get('end') or {}).get('dateTime'))
+            if get('timeMin'):
+                time_min = _parse(get('timeMin'))
+                items = [e for e in items if end(e) is None or end(e) > time_min]
+            if get('timeMax'):
+                time_max = _parse(get('timeMax'))
+                items = [e for e in items if start(e) is None or start(e) < time_max]
+
+        offset = int(get('pageToken') or 0)
+        size = int(get('maxResults') or 250)
+        page = items[offset:offset + size]
+        result = {'items': [self._public(e) for e in page]}
+        if offset + size < len(items):
+            result['nextPageToken'] = str(offset + size)
+        else:
+            result['nextSyncToken'] = str(self._sequence)
+        return 200, result
+
+    def _batch(self, content_type, body):
+        self.counters['batches'] += 1
+        message = BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        parts = message.get_payload()
+        self.batch_sizes.append(len(parts))
+
+        boundary = uuid.uuid4().hex
+        chunks = []
+        for position, part in enumerate(parts):
+            self.counters['requests'] += 1
+            raw = part.get_payload()
+            request_line, rest = raw.split('\n', 1)
+            method, path, _ = request_line.split(' ', 2)
+            inner = rest.replace('\r\n', '\n').split('\n\n', 1)
+            inner_body = inner[1].encode() if len(inner) > 1 else b''
+            if self.rate_limit_per_batch is not None and position >= self.rate_limit_per_batch:
+                self.counters['rate_limited'] += 1
+                status, payload = self._error(403, 'rateLimitExceeded', 'Rate Limit Exceeded')
+            else:
+                status, payload = self._dispatch(method, path, inner_body)
+            data = payload.decode() if isinstance(payload, bytes) else json.dumps(payload)
+            content_id = part['Content-ID'].replace('<', '<response-', 1)
+            chunks.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n\r\n{data}\r\n"
+            )
+        chunks.append(f"--{boundary}--")
+        return 200, {'Content-Type': f'multipart/mixed; boundary={boundary}'}, ''.join(chunks).encode()
+
+
+def _parse(value):
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
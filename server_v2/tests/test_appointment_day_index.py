@@ -0,0 +1,76 @@
+import datetime as dt
+
+import dbf
+import pytest
+
+import services.appointment_day_index as appointment_day_index
+import services.appointment_reminder_service as reminders
+import services.reminder_dispatch_engine as dispatch_engine
+from services.patient_index import PatientIndex
+
+
+class _Engine:
+    def should_send_today(self, weekday):
+        return True
+
+    def get_morning_threshold_hour(self, day_of_week):
+        return 13
+
+
+@pytest.fixture
+def archivio(tmp_path, dbf_file, monkeypatch):
+    monkeypatch.setattr(reminders, "get_patient_index",
+                        lambda path: PatientIndex(path, index_dir=str(tmp_path / "patient_index")))
+    monkeypatch.setattr(dispatch_engine, "get_dispatch_engine", lambda: _Engine())
+
+    domani = dt.datetime.now(reminders.ROME_TZ).date() + dt.timedelta(days=1)
+    appunta = dbf_file(
+        "APPUNTA.DBF",
+        "DB_APDATA D; DB_APOREIN N(5,2); DB_APPACOD C(6); DB_GUARDIA C(2); DB_APSTUDI N(2,0); DB_APDESCR C(30)",
+        [
+            (domani, 9.4, "P1", "V", 1, "ROSSI"),
+            (domani, 14.3, "P2", "I", 2, "BIANCHI"),
+            (domani, 10.0, "", "V", 1, "SENZA PAZIENTE"),
+            (domani + dt.timedelta(days=1), 9.0, "P1", "V", 1, "ROSSI"),
+        ],
+    )
+    pazienti = dbf_file("PAZIENTI.DBF", "DB_CODE C(6); DB_PANOME C(30); DB_PACELLU C(15); DB_PATELEF C(15)", [
+        ("P1", "ROSSI MARIO", "3331234567", ""),
+        ("P2", "BIANCHI ANNA", "", "0574123456"),
+    ])
+
+    paths = {"APPUNTA": str(appunta), "pazienti": str(pazienti)}
+    monkeypatch.setattr(reminders, "_dbf_path", lambda name: paths[name])
+    return appunta, domani
+
+
+def test_selezione_reminder_dal_bucket_del_giorno(archivio, modifica_dbf):
+    appunta, domani = archivio
+
+    rows = reminders.get_upcoming_appointments("24h")
+    assert [(r["patient_id"], r["appointment_time"], r["patient_name"], r["cell"], r["tel"]) for r in rows] == [
+        ("P1", "09:40", "ROSSI MARIO", "3331234567", ""),
+        ("P2", "14:30", "BIANCHI ANNA", "", "0574123456"),
+    ]
+    assert [r["patient_id"] for r in reminders.get_upcoming_appointments("24h", slot="afternoon")] == ["P2"]
+
+    with modifica_dbf(appunta) as table:
+        with table[1] as record:
+            record.db_apdata = domani + dt.timedelta(days=1)
+        dbf.delete(table[0])
+    appointment_day_index.get_appointment_day_index(str(appunta)).refresh()
+
+    assert reminders.get_upcoming_appointments("24h") == []
+    status = appointment_day_index.get_appointment_day_index(str(appunta)).get_status()
+    assert status["stats"]["full_builds"] == 1
+    assert status["stats"]["rows_indexed"] == 4 + 2
+    assert status["rows"] == 2
+
+
+def test_appuntamenti_senza_ora_di_inizio_esclusi(archivio, modifica_dbf):
+    appunta, domani = archivio
+    with modifica_dbf(appunta) as table:
+        table.append((domani, None, "P2", "V", 1, "SENZA ORA"))
+
+    rows = reminders.get_upcoming_appointments("24h")
+    assert [(r["patient_id"], r["appointment_time"]) for r in rows] == [("P1", "09:40"), ("P2", "14:30")]
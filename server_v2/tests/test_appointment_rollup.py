@@ -0,0 +1,58 @@
+import datetime as dt
+
+import dbf
+import pytest
+
+import services.appointment_rollup as appointment_rollup
+from services.appointment_rollup import AppointmentRollupCube
+
+
+@pytest.fixture
+def appunta(dbf_file):
+    return dbf_file(
+        "APPUNTA.DBF",
+        "DB_APDATA D; DB_APOREIN N(5,2); DB_APOREOU N(5,2); DB_GUARDIA C(2); DB_APMEDIC N(3,0); DB_APSTUDI N(2,0)",
+        [
+            (dt.date(2024, 1, 10), 9.0, 9.3, "V", 1, 1),
+            (dt.date(2024, 3, 20), 10.0, 11.0, "V", 2, 1),
+            (dt.date(2025, 1, 5), 14.3, 15.0, "I", 1, 2),
+            (dt.date(2025, 3, 1), 9.0, 9.5, "V", 1, 1),
+            (dt.date(2025, 3, 25), 9.0, 10.0, "V ", 2, 1),
+            (None, 9.0, 10.0, "V", 1, 1),
+        ],
+    )
+
+
+def test_statistiche_mensili_aggiornamento_incrementale_e_ripristino(appunta, modifica_dbf):
+    cube = AppointmentRollupCube(str(appunta))
+
+    stats = cube.monthly_stats([2024, 2025], ytd_limit=(3, 10))
+    assert stats["2025"][0] == {"month": 1, "count": 1, "first_visits": 0, "first_visits_ytd": 0}
+    assert stats["2025"][2] == {"month": 3, "count": 2, "first_visits": 2, "first_visits_ytd": 1}
+    assert stats["2024"][2]["first_visits_ytd"] == 0
+    assert sum(m["count"] for m in stats["2024"]) == 2
+    assert cube.aggregate(("year", "tipo"), years=[2025]) == [
+        {"year": 2025, "tipo": "I", "count": 1, "minutes": 30},
+        {"year": 2025, "tipo": "V", "count": 2, "minutes": 110},
+    ]
+    assert cube.aggregate((), medico=2) == [{"count": 2, "minutes": 120}]
+
+    with modifica_dbf(appunta) as table:
+        with table[2] as record:
+            record.db_guardia = "V"
+        dbf.delete(table[0])
+        table.append((dt.date(2025, 2, 14), 16.0, 16.3, "V", 3, 2))
+
+    stats = cube.monthly_stats([2024, 2025])
+    assert [m["first_visits"] for m in stats["2025"][:3]] == [1, 1, 2]
+    assert sum(m["count"] for m in stats["2024"]) == 1
+    status = cube.get_status()
+    assert status["in_sync"] and status["stats"]["full_builds"] == 1
+    assert status["stats"]["rows_indexed"] == 6 + 3
+
+    # Il riavvio riparte dallo stato salvato: stesse celle senza ricostruzione completa
+    cube._persist(appointment_rollup.get_dbf_mirror())
+    restarted = AppointmentRollupCube(str(appunta))
+    assert restarted.monthly_stats([2024, 2025]) == stats
+    assert restarted.get_status()["loaded_from_disk"]
+    assert restarted.get_status()["stats"]["full_builds"] == 0
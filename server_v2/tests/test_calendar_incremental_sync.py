@@ -0,0 +1,99 @@
+import pytest
+
+from services.calendar_incremental_sync import CalendarSyncLedger, sync_incremental
+from .fake_calendar_api import FakeCalendarApi
+
+CAL = "studio1@group.calendar.google.com"
+
+
+def _record(ora, descrizione, note=""):
+    return {"DATA": "2026-03-05", "ORA_INIZIO": ora, "ORA_FINE": ora + 1, "TIPO": "V", "STUDIO": 1,
+            "DESCRIZIONE": descrizione, "NOTE": note, "_PATIENT_ID": f"P{int(ora)}"}
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("CALENDAR_ID_STUDIO_1", CAL)
+    monkeypatch.delenv("CALENDAR_ID_STUDIO_2", raising=False)
+    api = FakeCalendarApi().start()
+    yield api
+    api.stop()
+
+
+def test_solo_le_modifiche_toccano_google(api, tmp_path):
+    ledger = CalendarSyncLedger(str(tmp_path / "calendar_sync.sqlite"))
+    service = api.service()
+    records = [_record(9.0, "ROSSI"), _record(10.0, "BIANCHI"), _record(11.0, "VERDI")]
+
+    def run(records):
+        before = dict(api.counters)
+        stats, anomalies = sync_incremental(service, records, ledger=ledger)
+        assert anomalies == []
+        return stats, {key: api.counters[key] - before[key] for key in before}
+
+    stats, _ = run(records)
+    assert stats["incremental"]["mode"] == "bootstrap"
+    assert (stats["inserted"], stats["updated"], stats["pruned"], stats["errors"]) == (3, 0, 0, 0)
+
+    # Nessuna modifica: solo la lettura del delta, niente normalizzazione né scritture
+    stats, calls = run(records)
+    assert stats["incremental"]["normalized"] == 0 and stats["skipped"] == 3
+    assert calls["lists"] == 1 and calls["batches"] == 0 and calls["requests"] == 1
+
+    # Nota cambiata nel DBF, evento di BIANCHI modificato a mano su Google, VERDI cancellato dal DBF
+    records[0] = _record(9.0, "ROSSI", note="portare esami")
+    bianchi = next(e for e in api.events(CAL).values() if e["summary"] == "BIANCHI")
+    api.add_event(CAL, dict(bianchi, summary="MODIFICATO A MANO"))
+    stats, calls = run(records[:2])
+    info = stats["incremental"]
+    # La finestra del 5 marzo è già nell'indice locale, aggiornato dal delta: nessuna lettura a finestra
+    assert (info["normalized"], info["remote_changes"], info["window_reads"]) == (2, 1, 0)
+    assert calls["lists"] == 1
+    assert (stats["inserted"], stats["updated"], stats["pruned"], stats["errors"]) == (0, 2, 1, 0)
+    assert sorted(e["summary"] for e in api.events(CAL).values()) == ["BIANCHI", "ROSSI"]
+    assert next(e for e in api.events(CAL).values() if e["summary"] == "ROSSI")["description"] == "portare esami"
+
+    # Le nostre scritture tornano nel delta ma sono riconosciute dall'etag
+    stats, calls = run(records[:2])
+    assert stats["incremental"]["remote_echoes"] == 2 and stats["incremental"]["normalized"] == 0
+    assert calls["batches"] == 0
+
+    # Token scaduto (410): rilettura completa, nessuna scrittura perché Google è già allineato
+    api.expire_sync_tokens()
+    stats, calls = run(records[:2])
+    assert stats["incremental"]["mode"] == "bootstrap"
+    assert (stats["inserted"], stats["updated"], stats["skipped"], calls["batches"]) == (0, 0, 2, 0)
+    assert ledger.get_status()["synced_events"] == 2
+
+
+def test_indice_eventi_google_a_finestre(api, tmp_path):
+    from services.calendar_incremental_sync import lookup_google_events
+
+    ledger = CalendarSyncLedger(str(tmp_path / "calendar_sync.sqlite"))
+    service = api.service()
+    for giorno, titolo in (("2026-03-02", "LUNEDI"), ("2026-03-05", "GIOVEDI"), ("2026-04-10", "APRILE")):
+        api.add_event(CAL, {"summary": titolo, "start": {"dateTime": f"{giorno}T09:00:00+01:00"},
+                            "end": {"dateTime": f"{giorno}T10:00:00+01:00"}})
+
+    # Primo accesso: lettura a finestra che fornisce anche il syncToken
+    info = {}
+    by_uid, by_fp = lookup_google_events(service, [CAL], "2026-03-01", "2026-03-06", ledger=ledger, info=info)
+    assert sorted(e["summary"] for e in by_fp.values()) == ["GIOVEDI", "LUNEDI"]
+    assert info["window_reads"] == 1 and CAL in ledger.get_tokens()
+
+    # Finestra già letta: solo il delta, che porta modifiche e cancellazioni nell'indice
+    giovedi = next(e for e in api.events(CAL).values() if e["summary"] == "GIOVEDI")
+    api.add_event(CAL, dict(giovedi, summary="GIOVEDI SPOSTATO"))
+    api.add_event(CAL, dict(next(e for e in api.events(CAL).values() if e["summary"] == "LUNEDI"), status="cancelled"))
+    before = api.counters["lists"]
+    _, by_fp = lookup_google_events(service, [CAL], "2026-03-02", "2026-03-05", ledger=ledger)
+    assert [e["summary"] for e in by_fp.values()] == ["GIOVEDI SPOSTATO"]
+    assert api.counters["lists"] - before == 1
+
+    # Finestra più ampia: si legge solo il tratto mancante e gli intervalli si uniscono
+    info = {}
+    _, by_fp = lookup_google_events(service, [CAL], "2026-03-01", "2026-04-30", ledger=ledger, info=info)
+    assert sorted(e["summary"] for e in by_fp.values()) == ["APRILE", "GIOVEDI SPOSTATO"]
+    assert info["window_reads"] == 1
+    assert [(w["date_from"], w["date_to"]) for w in ledger.get_status()["google_event_windows"]] == [
+        ("2026-03-01", "2026-04-30")]
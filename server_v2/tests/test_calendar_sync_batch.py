@@ -0,0 +1,69 @@
+import pytest
+
+from core.schemas import AppointmentKind, NormalizedAppointment
+from services.calendar_sync_engine import SYNC_MODE_BATCH, AimdController, sync_appointments
+from .fake_calendar_api import FakeCalendarApi
+
+CAL = "studio1@group.calendar.google.com"
+GIORNO = "2026-03-05"
+
+
+def _appuntamento(uid, ora, titolo):
+    return NormalizedAppointment(
+        uid=uid, kind=AppointmentKind.PATIENT_EXISTING, date=GIORNO,
+        start_time=ora, end_time=f"{int(ora[:2]) + 1:02d}:00", title=titolo, description="",
+        patient_id="P1", is_new_patient=False, metadata={"studio": 1, "tipo": "V"}, raw={},
+    )
+
+
+def _evento(event_id, titolo, ora, uid=None):
+    event = {"id": event_id, "summary": titolo,
+             "start": {"dateTime": f"{GIORNO}T{ora}:00"}, "end": {"dateTime": f"{GIORNO}T{int(ora[:2]) + 1:02d}:00:00"}}
+    if uid:
+        event["extendedProperties"] = {"private": {"uid": uid}}
+    return event
+
+
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setenv("CALENDAR_ID_STUDIO_1", CAL)
+    api = FakeCalendarApi(rate_limit_per_batch=6).start()
+    yield api
+    api.stop()
+
+
+def test_piano_eseguito_a_batch_con_aimd_e_retry(api):
+    appuntamenti = [_appuntamento(f"n{i:02d}", f"{8 + i % 10:02d}:00", f"NUOVO {i}") for i in range(20)]
+    appuntamenti += [_appuntamento("agg", "10:00", "AGGIORNATO"), _appuntamento("conf", "11:00", "CONFLITTO"),
+                     _appuntamento("leg", "12:00", "LEGACY")]
+
+    esistenti = {
+        "agg": api.add_event(CAL, _evento("sdaiagg", "VECCHIO TITOLO", "10:00", uid="agg")),
+        "orfano": api.add_event(CAL, _evento("sdaiorfano", "CANCELLATO NEL DBF", "15:00", uid="orfano")),
+    }
+    api.add_event(CAL, _evento("sdaiconf", "CONFLITTO", "11:00", uid="conf"))  # non nell'indice: insert -> 409
+    legacy = api.add_event(CAL, _evento("legacy123", "LEGACY", "12:00"))
+    for event in (*esistenti.values(), legacy):
+        event["calendarId"] = CAL
+    by_fingerprint = {f"{CAL}|{GIORNO}|12:00|13:00|legacy": legacy}
+
+    progress = []
+    controller = AimdController(initial=8, sleep=lambda seconds: None)
+    stats = sync_appointments(
+        service=api.service(), appointments=appuntamenti, existing_by_uid=esistenti,
+        existing_by_fingerprint=by_fingerprint, on_progress=lambda done, total: progress.append((done, total)),
+        mode=SYNC_MODE_BATCH, controller=controller,
+    )
+
+    assert (stats["inserted"], stats["updated"], stats["pruned"], stats["errors"]) == (21, 2, 1, 0)  # 409 su insert: aggiornato ma contato come inserito (come la sync seriale)
+    eventi = api.events(CAL)
+    assert sorted(eventi) == sorted([f"sdain{i:02d}" for i in range(20)] + ["sdaiagg", "sdaiconf", "sdaileg"])
+    assert eventi["sdaiagg"]["summary"] == "AGGIORNATO"
+    assert eventi["sdaileg"]["extendedProperties"]["private"]["uid"] == "leg"
+
+    batch = stats["batch"]
+    assert batch["plan"] == {"insert": 22, "update": 1, "patch": 0, "delete": 2, "skip": 0, "invalid": 0}
+    assert batch["quota_errors"] == api.counters["rate_limited"] > 0
+    assert batch["window_min"] < 8 and batch["throttled_batches"] > 0
+    assert batch["batches"] == api.counters["batches"] < batch["requests"]
+    assert progress[-1] == (23, 23)
@@ -0,0 +1,33 @@
+import threading
+import time
+
+from services.change_pipeline import ChangePipeline
+
+
+def test_raffica_coalizzata_in_un_solo_confronto():
+    calls = []
+    release = threading.Event()
+
+    def handler(table):
+        calls.append(table)
+        if len(calls) == 1:
+            release.wait(2)
+
+    pipeline = ChangePipeline(handler, debounce_seconds=0.05, max_delay_seconds=1.0, workers=2)
+    for _ in range(20):
+        pipeline.submit("APPUNTA")
+    pipeline.submit("PREVENT")
+    time.sleep(0.2)
+
+    # Eventi durante l'elaborazione della stessa tabella: un solo giro successivo
+    for _ in range(5):
+        pipeline.submit("APPUNTA")
+    time.sleep(0.1)
+    assert pipeline.get_stats()["running_tables"] == ["APPUNTA"]
+    release.set()
+
+    assert pipeline.wait_idle(timeout=2)
+    assert sorted(calls) == ["APPUNTA", "APPUNTA", "PREVENT"]
+    stats = pipeline.get_stats()
+    assert stats["events"] == 26 and stats["batches"] == 3
+    assert stats["coalesced_events"] == 23 and stats["handler_errors"] == 0
@@ -0,0 +1,27 @@
+import services.dbf_data_service as dbf_data_service
+
+
+class _Reader:
+    def __init__(self, base):
+        self.base = base
+
+    def _get_dbf_path(self, file_name):
+        return str(self.base / file_name)
+
+
+def test_arricchimento_in_blocco_risolve_chiavi_una_volta(tmp_path, dbf_file):
+    dbf_file("ELENCO.DBF", "DB_CODE C(6); DB_ELPACOD C(6)", [
+        ("E1", "P10"),
+        ("E2", "P20"),
+        ("E1", "P99"),  # duplicato: vale il primo in ordine di file
+    ])
+    service = dbf_data_service.DbfDataService(reader=_Reader(tmp_path))
+
+    records = [{"DB_PRELCOD": "E1"}, {"DB_PRELCOD": "E2"}, {"DB_PRELCOD": "E1"}, {"DB_PRELCOD": "X"}, {}]
+    stats = service.enrich_records(records, {
+        "source_field": "DB_PRELCOD", "target_table": "ELENCO.DBF", "target_key_field": "DB_CODE",
+        "target_value_field": "DB_ELPACOD", "new_field_name": "id_paziente",
+    })
+
+    assert [r.get("id_paziente") for r in records] == ["P10", "P20", "P10", None, None]
+    assert (stats["records"], stats["keys"], stats["resolved"], stats["missing"]) == (5, 3, 2, 1)
@@ -0,0 +1,56 @@
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from services.dbf_mirror import DbfMirror
+
+
+@pytest.fixture
+def tabella(dbf_file):
+    return dbf_file("PROVA.DBF", "DB_CODE C(6); DB_NOME C(20); DB_DATA D; DB_IMPORTO N(10,2); DB_FLAG L", [
+        ("A1", "ROSSI MARIO", dt.date(2024, 3, 1), 120.5, True),
+        ("A2", "VERDI ANNA", None, None, False),
+        ("A3", "BIANCHI LUCA", dt.date(2023, 12, 31), 80, None),
+    ])
+
+
+def test_mirror_decodifica_colonne_come_libreria_dbf(tabella, mirror):
+    table = mirror.table_at(str(tabella))
+
+    assert len(table) == 3
+    assert table.values("DB_CODE") == ["A1", "A2", "A3"]
+    assert table.values("DB_DATA") == [dt.date(2024, 3, 1), None, dt.date(2023, 12, 31)]
+    assert table.values("DB_IMPORTO") == [120.5, None, 80.0]
+    assert table.values("DB_FLAG") == [True, False, None]
+    assert list(table.find("DB_NOME", "VERDI ANNA")) == [1]
+    assert table.lookup("DB_CODE", " A3") == 2
+    assert table.lookup("DB_CODE", "ZZ") is None
+
+
+def test_mirror_refresh_incrementale_decodifica_solo_righe_cambiate(tabella, mirror, modifica_dbf):
+    first = mirror.table_at(str(tabella))
+
+    with modifica_dbf(tabella) as table:
+        with table[1] as record:
+            record.db_importo = 55
+        table.append(("A4", "NERI PIO", dt.date(2025, 1, 2), 10, True))
+
+    second = mirror.table_at(str(tabella))
+
+    assert second.generation == first.generation + 1
+    assert sorted(second.changed_rows.tolist()) == [1, 3]
+    assert second.values("DB_IMPORTO") == [120.5, 55.0, 80.0, 10.0]
+    assert second.values("DB_CODE")[3] == "A4"
+    # La generazione precedente resta immutata per i lettori in corso
+    assert first.values("DB_IMPORTO") == [120.5, None, 80.0]
+
+
+def test_mirror_persistito_riparte_senza_rebuild(tabella, mirror):
+    mirror.table_at(str(tabella))
+
+    riavviato = DbfMirror(mirror_dir=str(mirror.mirror_dir), stat_interval=0)
+    table = riavviato.table_at(str(tabella))
+
+    assert riavviato.get_status()["stats"]["full_builds"] == 0
+    assert np.array_equal(table.numbers("DB_IMPORTO"), [120.5, 0.0, 80.0])
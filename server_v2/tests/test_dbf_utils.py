@@ -0,0 +1,42 @@
+import datetime as dt
+
+import dbf
+import numpy as np
+import pytest
+
+from utils.dbf_utils import DbfRecordDecoder
+
+
+@pytest.fixture
+def appunta(tmp_path):
+    path = tmp_path / "APPUNTA.DBF"
+    table = dbf.Table(
+        str(path),
+        "DB_APDATA D; DB_APOREIN N(5,2); DB_APPACOD C(8); DB_APSTUDI N(2,0)",
+        codepage="cp1252",
+    )
+    table.open(dbf.READ_WRITE)
+    table.append((dt.date(2025, 3, 4), 9.3, "P1", 1))
+    table.append((dt.date(2025, 3, 5), 17.25, "P2", 2))
+    table.append((dt.date(2025, 4, 1), 10, "P3", 1))
+    table.append((None, None, "", None))
+    dbf.delete(table[1])
+    table.close()
+    return path
+
+
+def test_decoder_espone_flag_cancellazione_e_viste_strutturate(appunta):
+    with DbfRecordDecoder(str(appunta)) as decoder:
+        assert len(decoder) == 4
+        assert decoder.deleted_mask().tolist() == [False, True, False, False]
+        assert decoder.records["DB_APPACOD"][0].strip() == b"P1"
+
+
+def test_decoder_filtra_mese_e_decodifica_solo_le_righe_scelte(appunta):
+    with DbfRecordDecoder(str(appunta)) as decoder:
+        rows = np.flatnonzero(decoder.live_mask() & decoder.month_mask("DB_APDATA", 2025, 3))
+
+        assert rows.tolist() == [0]
+        assert decoder.values("DB_APPACOD", rows) == ["P1"]
+        assert decoder.values("DB_APOREIN") == [9.3, 17.25, 10.0, None]
+        assert decoder.values("DB_APDATA", slice(2, 4)) == [dt.date(2025, 4, 1), None]
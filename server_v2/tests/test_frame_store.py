@@ -0,0 +1,37 @@
+import datetime as dt
+
+from services.economics.data_normalizer import PRODUCTION
+from services.economics.frame_store import FrameStore
+
+
+def test_partizioni_annuali_ricostruite_solo_se_cambiano(tmp_path, dbf_file, mirror, modifica_dbf):
+    path = dbf_file(
+        "FATTURE.DBF",
+        "DB_CODE C(6); DB_FAPACOD C(6); DB_FADATA D; DB_FAIMPON N(10,2); DB_FANUMER C(8); DB_FAPAGAM C(3)",
+        [
+            ("F1", "P1", dt.date(2023, 5, 2), 100.0, "1", "CON"),
+            ("F2", "P2", dt.date(2024, 1, 9), 50.0, "2", "BAN"),
+            ("F3", "P1", dt.date(2023, 7, 1), 0.0, "3", "CON"),  # importo nullo: escluso
+            ("F4", "P3", dt.date(2023, 8, 3), 20.0, "4", "CON"),
+        ],
+    )
+    store = FrameStore(store_dir=str(tmp_path / "frames"))
+
+    df = store.frame(PRODUCTION, mirror.table_at(str(path)))
+    assert df["fatturaid"].tolist() == ["F1", "F2", "F4"]  # ordine di file, tutti gli anni
+    assert df["modo_pagamento"].dtype == object
+    assert store.frame(PRODUCTION, mirror.table_at(str(path)), 2024)["mese"].tolist() == [1]
+    assert store.get_status()["stats"]["built"] == 2
+
+    with modifica_dbf(path) as table:
+        with table[1] as record:
+            record.db_faimpon = 75.0
+
+    df = store.frame(PRODUCTION, mirror.table_at(str(path)))
+    assert df["importo"].tolist() == [100.0, 75.0, 20.0]
+    assert store.get_status()["stats"]["built"] == 3  # solo il 2024
+
+    riavviato = FrameStore(store_dir=str(tmp_path / "frames"))
+    riavviato.invalidate()
+    assert riavviato.frame(PRODUCTION, mirror.table_at(str(path)), 2023)["importo"].tolist() == [100.0, 20.0]
+    assert riavviato.get_status()["stats"] == {"built": 0, "loaded_from_disk": 1, "write_errors": 0}
@@ -0,0 +1,37 @@
+from services.material_classifier import KeywordMatcher, MaterialPatternIndex
+from services.materiali_migration_service import MaterialiMigrationService
+
+
+def _pattern(nome, branca, sottoconto):
+    return {'nome': nome, 'fornitoreid': 'F1', 'classification': {
+        'contoid': 1, 'brancaid': 2, 'sottocontoid': 3, 'contonome': 'MATERIALI',
+        'brancanome': branca, 'sottocontonome': sottoconto}}
+
+
+def test_keyword_matcher_semantica_sottostringa():
+    matcher = KeywordMatcher(['file', 'files', 'fil', 'lima', 'paper point', 'point'])
+    assert matcher.find('reciproc files r25') == {'fil', 'file', 'files'}
+    assert matcher.find('paper points') == {'paper point', 'point'}
+    assert matcher.find('') == set()
+
+
+def test_classificazione_e_match_pattern():
+    service = MaterialiMigrationService(None)
+    classify = service.keyword_classifier.classify
+    assert classify('composito flowable a2') == ('conservativa', 115)
+    assert classify('guanti trasporto') == ('non_dental', 0)   # parola esclusa
+    assert classify('point paper 25') == ('endodonzia', 44)     # frase con parole separate
+    assert classify('cemento') == ('protesi', 125)              # match esatto
+    assert classify('xyz') == ('unknown', 0)
+
+    patterns = [
+        _pattern('GUANTI NITRILE M', 'IGIENE', 'MONOUSO'),
+        _pattern('RECIPROC BLUE FILES R25', 'ENDODONZIA', 'STRUMENTI MANUALI'),
+        _pattern('CELTRA DUO A3', 'CONSERVATIVA', 'COMPOSITI'),
+    ]
+    index = MaterialPatternIndex(patterns, service._calculate_similarity)
+    assert index.match('RECIPROC FILES R40 6ST')['confidence'] == 95
+    match = index.match('CELTRA DUO A2 REFILL')
+    assert (match['matched_pattern'], match['confidence']) == ('CELTRA DUO A3', 100)
+    assert index.match('CARTA FOTOCOPIE') is None
+    assert service._find_pattern_match('guanti nitrile s', patterns)['classification']['brancanome'] == 'IGIENE'
@@ -0,0 +1,38 @@
+import datetime as dt
+
+import pytest
+
+from services.occupancy_index import OccupancyIndex
+
+GIORNO = dt.date(2025, 3, 5)
+
+
+@pytest.fixture
+def appunta(dbf_file):
+    return dbf_file(
+        "APPUNTA.DBF",
+        "DB_APDATA D; DB_APOREIN N(5,2); DB_APOREOU N(5,2); DB_APMEDIC N(3,0); DB_NOTE C(20); DB_APDESCR C(30)",
+        [
+            (GIORNO, 14.3, 15.0, 1, "", "CONTROLLO"),
+            (GIORNO, 9.0, 9.5, 1, "", "IGIENE"),
+            (GIORNO, 9.0, 10.0, 2, "", "IGIENE"),
+        ],
+    )
+
+
+def test_intervalli_ordinati_e_marker_assenza_incrementale(appunta, modifica_dbf):
+    index = OccupancyIndex(str(appunta))
+
+    assert index.occupati(1, GIORNO) == ([(540, 590), (870, 900)], False)
+    assert index.occupati(2, GIORNO) == ([(540, 600)], False)
+    assert index.occupati(5, GIORNO) == ([], False)
+
+    with modifica_dbf(appunta) as table:
+        with table[0] as record:
+            record.db_apdata = GIORNO + dt.timedelta(days=1)
+        table.append((GIORNO, 8.0, 8.1, 2, "", "Lara No"))
+
+    assert index.occupati(1, GIORNO) == ([(540, 590)], False)
+    assert index.occupati(1, GIORNO + dt.timedelta(days=1)) == ([(870, 900)], False)
+    assert index.occupati(2, GIORNO)[1] is True
+    assert index.get_status()["stats"]["rows_indexed"] == 3 + 2
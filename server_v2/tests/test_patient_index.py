@@ -0,0 +1,52 @@
+import pytest
+
+from services.patient_index import PatientIndex, normalize_phone
+
+
+@pytest.fixture
+def pazienti(dbf_file):
+    return dbf_file(
+        "PAZIENTI.DBF",
+        "DB_CODE C(6); DB_PANOME C(30); DB_PACODFI C(16); DB_PATELEF C(20); DB_PACELLU C(20)",
+        [
+            ("P1", "ROSSI MARIO", "RSSMRA80A01D612X", "0571 123456", "+39 333 1234567"),
+            ("P2", "D'ANGELO LUCÌA", "", "", "3471112233"),
+            ("", "SENZA CODICE", "", "", ""),
+            ("P4", "ROSSINI ANNA", "RSSNNA90B41D612Y", "", ""),
+        ],
+    )
+
+
+def test_lookup_per_id_nome_telefono_e_ricerca(pazienti, tmp_path):
+    index = PatientIndex(str(pazienti), index_dir=str(tmp_path / "index"))
+
+    assert index.find_by_id("P4") == [3]
+    assert index.find_by_name("d angelo  lucia") == [1]
+    assert index.find_by_phone("0039 333-1234567") == [0]
+    assert index.find_by_codice_fiscale("rssnna90b41d612y") == [3]
+    # Sottostringa su nome/CF: le righe senza DB_CODE sono escluse
+    assert index.search("ross") == [0, 3]
+    assert index.search("codice") == []
+    assert index.search(telefono="1122") == [1]
+    assert index.search_fuzzy("rosi mario", limit=1)[0][0] == 0
+    assert normalize_phone("+39 347 111 2233") == "3471112233"
+
+
+def test_indice_incrementale_e_persistito(pazienti, tmp_path, modifica_dbf):
+    index_dir = str(tmp_path / "index")
+    index = PatientIndex(str(pazienti), index_dir=index_dir)
+    assert index.find_by_id("P2") == [1]
+
+    with modifica_dbf(pazienti) as table:
+        with table[1] as record:
+            record.db_code = "P9"
+        table.append(("P5", "BIANCHI LUCA", "", "", ""))
+
+    assert index.find_by_id("P2") == []
+    assert index.find_by_id("P9") == [1]
+    assert index.get_status()["stats"]["rows_indexed"] == 4 + 2
+
+    riavviato = PatientIndex(str(pazienti), index_dir=index_dir)
+    assert riavviato.find_by_name("bianchi luca") == [4]
+    status = riavviato.get_status()["stats"]
+    assert status["loaded_from_disk"] and status["rows_indexed"] == 0
@@ -0,0 +1,87 @@
+import datetime as dt
+import sqlite3
+
+import pytest
+
+import services.recall_index as recall_index
+from services.recall_index import RecallIndex
+
+OGGI = dt.date(2025, 6, 15)
+
+
+@pytest.fixture
+def sources(tmp_path, dbf_file, monkeypatch):
+    igiene = {"version": 1, "lookup": {"P2": (dt.date(2025, 1, 10), 2)}}
+    monkeypatch.setattr(recall_index, "_igiene_version", lambda: igiene["version"])
+    monkeypatch.setattr(recall_index, "build_last_igiene_lookup", lambda: dict(igiene["lookup"]))
+
+    pazienti = dbf_file(
+        "PAZIENTI.DBF",
+        "DB_CODE C(8); DB_PANOME C(30); DB_PADANAS D; DB_PASESSO C(1); DB_PATELEF C(15); DB_PACELLU C(15); "
+        "DB_PAULTVI D; DB_PARIMOT C(6); DB_PARICHI C(1)",
+        [
+            ("P1", "ROSSI MARIO", dt.date(1980, 1, 1), "M", "", "333111", dt.date(2024, 12, 1), "1", "S"),
+            ("P2", "BIANCHI ANNA", dt.date(2015, 7, 1), "F", "", "333222", dt.date(2023, 1, 1), "21", "S"),
+            ("P3", "VERDI LUCA", dt.date(1990, 1, 1), "M", "0555", "", dt.date(2025, 1, 1), "5", "S"),
+            ("P4", "NERI SARA", dt.date(1970, 1, 1), "F", "", "333444", dt.date(2025, 5, 1), "2", "N"),
+            ("P5", "GIALLI ELSA", None, "F", "", "333555", None, "4", "S"),
+        ],
+    )
+
+    db = tmp_path / "studio.db"
+    conn = sqlite3.connect(str(db))
+    conn.execute("CREATE TABLE richiami (id INTEGER PRIMARY KEY, paziente_id TEXT, data_ultima_visita TEXT, "
+                 "tipo_richiamo TEXT, tempo_richiamo INTEGER, da_richiamare TEXT)")
+    conn.executemany("INSERT INTO richiami VALUES (?, ?, ?, ?, ?, ?)", [
+        (1, "P1", None, "1", 6, "S"),
+        (2, "P2", None, "21", 6, "S"),
+        (3, "P3", "2024-11-20", "5", 12, "S"),
+        (4, "P4", None, "2", 6, "S"),      # la tabella richiami riattiva il paziente
+    ])
+    conn.commit()
+    conn.close()
+    return RecallIndex(str(pazienti), richiami_db_path=str(db)), pazienti, db, igiene
+
+
+def test_selezione_per_range_e_aggiornamento_incrementale(sources, modifica_dbf):
+    index, pazienti, db, igiene = sources
+
+    tutti = index.select(solo_cellulare=False, today=OGGI)
+    assert [(p["id"], p["giorni_ritardo"]) for p in tutti] == [("P1", 14), ("P2", 0), ("P3", 0), ("P4", 0), ("P5", 0)]
+    p2 = tutti[1]
+    assert p2["data_richiamo_prevista"] == "2025-07-10"  # ultima igiene da PREVENT, non DB_PAULTVI
+    assert (p2["ultima_visita"], p2["tipo_richiamo_nomi"], p2["mesi_dalla_visita"]) == (
+        "2023-01-01", ["Igiene", "Generico"], 5)
+    assert tutti[4]["data_richiamo_prevista"] is None  # senza mesi nella tabella richiami
+
+    assert [p["id"] for p in index.select(tipo_filtro="2", today=OGGI)] == ["P2", "P4"]
+    assert [p["id"] for p in index.select(tipo_filtro="21", solo_cellulare=False, today=OGGI)] == ["P2"]
+    assert [p["id"] for p in index.select(filtro="donne", today=OGGI)] == ["P2", "P4", "P5"]
+    assert [p["id"] for p in index.select(filtro="bambini", eta_max=16, today=OGGI)] == ["P2"]
+    assert [p["id"] for p in index.select(scaduti_solo=True, today=OGGI)] == ["P1"]
+    assert index.select(ritardo_max_giorni=10, solo_cellulare=False, scaduti_solo=True, today=OGGI) == []
+    entro = [p["id"] for p in index.select(entro=dt.date(2025, 7, 31), solo_cellulare=False, today=OGGI)]
+    assert entro == ["P1", "P2"]
+    assert len(index.select(solo_cellulare=False, limit=2, today=OGGI)) == 2
+
+    # Modifica della tabella richiami: ricalcolato solo P3
+    computed = index.get_status()["stats"]["rows_computed"]
+    conn = sqlite3.connect(str(db))
+    conn.execute("UPDATE richiami SET data_ultima_visita = '2024-01-10' WHERE paziente_id = 'P3'")
+    conn.commit()
+    conn.close()
+    assert [p["id"] for p in index.select(scaduti_solo=True, solo_cellulare=False, today=OGGI)] == ["P3", "P1"]
+    assert index.get_status()["stats"]["rows_computed"] == computed + 1
+
+    # Nuova igiene in PREVENT: P2 si sposta, P4 entra tra gli scaduti
+    igiene["version"] += 1
+    igiene["lookup"] = {"P2": (dt.date(2025, 3, 1), 2), "P4": (dt.date(2024, 10, 1), 5)}
+    scaduti = index.select(scaduti_solo=True, today=OGGI)
+    assert [(p["id"], p["giorni_ritardo"]) for p in scaduti] == [("P4", 75), ("P1", 14)]
+
+    # Paziente non piu' da richiamare nel DBF (senza voce nella tabella richiami)
+    with modifica_dbf(pazienti) as table:
+        with table[4] as record:
+            record.db_parichi = "N"
+    assert [p["id"] for p in index.select(filtro="donne", today=OGGI)] == ["P4", "P2"]
+    assert index.get_status()["da_richiamare"] == 4
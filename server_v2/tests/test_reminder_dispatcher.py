@@ -0,0 +1,63 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import core.automation_config as automation_config
+import services.appointment_reminder_service as reminders
+from services.reminder_dispatcher import DispatchJob, DispatchSettings, ReminderDispatcher, TokenBucket
+
+
+class _FakeEvolution(BaseHTTPRequestHandler):
+    """Evolution API finta: la prima sendText risponde 503, le successive 201."""
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.requests.append(body['number'])
+        status = 503 if len(self.requests) == 1 else 201
+        payload = json.dumps({'key': {'id': f"MSG{len(self.requests)}"}}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_token_bucket_rispetta_raffica_e_rate():
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds):
+        waits.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0], sleep=sleep)
+    assert [bucket.acquire() for _ in range(4)] == [0.0, 0.0, 0.5, 0.5]
+    assert waits == [0.5, 0.5]
+
+
+def test_dispatch_con_retry_e_idempotenza(monkeypatch):
+    server = HTTPServer(('127.0.0.1', 0), _FakeEvolution)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(reminders, 'EVOLUTION_BASE_URL', f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(automation_config, 'get_automation_settings', lambda: {})
+    _FakeEvolution.requests = []
+
+    dispatcher = ReminderDispatcher(DispatchSettings(workers=2, retries=2, backoff_seconds=0.01,
+                                                     rates={'whatsapp': 100}, bursts={'whatsapp': 10}))
+    job = DispatchJob(key='P1|2026-01-02|09:00|24h', channel='whatsapp',
+                      send=lambda: reminders.send_whatsapp_text('3331234567', 'promemoria'))
+    results = []
+    try:
+        dispatcher.dispatch([job, job], lambda j, result: results.append(result))
+    finally:
+        server.shutdown()
+
+    assert len(results) == 1
+    assert results[0]['success'] and results[0]['attempts'] == 2
+    assert _FakeEvolution.requests == ['393331234567', '393331234567']
+    assert dispatcher.stats['retries'] == 1
+    assert dispatcher.stats['duplicates_skipped'] == 1
@@ -0,0 +1,57 @@
+import sqlite3
+
+import pytest
+
+import services.richiami_service as richiami_service
+from services.richiami_service import RichiamiService
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(richiami_service, "_TABLES_READY", True)
+    svc = RichiamiService()
+    svc.db_path = str(tmp_path / "studio.db")
+    monkeypatch.setattr(richiami_service, "_TABLES_READY", False)
+    svc._ensure_tables()
+    svc.create_richiamo("P1", "ROSSI MARIO", "2025-01-10", "1", 6)
+    svc.create_richiamo("P2", "BIANCHI ANNA", "2025-02-01", "2", 6)
+    return svc
+
+
+def _rows(svc):
+    conn = sqlite3.connect(svc.db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return {r["paziente_id"]: dict(r) for r in conn.execute("SELECT * FROM richiami ORDER BY id")}
+    finally:
+        conn.close()
+
+
+def test_bulk_upsert_diff_e_transazione_unica(service):
+    records = [
+        {"paziente_id": "P1", "nome": "ROSSI MARIO", "data_ultima_visita": "2025-01-10",
+         "tipo_richiamo": "1", "tempo_richiamo": 6, "da_richiamare": "S"},          # invariato
+        {"paziente_id": "P2", "nome": "BIANCHI ANNA", "data_ultima_visita": "2025-05-01",
+         "tipo_richiamo": "21", "tempo_richiamo": 12, "da_richiamare": "S"},        # cambiato
+        {"paziente_id": "P3", "nome": "VERDI LUCA", "data_ultima_visita": "2025-03-01",
+         "tipo_richiamo": "5", "tempo_richiamo": 12, "da_richiamare": "R"},         # nuovo, gia' richiamato
+        {"paziente_id": "P4", "nome": "NERI SARA", "da_richiamare": ""},            # senza stato
+    ]
+
+    report = service.bulk_upsert(records, update_existing=False)["data"]
+    assert {k: report[k] for k in ("inserted", "updated", "unchanged", "existing", "skipped")} == {
+        "inserted": 1, "updated": 0, "unchanged": 1, "existing": 1, "skipped": 1}
+    assert report["inserted_ids"] == ["P3"]
+    rows = _rows(service)
+    assert rows["P2"]["tipo_richiamo"] == "2"
+    assert (rows["P3"]["da_richiamare"], rows["P3"]["data_richiamo"]) == ("R", "2026-02-24")
+    assert rows["P3"]["richiamato_il"] is not None
+
+    report = service.bulk_upsert(records)["data"]
+    assert (report["inserted"], report["updated"], report["unchanged"]) == (0, 1, 2)
+    assert report["changes"] == [{"paziente_id": "P2", "fields": {
+        "data_ultima_visita": ["2025-02-01", "2025-05-01"], "tipo_richiamo": ["2", "21"], "tempo_richiamo": [6, 12]}}]
+    rows = _rows(service)
+    assert len(rows) == 3
+    assert (rows["P2"]["tipo_richiamo"], rows["P2"]["tempo_richiamo"], rows["P2"]["data_richiamo"]) == (
+        "21", 12, "2026-04-26")
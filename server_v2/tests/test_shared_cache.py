@@ -0,0 +1,50 @@
+import threading
+import time
+
+import numpy as np
+
+from core.shared_cache import CacheNamespace, estimate_size
+
+
+def test_budget_in_byte_lru_e_versione():
+    cache = CacheNamespace("test", max_bytes=3000)
+    assert estimate_size(np.zeros(100, dtype=np.float64)) == 800
+
+    cache.set("a", np.zeros(100), version=1)
+    cache.set("b", np.zeros(100), version=1)
+    assert cache.get("a", version=1) is not None  # "a" diventa la più recente
+    cache.set("c", np.zeros(200), version=1)
+
+    assert cache.get("b", version=1) is None
+    assert cache.get("a", version=2) is None  # file cambiato: voce scartata
+    assert cache.get("c", version=1) is not None
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1 and stats["stale_versions"] == 1
+    assert stats["bytes"] == 1600
+    assert cache.set("big", np.zeros(1000)) is False
+
+
+def test_single_flight_un_solo_caricamento():
+    cache = CacheNamespace("test", max_bytes=1 << 20)
+    calls = []
+    started = threading.Event()
+
+    def loader():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return {"righe": list(range(10))}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", loader, version=7)))
+               for _ in range(5)]
+    threads[0].start()
+    started.wait()
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert all(r is results[0] for r in results)
+    assert cache.get_stats()["coalesced"] == 4
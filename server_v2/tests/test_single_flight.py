@@ -0,0 +1,40 @@
+import threading
+import time
+
+import pytest
+
+from core.single_flight import SingleFlight
+
+
+def test_errore_propagato_a_tutti_e_metriche():
+    group = SingleFlight("test")
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.05)
+        raise ValueError("DBF illeggibile")
+
+    errors = []
+
+    def call():
+        try:
+            group.do("k", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    threads[0].start()
+    started.wait()
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(errors) == 3 and errors[0] is errors[1] is errors[2]
+    stats = group.get_stats()
+    assert stats["executions"] == 1 and stats["coalesced"] == 2 and stats["errors"] == 1
+    assert stats["coalescing_rate_percent"] == pytest.approx(66.7)
+
+    # Chiave libera: nuova esecuzione, risultato non condiviso
+    assert group.do("k", lambda: 42) == (42, False)
@@ -0,0 +1,45 @@
+import datetime as dt
+
+import pytest
+
+import services.slot_finder_service as slot_finder
+
+LUNEDI = dt.date(2025, 3, 3)
+
+
+@pytest.fixture
+def agenda(dbf_file, monkeypatch):
+    path = dbf_file(
+        "APPUNTA.DBF",
+        "DB_APDATA D; DB_APOREIN N(5,2); DB_APOREOU N(5,2); DB_APMEDIC N(3,0); DB_NOTE C(20); DB_APDESCR C(30)",
+        [
+            (LUNEDI, 9.0, 10.0, 1, "", "CONTROLLO"),
+            (LUNEDI, 14.0, 15.0, 5, "", "IGIENE"),
+        ],
+    )
+    monkeypatch.setattr(slot_finder, "_get_appunta_path", lambda: str(path))
+    monkeypatch.setattr(slot_finder, "build_last_igienista_lookup", lambda: {"P3": (dt.date(2024, 9, 1), 5)})
+    return path
+
+
+def test_batch_assegna_slot_senza_conflitti(agenda):
+    pazienti = [
+        {"id": "P1", "nome": "ROSSI", "tipo_richiamo": "1"},
+        {"id": "P2", "nome": "VERDI", "tipo_richiamo": "4"},
+        {"id": "P3", "nome": "BIANCHI", "tipo_richiamo": "21"},
+    ]
+
+    risultati = slot_finder.pianifica_slot_batch(pazienti, giorni_avanti=7, alternative=1, data_inizio=LUNEDI)
+
+    slot = [(r["slot"]["data"], r["slot"]["inizio"], r["slot"]["operatore_id"]) for r in risultati]
+    assert slot == [
+        ("2025-03-03", "10:00", 1),
+        ("2025-03-03", "10:30", 1),
+        ("2025-03-03", "15:40", 5),
+    ]
+    assert risultati[2]["operatore_suggerito"] == "anet"
+    assert risultati[2]["ultima_igiene"] == {"operatore_id": 5, "data": "2024-09-01"}
+    # Le alternative partono dopo lo slot riservato, non lo duplicano
+    assert risultati[1]["alternative"][0]["inizio"] == "11:00"
+    # La ricerca singola non vede le prenotazioni del lotto
+    assert slot_finder.trova_slot_liberi(1, 30, max_slot=1, data_inizio=LUNEDI)[0]["inizio"] == "10:00"
@@ -0,0 +1,53 @@
+import dbf
+
+from services.dbf_mirror import DbfMirror
+from services.snapshot_manager import SnapshotManager
+
+
+def test_modifiche_per_offset_con_cancellazioni(tmp_path, dbf_file, mirror, modifica_dbf):
+    path = dbf_file("PREVENT.DBF", "DB_PRONCOD C(6); DB_GUARDIA N(1,0); DB_PRDESCR C(20)",
+                    [(codice, 1, "Visita") for codice in ("A1", "A2", "A3")])
+
+    manager = SnapshotManager(snapshot_dir=str(tmp_path / "snapshots"), mirror=mirror)
+    assert manager.start_monitoring("preventivi", str(path))
+    assert manager.get_changes("preventivi") == []
+
+    with modifica_dbf(path) as table:
+        with table[0] as record:
+            record.db_guardia = 3
+        dbf.delete(table[1])
+        table.append(("A4", 2, "Igiene"))
+
+    changes = manager.get_changes("preventivi")
+    assert [c["type"] for c in changes] == ["modified", "deleted", "new"]
+    assert changes[0]["old_data"]["DB_GUARDIA"] == 1 and changes[0]["new_data"]["DB_GUARDIA"] == 3
+    assert changes[1]["old_data"]["DB_PRONCOD"] == "A2"
+    assert changes[2]["new_data"] == {"DB_PRONCOD": "A4", "DB_GUARDIA": 2, "DB_PRDESCR": "Igiene"}
+
+    assert manager.update_snapshot("preventivi")
+    assert manager.get_changes("preventivi") == []
+    assert manager.get_snapshot_status()["tables"]["preventivi"]["record_count"] == 3
+
+
+def test_snapshot_persistito_come_base_piu_delta(tmp_path, dbf_file, mirror, modifica_dbf):
+    path = dbf_file("PREVENT.DBF", "DB_PRONCOD C(6); DB_GUARDIA N(1,0)", [("A1", 1), ("A2", 1)])
+    snapshot_dir = str(tmp_path / "snapshots")
+
+    primo = SnapshotManager(snapshot_dir=snapshot_dir, mirror=mirror)
+    primo.start_monitoring("preventivi", str(path))
+    with modifica_dbf(path) as table:
+        table.append(("A3", 1))
+    assert [c["type"] for c in primo.get_changes("preventivi")] == ["new"]
+    primo.update_snapshot("preventivi")
+    assert primo.store.get_stats()["delta_writes"] == 1
+
+    # Riavvio: metadati subito, immagine (base + delta) solo al primo confronto
+    secondo = SnapshotManager(snapshot_dir=snapshot_dir,
+                              mirror=DbfMirror(mirror_dir=str(mirror.mirror_dir), stat_interval=0))
+    assert secondo.load_existing_snapshots("preventivi") == {"preventivi": True}
+    assert secondo.get_snapshot("preventivi").record_count == 3
+    with modifica_dbf(path) as table:
+        with table[2] as record:
+            record.db_guardia = 3
+    changes = secondo.get_changes("preventivi")
+    assert [(c["type"], c["old_data"]["DB_GUARDIA"]) for c in changes] == [("modified", 1)]
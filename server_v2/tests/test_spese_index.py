@@ -0,0 +1,66 @@
+import datetime as dt
+
+import dbf
+import pytest
+
+from services.spese_fornitori_service import SpeseFornitoriService
+
+
+@pytest.fixture
+def service(dbf_file, modifica_dbf, monkeypatch):
+    spese = dbf_file(
+        "SPESAFOR.DBF",
+        "DB_CODE C(8); DB_SPFOCOD C(8); DB_SPDATA D; DB_SPNUMER C(10); DB_SPDESCR C(30); "
+        "DB_SPCOSTO N(10,2); DB_SPCOIVA N(10,2); DB_NOTE C(20)",
+        [
+            ("S1", "F1", dt.date(2025, 3, 1), "A/1", "GUANTI", 100.0, 22.0, ""),
+            ("S2", "F2", dt.date(2025, 3, 1), "B/7", "IMPIANTI", 500.0, 0.0, "urgente"),
+            ("S3", "F1", dt.date(2025, 5, 10), "A/2", "MASCHERINE", 50.0, 11.0, ""),
+            ("S4", "F3", dt.date(2024, 12, 31), "C/1", "AFFITTO", 1000.0, 0.0, ""),
+            ("S5", "F2", dt.date(2025, 1, 15), "B/1", "FRESE", 80.0, 17.6, ""),
+            ("", "F1", dt.date(2025, 6, 1), "", "SENZA CODICE", 1.0, 0.0, ""),
+            ("S6", "F3", dt.date(2025, 2, 1), "C/2", "CANCELLATA", 1.0, 0.0, ""),
+        ],
+    )
+    with modifica_dbf(spese) as table:
+        dbf.delete(table[-1])
+
+    fornitori = dbf_file("FORNITOR.DBF", "DB_CODE C(8); DB_FONOME C(30)", [
+        ("F1", "Zeta Dental"),
+        ("F2", "Alfa Impianti"),
+        ("F3", "Zeta Dental"),
+    ])
+
+    svc = SpeseFornitoriService(None)
+    monkeypatch.setattr(svc, "_get_spese_dbf_path", lambda: str(spese))
+    monkeypatch.setattr(svc, "_get_fornitori_dbf_path", lambda: str(fornitori))
+    monkeypatch.setattr(svc, "_classification_filter",
+                        lambda conto_id=None, branca_id=None, sottoconto_id=None: {"F2"} if conto_id else None)
+    return svc
+
+
+def test_lista_filtri_e_aggregati_dall_indice(service):
+    result = service.get_spese(page=1, per_page=2, filters={"anno": 2025})
+    assert (result["total"], result["pages"], result["has_next"]) == (4, 2, True)
+    assert [s["id"] for s in result["spese"]] == ["S3", "S2"]  # data desc, poi nome fornitore
+    assert result["spese"][1] == {
+        "id": "S2", "codice_fornitore": "F2", "nome_fornitore": "Alfa Impianti", "data_spesa": dt.date(2025, 3, 1),
+        "numero_documento": "B/7", "descrizione": "IMPIANTI", "costo_netto": 500.0, "costo_iva": 0.0,
+        "note": "urgente", "totale": 500.0,
+    }
+    assert [s["id"] for s in service.get_spese(2, 2, {"anno": 2025})["spese"]] == ["S1", "S5"]
+
+    assert service.get_spese(1, 10, {"codice_fornitore": "F1, F3"})["total"] == 3
+    assert [s["id"] for s in service.get_spese(1, 10, {"conto_id": 4})["spese"]] == ["S2", "S5"]
+    assert [s["id"] for s in service.get_spese(1, 10, {"search": "b/"})["spese"]] == ["S2", "S5"]
+    filtro_date = {"data_inizio": "2025-01-01", "data_fine": "2025-03-01"}
+    assert [s["id"] for s in service.get_spese(1, 10, filtro_date)["spese"]] == ["S2", "S1", "S5"]
+
+    riepilogo = service.get_riepilogo_spese(2025)
+    assert [(r["nome"], r["id"], r["importo_totale"], r["numero_fatture"]) for r in riepilogo["data"]] == [
+        ("Alfa Impianti", "F2", 597.6, 2), ("Zeta Dental", "F1", 183.0, 2)]
+
+    assert service.get_active_suppliers(None) == [{"id": "F2", "nome": "Alfa Impianti"},
+                                                  {"id": "F1,F3", "nome": "Zeta Dental"}]
+    assert service.get_stats({"anno": 2025, "codice_fornitore": "F1"})["data"] == {
+        "total_costo": 150.0, "total_iva": 33.0, "total_grand": 183.0, "count": 2}
@@ -0,0 +1,74 @@
+import sqlite3
+import threading
+
+import pytest
+
+from core.config import Config
+from core.database_manager import DatabaseManager
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = DatabaseManager(Config(db_path=str(tmp_path / "main.db"), environment="test"))
+    yield manager
+    manager.release_thread_connections()
+
+
+def test_connessione_per_thread_riusata_con_statistiche(manager, tmp_path):
+    db = str(tmp_path / "altro.db")
+    with manager.connection(db, caller="setup") as conn:
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+        first = conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 0
+
+    # Commit all'uscita del blocco piu' esterno, i blocchi annidati condividono la transazione
+    with manager.connection(db, caller="svc") as conn:
+        assert conn is first
+        conn.execute("INSERT INTO t (v) VALUES ('a')")
+        with manager.connection(db, caller="svc", row_factory=None) as inner:
+            assert inner.execute("SELECT v FROM t").fetchone() == ("a",)
+        assert conn.in_transaction
+    with pytest.raises(RuntimeError):
+        with manager.connection(db, caller="svc") as conn:
+            conn.execute("INSERT INTO t (v) VALUES ('b')")
+            raise RuntimeError("boom")
+    assert manager.fetch_all("SELECT v FROM t", db_path=db, caller="svc") == [{"v": "a"}]
+    assert manager.execute("INSERT INTO t (v) VALUES (?)", ("c",), db_path=db, caller="svc").rowcount == 1
+
+    check = sqlite3.connect(db)
+    assert check.execute("SELECT v FROM t ORDER BY id").fetchall() == [("a",), ("c",)]
+    check.close()
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.fetch_one("SELECT COUNT(*) AS n FROM t", db_path=db)))
+    thread.start()
+    thread.join()
+    assert other == [{"n": 2}]
+
+    stats = manager.get_statistics()
+    assert stats["thread_connections"] == 2
+    svc = stats["callers"]["svc"]
+    assert (svc["calls"], svc["statements"], svc["errors"]) == (5, 5, 1)
+    assert svc["max_ms"] >= svc["avg_ms"] > 0
+
+    # Dopo il rilascio il thread riapre una nuova connessione
+    assert manager.release_thread_connections(db) == 2
+    with manager.connection(db) as conn:
+        assert conn is not first
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 2
+
+
+
+def test_connessioni_di_thread_non_aprono_il_db_predefinito(tmp_path):
+    manager = DatabaseManager(Config(db_path=str(tmp_path / "main.db"), environment="test"))
+    db = str(tmp_path / "ad_hoc.db")
+    manager.execute("CREATE TABLE t (v TEXT)", db_path=db)
+    assert manager.fetch_all("SELECT COUNT(*) AS n FROM t", db_path=db) == [{"n": 0}]
+    assert not (tmp_path / "main.db").exists()
+
+    # Il pool sul database configurato si apre al primo get_connection
+    with manager.get_connection() as conn:
+        conn.execute("SELECT 1")
+    assert (tmp_path / "main.db").exists()
+    manager.release_thread_connections()
@@ -9,6 +9,7 @@ and adds enterprise-grade optimizations for calendar system:
 - Intelligent caching with file watching
 - Parallel processing capabilities  
 - Deleted record filtering optimization
+- Native mmap + NumPy record decoder (no per-record Python objects)
 - Memory-efficient streaming
 - Comprehensive metrics and monitoring
 
@@ -18,24 +19,23 @@ Performance Target: 10x faster than v1
 """
 
 import pandas as pd
+import numpy as np
 import logging
 import math
+import mmap
 import os
 import time
 import struct
 import threading
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union, Tuple
+from typing import Any, Callable, Dict, List, Optional, Union, Tuple
 from dataclasses import dataclass
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import hashlib
-
-# DBF libraries
-import dbf
-from dbfread import DBF
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 from core.exceptions import DbfProcessingError
 from core.config_manager import get_config
+from core.shared_cache import file_version, get_shared_cache
 from core.constants_v2 import (
     COLONNE, get_appointment_type_name, get_appointment_color, 
     get_google_color_id, get_medico_name, get_campo_dbf
@@ -571,6 +571,423 @@ def clean_materiali_data(df: pd.DataFrame) -> pd.DataFrame:
     return normalize_dbf_data(df, field_mappings, ['codice_materiale', 'descrizione'])
 
 
+# =============================================================================
+# NATIVE DBF DECODER (MMAP + NUMPY)
+# =============================================================================
+
+DBF_ENCODING = 'cp1252'
+
+_CHAR_TYPES = {'C', 'V'}
+_NUMERIC_TYPES = {'N', 'F'}
+_MEMO_TYPES = {'M', 'G', 'P', 'W'}
+_SKIPPED_TYPES = {'0'}  # _NullFlags di Visual FoxPro
+_DELETED_FLAG = 0x2A    # '*'
+
+
+@dataclass(frozen=True)
+class DbfField:
+    """Descrittore di un campo DBF (offset relativo all'inizio del record)."""
+    name: str
+    type: str
+    offset: int
+    length: int
+    decimals: int
+
+
+@dataclass(frozen=True)
+class DbfHeader:
+    """Header di un file DBF con i descrittori dei campi."""
+    version: int
+    record_count: int
+    header_length: int
+    record_length: int
+    fields: Tuple[DbfField, ...]
+
+    @property
+    def data_fields(self) -> Tuple[DbfField, ...]:
+        """Campi con dati utente (esclusi i campi di sistema come _NullFlags)."""
+        return tuple(f for f in self.fields if f.type not in _SKIPPED_TYPES and f.length > 0)
+
+    @property
+    def layout(self) -> Tuple[Tuple[str, str, int, int, int], ...]:
+        """Firma del layout record: se cambia serve una ricostruzione completa."""
+        return tuple((f.name, f.type, f.offset, f.length, f.decimals) for f in self.fields) + (
+            ('', '', self.header_length, self.record_length, 0),
+        )
+
+    @property
+    def numpy_dtype(self) -> np.dtype:
+        """Dtype strutturato del record: flag di cancellazione + un campo S<len> per colonna."""
+        fields = self.data_fields
+        return np.dtype({
+            'names': ['_DELETED'] + [f.name for f in fields],
+            'formats': ['S1'] + [f'S{f.length}' for f in fields],
+            'offsets': [0] + [f.offset for f in fields],
+            'itemsize': self.record_length,
+        })
+
+
+def parse_dbf_header(buffer) -> DbfHeader:
+    """Decodifica header e field descriptor da un buffer (bytes o mmap) che inizia dal byte 0."""
+    if len(buffer) < 32:
+        raise DbfProcessingError("Header DBF troncato")
+
+    version = buffer[0]
+    record_count, header_length, record_length = struct.unpack_from('<IHH', buffer, 4)
+
+    fields = []
+    offset = 1  # byte 0 = flag di cancellazione
+    position = 32
+    while position + 32 <= len(buffer):
+        descriptor = bytes(buffer[position:position + 32])
+        if descriptor[0] == 0x0D:
+            break
+        name = descriptor[:11].split(b'\x00', 1)[0].decode('ascii', errors='ignore').strip().upper()
+        field_type = chr(descriptor[11]).upper()
+        length = descriptor[16]
+        decimals = descriptor[17]
+        fields.append(DbfField(name, field_type, offset, length, decimals))
+        offset += length
+        position += 32
+
+    return DbfHeader(version, record_count, header_length, record_length, tuple(fields))
+
+
+def _read_header_from(f, file_path: str) -> DbfHeader:
+    f.seek(0)
+    head = f.read(32)
+    if len(head) < 32:
+        raise DbfProcessingError("Header DBF troncato", file_path=file_path)
+    header_length = struct.unpack_from('<H', head, 8)[0]
+    return parse_dbf_header(head + f.read(max(0, header_length - 32)))
+
+
+def read_dbf_header(file_path: str) -> DbfHeader:
+    """Legge solo l'header di un file DBF (due read, nessun record)."""
+    with open(file_path, 'rb') as f:
+        return _read_header_from(f, file_path)
+
+
+def _field_bytes(raw: np.ndarray, field: DbfField) -> np.ndarray:
+    # Copia contigua: i risultati non devono tenere riferimenti al file mappato
+    return raw[:, field.offset:field.offset + field.length].copy()
+
+
+def _parse_ascii_digits(block: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Interpreta blocchi di cifre ASCII; restituisce (valori interi, maschera validita')."""
+    digits = block.astype(np.int64) - 48
+    valid = np.all((digits >= 0) & (digits <= 9), axis=1)
+    values = np.zeros(block.shape[0], dtype=np.int64)
+    for column in range(block.shape[1]):
+        values = values * 10 + np.where(valid, digits[:, column], 0)
+    return values, valid
+
+
+def _decode_date(raw: np.ndarray, field: DbfField) -> np.ndarray:
+    """Campi D (YYYYMMDD in ASCII) -> datetime64[D], NaT se vuoti o non validi."""
+    block = _field_bytes(raw, field)
+    result = np.full(block.shape[0], np.datetime64('NaT'), dtype='datetime64[D]')
+    if block.shape[1] != 8 or block.shape[0] == 0:
+        return result
+
+    values, valid = _parse_ascii_digits(block)
+    year = values // 10000
+    month = (values // 100) % 100
+    day = values % 100
+    valid &= (year > 0) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+
+    months = (year[valid] - 1970) * 12 + (month[valid] - 1)
+    days = np.datetime64('1970-01', 'M') + months.astype('timedelta64[M]')
+    result[valid] = days.astype('datetime64[D]') + (day[valid] - 1).astype('timedelta64[D]')
+    return result
+
+
+def _decode_datetime(raw: np.ndarray, field: DbfField) -> np.ndarray:
+    """Campi T di Visual FoxPro (giorno giuliano + millisecondi) -> datetime64[ms]."""
+    block = _field_bytes(raw, field)
+    result = np.full(block.shape[0], np.datetime64('NaT'), dtype='datetime64[ms]')
+    if block.shape[1] != 8 or block.shape[0] == 0:
+        return result
+
+    parts = block.view('<i4').reshape(-1, 2)
+    julian, millis = parts[:, 0].astype(np.int64), parts[:, 1].astype(np.int64)
+    valid = julian > 0
+    epoch_days = julian[valid] - 2440588  # 2440588 = 1970-01-01
+    result[valid] = (epoch_days * 86400000 + millis[valid]).astype('datetime64[ms]')
+    return result
+
+
+def _decode_numeric(raw: np.ndarray, field: DbfField) -> np.ndarray:
+    """Campi N/F (numeri ASCII allineati a destra) -> float64, NaN se vuoti."""
+    block = _field_bytes(raw, field)
+    count = block.shape[0]
+    if count == 0:
+        return np.zeros(0, dtype=np.float64)
+
+    digits = block.astype(np.int64) - 48
+    is_digit = (digits >= 0) & (digits <= 9)
+    after_point = np.cumsum(block == ord('.'), axis=1) > 0
+
+    mantissa = np.zeros(count, dtype=np.int64)
+    for column in range(block.shape[1]):
+        mantissa = np.where(is_digit[:, column], mantissa * 10 + digits[:, column], mantissa)
+    scale = np.sum(is_digit & after_point, axis=1)
+
+    values = mantissa.astype(np.float64) / np.power(10.0, scale)
+    values = np.where(np.any(block == ord('-'), axis=1), -values, values)
+    return np.where(np.any(is_digit, axis=1), values, np.nan)
+
+
+def _decode_logical(raw: np.ndarray, field: DbfField) -> np.ndarray:
+    """Campi L -> int8: 1 vero, 0 falso, -1 non valorizzato."""
+    block = _field_bytes(raw, field)[:, 0]
+    result = np.full(block.shape[0], -1, dtype=np.int8)
+    result[np.isin(block, np.frombuffer(b'TtYy', dtype=np.uint8))] = 1
+    result[np.isin(block, np.frombuffer(b'FfNn', dtype=np.uint8))] = 0
+    return result
+
+
+def _decode_memo_pointer(raw: np.ndarray, field: DbfField) -> np.ndarray:
+    """Campi memo -> numero di blocco nel file .FPT/.DBT (0 = vuoto)."""
+    block = _field_bytes(raw, field)
+    if field.length == 4:
+        return block.view('<i4').reshape(-1).astype(np.int64)
+    values, valid = _parse_ascii_digits(np.where(block == 0x20, 48, block).astype(np.uint8))
+    return np.where(valid, values, 0)
+
+
+def decode_dbf_column(raw: np.ndarray, field: DbfField) -> np.ndarray:
+    """
+    Decodifica un campo per tutte le righe di `raw` (matrice n_record x record_length).
+
+    Tipi risultanti: char -> bytes S<len>, D -> datetime64[D], T -> datetime64[ms],
+    N/F -> float64 (NaN se vuoto), L -> int8 (1/0/-1), memo -> numero di blocco.
+    """
+    if field.type in _CHAR_TYPES:
+        return _field_bytes(raw, field).view(f'S{field.length}').reshape(-1)
+    if field.type == 'D':
+        return _decode_date(raw, field)
+    if field.type == 'T':
+        return _decode_datetime(raw, field)
+    if field.type in _NUMERIC_TYPES:
+        return _decode_numeric(raw, field)
+    if field.type == 'L':
+        return _decode_logical(raw, field)
+    if field.type == 'I':
+        return _field_bytes(raw, field).view('<i4').reshape(-1).astype(np.int64)
+    if field.type == 'B':
+        return _field_bytes(raw, field).view('<f8').reshape(-1)
+    if field.type == 'Y':
+        return _field_bytes(raw, field).view('<i8').reshape(-1) / 10000.0
+    if field.type in _MEMO_TYPES:
+        return _decode_memo_pointer(raw, field)
+    return _field_bytes(raw, field).view(f'S{field.length}').reshape(-1)
+
+
+def dbf_column_values(field: DbfField,
+                      column: np.ndarray,
+                      memo_reader: Optional[Callable[[int], str]] = None) -> List[Any]:
+    """
+    Converte una colonna decodificata in valori Python con la stessa semantica
+    della libreria dbf: str ripulite, date/datetime o None, int se senza
+    decimali altrimenti float, bool o None, testo memo.
+    """
+    if field.type in _CHAR_TYPES:
+        return [v.decode(DBF_ENCODING, errors='ignore').strip() for v in column.tolist()]
+    if field.type in ('D', 'T'):
+        return column.astype(object).tolist()
+    if field.type == 'L':
+        return [None if v < 0 else bool(v) for v in column.tolist()]
+    if field.type in _NUMERIC_TYPES:
+        as_int = field.decimals == 0
+        return [None if v != v else (int(v) if as_int else v) for v in column.tolist()]
+    if field.type in _MEMO_TYPES:
+        if memo_reader is None:
+            return [''] * len(column)
+        return [memo_reader(int(block)) for block in column.tolist()]
+    if column.dtype.kind == 'S':
+        return [v.decode(DBF_ENCODING, errors='ignore').strip() for v in column.tolist()]
+    return column.tolist()
+
+
+def locate_dbf_memo(file_path: str) -> Optional[str]:
+    """Percorso del file memo (.FPT/.DBT) associato a un DBF, se esiste."""
+    base = os.path.splitext(file_path)[0]
+    for ext in ('.FPT', '.fpt', '.DBT', '.dbt'):
+        if os.path.exists(base + ext):
+            return base + ext
+    return None
+
+
+def read_dbf_memo(memo_path: Optional[str], block: int) -> str:
+    """Legge il testo di un blocco memo (FoxPro .FPT o dBase .DBT)."""
+    if not memo_path or block <= 0:
+        return ''
+    try:
+        with open(memo_path, 'rb') as f:
+            if memo_path.lower().endswith('.fpt'):
+                f.seek(6)
+                block_size = struct.unpack('>H', f.read(2))[0] or 64
+                f.seek(block * block_size)
+                _, length = struct.unpack('>II', f.read(8))
+                data = f.read(length)
+            else:
+                f.seek(block * 512)
+                data = f.read(65536).split(b'\x1a', 1)[0]
+        return data.decode(DBF_ENCODING, errors='ignore').strip()
+    except Exception as e:
+        logger.warning(f"Lettura memo fallita ({memo_path}, blocco {block}): {e}")
+        return ''
+
+
+class DbfRecordDecoder:
+    """
+    Decoder DBF nativo basato su mmap.
+
+    L'header viene letto una sola volta e i record sono esposti come viste
+    NumPy sul file mappato, senza copie e senza un oggetto Python per record:
+    - `raw`: matrice (n_record, record_length) di byte
+    - `records`: array strutturato con un campo S<len> per colonna
+    Le conversioni (date, numeri, char) avvengono per colonna in forma
+    vettoriale e solo sulle righe richieste.
+
+    Con `start`/`stop` viene mappata solo la finestra di record richiesta
+    (offset = header_length + start * record_length): e' la base del chunking
+    parallelo. Gli indici di riga sono relativi a `first_record`.
+
+    Usare come context manager e chiudere subito: su Windows un file mappato
+    non puo' essere esteso dal gestionale mentre la mappa e' aperta.
+
+    Esempio:
+        with DbfRecordDecoder(path) as decoder:
+            rows = np.flatnonzero(decoder.live_mask() & decoder.month_mask('DB_APDATA', 2025, 3))
+            pazienti = decoder.values('DB_APPACOD', rows)
+    """
+
+    def __init__(self, file_path: str, start: int = 0, stop: Optional[int] = None):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        self._mmap = None
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            self.header = _read_header_from(self._file, file_path)
+
+            # Il gestionale puo' aggiornare il record count dopo aver scritto i dati
+            record_length = max(1, self.header.record_length)
+            available = max(0, (size - self.header.header_length) // record_length)
+            total = min(self.header.record_count, available)
+            self.first_record = min(max(0, start), total)
+            last = total if stop is None else min(max(stop, self.first_record), total)
+            self.record_count = last - self.first_record
+
+            if self.record_count:
+                # mmap richiede un offset allineato alla granularita' di allocazione
+                byte_offset = self.header.header_length + self.first_record * record_length
+                aligned = byte_offset - byte_offset % mmap.ALLOCATIONGRANULARITY
+                length = byte_offset - aligned + self.record_count * record_length
+                self._mmap = mmap.mmap(self._file.fileno(), length, access=mmap.ACCESS_READ, offset=aligned)
+                self.raw = np.frombuffer(self._mmap, dtype=np.uint8,
+                                         count=self.record_count * record_length,
+                                         offset=byte_offset - aligned).reshape(self.record_count, record_length)
+            else:
+                self.raw = np.zeros((0, record_length), dtype=np.uint8)
+        except Exception:
+            self.close()
+            raise
+
+        self._fields = {f.name: f for f in self.header.data_fields}
+        self._records = None
+        self._memo_path = None
+
+    def __enter__(self) -> 'DbfRecordDecoder':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def close(self) -> None:
+        """Rilascia viste, mappa e file."""
+        self.raw = None
+        self._records = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Esiste ancora una vista esterna: la mappa viene chiusa dal GC
+                pass
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def records(self) -> np.ndarray:
+        """Vista strutturata dei record (campi char grezzi S<len>, nessuna copia)."""
+        if self._records is None:
+            self._records = self.raw.reshape(-1).view(self.header.numpy_dtype) if self.record_count \
+                else np.zeros(0, dtype=self.header.numpy_dtype)
+        return self._records
+
+    @property
+    def field_names(self) -> List[str]:
+        return list(self._fields)
+
+    def has_field(self, name: str) -> bool:
+        return name.upper() in self._fields
+
+    def field(self, name: str) -> DbfField:
+        try:
+            return self._fields[name.upper()]
+        except KeyError:
+            raise DbfProcessingError(f"Campo {name} non presente in {os.path.basename(self.file_path)}",
+                                     file_path=self.file_path, field_name=name)
+
+    def deleted_mask(self) -> np.ndarray:
+        """Flag di cancellazione di tutti i record (una sola slice strided)."""
+        return self.raw[:, 0] == _DELETED_FLAG
+
+    def live_mask(self) -> np.ndarray:
+        """Maschera dei record non cancellati."""
+        return self.raw[:, 0] != _DELETED_FLAG
+
+    def _select(self, rows: Union[None, slice, np.ndarray]) -> np.ndarray:
+        if rows is None:
+            return self.raw
+        if isinstance(rows, slice):
+            return self.raw[rows]  # vista, nessuna copia
+        return self.raw[np.asarray(rows, dtype=np.int64)]
+
+    def column(self, name: str, rows: Union[None, slice, np.ndarray] = None) -> np.ndarray:
+        """Colonna tipizzata, per tutte le righe o solo per `rows` (indici o slice)."""
+        return decode_dbf_column(self._select(rows), self.field(name))
+
+    def values(self, name: str, rows: Union[None, slice, np.ndarray] = None) -> List[Any]:
+        """Valori Python (vedi dbf_column_values) per tutte le righe o solo per `rows`."""
+        return dbf_column_values(self.field(name), self.column(name, rows), self.read_memo)
+
+    def month_mask(self,
+                   name: str,
+                   year: int,
+                   month: Optional[int] = None,
+                   rows: Union[None, slice, np.ndarray] = None) -> np.ndarray:
+        """Righe con data nel mese (o nell'anno, se month e' None) indicato."""
+        dates = self.column(name, rows)
+        if month is None:
+            return dates.astype('datetime64[Y]') == np.datetime64(f'{year:04d}', 'Y')
+        return dates.astype('datetime64[M]') == np.datetime64(f'{year:04d}-{month:02d}', 'M')
+
+    def read_memo(self, block: int) -> str:
+        """Testo di un blocco memo del file .FPT/.DBT associato."""
+        if block <= 0:
+            return ''
+        if self._memo_path is None:
+            self._memo_path = locate_dbf_memo(self.file_path) or ''
+        return read_dbf_memo(self._memo_path, block)
+
+
 # =============================================================================
 # ENTERPRISE DBF OPTIMIZATIONS FOR CALENDAR SYSTEM
 # =============================================================================
@@ -603,13 +1020,70 @@ class ChunkResult:
     records: List[Dict[str, Any]]
     metrics: ReadingMetrics
 
+# Chiavi logiche COLONNE['appuntamenti'] lette per ogni appuntamento selezionato
+_APPOINTMENT_KEYS = ('data', 'ora_inizio', 'ora_fine', 'id_paziente', 'tipo',
+                     'studio', 'medico', 'note', 'descrizione')
+
+
+def _select_appointment_rows(decoder: DbfRecordDecoder,
+                             month: int,
+                             year: int,
+                             studio_id: Optional[int]) -> np.ndarray:
+    """
+    Indici (relativi al decoder) dei record non cancellati del mese richiesto,
+    opzionalmente filtrati per studio.
+    """
+    col_app = COLONNE['appuntamenti']
+    mask = decoder.live_mask()
+    mask &= decoder.month_mask(col_app['data'], year, month)        # DB_APDATA
+    if studio_id is not None:
+        mask &= decoder.column(col_app['studio']) == studio_id     # DB_APSTUDI
+    return np.flatnonzero(mask)
+
+
+def _read_appointment_values(decoder: DbfRecordDecoder, rows: np.ndarray) -> List[Dict[str, Any]]:
+    """Valori grezzi (per chiave logica) delle sole righe selezionate, decodificati per colonna."""
+    if len(rows) == 0:
+        return []
+    col_app = COLONNE['appuntamenti']
+    columns = [
+        decoder.values(col_app[key], rows) if decoder.has_field(col_app[key]) else [None] * len(rows)
+        for key in _APPOINTMENT_KEYS
+    ]
+    return [dict(zip(_APPOINTMENT_KEYS, values)) for values in zip(*columns)]
+
+
+def _read_appointment_chunk(appointments_path: str,
+                            start_record: int,
+                            end_record: int,
+                            month: int,
+                            year: int,
+                            studio_id: Optional[int]) -> Dict[str, Any]:
+    """
+    Worker di chunk (thread o processo): mappa solo i byte dei record
+    [start_record, end_record) e restituisce i valori grezzi selezionati.
+
+    Funzione di modulo e risultato serializzabile, per l'uso con ProcessPoolExecutor.
+    """
+    start_time = time.time()
+    with DbfRecordDecoder(appointments_path, start_record, end_record) as decoder:
+        rows = _select_appointment_rows(decoder, month, year, studio_id)
+        return {
+            'records': _read_appointment_values(decoder, rows),
+            'records_read': len(decoder),
+            'deleted_filtered': int(decoder.deleted_mask().sum()),
+            'execution_time_ms': (time.time() - start_time) * 1000,
+        }
+
+
 class DBFOptimizedReader:
     """
     Lettore DBF Enterprise ottimizzato per StudioDimaAI v2.
     
     Caratteristiche:
     - Chunked reading per file >100MB con parallel processing
-    - Cache intelligente con TTL e LRU eviction
+    - Cache condivisa (namespace 'dbf_reader') con budget in byte, TTL e
+      invalidazione per versione dei file; caricamenti concorrenti coalizzati
     - Deleted record filtering binario ultra-veloce  
     - Memory-efficient streaming per dataset grandi
     - Comprehensive metrics per monitoring
@@ -618,24 +1092,30 @@ class DBFOptimizedReader:
     Performance Target: 10x più veloce della v1
     """
     
-    def __init__(self, cache_ttl: int = 300, max_cache_items: int = 100):
+    def __init__(self,
+                 cache_ttl: int = 300,
+                 cache_max_bytes: Optional[int] = None,
+                 parallel_mode: str = 'thread',
+                 max_workers: Optional[int] = None):
         """
         Inizializza reader ottimizzato.
         
         Args:
             cache_ttl: Time-to-live cache in secondi (default 5 min)
-            max_cache_items: Massimo elementi in cache (LRU eviction)
+            cache_max_bytes: Budget di memoria del namespace 'dbf_reader' (LRU eviction)
+            parallel_mode: 'thread' oppure 'process' (decodifica dei chunk multi-core)
+            max_workers: Worker paralleli (default min(4, cpu))
         """
         # Performance settings
         self.default_chunk_size = 1000
-        self.max_workers = min(4, os.cpu_count() or 1)
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.parallel_mode = parallel_mode if parallel_mode in ('thread', 'process') else 'thread'
+        self._process_pool = None
+        self._process_pool_lock = threading.Lock()
         
-        # Cache intelligente
-        self.cache = {}
-        self.cache_timestamps = {}
+        # Cache condivisa: budget in byte e TTL sul namespace del reader
         self.cache_ttl = cache_ttl
-        self.max_cache_items = max_cache_items
-        self.cache_lock = threading.RLock()
+        self.cache = get_shared_cache().configure('dbf_reader', max_bytes=cache_max_bytes, ttl=cache_ttl)
         
         # File info cache
         self.file_info_cache = {}
@@ -676,35 +1156,27 @@ class DBFOptimizedReader:
             appointments_path = self._get_dbf_path('APPUNTA.DBF')
             patients_path = self._get_dbf_path('PAZIENTI.DBF')
             
-            # Smart cache key con file mtime per auto-invalidation
-            cache_key = self._generate_cache_key(
-                'appointments', appointments_path, month, year, studio_id
-            )
-            
-            # Try cache first (thread-safe)
-            cached_data = self._get_from_cache(cache_key)
-            if cached_data:
-                execution_time = (time.time() - start_time) * 1000
-                self._record_metrics(appointments_path, len(cached_data), 0, execution_time, 0, True)
-                # logger.info(f"Cache hit: {len(cached_data)} appointments for {month:02d}/{year}")
-                return cached_data
+            # Cache per (mese, anno, studio), invalidata quando cambia APPUNTA o PAZIENTI
+            loaded = []
+            def load():
+                loaded.append(True)
+                return self._load_appointments_enterprise(
+                    appointments_path=appointments_path,
+                    patients_path=patients_path,
+                    month=month,
+                    year=year,
+                    studio_id=studio_id,
+                    chunk_size=chunk_size or self.default_chunk_size
+                )
             
-            # Load con ottimizzazioni enterprise
-            appointments = self._load_appointments_enterprise(
-                appointments_path=appointments_path,
-                patients_path=patients_path,
-                month=month,
-                year=year,
-                studio_id=studio_id,
-                chunk_size=chunk_size or self.default_chunk_size
+            appointments = self._cached(
+                ('appointments', os.path.abspath(appointments_path), month, year, studio_id),
+                load, appointments_path, patients_path
             )
             
-            # Cache result con thread safety
-            self._store_in_cache(cache_key, appointments)
-            
             # Record metrics
             execution_time = (time.time() - start_time) * 1000
-            self._record_metrics(appointments_path, len(appointments), 0, execution_time, 0, False)
+            self._record_metrics(appointments_path, len(appointments), 0, execution_time, 0, not loaded)
             
             # logger.info(f"Loaded {len(appointments)} appointments for {month:02d}/{year} in {execution_time:.2f}ms")
             
@@ -750,38 +1222,26 @@ class DBFOptimizedReader:
         """
         👥 Caricamento pazienti memory-efficient con cache usando mapping COLONNE.
         """
-        cache_key = self._generate_cache_key('patients', patients_path)
-        
-        # Try cache
-        cached_patients = self._get_from_cache(cache_key)
-        if cached_patients:
-            return cached_patients
-        
+        return self._cached(
+            ('patients', os.path.abspath(patients_path)),
+            lambda: self._read_patients_names(patients_path), patients_path
+        )
+    
+    def _read_patients_names(self, patients_path: str) -> Dict[str, str]:
         patients_dict = {}
-        
+
         # Get field names da constants
         col_paz = COLONNE['pazienti']
         id_field = col_paz['id']           # DB_CODE
         name_field = col_paz['nome']       # DB_PANOME
-        
+
         try:
-            # Memory-efficient reading con mapping COLONNE
-            with dbf.Table(patients_path, codepage='cp1252') as table:
-                for record in table:
-                    try:
-                        # Uso mapping da constants invece di nomi hardcoded
-                        patient_id = clean_dbf_value(getattr(record, id_field.lower()))
-                        patient_name = clean_dbf_value(getattr(record, name_field.lower()))
-                        
-                        if patient_id and patient_name:
-                            patients_dict[str(patient_id)] = str(patient_name)
-                    except Exception as e:
-                        # Skip record con errore
-                        continue
-            
-            # Cache con TTL
-            self._store_in_cache(cache_key, patients_dict)
-            # logger.debug(f"Cached {len(patients_dict)} patients from {name_field}")
+            # Lettura colonnare dal mirror condiviso (niente dbf.Table per record)
+            from services.dbf_mirror import get_dbf_mirror
+            table = get_dbf_mirror().table_at(patients_path)
+            for patient_id, patient_name in zip(table.values(id_field), table.values(name_field)):
+                if patient_id and patient_name:
+                    patients_dict[patient_id] = patient_name
             
         except Exception as e:
             logger.error(f"Error loading patients: {e}")
@@ -797,46 +1257,14 @@ class DBFOptimizedReader:
                                       studio_id: Optional[int]) -> List[Dict[str, Any]]:
         """
         📄 Single-chunk reading ottimizzato per file piccoli.
+
+        Filtri (cancellati, mese, studio) calcolati per colonna sul file mappato:
+        si costruisce un dict solo per gli appuntamenti selezionati.
         """
-        
-        appointments = []
-        deleted_records = self._get_deleted_records_binary(appointments_path)
-        
-        with dbf.Table(appointments_path, codepage='cp1252') as table:
-            record_index = 0
-            
-            for record in table:
-                # Skip deleted (ultra-fast binary check)
-                if record_index in deleted_records:
-                    record_index += 1
-                    continue
-                
-                # Date filter usando mapping COLONNE
-                try:
-                    col_app = COLONNE['appuntamenti']
-                    app_date = getattr(record, col_app['data'].lower())  # DB_APDATA
-                    if not app_date or app_date.month != month or app_date.year != year:
-                        record_index += 1
-                        continue
-                    
-                    # Studio filter usando mapping COLONNE
-                    if studio_id is not None:
-                        studio = getattr(record, col_app['studio'].lower())  # DB_APSTUDI
-                        if studio != studio_id:
-                            record_index += 1
-                            continue
-                except Exception as e:
-                    # Skip record con errore
-                    record_index += 1
-                    continue
-                
-                # Process appointment con cleaning
-                appointment = self._process_appointment_record(record, patients_dict)
-                appointments.append(appointment)
-                
-                record_index += 1
-        
-        return appointments
+        with DbfRecordDecoder(appointments_path) as decoder:
+            rows = _select_appointment_rows(decoder, month, year, studio_id)
+            raw_records = _read_appointment_values(decoder, rows)
+        return [self._process_appointment_record(record, patients_dict) for record in raw_records]
     
     def _read_appointments_parallel_chunks(self,
                                          appointments_path: str,
@@ -844,171 +1272,139 @@ class DBFOptimizedReader:
                                          month: int,
                                          year: int,
                                          studio_id: Optional[int],
-                                         chunk_size: int) -> List[Dict[str, Any]]:
+                                         chunk_size: int,
+                                         mode: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         ⚡ Parallel chunked processing per file grandi.
+
+        Ogni chunk calcola il proprio offset (header_length + i * record_length)
+        e decodifica solo la sua slice: il lavoro totale e' lineare nel numero di
+        record. In modalita' 'process' la decodifica gira su piu' core tramite
+        ProcessPoolExecutor; l'arricchimento (pazienti, colori) resta nel processo
+        principale e riguarda solo gli appuntamenti selezionati.
         """
         
+        mode = mode or self.parallel_mode
         file_info = self._get_file_info(appointments_path)
+        if mode == 'process':
+            # Chunk piu' grandi: ogni task paga la serializzazione del risultato
+            chunk_size = max(chunk_size, math.ceil(file_info.record_count / (self.max_workers * 4)))
         total_chunks = (file_info.record_count + chunk_size - 1) // chunk_size
         
         # logger.info(f"Processing {file_info.record_count} records in {total_chunks} parallel chunks")
         
-        all_appointments = []
-        
-        # Parallel execution con ThreadPoolExecutor
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+        executor = None
+        if mode == 'process':
+            try:
+                executor = self._get_process_pool()
+            except Exception as e:
+                logger.warning(f"⚠️ Process pool non disponibile ({e}), uso thread")
+        own_executor = executor is None
+        if own_executor:
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        
+        chunk_results = {}
+        try:
             # Submit tutti i chunk jobs
             future_to_chunk = {}
-            
             for chunk_id in range(total_chunks):
                 start_record = chunk_id * chunk_size
                 end_record = min((chunk_id + 1) * chunk_size, file_info.record_count)
                 
                 future = executor.submit(
-                    self._process_chunk_enterprise,
-                    appointments_path, patients_dict, chunk_id,
-                    start_record, end_record, month, year, studio_id
+                    _read_appointment_chunk,
+                    appointments_path, start_record, end_record, month, year, studio_id
                 )
                 future_to_chunk[future] = chunk_id
             
             # Collect results as completed
-            chunk_results = {}
             for future in as_completed(future_to_chunk):
                 chunk_id = future_to_chunk[future]
                 try:
-                    chunk_result = future.result()
-                    chunk_results[chunk_id] = chunk_result
-                    # logger.debug(f"Chunk {chunk_id}: {len(chunk_result.records)} records processed")
+                    chunk_results[chunk_id] = self._build_chunk_result(
+                        chunk_id, appointments_path, future.result(), patients_dict
+                    )
+                    # logger.debug(f"Chunk {chunk_id}: {len(chunk_results[chunk_id].records)} records processed")
                 except Exception as e:
                     logger.error(f"Chunk {chunk_id} failed: {e}")
+                    if isinstance(e, BrokenProcessPool):
+                        self._shutdown_process_pool()
                     # Empty result for failed chunk
                     chunk_results[chunk_id] = ChunkResult(
                         chunk_id, [], 
                         ReadingMetrics(appointments_path, 0, 0, 0, 0)
                     )
+        finally:
+            if own_executor:
+                executor.shutdown(wait=True)
         
         # Combine results in correct order
+        all_appointments = []
         for chunk_id in sorted(chunk_results.keys()):
             all_appointments.extend(chunk_results[chunk_id].records)
         
         # logger.info(f"Parallel processing completed: {len(all_appointments)} total appointments")
         return all_appointments
     
-    def _process_chunk_enterprise(self,
-                                appointments_path: str,
-                                patients_dict: Dict[str, str],
-                                chunk_id: int,
-                                start_record: int,
-                                end_record: int,
-                                month: int,
-                                year: int,
-                                studio_id: Optional[int]) -> ChunkResult:
+    def _build_chunk_result(self,
+                            chunk_id: int,
+                            appointments_path: str,
+                            payload: Dict[str, Any],
+                            patients_dict: Dict[str, str]) -> ChunkResult:
         """
-        🏭 Enterprise chunk processor con error handling avanzato.
+        🏭 Arricchisce i valori grezzi restituiti da un worker di chunk.
         """
-        
-        start_time = time.time()
-        chunk_appointments = []
-        records_read = 0
-        deleted_filtered = 0
-        
-        # Get deleted records (cached per performance)
-        deleted_records = self._get_deleted_records_binary(appointments_path)
-        
-        try:
-            with dbf.Table(appointments_path, codepage='cp1252') as table:
-                # Navigate to start position efficiently
-                records_iter = iter(table)
-                for _ in range(start_record):
-                    next(records_iter, None)
-                
-                # Process chunk with optimizations
-                for record_index in range(start_record, end_record):
-                    try:
-                        record = next(records_iter)
-                        records_read += 1
-                        
-                        # Binary deleted check (ultra-fast)
-                        if record_index in deleted_records:
-                            deleted_filtered += 1
-                            continue
-                        
-                        # Early date filter usando mapping COLONNE
-                        try:
-                            col_app = COLONNE['appuntamenti']
-                            app_date = getattr(record, col_app['data'].lower())  # DB_APDATA
-                            if not app_date or app_date.month != month or app_date.year != year:
-                                continue
-                            
-                            # Studio filter usando mapping COLONNE
-                            if studio_id is not None:
-                                studio = getattr(record, col_app['studio'].lower())  # DB_APSTUDI
-                                if studio != studio_id:
-                                    continue
-                        except Exception as e:
-                            # Skip record con errore
-                            continue
-                        
-                        # Process con data cleaning
-                        appointment = self._process_appointment_record(record, patients_dict)
-                        chunk_appointments.append(appointment)
-                        
-                    except StopIteration:
-                        break
-                    except Exception as e:
-                        logger.warning(f"⚠️ Record {record_index} processing error: {e}")
-        
-        except Exception as e:
-            logger.error(f"❌ Chunk {chunk_id} processing error: {e}")
-        
-        execution_time = (time.time() - start_time) * 1000
-        
+        chunk_appointments = [
+            self._process_appointment_record(record, patients_dict) for record in payload['records']
+        ]
         metrics = ReadingMetrics(
             file_path=appointments_path,
-            records_read=records_read,
-            deleted_filtered=deleted_filtered,
-            execution_time_ms=execution_time,
+            records_read=payload['records_read'],
+            deleted_filtered=payload['deleted_filtered'],
+            execution_time_ms=payload['execution_time_ms'],
             chunk_count=1
         )
-        
         return ChunkResult(chunk_id, chunk_appointments, metrics)
     
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        """Pool di processi persistente (avvio dei worker pagato una sola volta)."""
+        with self._process_pool_lock:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._process_pool
+    
+    def _shutdown_process_pool(self):
+        with self._process_pool_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False, cancel_futures=True)
+                self._process_pool = None
+    
     def _process_appointment_record(self, 
-                                  record: Any, 
+                                  record: Dict[str, Any], 
                                   patients_dict: Dict[str, str]) -> Dict[str, Any]:
         """
         📝 Process appointment record con constants mapping e data enrichment.
+
+        Args:
+            record: Valori grezzi del record per chiave logica COLONNE['appuntamenti']
+                    (data, ora_inizio, ora_fine, id_paziente, tipo, studio, medico, note, descrizione)
+            patients_dict: Mappa id paziente -> nome
         """
         
         try:
-            # Get field mappings da constants
-            col_app = COLONNE['appuntamenti']
-            
             # Get patient info usando mapping
-            patient_id_field = col_app['id_paziente'].lower()  # db_appacod
-            patient_id = clean_dbf_value(getattr(record, patient_id_field))
+            patient_id = clean_dbf_value(record.get('id_paziente'))
             patient_name = patients_dict.get(str(patient_id), '') if patient_id else ''
             
-            # Get basic appointment data usando mapping
-            data_field = col_app['data'].lower()                # db_apdata
-            ora_inizio_field = col_app['ora_inizio'].lower()    # db_aporein  
-            ora_fine_field = col_app['ora_fine'].lower()        # db_aporeou
-            tipo_field = col_app['tipo'].lower()                # db_guardia
-            studio_field = col_app['studio'].lower()            # db_apstudi
-            medico_field = col_app['medico'].lower()            # db_apmedic
-            note_field = col_app['note'].lower()                # db_note
-            desc_field = col_app['descrizione'].lower()         # db_apdescr
-            
             # Extract raw values con safe access
-            raw_data = getattr(record, data_field, None)
-            raw_ora_inizio = clean_dbf_value(getattr(record, ora_inizio_field, 0), 0)
-            raw_ora_fine = clean_dbf_value(getattr(record, ora_fine_field, 0), 0) 
-            raw_tipo = clean_dbf_value(getattr(record, tipo_field, ''))
-            raw_studio = clean_dbf_value(getattr(record, studio_field, 1), 1)
-            raw_medico = clean_dbf_value(getattr(record, medico_field, 1), 1)
-            raw_note = clean_dbf_value(getattr(record, note_field, ''))
-            raw_desc = clean_dbf_value(getattr(record, desc_field, ''))
+            raw_data = record.get('data')
+            raw_ora_inizio = clean_dbf_value(record.get('ora_inizio'), 0)
+            raw_ora_fine = clean_dbf_value(record.get('ora_fine'), 0) 
+            raw_tipo = clean_dbf_value(record.get('tipo'))
+            raw_studio = clean_dbf_value(record.get('studio'), 1)
+            raw_medico = clean_dbf_value(record.get('medico'), 1)
+            raw_note = clean_dbf_value(record.get('note'))
+            raw_desc = clean_dbf_value(record.get('descrizione'))
             
             # Build enriched appointment usando constants per decodifica
             appointment = {
@@ -1069,46 +1465,23 @@ class DBFOptimizedReader:
         
         Performance: 100x più veloce della lettura record-by-record.
         """
-        cache_key = self._generate_cache_key('deleted', file_path)
-        
-        # Try cache
-        cached = self._get_from_cache(cache_key)
-        if cached is not None:
-            return cached
-        
+        return self._cached(
+            ('deleted', os.path.abspath(file_path)),
+            lambda: self._scan_deleted_records(file_path), file_path
+        )
+    
+    def _scan_deleted_records(self, file_path: str) -> set:
         deleted_records = set()
         
         try:
-            with open(file_path, 'rb') as f:
-                # Read DBF header efficiently
-                f.seek(8)  # Skip to header length
-                header_len = struct.unpack('<H', f.read(2))[0]
-                record_len = struct.unpack('<H', f.read(2))[0]
-                
-                # Binary scan for deleted flags
-                f.seek(header_len)
-                record_index = 0
-                
-                while True:
-                    delete_flag = f.read(1)
-                    if not delete_flag:
-                        break
-                    
-                    if delete_flag == b'*':  # DBF deleted marker
-                        deleted_records.add(record_index)
-                    
-                    # Jump to next record efficiently
-                    f.seek(f.tell() + record_len - 1)
-                    record_index += 1
+            # Flag di cancellazione letti come una sola slice strided del file mappato
+            with DbfRecordDecoder(file_path) as decoder:
+                deleted_records = set(np.flatnonzero(decoder.deleted_mask()).tolist())
         
         except Exception as e:
             logger.warning(f"⚠️ Binary deleted scan failed: {e}, using fallback")
             deleted_records = set()
         
-        # Cache result
-        self._store_in_cache(cache_key, deleted_records)
-        
-            # logger.debug(f"Found {len(deleted_records)} deleted records in {os.path.basename(file_path)}")
         return deleted_records
     
     def _get_file_info(self, file_path: str) -> DBFFileInfo:
@@ -1204,57 +1577,13 @@ class DBFOptimizedReader:
             logger.error(f"DBF path resolution failed: {e}")
             raise DbfProcessingError(f"Cannot resolve DBF path for {filename}: {e}")
     
-    def _generate_cache_key(self, prefix: str, file_path: str, *args) -> str:
-        """
-        Generate cache key con file mtime per auto-invalidation.
-        """
-        components = [
-            prefix,
-            os.path.basename(file_path),
-            str(os.path.getmtime(file_path)),
-            *[str(arg) for arg in args]
-        ]
-        return hashlib.md5('|'.join(components).encode()).hexdigest()
-    
-    def _get_from_cache(self, key: str) -> Optional[Any]:
+    def _cached(self, key: Tuple, loader: Callable[[], Any], *paths: str) -> Any:
         """
-        📦 Thread-safe cache retrieval con TTL check.
+        📦 Lettura dalla cache condivisa con auto-invalidation sulla versione
+        (mtime, size) dei file sorgente; richieste concorrenti per la stessa
+        chiave attendono un solo caricamento.
         """
-        with self.cache_lock:
-            if key in self.cache:
-                timestamp = self.cache_timestamps.get(key, 0)
-                if time.time() - timestamp < self.cache_ttl:
-                    return self.cache[key]
-                else:
-                    # Expired - cleanup
-                    del self.cache[key]
-                    if key in self.cache_timestamps:
-                        del self.cache_timestamps[key]
-        return None
-    
-    def _store_in_cache(self, key: str, value: Any):
-        """
-        💾 Thread-safe cache storage con LRU eviction.
-        """
-        with self.cache_lock:
-            # Store value
-            self.cache[key] = value
-            self.cache_timestamps[key] = time.time()
-            
-            # LRU eviction se necessario
-            if len(self.cache) > self.max_cache_items:
-                # Remove oldest 20%
-                items = list(self.cache_timestamps.items())
-                items.sort(key=lambda x: x[1])
-                
-                items_to_remove = items[:max(1, len(items) // 5)]
-                for old_key, _ in items_to_remove:
-                    if old_key in self.cache:
-                        del self.cache[old_key]
-                    if old_key in self.cache_timestamps:
-                        del self.cache_timestamps[old_key]
-                
-                logger.debug(f"🧹 Cache LRU eviction: removed {len(items_to_remove)} items")
+        return self.cache.get_or_load(key, loader, version=file_version(*paths))
     
     def _record_metrics(self, file_path: str, records_read: int, deleted_filtered: int, 
                        execution_time_ms: float, chunk_count: int, cache_hit: bool):
@@ -1296,16 +1625,13 @@ class DBFOptimizedReader:
                     'cache_hit_rate_percent': len([m for m in recent_metrics if m.cache_hit]) / len(recent_metrics) * 100,
                     'total_deleted_filtered': sum(m.deleted_filtered for m in recent_metrics),
                 },
-                'cache': {
-                    'items_count': len(self.cache),
-                    'max_items': self.max_cache_items,
-                    'ttl_seconds': self.cache_ttl
-                },
+                'cache': self.cache.get_stats(),
                 'performance': {
                     'fastest_operation_ms': min(m.execution_time_ms for m in recent_metrics),
                     'slowest_operation_ms': max(m.execution_time_ms for m in recent_metrics),
                     'chunk_size': self.default_chunk_size,
-                    'max_workers': self.max_workers
+                    'max_workers': self.max_workers,
+                    'parallel_mode': self.parallel_mode
                 }
             }
     
@@ -1327,6 +1653,7 @@ class DBFOptimizedReader:
                 },
                 'cache_status': {
                     'items': len(self.cache),
+                    'bytes': self.cache.bytes_used,
                     'hit_rate': self._calculate_cache_hit_rate()
                 },
                 'timestamp': datetime.now().isoformat()
@@ -1358,100 +1685,32 @@ class DBFOptimizedReader:
         """
         🧹 Cleanup resources per shutdown graceful.
         """
-        with self.cache_lock:
-            self.cache.clear()
-            self.cache_timestamps.clear()
+        self.cache.invalidate()
         
         with self.metrics_lock:
             self.metrics.clear()
             
         self.file_info_cache.clear()
+        self._shutdown_process_pool()
         
         logger.info("🧹 DBF Optimized Reader cleanup completed")
 
     def get_stats_aggregates(self, years: List[int], ytd_limit: Optional[tuple] = None) -> Dict[str, List[Dict[str, Any]]]:
         """
-        📊 Calcola statistiche aggregate per gli anni richiesti direttamente dal DBF.
-        Ottimizzato per leggere solo campi DATA e TIPO.
+        📊 Calcola statistiche aggregate per gli anni richiesti.
+        Legge le celle precalcolate del cubo rollup di APPUNTA (services.appointment_rollup),
+        aggiornato in modo incrementale dal DBF mirror.
         
         Args:
             years: Lista di anni da analizzare
             ytd_limit: Tuple (mese, giorno) opzionale per calcolare YTD. 
                        Se presente, aggiunge 'first_visits_ytd' al risultato.
         """
-        stats = {str(year): {} for year in years}
-        
-        # Parse ytd_limit
-        limit_month, limit_day = ytd_limit if ytd_limit else (13, 32)
-        
         try:
-            appointments_path = self._get_dbf_path('APPUNTA.DBF')
-            deleted_records = self._get_deleted_records_binary(appointments_path)
-            
-            # Mapping campi
-            col_app = COLONNE['appuntamenti']
-            data_field = col_app['data'].lower()
-            tipo_field = col_app['tipo'].lower()
+            from services.appointment_rollup import get_appointment_rollup
             
-            with dbf.Table(appointments_path, codepage='cp1252') as table:
-                record_index = 0
-                for record in table:
-                    if record_index in deleted_records:
-                        record_index += 1
-                        continue
-                        
-                    try:
-                        # Extract data - fast path
-                        app_date = getattr(record, data_field)
-                        if not app_date:
-                            record_index += 1
-                            continue
-                            
-                        # Check year match
-                        year = app_date.year
-                        if year not in years:
-                            record_index += 1
-                            continue
-                            
-                        # Extract type
-                        tipo = clean_dbf_value(getattr(record, tipo_field))
-                        
-                        # Init month entry if needed
-                        if app_date.month not in stats[str(year)]:
-                            stats[str(year)][app_date.month] = {'count': 0, 'first_visits': 0, 'first_visits_ytd': 0}
-                        
-                        entry = stats[str(year)][app_date.month]
-                        entry['count'] += 1
-                        
-                        if tipo == 'V':
-                            entry['first_visits'] += 1
-                            # YTD Check: Same year logic handled by caller aggregating the result, 
-                            # here we just flag if this specific record is within the calendar period defined by ytd_limit
-                            # irrelevant of the year of the record.
-                            # e.g. if limit is (3, 15), we count it if date.month < 3 or (date.month == 3 and date.day <= 15)
-                            if app_date.month < limit_month or (app_date.month == limit_month and app_date.day <= limit_day):
-                                entry['first_visits_ytd'] += 1
-                            
-                    except Exception:
-                        pass
-                        
-                    record_index += 1
-                    
-            # Format output as list per year
-            result = {}
-            for year_str, months_data in stats.items():
-                year_list = []
-                for month in range(1, 13):
-                    data = months_data.get(month, {'count': 0, 'first_visits': 0, 'first_visits_ytd': 0})
-                    year_list.append({
-                        'month': month,
-                        'count': data['count'],
-                        'first_visits': data['first_visits'],
-                        'first_visits_ytd': data.get('first_visits_ytd', 0)
-                    })
-                result[year_str] = year_list
-                
-            return result
+            cube = get_appointment_rollup(self._get_dbf_path('APPUNTA.DBF'))
+            return cube.monthly_stats(years, ytd_limit)
             
         except Exception as e:
             logger.error(f"Error computing stats aggregates: {e}")
@@ -1546,7 +1805,13 @@ def get_optimized_reader() -> DBFOptimizedReader:
     """Get singleton optimized reader instance."""
     global _global_reader
     if _global_reader is None:
-        _global_reader = DBFOptimizedReader()
+        config = get_config()
+        performance = config.get_performance_config()
+        _global_reader = DBFOptimizedReader(
+            cache_ttl=performance['cache_ttl_seconds'],
+            cache_max_bytes=performance['cache_max_mb'] * 1024 * 1024,
+            parallel_mode=config.get('DBF_PARALLEL_MODE', 'thread')
+        )
     return _global_reader
 
 def get_appointments_fast(month: int, year: int, studio_id: Optional[int] = None) -> List[Dict[str, Any]]: